@@ -0,0 +1,333 @@
+"""
+Admission control.
+Token buckets per client and per upstream model decide whether a request may
+go ahead, wait briefly, or be turned away with a Retry-After before it costs
+an upstream round trip. Upstream buckets adapt AIMD-style: their rate grows
+additively while calls succeed, is cut multiplicatively on a 429, and is
+capped by the limits the upstream reports in its rate-limit headers.
+
+With several worker processes, client buckets can live in a shared SQLite
+file so a client's quota holds whichever worker serves it, and each worker's
+upstream buckets start from its share of the configured rates; AIMD then
+keeps the workers' shares fair as they each react to the same 429s.
+"""
+
+import re
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+def parse_duration(value: str) -> Optional[float]:
+    """Seconds in an OpenAI reset header such as "1s", "6m0s" or "20ms"."""
+    parts = DURATION_PART.findall(value or "")
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+
+class TokenBucket:
+    """
+    Admits `rate` calls per second on average, up to `burst` at once.
+
+    Tokens may go negative: a caller that is willing to wait takes its token
+    now and sleeps until the bucket would have refilled, so waiters are
+    served in arrival order without a separate queue.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: Optional[float] = None) -> float:
+        """Seconds until a token would be available."""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        return max((1 - self.tokens) / self.rate, self.paused_until - now, 0.0)
+
+    def spare_wait(self, spare: float, now: Optional[float] = None) -> float:
+        """Seconds until a token would be available with `spare` more still left in the bucket."""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        return max((1 + spare - self.tokens) / self.rate, self.paused_until - now, 0.0)
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """Take a token and return how long to wait for it, or None (taking nothing) if that exceeds max_wait."""
+        wait = self.wait_time()
+        if wait > max_wait:
+            return None
+        self.tokens -= 1
+        return wait
+
+
+class AdaptiveBucket(TokenBucket):
+    """
+    Token bucket whose rate follows upstream feedback.
+
+    Until the first 429 the rate grows by one call/s per success, doubling
+    each second at full use (slow start), so a fresh process quickly reaches
+    the traffic it is offered. After that it grows additively and is cut
+    multiplicatively on each burst of 429s.
+    """
+
+    def __init__(self, rate: float, burst: float, min_rate: float, max_rate: float, increase: float, decrease: float):
+        super().__init__(rate, burst)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.ceiling = max_rate  # Configured maximum; max_rate may be lowered to the upstream's reported limit
+        self.increase = increase
+        self.decrease = decrease
+        self.last_decrease = 0.0
+        self.rate_limited = 0
+        self.slow_start = True
+
+    def on_success(self) -> None:
+        if self.slow_start:
+            self.rate = min(self.max_rate, self.rate + 1.0)
+        else:
+            # About `increase` calls/s more per second of successful traffic at the current rate
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def on_rate_limited(self, retry_after: Optional[float]) -> None:
+        now = time.monotonic()
+        self.rate_limited += 1
+        self.slow_start = False
+        # One burst of 429s for calls already in flight counts as a single signal
+        if now - self.last_decrease > max(1.0, 1.0 / self.rate):
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.tokens = min(self.tokens, 0.0)
+            self.last_decrease = now
+            logger.warning("Upstream rate limited - new rate %.2f/s, retry after %ss", self.rate, retry_after)
+        if retry_after:
+            self.paused_until = max(self.paused_until, now + retry_after)
+
+    def on_limits(self, limit_per_minute: Optional[float], remaining: Optional[float], reset: Optional[float]) -> None:
+        """Apply the request limits an upstream reported with a response."""
+        if limit_per_minute:
+            self.max_rate = min(self.ceiling, limit_per_minute / 60)
+            self.rate = min(self.rate, self.max_rate)
+        if remaining is not None and remaining <= 0 and reset:
+            self.paused_until = max(self.paused_until, time.monotonic() + reset)
+
+
+class SQLiteBucketStore:
+    """Client token buckets in a local SQLite file, shared by workers on one host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS client_buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._takes = 0
+
+    def take(self, key: str, rate: float, burst: float) -> Optional[float]:
+        """Take a token from the key's bucket: None if one was free, otherwise seconds until one is."""
+        with self._lock:
+            now = time.time()
+            # BEGIN IMMEDIATE holds the write lock across the read, so two workers cannot spend the same token
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT tokens, updated FROM client_buckets WHERE key = ?", (key,)
+                ).fetchone()
+                tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+                wait = None if tokens >= 1 else (1 - tokens) / rate
+                if wait is None:
+                    tokens -= 1
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO client_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                    (key, tokens, now),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._takes += 1
+            if self._takes % 1000 == 0:
+                # Buckets idle long enough to have refilled are the same as no bucket
+                self._conn.execute("DELETE FROM client_buckets WHERE updated < ?", (now - burst / rate,))
+        return wait
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class AdmissionController:
+    """Client and upstream token buckets for the endpoints that call OpenAI."""
+
+    def __init__(
+        self,
+        client_rate: float,
+        client_burst: float,
+        upstream_rate: float,
+        upstream_burst: float,
+        upstream_min_rate: float,
+        upstream_max_rate: float,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        max_wait: float = 2.0,
+        max_clients: int = 10000,
+        workers: int = 1,
+        client_store: Optional[SQLiteBucketStore] = None
+    ):
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.client_store = client_store
+        # Each worker starts from its share of the upstream budget
+        self.workers = max(1, workers)
+        self.upstream_settings = dict(
+            rate=upstream_rate / self.workers, burst=max(1.0, upstream_burst / self.workers),
+            min_rate=upstream_min_rate / self.workers, max_rate=upstream_max_rate / self.workers,
+            increase=increase / self.workers, decrease=decrease
+        )
+        self.max_wait = max_wait
+        self.max_clients = max_clients
+        self.clients: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.upstreams: Dict[str, AdaptiveBucket] = {}
+        self.rejected_clients = 0
+        self.rejected_upstream = 0
+        self.waited = 0
+
+    async def admit_client(self, key: str) -> Optional[float]:
+        """None if the client may proceed, otherwise the seconds it should wait before retrying."""
+        if self.client_rate <= 0:
+            return None
+        if self.client_store is not None:
+            retry_after = await asyncio.to_thread(self.client_store.take, key, self.client_rate, self.client_burst)
+            if retry_after is not None:
+                self.rejected_clients += 1
+            return retry_after
+        bucket = self.clients.get(key)
+        if bucket is None:
+            bucket = self.clients[key] = TokenBucket(self.client_rate, self.client_burst)
+            if len(self.clients) > self.max_clients:
+                # Least recently seen client; if it comes back it starts with a full bucket
+                self.clients.popitem(last=False)
+        else:
+            self.clients.move_to_end(key)
+        # Clients over their quota are shed at once; only upstream capacity is worth queueing for
+        if bucket.reserve(0.0) is None:
+            self.rejected_clients += 1
+            return bucket.wait_time()
+        return None
+
+    def upstream(self, key: str) -> AdaptiveBucket:
+        bucket = self.upstreams.get(key)
+        if bucket is None:
+            bucket = self.upstreams[key] = AdaptiveBucket(**self.upstream_settings)
+        return bucket
+
+    async def admit_upstream(self, key: str, max_wait: Optional[float] = None, spare: float = 0.0) -> Optional[float]:
+        """
+        Wait for the upstream bucket when that takes at most max_wait.
+
+        Returns None once the call may proceed, or the estimated seconds
+        until capacity frees up if the request should be shed instead.
+        Upstream admission is disabled when the starting rate is 0.
+
+        With spare, the call only goes once that many tokens would still be
+        left after it, and it does not queue for a token: it sleeps and
+        looks again, so calls without spare arriving meanwhile go first.
+        Background work uses it to leave headroom for interactive calls.
+        """
+        if self.upstream_settings["rate"] <= 0:
+            return None
+        bucket = self.upstream(key)
+        if spare > 0:
+            return await self._admit_spare(bucket, self.max_wait if max_wait is None else max_wait, spare)
+        wait = bucket.reserve(self.max_wait if max_wait is None else max_wait)
+        if wait is None:
+            self.rejected_upstream += 1
+            return bucket.wait_time()
+        if wait > 0:
+            self.waited += 1
+            await asyncio.sleep(wait)
+        return None
+
+    async def _admit_spare(self, bucket: AdaptiveBucket, max_wait: float, spare: float) -> Optional[float]:
+        give_up = time.monotonic() + max_wait
+        spare = min(spare, bucket.burst - 1)  # A full bucket always admits
+        waited = False
+        while True:
+            wait = bucket.spare_wait(spare)
+            if wait <= 0:
+                bucket.tokens -= 1
+                return None
+            if time.monotonic() + wait > give_up:
+                self.rejected_upstream += 1
+                return wait
+            if not waited:
+                waited = True
+                self.waited += 1
+            await asyncio.sleep(wait)
+
+    def try_upstream(self, key: str) -> bool:
+        """Take an upstream token only if one is free right now, for optional calls such as hedges."""
+        if self.upstream_settings["rate"] <= 0:
+            return True
+        return self.upstream(key).reserve(0.0) is not None
+
+    def observe_upstream(self, key: str, status_code: int, headers: Mapping[str, str]) -> None:
+        """Feed an upstream response's status and rate-limit headers back into its bucket."""
+        if self.upstream_settings["rate"] <= 0:
+            return
+        bucket = self.upstream(key)
+        if status_code == 429:
+            retry_after = None
+            try:
+                if "retry-after-ms" in headers:
+                    retry_after = float(headers["retry-after-ms"]) / 1000
+                elif "retry-after" in headers:
+                    retry_after = float(headers["retry-after"])
+            except ValueError:
+                pass
+            bucket.on_rate_limited(retry_after)
+            return
+        if status_code < 400:
+            bucket.on_success()
+            limit = headers.get("x-ratelimit-limit-requests")
+            remaining = headers.get("x-ratelimit-remaining-requests")
+            try:
+                bucket.on_limits(
+                    float(limit) if limit else None,
+                    float(remaining) if remaining else None,
+                    parse_duration(headers.get("x-ratelimit-reset-requests", ""))
+                )
+            except ValueError:
+                pass
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "clients": len(self.clients),
+            "rejected_clients": self.rejected_clients,
+            "rejected_upstream": self.rejected_upstream,
+            "waited": self.waited,
+            "upstreams": {
+                key: {"rate": round(bucket.rate, 2), "max_rate": round(bucket.max_rate, 2),
+                      "rate_limited": bucket.rate_limited}
+                for key, bucket in self.upstreams.items()
+            },
+        }
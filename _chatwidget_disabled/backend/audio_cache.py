@@ -0,0 +1,228 @@
+"""
+Persistent on-disk cache for generated TTS audio.
+Files are content addressed, evicted least-recently-used once the directory
+exceeds its size budget, and served with strong ETags and HTTP Range support.
+"""
+
+import os
+import re
+import time
+import hashlib
+import asyncio
+import logging
+import threading
+from typing import AsyncIterator, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+
+logger = logging.getLogger(__name__)
+
+# File extension and media type for each TTS output format family
+FORMAT_TYPES = {
+    "mp3": ("mp3", "audio/mpeg"),
+    "pcm": ("pcm", "audio/L16"),
+    "ulaw": ("ulaw", "audio/basic"),
+    "opus": ("opus", "audio/ogg"),
+}
+
+# Only audio extensions, so request links (<key>.link) in the same directory are never served as audio
+AUDIO_ID_PATTERN = re.compile(r"^[0-9a-f]{64}\.(?:mp3|ulaw|opus|bin|pcm\d*)$")
+# Raw PCM output formats (pcm_24000) and the audio id extensions they map to (pcm24000)
+PCM_PATTERN = re.compile(r"^pcm_?(\d+)$")
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# Audio ids are content hashes, so a given URL never changes
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def format_type(output_format: str) -> tuple:
+    """
+    Return (extension, media type) for a TTS output format such as mp3_44100_128.
+
+    Raw PCM has no header to carry its sample rate, so both the extension and
+    the audio/L16 media type name it; an audio id extension maps back the same way.
+    """
+    pcm = PCM_PATTERN.match(output_format)
+    if pcm:
+        return f"pcm{pcm.group(1)}", f"audio/L16;rate={pcm.group(1)};channels=1"
+    return FORMAT_TYPES.get(output_format.split("_")[0], ("bin", "application/octet-stream"))
+
+
+def make_audio_id(summary_text: str, voice_id: str, model_id: str, output_format: str) -> str:
+    """Content address for the audio of one summary in one voice and format."""
+    summary_hash = hashlib.sha256(summary_text.encode("utf-8")).hexdigest()
+    digest = hashlib.sha256(f"{summary_hash}:{voice_id}:{model_id}:{output_format}".encode("utf-8")).hexdigest()
+    return f"{digest}.{format_type(output_format)[0]}"
+
+
+class AudioCache:
+    """Size-bounded directory of audio files plus request-to-audio links."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Size accounting is updated from writer threads and from the event loop
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._bytes = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    def path_for(self, audio_id: str) -> Optional[str]:
+        """Path of a cached audio id, or None if the id is malformed."""
+        if not AUDIO_ID_PATTERN.match(audio_id):
+            return None
+        return os.path.join(self.directory, audio_id)
+
+    def lookup(self, audio_id: str) -> Optional[os.stat_result]:
+        """Stat a cached file and mark it recently used; None on a miss."""
+        path = self.path_for(audio_id)
+        try:
+            stat_result = os.stat(path) if path else None
+        except FileNotFoundError:
+            stat_result = None
+        if stat_result is None:
+            self.misses += 1
+            return None
+        now = time.time()
+        os.utime(path, (now, now))
+        self.hits += 1
+        return stat_result
+
+    def resolve_link(self, request_key: str) -> Optional[str]:
+        """Audio id previously generated for a request key, if still cached."""
+        link_path = os.path.join(self.directory, f"{request_key}.link")
+        try:
+            with open(link_path, "r") as f:
+                audio_id = f.read().strip()
+        except FileNotFoundError:
+            return None
+        os.utime(link_path)
+        return audio_id
+
+    def link(self, request_key: str, audio_id: str) -> None:
+        """Remember which audio a request key produced, so repeats skip the summary call."""
+        link_path = os.path.join(self.directory, f"{request_key}.link")
+        with open(link_path, "w") as f:
+            f.write(audio_id)
+        with self._lock:
+            self._bytes += len(audio_id)
+
+    async def store(self, audio_id: str, data: bytes, request_key: Optional[str] = None) -> None:
+        """Persist a complete audio file (and optional request link), then enforce the size budget."""
+        path = self.path_for(audio_id)
+        if path is None or not data:
+            return
+        await asyncio.to_thread(self._write, path, audio_id, data, request_key)
+
+    def _write(self, path: str, audio_id: str, data: bytes, request_key: Optional[str]) -> None:
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            self._bytes += len(data)
+
+        if request_key:
+            self.link(request_key, audio_id)
+
+        with self._lock:
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Delete least recently used files until under 90% of the budget; called holding the lock."""
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.is_file() and not entry.name.endswith(".tmp")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        self._bytes = sum(entry.stat().st_size for entry in entries)
+        target = self.max_bytes * 0.9
+        for entry in entries:
+            if self._bytes <= target:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self._bytes -= size
+            self.evictions += 1
+
+    async def tee(self, audio_id: str, source: AsyncIterator[bytes], request_key: Optional[str] = None) -> AsyncIterator[bytes]:
+        """Pass chunks through and store the file only if the stream completes."""
+        chunks = []
+        async for chunk in source:
+            chunks.append(chunk)
+            yield chunk
+        await self.store(audio_id, b"".join(chunks), request_key)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "directory": self.directory,
+        }
+
+
+def read_range(path: str, start: int, length: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(length)
+
+
+async def cached_audio_response(
+    request: Request,
+    path: str,
+    stat_result: os.stat_result,
+    audio_id: str,
+    media_type: str,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """
+    Serve a cached audio file with a strong ETag, immutable caching and single-range support.
+
+    Full responses go through FileResponse so servers supporting pathsend can
+    hand the file to the kernel; range responses read only the requested slice,
+    in a worker thread.
+    """
+    etag = f'"{audio_id.split(".")[0]}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        **(headers or {}),
+    }
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    size = stat_result.st_size
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range == etag):
+        match = RANGE_PATTERN.match(range_header.strip())
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(size - int(match.group(2)), 0)
+                end = size - 1
+            if start >= size or start > end:
+                return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+            body = await asyncio.to_thread(read_range, path, start, end - start + 1)
+            return Response(
+                content=body,
+                status_code=206,
+                media_type=media_type,
+                headers={**headers, "Content-Range": f"bytes {start}-{end}/{size}"},
+            )
+
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat_result)
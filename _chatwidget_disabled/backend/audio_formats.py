@@ -0,0 +1,114 @@
+"""
+Output format negotiation for TTS audio.
+Spoken-word summaries sound the same at a fraction of the bitrate music
+needs, and on a slow mobile link every byte delays playback. /api/listen
+picks the format from what the client can play (an explicit format, a list
+of codecs, or the Accept header) and how fast its connection is (a network
+hint from the widget, or the Save-Data, ECT and Downlink client hints).
+"""
+
+from typing import Iterable, Mapping, Optional, Sequence
+
+# Formats the TTS upstream offers; opus is Ogg Opus
+OUTPUT_FORMATS = {
+    "mp3_22050_32", "mp3_44100_32", "mp3_44100_64", "mp3_44100_96", "mp3_44100_128", "mp3_44100_192",
+    "pcm_16000", "pcm_22050", "pcm_24000", "pcm_44100",
+    "ulaw_8000",
+    "opus_48000_32", "opus_48000_64", "opus_48000_96", "opus_48000_128", "opus_48000_192",
+}
+
+# Connection tiers, slowest first
+SLOW, MEDIUM, FAST = "slow", "medium", "fast"
+
+# Format for each codec and tier. Opus at 32 kbit/s is as clear for speech as MP3 at 64; raw PCM
+# is only for clients that can play nothing else
+FORMAT_LADDERS = {
+    "opus": {SLOW: "opus_48000_32", MEDIUM: "opus_48000_32", FAST: "opus_48000_64"},
+    "mp3": {SLOW: "mp3_22050_32", MEDIUM: "mp3_44100_64", FAST: "mp3_44100_128"},
+    "pcm": {SLOW: "pcm_16000", MEDIUM: "pcm_16000", FAST: "pcm_24000"},
+}
+
+# Media types in an Accept header and the codec each stands for
+ACCEPT_CODECS = {
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/l16": "pcm",
+}
+
+# Network Information API effective connection types (navigator.connection.effectiveType)
+EFFECTIVE_TYPE_TIERS = {"slow-2g": SLOW, "2g": SLOW, "3g": MEDIUM, "4g": FAST}
+
+
+def codecs_from_accept(accept: str) -> list:
+    """Codecs named in an Accept header, by descending q-value; [] when it names none."""
+    ranked = []
+    for position, item in enumerate(accept.split(",")):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    pass
+        codec = ACCEPT_CODECS.get(media_type.lower())
+        if codec and quality > 0:
+            ranked.append((-quality, position, codec))
+    return list(dict.fromkeys(codec for _, _, codec in sorted(ranked)))
+
+
+def network_tier(network: Optional[str], headers: Mapping[str, str]) -> Optional[str]:
+    """
+    Connection tier from the widget's network hint ("save-data" or an
+    effective connection type), else from the Save-Data, ECT and Downlink
+    request headers; None when nothing is known.
+    """
+    if network:
+        return SLOW if network == "save-data" else EFFECTIVE_TYPE_TIERS.get(network)
+    if headers.get("save-data", "").lower() == "on":
+        return SLOW
+    if headers.get("ect") in EFFECTIVE_TYPE_TIERS:
+        return EFFECTIVE_TYPE_TIERS[headers["ect"]]
+    try:
+        downlink = float(headers["downlink"])  # Mbit/s
+    except (KeyError, ValueError):
+        return None
+    return SLOW if downlink < 0.5 else MEDIUM if downlink < 2 else FAST
+
+
+def negotiate_format(
+    explicit: Optional[str],
+    codecs: Optional[Sequence[str]],
+    headers: Mapping[str, str],
+    network: Optional[str],
+    default: str,
+    allowed: Iterable[str] = OUTPUT_FORMATS,
+) -> str:
+    """
+    The output format to generate: an explicit format as is, otherwise the
+    first codec the client can play (its list, else its Accept header) at the
+    bitrate for its connection tier. Otherwise the default codec at that
+    tier, if allowed; failing all of these, the default.
+    """
+    if explicit:
+        return explicit
+    if codecs is None:
+        codecs = codecs_from_accept(headers.get("accept", ""))
+    tier = network_tier(network, headers)
+    allowed = set(allowed)
+    default_codec = default.split("_")[0]
+    for codec in codecs:
+        ladder = FORMAT_LADDERS.get(codec)
+        if ladder is None:
+            continue
+        if tier is None and codec == default_codec:
+            return default
+        candidate = ladder[tier or FAST]
+        if candidate in allowed:
+            return candidate
+    if tier and default_codec in FORMAT_LADDERS and FORMAT_LADDERS[default_codec][tier] in allowed:
+        return FORMAT_LADDERS[default_codec][tier]
+    return default
@@ -0,0 +1,73 @@
+"""
+Bounded-parallel batch runner for upstream jobs.
+Runs many independent calls under a concurrency cap, retries transient
+failures with exponential backoff, and pauses every worker when the upstream
+reports a rate limit, so a large batch slows down instead of failing.
+"""
+
+import time
+import random
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Sequence, Tuple
+
+from upstream import is_rate_limited, is_retryable, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+
+class BatchRunner:
+    """Runs fn over items with at most max_parallel calls in flight."""
+
+    def __init__(self, max_parallel: int, attempts: int = 3, base_delay: float = 1.0, max_delay: float = 30.0):
+        self.max_parallel = max_parallel
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.rate_limited = 0
+        self._resume_at = 0.0  # Monotonic time before which no worker starts a call
+
+    def _backoff(self, error: Exception, attempt: int) -> float:
+        delay = retry_after_seconds(error)
+        if delay is None:
+            delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+        return delay
+
+    async def _call(self, fn: Callable[[Any], Awaitable[Any]], item: Any) -> Any:
+        for attempt in range(self.attempts):
+            pause = self._resume_at - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            try:
+                return await fn(item)
+            except Exception as e:
+                if attempt == self.attempts - 1 or not is_retryable(e):
+                    raise
+                delay = self._backoff(e, attempt)
+                self.retries += 1
+                if is_rate_limited(e):
+                    # Hold back the whole batch, not just this worker
+                    self.rate_limited += 1
+                    self._resume_at = max(self._resume_at, time.monotonic() + delay)
+                logger.warning("Batch call failed (attempt %s/%s), "
+                               "retrying in %.1fs: %s",
+                               attempt + 1, self.attempts, delay, str(e))
+                await asyncio.sleep(delay)
+
+    async def run(
+        self,
+        items: Sequence[Any],
+        fn: Callable[[Any], Awaitable[Any]]
+    ) -> List[Tuple[Optional[Any], Optional[Exception]]]:
+        """Return (result, None) or (None, error) for each item, in order."""
+        limit = asyncio.Semaphore(self.max_parallel)
+
+        async def run_one(item: Any) -> Tuple[Optional[Any], Optional[Exception]]:
+            async with limit:
+                try:
+                    return await self._call(fn, item), None
+                except Exception as e:
+                    return None, e
+
+        return await asyncio.gather(*(run_one(item) for item in items))
@@ -0,0 +1,84 @@
+"""
+Admission control against a rate-limited upstream.
+Offers summarize requests for distinct documents (so nothing is cached) at a
+fixed open-loop rate above the fake upstream's --completion-rate-limit, then
+reports what clients saw and how many calls the upstream had to reject.
+
+Usage:
+    python bench/fake_upstream.py --port 9000 --latency 0.3 --completion-rate-limit 10
+    ADMISSION_CLIENT_RATE=0 uvicorn main:app --port 8000      # upstream admission on (default)
+    ADMISSION_CLIENT_RATE=0 ADMISSION_UPSTREAM_RATE=0 uvicorn main:app --port 8000   # off, for comparison
+    python bench/bench_admission.py --rate 30 --duration 20
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from load import SAMPLE_TEXT, percentile  # noqa: E402
+
+
+async def main(args) -> None:
+    async with httpx.AsyncClient(base_url=args.url, timeout=120.0,
+                                 limits=httpx.Limits(max_connections=1000)) as client, \
+            httpx.AsyncClient(base_url=args.upstream, timeout=10.0) as upstream:
+        before = (await upstream.get("/stats")).json()["completions"]
+        statuses = Counter()
+        latencies = {"ok": [], "shed": []}
+        retry_after_missing = 0
+
+        async def one(index: int) -> None:
+            nonlocal retry_after_missing
+            started = time.perf_counter()
+            try:
+                response = await client.post("/api/summarize", json={"message": f"Document {index}. {SAMPLE_TEXT}"})
+            except httpx.HTTPError:
+                statuses["transport error"] += 1
+                return
+            elapsed = time.perf_counter() - started
+            statuses[response.status_code] += 1
+            if response.status_code == 200:
+                latencies["ok"].append(elapsed)
+            elif response.status_code == 429:
+                latencies["shed"].append(elapsed)
+                if "retry-after" not in response.headers:
+                    retry_after_missing += 1
+
+        tasks = []
+        started = time.perf_counter()
+        for index in range(int(args.rate * args.duration)):
+            delay = started + index / args.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(one(index)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+        after = (await upstream.get("/stats")).json()["completions"]
+
+    accepted = after["accepted"] - before["accepted"]
+    rejected = after["rate_limited"] - before["rate_limited"]
+    print(f"Offered {len(tasks)} requests at {args.rate}/s over {elapsed:.1f}s")
+    print(f"Client statuses: {dict(statuses)}")
+    print(f"200 latency: p50 {percentile(latencies['ok'], 50) * 1000:.0f} ms, "
+          f"p99 {percentile(latencies['ok'], 99) * 1000:.0f} ms")
+    if latencies["shed"]:
+        print(f"429 latency: p50 {percentile(latencies['shed'], 50) * 1000:.0f} ms, "
+              f"p99 {percentile(latencies['shed'], 99) * 1000:.0f} ms, {retry_after_missing} without Retry-After")
+    print(f"Upstream: {accepted} calls accepted ({accepted / elapsed:.1f}/s), {rejected} rejected with 429")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--upstream", default="http://127.0.0.1:9000")
+    parser.add_argument("--rate", type=float, default=30.0, help="requests offered per second")
+    parser.add_argument("--duration", type=float, default=20.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,118 @@
+"""
+Bytes transferred and time to playable for /api/listen on throttled links.
+Starts the fake upstream and the backend behind bench/netem.py, and for each
+link profile requests the same uncached summary audio as an old client (no
+hints, the default format), and as the widget does now: with the codecs the
+browser plays and its connection's effectiveType. The fake upstream sizes
+audio by the format's bitrate, as ElevenLabs does.
+
+Time to playable is when the first --playable-seconds of audio have arrived,
+roughly when a browser's audio element can start playing without stalling;
+complete is when the last byte arrived.
+
+Usage:
+    python bench/bench_audio_formats.py
+    python bench/bench_audio_formats.py --link 2g --link 3g --runs 5 --output formats.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_upstream import format_kbps  # noqa: E402
+from load import request_body  # noqa: E402
+from netem import start_proxy  # noqa: E402
+from suite import harness  # noqa: E402
+
+# Link profiles: round trip time (s), download bandwidth (bit/s), and the effectiveType a browser reports
+LINKS = {
+    "2g": (0.3, 250_000, "2g"),
+    "3g": (0.15, 1_600_000, "3g"),
+    "4g": (0.05, 9_000_000, "4g"),
+}
+
+# Client: request body fields added to the listen request
+CLIENTS = {
+    "no_hints": lambda network: {},
+    "mp3_hinted": lambda network: {"formats": ["mp3"], "network": network},
+    "opus_hinted": lambda network: {"formats": ["opus", "mp3"], "network": network},
+}
+
+
+async def listen_once(client: httpx.AsyncClient, body: dict, playable_seconds: float) -> dict:
+    started = time.perf_counter()
+    received, playable_at = 0, None
+    async with client.stream("POST", "/api/listen", json=body) as response:
+        if response.status_code != 200:
+            raise RuntimeError(f"/api/listen returned {response.status_code}: {(await response.aread())[:200]!r}")
+        output_format = response.headers["x-audio-format"]
+        playable_bytes = format_kbps(output_format) * 1000 / 8 * playable_seconds
+        async for chunk in response.aiter_raw():
+            received += len(chunk)
+            if playable_at is None and received >= playable_bytes:
+                playable_at = time.perf_counter() - started
+    complete = time.perf_counter() - started
+    return {"format": output_format, "bytes": received, "playable_s": playable_at or complete, "complete_s": complete}
+
+
+async def run(backend_url: str, args) -> dict:
+    backend_port = int(backend_url.rsplit(":", 1)[1])
+    results = {}
+    index = 0
+    for link in args.link:
+        rtt, bandwidth, network = LINKS[link]
+        server, port = await start_proxy(backend_port, rtt, bandwidth)
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=300.0) as client:
+                for name, hints in CLIENTS.items():
+                    runs = []
+                    for _ in range(args.runs):
+                        index += 1
+                        body = {**request_body("/api/listen", index, unique=True), **hints(network)}
+                        runs.append(await listen_once(client, body, args.playable_seconds))
+                    result = results.setdefault(link, {})[name] = {
+                        "format": runs[0]["format"],
+                        "bytes": statistics.median(run["bytes"] for run in runs),
+                        "playable_ms": statistics.median(run["playable_s"] for run in runs) * 1000,
+                        "complete_ms": statistics.median(run["complete_s"] for run in runs) * 1000,
+                    }
+                    print(f"{link:<3} {name:<12} {result['format']:<14} {result['bytes'] / 1024:>7.0f} KiB  "
+                          f"playable {result['playable_ms']:>6.0f} ms  complete {result['complete_ms']:>6.0f} ms")
+        finally:
+            server.close()
+    return results
+
+
+def main(args) -> None:
+    with tempfile.TemporaryDirectory(prefix="widget-formats-") as log_dir:
+        with harness(args.upstream_args.split(), {"LISTEN_PIPELINE": "false"}, log_dir) as (backend_url, _):
+            results = asyncio.run(run(backend_url, args))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump({"runs": args.runs, "playable_seconds": args.playable_seconds,
+                       "upstream_args": args.upstream_args, "results": results}, output, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--link", action="append", choices=tuple(LINKS), help="link profiles (default: all)")
+    parser.add_argument("--runs", type=int, default=3, help="requests per link and client")
+    parser.add_argument("--playable-seconds", type=float, default=2.0,
+                        help="seconds of audio buffered before playback counts as possible")
+    # 30 s of speech at 128 kbit/s, voiced faster than real time
+    parser.add_argument("--upstream-args", default="--latency 0.05 --audio-chunks 60 --audio-chunk-size 8000 "
+                                                   "--audio-chunk-delay 0.01",
+                        help="arguments for fake_upstream.py")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+    args.link = args.link or list(LINKS)
+    main(args)
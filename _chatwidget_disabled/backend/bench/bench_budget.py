@@ -0,0 +1,78 @@
+"""
+Prompt budgeting: tokens saved and time spent fitting a long product page.
+Runs budget.fit_prompt on a synthetic page with navigation, repeated blocks
+and a footer; no network or backend process is needed.
+
+Usage:
+    python bench/bench_budget.py --budget 3000 --features 400
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import budget  # noqa: E402
+
+NAVIGATION = ["Skip to main content", "Home", "Menu", "Search", "Sign in", "Cart", "Wishlist"]
+FOOTER = ["Follow us", "Newsletter", "Privacy policy", "Terms of use", "© 2024 Apex Sports. All rights reserved."]
+
+
+def build_summary_messages(text: str) -> list:
+    """Same shape as the backend's summary prompt."""
+    return [
+        {"role": "system", "content": "You provide clear, concise summaries in exactly 3 bullet points."},
+        {"role": "user", "content": f"Please summarize the following text in exactly 3 bullet points.\n\nText to summarize:\n{text}"},
+    ]
+
+
+def synthetic_page(features: int) -> str:
+    """A long product page with boilerplate around the content and repeated review blocks."""
+    lines = NAVIGATION + ["# Apex Runner", "The Apex Runner is a lightweight daily trainer."]
+    for i in range(features):
+        if i % 25 == 0:
+            lines.append(f"Section {i // 25 + 1}")
+        lines.append(
+            f"Detail {i}: the knit upper, foam midsole and rubber outsole were tested over {i + 10} km "
+            "of road and trail running. Testers reported consistent cushioning and grip."
+        )
+        if i % 10 == 0:
+            lines += ["Customers also viewed", "Add to cart"]
+    return "\n".join(NAVIGATION + lines + FOOTER)
+
+
+def main(args) -> None:
+    logging.getLogger("budget").setLevel(logging.WARNING)
+    page = synthetic_page(args.features)
+    model = args.model
+
+    started = time.perf_counter()
+    budget.get_encoder(model)
+    encoder_load = time.perf_counter() - started
+    encoder = budget.get_encoder(model)
+
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        messages, usage = budget.fit_prompt("summarize", model, build_summary_messages, page, budget=args.budget)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+
+    print(f"tokenizer: {encoder.name if encoder else 'estimate'} (first load {encoder_load * 1000:.1f} ms, then cached)")
+    print(f"page: {len(page)} chars")
+    print(f"prompt tokens: {usage['prompt_tokens_before_trim']} -> {usage['prompt_tokens_after_trim']} "
+          f"(budget {usage['prompt_budget']})")
+    print(f"fit_prompt: p50 {timings[len(timings) // 2] * 1000:.2f} ms, max {timings[-1] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--budget", type=int, default=3000, help="prompt token budget")
+    parser.add_argument("--features", type=int, default=400, help="content blocks on the page")
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,142 @@
+"""
+Round trips of the widget's requests over REST and over the /ws channel.
+Starts the fake upstream and the backend, and puts a proxy (bench/netem.py)
+in front of the backend that delays every packet by half of --rtt in each
+direction, like a mobile link. Sends the same sequence of requests, one after the other, as:
+
+    rest_preflight  a CORS preflight before every POST (the preflight cache missed)
+    rest            POST only (the browser still had the preflight cached)
+    ws              frames on one WebSocket, opened once
+
+Every request carries a distinct document, so nothing is served from a cache,
+and every mode reuses its connection the way a browser would.
+
+Usage:
+    python bench/bench_channel.py --rtt 0.1 --requests 20
+    python bench/bench_channel.py --rtt 0.3 --endpoint /api/listen --output channel.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import httpx
+import websockets
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from load import percentile, request_body  # noqa: E402
+from netem import start_proxy  # noqa: E402
+from suite import harness  # noqa: E402
+
+PREFLIGHT_HEADERS = {
+    "Origin": "https://shop.example",
+    "Access-Control-Request-Method": "POST",
+    "Access-Control-Request-Headers": "content-type",
+}
+
+
+async def rest_request(client: httpx.AsyncClient, endpoint: str, body: dict, preflight: bool) -> None:
+    if preflight:
+        response = await client.options(endpoint, headers=PREFLIGHT_HEADERS)
+        response.raise_for_status()
+    response = await client.post(endpoint, json=body, headers={"Origin": PREFLIGHT_HEADERS["Origin"]})
+    if response.status_code != 200:
+        raise RuntimeError(f"{endpoint} returned {response.status_code}: {response.text[:200]}")
+
+
+async def ws_request(websocket, request_id: str, endpoint: str, body: dict) -> None:
+    await websocket.send(json.dumps({"type": "request", "id": request_id, "op": endpoint.rsplit("/", 1)[1],
+                                     "body": body}))
+    while True:
+        message = await websocket.recv()
+        if isinstance(message, bytes):
+            chunk = len(message) - 1 - message[0]
+            await websocket.send(json.dumps({"type": "ack", "id": request_id, "bytes": chunk}))
+            continue
+        frame = json.loads(message)
+        if frame["type"] == "response" and frame["status"] != 200:
+            raise RuntimeError(f"{endpoint} returned {frame['status']}: {json.dumps(frame['body'])[:200]}")
+        if frame["type"] in ("response", "end"):
+            return
+        if frame["type"] in ("abort", "cancelled"):
+            raise RuntimeError(f"{endpoint} ended with {frame['type']}")
+
+
+async def run_mode(url: str, mode: str, endpoints: list, requests: int, first_index: int) -> dict:
+    """Latency of each request of a mode; the first includes opening the connection."""
+    latencies = []
+    started = time.perf_counter()
+    if mode == "ws":
+        async with websockets.connect(f"{url.replace('http', 'ws', 1)}/ws", max_size=None) as websocket:
+            for index in range(requests):
+                endpoint = endpoints[index % len(endpoints)]
+                sent = time.perf_counter()
+                await ws_request(websocket, str(index), endpoint, request_body(endpoint, first_index + index, True))
+                latencies.append(time.perf_counter() - sent)
+    else:
+        async with httpx.AsyncClient(base_url=url, timeout=60.0) as client:
+            for index in range(requests):
+                endpoint = endpoints[index % len(endpoints)]
+                sent = time.perf_counter()
+                await rest_request(client, endpoint, request_body(endpoint, first_index + index, True),
+                                   mode == "rest_preflight")
+                latencies.append(time.perf_counter() - sent)
+    total = time.perf_counter() - started
+    return {
+        "first_ms": latencies[0] * 1000,
+        "p50_ms": percentile(latencies[1:] or latencies, 50) * 1000,
+        "p95_ms": percentile(latencies[1:] or latencies, 95) * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "total_s": total,
+    }
+
+
+async def run(backend_url: str, args) -> dict:
+    backend_port = int(backend_url.rsplit(":", 1)[1])
+    server, proxy_port = await start_proxy(backend_port, args.rtt)
+    url = f"http://127.0.0.1:{proxy_port}"
+    results = {}
+    try:
+        # One untimed request per endpoint first, so the first mode does not pay for the backend's warmup
+        async with httpx.AsyncClient(base_url=backend_url, timeout=60.0) as client:
+            for index, endpoint in enumerate(args.endpoint):
+                await rest_request(client, endpoint, request_body(endpoint, -1 - index, True), False)
+        for offset, mode in enumerate(("rest_preflight", "rest", "ws")):
+            results[mode] = await run_mode(url, mode, args.endpoint, args.requests, offset * args.requests)
+            result = results[mode]
+            print(f"{mode:<15} first {result['first_ms']:>6.0f} ms  p50 {result['p50_ms']:>6.0f} ms  "
+                  f"p95 {result['p95_ms']:>6.0f} ms  total {result['total_s']:>5.1f} s")
+    finally:
+        server.close()
+    return results
+
+
+def main(args) -> None:
+    print(f"rtt {args.rtt * 1000:.0f} ms, {args.requests} requests: {', '.join(args.endpoint)}")
+    with tempfile.TemporaryDirectory(prefix="widget-channel-") as log_dir:
+        with harness(args.upstream_args.split(), {}, log_dir) as (backend_url, _):
+            results = asyncio.run(run(backend_url, args))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump({"rtt_s": args.rtt, "requests": args.requests, "endpoints": args.endpoint,
+                       "upstream_args": args.upstream_args, "results": results}, output, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rtt", type=float, default=0.1, help="round trip time the proxy adds, in seconds")
+    parser.add_argument("--requests", type=int, default=20, help="requests per mode")
+    parser.add_argument("--endpoint", action="append",
+                        choices=("/api/chat", "/api/summarize", "/api/details", "/api/listen"),
+                        help="endpoints to call, in rotation (default: /api/chat)")
+    parser.add_argument("--upstream-args", default="--latency 0.05", help="arguments for fake_upstream.py")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+    args.endpoint = args.endpoint or ["/api/chat"]
+    main(args)
@@ -0,0 +1,91 @@
+"""
+Stress test for /api/listen with many concurrent slow listeners.
+Each listener asks for distinct audio and reads it at a throttled rate; a
+fraction disconnects halfway. Meanwhile /health is polled to show whether
+the event loop stays responsive.
+
+Usage (with bench/fake_upstream.py and the backend running):
+    python bench/bench_listeners.py --listeners 200 --read-delay 0.05 --disconnect-ratio 0.25
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from load import SAMPLE_TEXT, percentile  # noqa: E402
+
+
+async def listener(client: httpx.AsyncClient, index: int, read_delay: float, disconnect: bool) -> tuple:
+    """Read one listen stream slowly; return (outcome, bytes received)."""
+    received = 0
+    chunks = 0
+    body = {"message": f"{SAMPLE_TEXT} Listener {index}."}
+    try:
+        async with client.stream("POST", "/api/listen", json=body) as response:
+            if response.status_code != 200:
+                return "error", 0
+            async for chunk in response.aiter_bytes(4096):
+                received += len(chunk)
+                chunks += 1
+                if disconnect and chunks == 3:
+                    return "disconnected", received
+                await asyncio.sleep(read_delay)
+    except httpx.HTTPError:
+        return "error", received
+    return "completed", received
+
+
+async def probe_health(client: httpx.AsyncClient, stop: asyncio.Event, samples: list) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get("/health")
+        samples.append(time.perf_counter() - started)
+        await asyncio.sleep(0.05)
+
+
+async def main(args) -> None:
+    limits = httpx.Limits(max_connections=args.listeners + 10)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=120.0) as client, \
+            httpx.AsyncClient(base_url=args.url, timeout=10.0) as probe_client:
+        stop = asyncio.Event()
+        health = []
+        probe = asyncio.create_task(probe_health(probe_client, stop, health))
+
+        started = time.perf_counter()
+        disconnect_every = int(1 / args.disconnect_ratio) if args.disconnect_ratio else 0
+        results = await asyncio.gather(*(
+            listener(client, i, args.read_delay, bool(disconnect_every) and i % disconnect_every == 0)
+            for i in range(args.listeners)
+        ))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probe
+
+        upstream = (await probe_client.get(f"{args.upstream}/stats")).json() if args.upstream else {}
+
+    outcomes = {}
+    for outcome, _ in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    total_bytes = sum(received for _, received in results)
+    print(f"{args.listeners} listeners in {elapsed:.1f}s: {outcomes}, {total_bytes / 1e6:.1f} MB delivered")
+    print(f"/health during load: p50 {percentile(health, 50) * 1000:.0f} ms, "
+          f"p99 {percentile(health, 99) * 1000:.0f} ms, max {max(health) * 1000:.0f} ms")
+    if upstream:
+        print(f"upstream TTS streams: {upstream}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--upstream", default="http://127.0.0.1:9000", help="fake upstream, for stream counters")
+    parser.add_argument("--listeners", type=int, default=200)
+    parser.add_argument("--read-delay", type=float, default=0.05, help="seconds between chunk reads")
+    parser.add_argument("--disconnect-ratio", type=float, default=0.25)
+    args = parser.parse_args()
+    asyncio.run(main(args))
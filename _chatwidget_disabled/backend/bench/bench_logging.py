@@ -0,0 +1,130 @@
+"""
+Logging overhead per request: synchronous FileHandler vs the queued JSON pipeline.
+Emits the six log lines a summarize request writes and times them on the
+calling thread (the event loop, in the backend), first through the old
+basicConfig setup with eager f-strings, then through logging_setup with lazy
+formatting, with and without INFO sampling. Logs go to a temporary directory
+and the console output to /dev/null; no backend process is needed.
+--stall-every/--stall-ms simulate a disk that occasionally blocks on write.
+
+Usage:
+    python bench/bench_logging.py --requests 20000
+    python bench/bench_logging.py --requests 20000 --stall-every 500 --stall-ms 20
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s"
+MESSAGE = "Running shoes need a responsive midsole and a breathable upper. " * 20
+
+
+def eager_request(logger: logging.Logger, request_id: str) -> None:
+    """The log lines of one summarize request, formatted the way main.py used to."""
+    logger.info(f"[{request_id}] POST /api/summarize - Request started")
+    logger.info(f"Summarize request - Model: gpt-3.5-turbo, Content length: {len(MESSAGE)} chars, Page: None")
+    logger.info(f"Sending summarization request to OpenAI - Model: gpt-3.5-turbo")
+    logger.info(f"Summary generated - Processing time: {0.512:.3f}s, Tokens used: {412}, Bullet points found: {3}")
+    logger.info(f"Summarize request successful - Processing time: {0.514:.3f}s")
+    logger.info(f"[{request_id}] POST /api/summarize - Status: {200} - Time: {0.515:.3f}s")
+
+
+def lazy_request(logger: logging.Logger, request_id: str) -> None:
+    """The same lines with lazy %-formatting and structured fields, as main.py writes them now."""
+    logger.info("%s %s - Request started", "POST", "/api/summarize",
+                extra={"method": "POST", "path": "/api/summarize"})
+    logger.info("Summarize request - Model: %s, Content length: %s chars, Page: %s",
+                "gpt-3.5-turbo", len(MESSAGE), None)
+    logger.info("Sending summarization request to OpenAI - Model: %s", "gpt-3.5-turbo")
+    logger.info("Summary generated - Processing time: %.3fs, Tokens used: %s, Bullet points found: %s", 0.512, 412, 3)
+    logger.info("Summarize request successful - Processing time: %.3fs", 0.514)
+    logger.info("%s %s - Status: %s - Time: %.3fs", "POST", "/api/summarize", 200, 0.515,
+                extra={"method": "POST", "path": "/api/summarize", "status": 200, "duration_ms": 515.0})
+
+
+def run(name: str, emit, logger: logging.Logger, requests: int, bind=None, drain=None) -> None:
+    timings = []
+    started = time.perf_counter()
+    for i in range(requests):
+        request_id = f"{i:08x}"
+        request_started = time.perf_counter()
+        if bind:
+            bind(request_id)
+        emit(logger, request_id)
+        timings.append(time.perf_counter() - request_started)
+    caller_total = time.perf_counter() - started
+    if drain:
+        drain()
+    total = time.perf_counter() - started
+
+    timings.sort()
+    p99 = timings[int(len(timings) * 0.99)]
+    print(f"{name:<38} mean {statistics.mean(timings) * 1e6:7.1f} us   p99 {p99 * 1e6:7.1f} us   "
+          f"caller {caller_total:5.2f}s   until written {total:5.2f}s")
+
+
+def wait_until_written(log_handler) -> None:
+    while not log_handler.queue.empty():
+        time.sleep(0.001)
+
+
+def add_disk_stalls(every: int, stall_ms: float) -> None:
+    """Make one in every `every` log file flushes block for stall_ms."""
+    flush = logging.FileHandler.flush
+    calls = [0]
+
+    def stalling_flush(self):
+        calls[0] += 1
+        if calls[0] % every == 0:
+            time.sleep(stall_ms / 1000)
+        flush(self)
+
+    logging.FileHandler.flush = stalling_flush
+
+
+def main(args) -> None:
+    if args.stall_every:
+        add_disk_stalls(args.stall_every, args.stall_ms)
+    directory = tempfile.mkdtemp(prefix="bench_logging_")
+    sys.stderr = open(os.devnull, "w")
+    root = logging.getLogger()
+    logger = logging.getLogger("main")
+
+    # Before: basicConfig with a FileHandler and a StreamHandler, written on the calling thread
+    root.setLevel(logging.INFO)
+    for handler in (logging.StreamHandler(), logging.FileHandler(os.path.join(directory, "sync.log"))):
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        root.addHandler(handler)
+    run("FileHandler, eager f-strings", eager_request, logger, args.requests)
+    for handler in list(root.handlers):
+        handler.close()
+        root.removeHandler(handler)
+
+    # After: queued pipeline, JSON written by a background thread
+    os.environ["LOG_FILE"] = os.path.join(directory, "queued.log")
+    os.environ["LOG_QUEUE_SIZE"] = str(args.requests * 6)
+    import logging_setup
+
+    log_handler = logging_setup.setup_logging()
+    run("Queue + JSON, lazy", lazy_request, logger, args.requests,
+        bind=logging_setup.bind_request, drain=lambda: wait_until_written(log_handler))
+    logging_setup.LOG_INFO_SAMPLE_RATE = args.sample_rate
+    run(f"Queue + JSON, lazy, {args.sample_rate:.0%} INFO sampled", lazy_request, logger, args.requests,
+        bind=logging_setup.bind_request, drain=lambda: wait_until_written(log_handler))
+    print(f"Dropped records: {log_handler.dropped}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--sample-rate", type=float, default=0.1, help="LOG_INFO_SAMPLE_RATE for the sampled run")
+    parser.add_argument("--stall-every", type=int, default=0, help="block one in this many log file flushes")
+    parser.add_argument("--stall-ms", type=float, default=20.0, help="length of each simulated disk stall")
+    main(parser.parse_args())
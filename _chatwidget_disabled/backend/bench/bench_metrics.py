@@ -0,0 +1,117 @@
+"""
+Metrics overhead: cost of recording and scraping the backend's Prometheus metrics.
+Times the primitive updates, the per-request middleware (against a bare ASGI
+app, so only the instrumentation is measured) and rendering /metrics with a
+realistic number of series; no network or backend process is needed.
+
+Usage:
+    python bench/bench_metrics.py --iterations 200000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from metrics import Registry, RequestMetricsMiddleware  # noqa: E402
+
+ROUTES = ["/api/chat", "/api/summarize", "/api/details", "/api/listen", "/api/pages", "/health", "/metrics"]
+MODELS = ["gpt-3.5-turbo", "gpt-4o-mini", "gpt-4o"]
+
+
+def per_op_ns(fn, iterations: int) -> float:
+    """Best of three runs of fn(iterations), in nanoseconds per call."""
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        fn(iterations)
+        best = min(best, time.perf_counter() - started)
+    return best / iterations * 1e9
+
+
+async def bare_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def serve(app, iterations: int) -> None:
+    scope = {"type": "http", "method": "POST", "path": "/api/chat"}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    for _ in range(iterations):
+        await app(scope, receive, send)
+
+
+def request_ns(app, iterations: int) -> float:
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        asyncio.run(serve(app, iterations))
+        best = min(best, time.perf_counter() - started)
+    return best / iterations * 1e9
+
+
+def main(args) -> None:
+    registry = Registry()
+    counter = registry.counter("bench_tokens", "Tokens.", ("endpoint", "model", "kind"))
+    histogram = registry.histogram("bench_seconds", "Latency.", ("method", "route", "status"))
+    gauge = registry.gauge("bench_in_flight", "In flight.")
+
+    def counter_inc(n):
+        for _ in range(n):
+            counter.inc("chat", "gpt-3.5-turbo", "prompt", amount=120)
+
+    def histogram_observe(n):
+        for _ in range(n):
+            histogram.observe(0.42, "POST", "/api/chat", "200")
+
+    def gauge_inc_dec(n):
+        for _ in range(n):
+            gauge.inc()
+            gauge.dec()
+
+    def baseline(n):
+        for _ in range(n):
+            pass
+
+    loop_ns = per_op_ns(baseline, args.iterations)
+    print(f"{'Counter.inc':<34} {per_op_ns(counter_inc, args.iterations) - loop_ns:8.0f} ns")
+    print(f"{'Histogram.observe':<34} {per_op_ns(histogram_observe, args.iterations) - loop_ns:8.0f} ns")
+    print(f"{'Gauge.inc + Gauge.dec':<34} {per_op_ns(gauge_inc_dec, args.iterations) - loop_ns:8.0f} ns")
+
+    requests = args.iterations // 10
+    instrumented = RequestMetricsMiddleware(bare_app, registry.histogram("bench_http", "HTTP.", ("method", "route", "status")),
+                                            registry.gauge("bench_http_in_flight", "HTTP in flight."))
+    bare = request_ns(bare_app, requests)
+    wrapped = request_ns(instrumented, requests)
+    print(f"{'Request through bare ASGI app':<34} {bare:8.0f} ns")
+    print(f"{'Request through metrics middleware':<34} {wrapped:8.0f} ns  (+{wrapped - bare:.0f} ns)")
+
+    # A busy production process: every route x status, every endpoint x model
+    for route in ROUTES:
+        for status in ("200", "400", "404", "429", "500"):
+            histogram.observe(0.1, "POST", route, status)
+    for endpoint in ("chat", "summarize", "details", "listen"):
+        for model in MODELS:
+            for kind in ("prompt", "completion"):
+                counter.inc(endpoint, model, kind)
+    started = time.perf_counter()
+    for _ in range(args.scrapes):
+        body = registry.render()
+    render_ms = (time.perf_counter() - started) / args.scrapes * 1000
+    print(f"{'Render /metrics':<34} {render_ms:8.2f} ms  ({len(body.splitlines())} lines, {len(body)} bytes)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--iterations", type=int, default=200000, help="updates per primitive timing run")
+    parser.add_argument("--scrapes", type=int, default=200, help="renders to average over")
+    main(parser.parse_args())
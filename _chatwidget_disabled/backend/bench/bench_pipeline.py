@@ -0,0 +1,75 @@
+"""
+Time-to-first-audio-byte: sequential vs pipelined summary-to-speech.
+Runs the speech pipeline against mocked LLM and TTS upstreams with
+configurable latency; no network or backend process is needed.
+
+Usage:
+    python bench/bench_pipeline.py --llm-first-token 0.4 --tokens-per-sec 40 --tts-first-byte 0.3
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from speech_pipeline import pipelined_speech, split_segments  # noqa: E402
+
+SUMMARY = (
+    "• The Apex Runner is a lightweight daily trainer with a responsive foam midsole.\n"
+    "• Its breathable knit upper and reinforced heel keep long runs cool and stable.\n"
+    "• Reviewers love the comfort but say the sizing runs about half a size small."
+)
+
+
+async def mock_llm(first_token: float, tokens_per_sec: float):
+    """Stream the summary word by word like a chat completion."""
+    await asyncio.sleep(first_token)
+    for word in SUMMARY.split(" "):
+        yield word + " "
+        await asyncio.sleep(1 / tokens_per_sec)
+
+
+async def mock_tts(text: str, first_byte: float, chars_per_sec: float, chunk_size: int = 4096):
+    """Stream fake audio for text: one chunk per 50 characters of input."""
+    await asyncio.sleep(first_byte)
+    for _ in range(max(1, len(text) // 50)):
+        yield b"\x00" * chunk_size
+        await asyncio.sleep(50 / chars_per_sec)
+
+
+async def sequential(args) -> tuple:
+    started = time.perf_counter()
+    text = "".join([delta async for delta in mock_llm(args.llm_first_token, args.tokens_per_sec)])
+    first = None
+    async for _ in mock_tts(text, args.tts_first_byte, args.tts_chars_per_sec):
+        first = first or time.perf_counter() - started
+    return first, time.perf_counter() - started
+
+
+async def pipelined(args) -> tuple:
+    started = time.perf_counter()
+    first = None
+    async for _ in pipelined_speech(
+        split_segments(mock_llm(args.llm_first_token, args.tokens_per_sec)),
+        lambda segment, previous: mock_tts(segment, args.tts_first_byte, args.tts_chars_per_sec),
+        max_parallel=args.parallel,
+    ):
+        first = first or time.perf_counter() - started
+    return first, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--llm-first-token", type=float, default=0.4, help="seconds to first summary token")
+    parser.add_argument("--tokens-per-sec", type=float, default=40.0, help="summary streaming rate")
+    parser.add_argument("--tts-first-byte", type=float, default=0.3, help="seconds to first audio byte per TTS call")
+    parser.add_argument("--tts-chars-per-sec", type=float, default=400.0, help="TTS streaming rate")
+    parser.add_argument("--parallel", type=int, default=2, help="segments synthesized or buffered at once")
+    args = parser.parse_args()
+
+    for name, run in (("sequential", sequential), ("pipelined", pipelined)):
+        first, total = asyncio.run(run(args))
+        print(f"{name:>10}: first audio byte {first * 1000:6.0f} ms, complete {total * 1000:6.0f} ms")
@@ -0,0 +1,139 @@
+"""
+Time from a Summarize (or Listen) click to its answer, with and without the
+widget prefetching the page when it loads.
+Starts the backend against bench/fake_upstream.py and simulates page views at
+a fixed rate (open loop). Each view is a distinct page. A view that
+prefetches sends /api/prefetch as the page loads. --click-rate of the views
+then click after a think time, taken in turn from --think. The others never
+click, so their prefetches are wasted.
+
+It runs three times:
+
+    off        no prefetch; every click starts the work
+    prefetch   prefetch with no budget
+    budgeted   prefetch with PREFETCH_SITE_PER_MINUTE=--site-budget
+
+After the views, it waits PREFETCH_TTL so unclaimed prefetches expire. It
+then reads the prefetch counters from /cache/stats and the upstream calls made
+from the fake upstream.
+
+Usage:
+    python bench/bench_prefetch.py
+    python bench/bench_prefetch.py --endpoint /api/listen --views 60 --output prefetch.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from load import OPS_HEADERS, percentile, request_body  # noqa: E402
+from suite import harness  # noqa: E402
+
+HEADERS = {"Origin": "https://shop.example"}
+
+
+async def view(client: httpx.AsyncClient, args, index: int, prefetch: bool, think: float, clicks: bool,
+               latencies: dict, statuses: dict) -> None:
+    """One page view: prefetch on load, then maybe a click after think seconds."""
+    body = request_body(args.endpoint, index, unique=True)
+    if prefetch:
+        response = await client.post("/api/prefetch", json={**body, "audio": args.endpoint == "/api/listen"},
+                                     headers=HEADERS)
+        status = response.json()["data"]["status"] if response.status_code == 202 else str(response.status_code)
+        statuses[status] = statuses.get(status, 0) + 1
+    if not clicks:
+        return
+    await asyncio.sleep(think)
+    started = time.perf_counter()
+    # The widget reads the whole body: the summary, or the audio into a blob
+    response = await client.post(args.endpoint, json=body, headers=HEADERS)
+    if response.status_code != 200:
+        raise RuntimeError(f"{args.endpoint} returned {response.status_code}: {response.text[:200]}")
+    latencies.setdefault(think, []).append(time.perf_counter() - started)
+
+
+async def run(backend_url: str, upstream_url: str, args, prefetch: bool, first_index: int) -> dict:
+    latencies, statuses = {}, {}
+    rng = random.Random(args.seed)
+    async with httpx.AsyncClient(base_url=backend_url, timeout=120.0) as client:
+        started = time.perf_counter()
+        tasks = []
+        for index in range(args.views):
+            delay = started + index / args.rps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            think = args.think[index % len(args.think)]
+            tasks.append(asyncio.ensure_future(view(
+                client, args, first_index + index, prefetch, think, rng.random() < args.click_rate,
+                latencies, statuses
+            )))
+        await asyncio.gather(*tasks)
+        # Let the prefetches nobody clicked on expire
+        await asyncio.sleep(args.ttl + 1.0)
+        counters = (await client.get("/cache/stats", headers=OPS_HEADERS)).json()["prefetch"]
+    async with httpx.AsyncClient(base_url=upstream_url) as upstream:
+        upstream_stats = (await upstream.get("/stats")).json()
+    clicks = [seconds for values in latencies.values() for seconds in values]
+    return {
+        "clicks": len(clicks),
+        "p50_ms": percentile(clicks, 50) * 1000,
+        "p95_ms": percentile(clicks, 95) * 1000,
+        "by_think_p50_ms": {str(think): percentile(values, 50) * 1000 for think, values in sorted(latencies.items())},
+        "prefetch_statuses": statuses,
+        "prefetch": counters,
+        "completions": upstream_stats["completions"]["accepted"],
+        "tts_calls": upstream_stats["started"],
+    }
+
+
+def main(args) -> None:
+    runs = {
+        "off": ({"PREFETCH": "false"}, False),
+        "prefetch": ({"PREFETCH_SITE_PER_MINUTE": "0", "PREFETCH_PER_MINUTE": "0"}, True),
+        "budgeted": ({"PREFETCH_SITE_PER_MINUTE": str(args.site_budget), "PREFETCH_PER_MINUTE": "0"}, True),
+    }
+    results = {"views": args.views, "rps": args.rps, "click_rate": args.click_rate, "think": args.think,
+               "endpoint": args.endpoint, "runs": {}}
+    for offset, (label, (env, prefetch)) in enumerate(runs.items()):
+        with tempfile.TemporaryDirectory(prefix="widget-prefetch-") as log_dir:
+            with harness(args.upstream_args.split(), {**env, "PREFETCH_TTL": str(args.ttl)}, log_dir) \
+                    as (backend_url, upstream_url):
+                result = results["runs"][label] = asyncio.run(
+                    run(backend_url, upstream_url, args, prefetch, offset * 10 ** 6)
+                )
+        by_think = "  ".join(f"{think}s {ms:.0f} ms" for think, ms in result["by_think_p50_ms"].items())
+        print(f"{label:<9} clicks {result['clicks']:>3}  p50 {result['p50_ms']:>6.0f} ms  "
+              f"p95 {result['p95_ms']:>6.0f} ms  by think time: {by_think}")
+        print(f"          prefetch {result['prefetch_statuses']}  hits {result['prefetch']['hits']}  "
+              f"wasted {result['prefetch']['wasted']}  completions {result['completions']}  "
+              f"tts calls {result['tts_calls']}")
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", choices=("/api/summarize", "/api/listen"), default="/api/summarize")
+    parser.add_argument("--views", type=int, default=40, help="page views per run")
+    parser.add_argument("--rps", type=float, default=4.0, help="page views per second")
+    parser.add_argument("--click-rate", type=float, default=0.6, help="share of views that click")
+    parser.add_argument("--think", type=float, action="append",
+                        help="seconds from page load to click, used in turn (default: 0.5, 1.5 and 5)")
+    parser.add_argument("--site-budget", type=float, default=15.0, help="PREFETCH_SITE_PER_MINUTE of the budgeted run")
+    parser.add_argument("--ttl", type=float, default=8.0, help="PREFETCH_TTL")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the click choices")
+    parser.add_argument("--upstream-args", default="--latency 1.5", help="arguments for fake_upstream.py")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+    args.think = args.think or [0.5, 1.5, 5.0]
+    main(args)
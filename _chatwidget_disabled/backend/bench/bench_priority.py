@@ -0,0 +1,151 @@
+"""
+Interactive latency while background work saturates the upstream.
+Starts the backend against bench/fake_upstream.py with a small OpenAI
+concurrency limit, then sends interactive /api/chat requests at a fixed rate
+(open loop) three times: alone, next to a closed loop of background
+summaries that keeps every slot busy, and next to the same background load
+with UPSTREAM_SCHEDULING=false, where calls take slots first come, first
+served. Background requests are one-document /api/summarize/batch calls,
+which the backend schedules as background work; every request carries a
+distinct document, so nothing is served from a cache.
+
+Usage:
+    python bench/bench_priority.py --duration 20
+    python bench/bench_priority.py --slots 8 --background 64 --rps 4 --output priority.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from load import OPS_HEADERS, SAMPLE_TEXT, percentile, request_body  # noqa: E402
+from suite import harness  # noqa: E402
+
+INGEST_HEADERS = {"Authorization": "Bearer bench"}
+
+
+async def interactive_load(client: httpx.AsyncClient, rps: float, duration: float, first_index: int) -> dict:
+    """Chat requests at rps for duration seconds; latency of each, whatever the others are doing."""
+    latencies, statuses = [], {}
+
+    async def one(index: int) -> None:
+        started = time.perf_counter()
+        try:
+            response = await client.post("/api/chat", json=request_body("/api/chat", index, unique=True))
+            status = str(response.status_code)
+        except httpx.HTTPError:
+            status = "transport_error"
+        statuses[status] = statuses.get(status, 0) + 1
+        if status == "200":
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    tasks = []
+    for index in range(int(rps * duration)):
+        delay = started + index / rps - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(one(first_index + index)))
+    await asyncio.gather(*tasks)
+    return {
+        "requests": len(latencies),
+        "statuses": statuses,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def background_load(client: httpx.AsyncClient, concurrency: int, stop: asyncio.Event, first_index: int) -> dict:
+    """Background summaries from `concurrency` workers until stop is set."""
+    counter = iter(range(first_index, 1 << 62))
+    done, statuses = 0, {}
+
+    async def worker():
+        nonlocal done
+        while not stop.is_set():
+            index = next(counter)
+            body = {"documents": [{"id": str(index), "text": f"Document {index}. {SAMPLE_TEXT}"}], "max_parallel": 1}
+            try:
+                status = str((await client.post("/api/summarize/batch", json=body, headers=INGEST_HEADERS)).status_code)
+            except httpx.HTTPError:
+                status = "transport_error"
+            statuses[status] = statuses.get(status, 0) + 1
+            done += status == "200"
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {"completed": done, "per_s": done / (time.perf_counter() - started), "statuses": statuses}
+
+
+def scheduler_counters(client: httpx.Client) -> dict:
+    counters = {}
+    for line in client.get("/metrics", headers=OPS_HEADERS).text.splitlines():
+        if line.startswith(("widget_upstream_preempted", "widget_upstream_dropped")) and 'upstream="openai"' in line:
+            name, value = line.rsplit(" ", 1)
+            counters[name] = float(value)
+    return counters
+
+
+async def run_phase(url: str, args, background: bool, first_index: int) -> dict:
+    limits = httpx.Limits(max_connections=args.background + 200, max_keepalive_connections=args.background + 50)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=120.0) as client:
+        stop = asyncio.Event()
+        background_task = None
+        if background:
+            background_task = asyncio.ensure_future(background_load(client, args.background, stop, first_index + 10 ** 6))
+            await asyncio.sleep(args.warmup)  # Let the background work fill every slot first
+        result = {"interactive": await interactive_load(client, args.rps, args.duration, first_index)}
+        if background_task is not None:
+            stop.set()
+            result["background"] = await background_task
+    return result
+
+
+def main(args) -> None:
+    upstream_args = args.upstream_args.split()
+    backend_env = {"OPENAI_MAX_CONCURRENCY": str(args.slots), "ADMISSION_UPSTREAM_RATE": str(args.admission_rate),
+                   "INGEST_API_TOKEN": "bench"}
+    phases = (("alone", True, False), ("background", True, True), ("background_fifo", False, True))
+    results = {"slots": args.slots, "rps": args.rps, "background_concurrency": args.background,
+               "upstream_args": args.upstream_args, "phases": {}}
+    for offset, (label, scheduling, background) in enumerate(phases):
+        env = {**backend_env, "UPSTREAM_SCHEDULING": "true" if scheduling else "false"}
+        with tempfile.TemporaryDirectory(prefix="widget-priority-") as log_dir:
+            with harness(upstream_args, env, log_dir) as (backend_url, _):
+                phase = asyncio.run(run_phase(backend_url, args, background, offset * 10 ** 7))
+                with httpx.Client(base_url=backend_url) as client:
+                    phase["scheduler"] = scheduler_counters(client)
+        results["phases"][label] = phase
+        interactive = phase["interactive"]
+        line = (f"{label:<16} chat p50 {interactive['p50_ms']:>6.0f} ms  p95 {interactive['p95_ms']:>6.0f} ms  "
+                f"p99 {interactive['p99_ms']:>6.0f} ms  statuses {interactive['statuses']}")
+        if background:
+            line += f"\n{'':<16} background {phase['background']['per_s']:.1f}/s {phase['background']['statuses']}"
+        print(line)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slots", type=int, default=16, help="OPENAI_MAX_CONCURRENCY of the backend")
+    parser.add_argument("--background", type=int, default=64, help="concurrent background requests")
+    parser.add_argument("--rps", type=float, default=4.0, help="interactive chat requests per second")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of interactive load per phase")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds of background load before measuring")
+    parser.add_argument("--admission-rate", type=float, default=0.0,
+                        help="ADMISSION_UPSTREAM_RATE of the backend; 0 leaves only the slots to share")
+    parser.add_argument("--upstream-args", default="--latency 0.5", help="arguments for fake_upstream.py")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    main(parser.parse_args())
@@ -0,0 +1,90 @@
+"""
+Error rate and tail latency of OpenAI calls against an unreliable upstream.
+Sends distinct chat messages (so nothing is cached or coalesced) from a fixed
+number of concurrent clients and reports client-visible errors, latency
+percentiles and fallback answers, plus the backend's retry, hedge and circuit
+breaker counters from /metrics. Run it against fake_upstream.py with its
+fault options and compare backend settings.
+
+Usage:
+    python bench/fake_upstream.py --port 9000 --latency 0.2 --completion-error-rate 0.05
+    python bench/fake_upstream.py --port 9000 --latency 0.2 --slow-rate 0.03 --slow-latency 3
+    python bench/fake_upstream.py --port 9000 --latency 0.2 --fail-model gpt-4o
+    ADMISSION_CLIENT_RATE=0 OPS_API_TOKEN=bench uvicorn main:app --port 8000
+    python bench/bench_resilience.py --concurrency 20 --duration 20 [--endpoint /api/details --model gpt-4o]
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from load import OPS_HEADERS, SAMPLE_TEXT, percentile  # noqa: E402
+
+REPORTED_METRICS = ("widget_upstream_retries_total", "widget_hedged_requests_total",
+                    "widget_circuit_opened_total", "widget_circuit_rejected_total", "widget_fallbacks_total")
+
+
+async def main(args) -> None:
+    statuses = Counter()
+    latencies = []
+    ok_latencies = []
+    fallback_answers = 0
+    counter = itertools.count()
+    deadline = time.perf_counter() + args.duration
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=120.0) as client:
+        async def worker():
+            nonlocal fallback_answers
+            while time.perf_counter() < deadline:
+                body = {"message": f"Request {next(counter)}. {SAMPLE_TEXT}"}
+                if args.model:
+                    body["model"] = args.model
+                started = time.perf_counter()
+                try:
+                    response = await client.post(args.endpoint, json=body)
+                except httpx.HTTPError:
+                    statuses["transport error"] += 1
+                    continue
+                elapsed = time.perf_counter() - started
+                statuses[response.status_code] += 1
+                latencies.append(elapsed)
+                if response.status_code == 200:
+                    ok_latencies.append(elapsed)
+                    if response.json()["data"].get("fallback"):
+                        fallback_answers += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        metrics_text = (await client.get("/metrics", headers=OPS_HEADERS)).text
+
+    total = sum(statuses.values())
+    errors = total - statuses[200]
+    print(f"{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s), statuses {dict(statuses)}")
+    print(f"Errors: {errors} ({errors / max(total, 1):.2%}), fallback answers: {fallback_answers}")
+    print(f"All requests: p50 {percentile(latencies, 50) * 1000:.0f} ms, p95 {percentile(latencies, 95) * 1000:.0f} ms, "
+          f"p99 {percentile(latencies, 99) * 1000:.0f} ms")
+    print(f"Successful:   p50 {percentile(ok_latencies, 50) * 1000:.0f} ms, p95 {percentile(ok_latencies, 95) * 1000:.0f} ms, "
+          f"p99 {percentile(ok_latencies, 99) * 1000:.0f} ms")
+    for line in metrics_text.splitlines():
+        if line.startswith(REPORTED_METRICS):
+            print(f"  {line}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoint", default="/api/chat")
+    parser.add_argument("--model", help="model to request; the endpoint's default when omitted")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=20.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,141 @@
+"""
+Chat latency while the preferred model degrades, with and without model routing.
+Starts the backend against bench/fake_upstream.py with two models, and sends
+chat requests at a fixed rate (open loop) through five phases, changing the
+fake upstream's settings between them:
+
+    healthy     both models answer in --latency
+    slow        the preferred model takes --slow-latency
+    recovered   back to normal
+    failing     the preferred model fails --error-rate of its calls
+    recovered2  back to normal
+
+It runs twice: with MODEL_ROUTING=true, where requests name no model and the
+router picks one, and with routing off, where requests name the preferred
+model and only fall back to the other after retries fail. Every request
+carries a distinct document, so nothing is served from a cache. The model and
+reason of every answer are read from its usage report.
+
+Usage:
+    python bench/bench_router.py
+    python bench/bench_router.py --phase-seconds 15 --rps 8 --output router.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from load import percentile, request_body  # noqa: E402
+from suite import harness  # noqa: E402
+
+PREFERRED, OTHER = "gpt-4o-mini", "gpt-3.5-turbo"
+
+
+def phases(args) -> list:
+    """(name, fake upstream settings) for each phase, in order."""
+    return [
+        ("healthy", {"model_latency": {}, "model_error_rate": {}}),
+        ("slow", {"model_latency": {PREFERRED: args.slow_latency}}),
+        ("recovered", {"model_latency": {}}),
+        ("failing", {"model_error_rate": {PREFERRED: args.error_rate}}),
+        ("recovered2", {"model_error_rate": {}}),
+    ]
+
+
+async def run_phase(client: httpx.AsyncClient, args, routed: bool, first_index: int) -> dict:
+    """Chat requests at args.rps for args.phase_seconds; latency, status, model and route of each."""
+    latencies, statuses, models, reasons, max_tokens = [], {}, {}, {}, []
+
+    async def one(index: int) -> None:
+        body = request_body("/api/chat", index, unique=True)
+        if not routed:
+            body["model"] = PREFERRED
+        started = time.perf_counter()
+        try:
+            response = await client.post("/api/chat", json=body)
+            status = str(response.status_code)
+        except httpx.HTTPError:
+            status = "transport_error"
+        statuses[status] = statuses.get(status, 0) + 1
+        if status != "200":
+            return
+        latencies.append(time.perf_counter() - started)
+        data = response.json()["data"]
+        route = data["usage"]["route"]
+        models[data["model"]] = models.get(data["model"], 0) + 1
+        reasons[route["reason"]] = reasons.get(route["reason"], 0) + 1
+        max_tokens.append(route["max_tokens"])
+
+    started = time.perf_counter()
+    tasks = []
+    for index in range(int(args.rps * args.phase_seconds)):
+        delay = started + index / args.rps - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(one(first_index + index)))
+    await asyncio.gather(*tasks)
+    return {
+        "statuses": statuses,
+        "models": models,
+        "reasons": reasons,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "max_tokens": max(max_tokens) if max_tokens else None,
+    }
+
+
+async def run(backend_url: str, upstream_url: str, args, routed: bool) -> dict:
+    results = {}
+    async with httpx.AsyncClient(base_url=backend_url, timeout=60.0) as client, \
+            httpx.AsyncClient(base_url=upstream_url) as upstream:
+        for offset, (name, settings) in enumerate(phases(args)):
+            (await upstream.post("/settings", json=settings)).raise_for_status()
+            result = results[name] = await run_phase(client, args, routed, offset * 10 ** 6)
+            print(f"  {name:<11} p50 {result['p50_ms']:>6.0f} ms  p95 {result['p95_ms']:>6.0f} ms  "
+                  f"models {result['models']}  reasons {result['reasons']}  statuses {result['statuses']}  "
+                  f"max_tokens {result['max_tokens']}")
+        results["fake_upstream"] = (await upstream.get("/stats")).json()["completions"]
+    return results
+
+
+def main(args) -> None:
+    upstream_args = ["--latency", str(args.latency), *args.upstream_args.split()]
+    backend_env = {
+        "ROUTER_MODELS_CHAT": f"{PREFERRED},{OTHER}",
+        "FALLBACK_MODEL_CHAT": OTHER,
+        "ROUTER_LATENCY_TARGETS": f"chat={args.latency_target}",
+        "ROUTER_PROBE_INTERVAL": str(args.probe_interval),
+    }
+    results = {"rps": args.rps, "phase_seconds": args.phase_seconds, "latency": args.latency,
+               "slow_latency": args.slow_latency, "error_rate": args.error_rate, "runs": {}}
+    for label, routed in (("routed", True), ("requested", False)):
+        print(f"{label}:")
+        env = {**backend_env, "MODEL_ROUTING": "true" if routed else "false"}
+        with tempfile.TemporaryDirectory(prefix="widget-router-") as log_dir:
+            with harness(upstream_args, env, log_dir) as (backend_url, upstream_url):
+                results["runs"][label] = asyncio.run(run(backend_url, upstream_url, args, routed))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rps", type=float, default=5.0, help="chat requests per second")
+    parser.add_argument("--phase-seconds", type=float, default=10.0, help="seconds of load per phase")
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds per completion of a healthy model")
+    parser.add_argument("--slow-latency", type=float, default=3.0, help="seconds per completion of the slow model")
+    parser.add_argument("--error-rate", type=float, default=0.5, help="share of the failing model's calls that fail")
+    parser.add_argument("--latency-target", type=float, default=1.5, help="ROUTER_LATENCY_TARGETS for chat")
+    parser.add_argument("--probe-interval", type=float, default=3.0, help="ROUTER_PROBE_INTERVAL")
+    parser.add_argument("--upstream-args", default="", help="more arguments for fake_upstream.py")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    main(parser.parse_args())
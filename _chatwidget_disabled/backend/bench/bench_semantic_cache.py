@@ -0,0 +1,102 @@
+"""
+Semantic cache quality and lookup cost, in-process.
+Caches one answer per question group, then asks every paraphrase in the
+group (should hit the group's answer) and a set of different questions about
+the same product (should miss). Reports hits, wrong hits and misses for a few
+thresholds, then the embed + lookup time against a full page index.
+
+Usage:
+    python bench/bench_semantic_cache.py --lookups 20000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from semantic_cache import SemanticCache, make_scope  # noqa: E402
+
+# First question of each group is cached; the rest are how other shoppers ask it
+GROUPS = (
+    ("Do these run small?", "does the sizing run small", "Do they run small?", "do these shoes run small"),
+    ("Are these waterproof?", "is it waterproof", "are they water proof?"),
+    ("How long does shipping take?", "how long does delivery take", "how long is shipping"),
+    ("Can I return these?", "can these be returned?", "can i return them"),
+    ("Is it machine washable?", "can it be machine washed", "is this machine washable?"),
+    ("What colours does it come in?", "what colors does it come in", "which colours does it come in?"),
+)
+# Close in wording, different in meaning: any hit is a false hit
+DIFFERENT = (
+    "Do these run large?",
+    "Is it not waterproof?",
+    "How much does shipping cost?",
+    "What is the return window?",
+    "Is it dishwasher safe?",
+    "Does it come in red?",
+    "How long does the battery last?",
+    "Do you ship to Canada?",
+)
+
+
+def quality(threshold: float) -> dict:
+    cache = SemanticCache(threshold=threshold, audit_rate=0)
+    scope = make_scope("gpt-3.5-turbo", "Trail running shoe product page")
+    for index, group in enumerate(GROUPS):
+        cache.store(scope, cache.embed(group[0]), group[0], {"message": str(index)})
+
+    results = {"hits": 0, "wrong_hits": 0, "misses": 0, "false_hits": 0}
+    for index, group in enumerate(GROUPS):
+        for question in group[1:]:
+            cached = cache.lookup(scope, cache.embed(question), question)
+            if cached is None:
+                results["misses"] += 1
+            elif cached["message"] == str(index):
+                results["hits"] += 1
+            else:
+                results["wrong_hits"] += 1
+    for question in DIFFERENT:
+        if cache.lookup(scope, cache.embed(question), question) is not None:
+            results["false_hits"] += 1
+    return results
+
+
+def lookup_cost(lookups: int, entries: int) -> tuple:
+    """Mean embed and lookup time in microseconds against one scope holding `entries` questions."""
+    cache = SemanticCache(max_per_scope=entries, audit_rate=0)
+    scope = make_scope("gpt-3.5-turbo", "page")
+    for i in range(entries):
+        question = f"question {i} about feature {i * 7919 % 1000} and option {i % 37}"
+        cache.store(scope, cache.embed(question), question, {"message": "answer"})
+
+    questions = [f"does option {i % 50} work with feature {i}" for i in range(lookups)]
+    started = time.perf_counter()
+    vectors = [cache.embed(question) for question in questions]
+    embedded = time.perf_counter()
+    for question, vector in zip(questions, vectors):
+        cache.lookup(scope, vector, question)
+    finished = time.perf_counter()
+    return (embedded - started) / lookups * 1e6, (finished - embedded) / lookups * 1e6
+
+
+def main(args) -> None:
+    paraphrases = sum(len(group) - 1 for group in GROUPS)
+    print(f"{paraphrases} paraphrases of {len(GROUPS)} cached questions, {len(DIFFERENT)} different questions")
+    print(f"{'threshold':>9} {'hits':>5} {'wrong':>5} {'misses':>6} {'false hits':>10}")
+    for threshold in args.thresholds:
+        r = quality(threshold)
+        print(f"{threshold:>9.2f} {r['hits']:>5} {r['wrong_hits']:>5} {r['misses']:>6} {r['false_hits']:>10}")
+
+    print(f"\n{'entries':>7} {'embed us':>9} {'lookup us':>10}")
+    for entries in args.entries:
+        embed_us, lookup_us = lookup_cost(args.lookups, entries)
+        print(f"{entries:>7} {embed_us:>9.1f} {lookup_us:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.7, 0.75, 0.8, 0.85, 0.9])
+    parser.add_argument("--entries", type=int, nargs="+", default=[16, 256, 1024])
+    main(parser.parse_args())
@@ -0,0 +1,131 @@
+"""
+Request size and prompt tokens of a long conversation, with and without sessions.
+Plays the same conversation about one page twice: first stateless, with the
+client resending the page and the transcript so far as context every turn,
+then through a session, where the page is sent once to /api/sessions and
+each turn carries only the new message. Reports request bytes, prompt tokens
+and prompt tokens served from the (emulated) upstream prefix cache per turn,
+plus session compactions from /metrics.
+
+Usage:
+    python bench/fake_upstream.py --port 9000 --latency 0.2
+    ADMISSION_CLIENT_RATE=0 OPS_API_TOKEN=bench uvicorn main:app --port 8000
+    python bench/bench_sessions.py --turns 30
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from load import OPS_HEADERS, SAMPLE_TEXT  # noqa: E402
+
+QUESTIONS = (
+    "How does the midsole feel on long runs?",
+    "Is the upper breathable enough for summer?",
+    "Should I size up?",
+    "How does it grip on wet roads?",
+    "Which colourway would you pick for trail use?",
+)
+
+
+async def chat(client: httpx.AsyncClient, body: dict, stream: bool) -> tuple:
+    """Send one chat turn; returns the request size, the reply and its usage."""
+    payload = json.dumps({**body, "stream": stream}).encode("utf-8")
+    headers = {"content-type": "application/json"}
+    if not stream:
+        response = await client.post("/api/chat", content=payload, headers=headers)
+        response.raise_for_status()
+        data = response.json()["data"]
+        return len(payload), data["message"], data["usage"]
+
+    reply, usage = "", {}
+    async with client.stream("POST", "/api/chat", content=payload, headers=headers) as response:
+        response.raise_for_status()
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: ") and event == "token":
+                reply += json.loads(line[6:])["delta"]
+            elif line.startswith("data: ") and event == "done":
+                usage = json.loads(line[6:]).get("usage") or {}
+    return len(payload), reply, usage
+
+
+async def run(client: httpx.AsyncClient, page: str, turns: int, use_session: bool, stream: bool) -> list:
+    rows = []
+    transcript = []
+    session_id = None
+    if use_session:
+        response = await client.post("/api/sessions", json={"context": page})
+        response.raise_for_status()
+        session_id = response.json()["data"]["session_id"]
+
+    for turn in range(turns):
+        message = f"Turn {turn + 1}: {QUESTIONS[turn % len(QUESTIONS)]}"
+        if use_session:
+            body = {"message": message, "session_id": session_id}
+        else:
+            history = "\n".join(transcript)
+            body = {"message": message, "context": f"{page}\n\n{history}" if history else page}
+        started = time.perf_counter()
+        size, reply, usage = await chat(client, body, stream)
+        elapsed = time.perf_counter() - started
+        transcript += [f"User: {message}", f"Assistant: {reply}"]
+        rows.append((size, usage.get("prompt_tokens", 0), usage.get("cached_tokens", 0), elapsed))
+        # Give background compaction a moment, as a reader would between questions
+        await asyncio.sleep(0.05)
+
+    if use_session:
+        response = await client.get(f"/api/sessions/{session_id}")
+        data = response.json()["data"]
+        print(f"  session: {len(data['turns'])} turns kept, {data['summarized_turns']} summarized, "
+              f"{data['history_tokens']} history tokens")
+        await client.delete(f"/api/sessions/{session_id}")
+    return rows
+
+
+def report(name: str, rows: list) -> None:
+    total_bytes = sum(row[0] for row in rows)
+    prompt = sum(row[1] for row in rows)
+    cached = sum(row[2] for row in rows)
+    last = rows[-1]
+    print(f"{name:<10} request bytes {total_bytes:8d} (last turn {last[0]:6d})   "
+          f"prompt tokens {prompt:7d} (last turn {last[1]:5d})   "
+          f"cached {cached:7d} ({cached / max(prompt, 1):.0%})   "
+          f"uncached {prompt - cached:7d}   mean latency {sum(row[3] for row in rows) / len(rows) * 1000:.0f} ms")
+
+
+async def main(args) -> None:
+    # A product page of about page_tokens tokens
+    page = " ".join([SAMPLE_TEXT] * max(1, args.page_tokens * 4 // len(SAMPLE_TEXT)))
+    async with httpx.AsyncClient(base_url=args.url, timeout=120.0) as client:
+        stateless = await run(client, page, args.turns, False, args.stream)
+        report("stateless", stateless)
+        session = await run(client, page, args.turns, True, args.stream)
+        report("session", session)
+        if args.per_turn:
+            print("turn  stateless bytes/prompt/cached   session bytes/prompt/cached")
+            for turn, (a, b) in enumerate(zip(stateless, session), 1):
+                print(f"{turn:4d}  {a[0]:7d} {a[1]:6d} {a[2]:6d}          {b[0]:7d} {b[1]:6d} {b[2]:6d}")
+        metrics_text = (await client.get("/metrics", headers=OPS_HEADERS)).text
+    for line in metrics_text.splitlines():
+        if line.startswith(("widget_session_compactions_total", "widget_llm_tokens_total")):
+            print(f"  {line}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--page-tokens", type=int, default=1500, help="approximate size of the page context")
+    parser.add_argument("--stream", action="store_true", help="use streamed chat turns")
+    parser.add_argument("--per-turn", action="store_true", help="print every turn")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,155 @@
+"""
+Cold start cost of the backend.
+Measures the time to import main.py in a fresh interpreter, then starts the
+backend against bench/fake_upstream.py several times and records, from the
+moment the process is spawned, when /health first answers and when the first
+request succeeds, and how long the first request of each kind took. Runs with
+the background upstream prewarm on and off, so its effect shows up side by
+side. --gap is the idle time between /health and the first request; a load
+balancer adding a new instance rarely sends traffic the instant it is ready.
+
+Usage:
+    python bench/bench_startup.py --runs 5
+    python bench/bench_startup.py --runs 10 --gap 0 --endpoint /api/listen --output startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from load import request_body  # noqa: E402
+from suite import BACKEND_DIR, free_port, wait_until_up  # noqa: E402
+
+IMPORT_SNIPPET = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+
+
+def backend_env(upstream_url: str, state_dir: str, prewarm: bool) -> dict:
+    return {
+        **os.environ,
+        "OPENAI_API_KEY": "bench",
+        "ELEVENLABS_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"{upstream_url}/v1",
+        "ELEVENLABS_BASE_URL": upstream_url,
+        "ADMISSION_CLIENT_RATE": "0",
+        "AUDIO_CACHE_DIR": os.path.join(state_dir, "audio_cache"),
+        "PAGE_STORE_PATH": os.path.join(state_dir, "pages.sqlite3"),
+        "LOG_FILE": os.path.join(state_dir, "widget_backend.log"),
+        "UPSTREAM_PREWARM": "true" if prewarm else "false",
+    }
+
+
+def import_seconds(env: dict) -> float:
+    """Time to import main.py in a fresh interpreter, module-level setup included."""
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def cold_start(env: dict, endpoints: list, gap: float, poll: float) -> dict:
+    """Spawn the backend; time /health and the first success from the spawn, and each endpoint's first request."""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    timings = {}
+    spawned = time.perf_counter()
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        with httpx.Client(base_url=url, timeout=60.0) as client:
+            while "health_s" not in timings:
+                if backend.poll() is not None:
+                    raise RuntimeError(f"backend exited with status {backend.returncode}")
+                try:
+                    if client.get("/health").status_code == 200:
+                        timings["health_s"] = time.perf_counter() - spawned
+                except httpx.HTTPError:
+                    time.sleep(poll)
+            time.sleep(gap)
+            for index, endpoint in enumerate(endpoints):
+                started = time.perf_counter()
+                # Unique documents, so no endpoint is served from a cache another one filled
+                response = client.post(endpoint, json=request_body(endpoint, index, unique=True))
+                if response.status_code != 200:
+                    raise RuntimeError(f"{endpoint} returned {response.status_code}: {response.text[:200]}")
+                timings[endpoint] = time.perf_counter() - started
+                timings.setdefault("first_success_s", time.perf_counter() - spawned)
+    finally:
+        backend.terminate()
+        try:
+            backend.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            backend.kill()
+    return timings
+
+
+def summarize(samples: list) -> dict:
+    return {"median_ms": statistics.median(samples) * 1000, "min_ms": min(samples) * 1000,
+            "max_ms": max(samples) * 1000}
+
+
+def main(args) -> None:
+    results = {"runs": args.runs, "gap_s": args.gap, "endpoints": args.endpoint, "upstream_args": args.upstream_args}
+    with tempfile.TemporaryDirectory(prefix="widget-startup-") as state_dir:
+        with open(os.path.join(state_dir, "upstream.log"), "w") as upstream_log:
+            upstream_port = free_port()
+            upstream_url = f"http://127.0.0.1:{upstream_port}"
+            upstream = subprocess.Popen(
+                [sys.executable, os.path.join(BACKEND_DIR, "bench", "fake_upstream.py"),
+                 "--port", str(upstream_port), *args.upstream_args.split()],
+                stdout=upstream_log, stderr=subprocess.STDOUT
+            )
+            try:
+                wait_until_up(f"{upstream_url}/stats", upstream)
+                imports = [import_seconds(backend_env(upstream_url, state_dir, False)) for _ in range(args.runs)]
+                results["import"] = summarize(imports)
+                print(f"import main: median {results['import']['median_ms']:.0f} ms, "
+                      f"min {results['import']['min_ms']:.0f} ms")
+
+                for prewarm in (True, False):
+                    label = "prewarm" if prewarm else "no_prewarm"
+                    runs = []
+                    for run in range(args.runs):
+                        # A fresh directory per run, so every start is cold for the caches too
+                        run_dir = os.path.join(state_dir, f"{label}-{run}")
+                        os.makedirs(run_dir)
+                        env = backend_env(upstream_url, run_dir, prewarm)
+                        runs.append(cold_start(env, args.endpoint, args.gap, args.poll))
+                    results[label] = {
+                        key: summarize([run[key] for run in runs]) for key in ("health_s", "first_success_s", *args.endpoint)
+                    }
+                    print(f"\n{label}")
+                    for key, summary in results[label].items():
+                        print(f"  {key:<16} median {summary['median_ms']:>6.0f} ms  "
+                              f"min {summary['min_ms']:>6.0f} ms  max {summary['max_ms']:>6.0f} ms")
+            finally:
+                upstream.terminate()
+                upstream.wait(timeout=10)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--endpoint", action="append", choices=("/api/chat", "/api/summarize", "/api/listen"),
+                        help="first requests to time, in order (default: /api/chat, then /api/listen)")
+    parser.add_argument("--gap", type=float, default=1.0, help="seconds between /health and the first request")
+    parser.add_argument("--upstream-args", default="--latency 0.05", help="arguments for fake_upstream.py")
+    parser.add_argument("--poll", type=float, default=0.005, help="seconds between /health polls")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+    args.endpoint = args.endpoint or ["/api/chat", "/api/listen"]
+    main(args)
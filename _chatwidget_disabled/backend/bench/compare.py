@@ -0,0 +1,70 @@
+"""
+Compare two bench/suite.py result files, scenario by scenario.
+Prints each metric before and after with the relative change; changes beyond
+--threshold percent in the bad direction are marked. Exits 1 when any is, so
+the comparison can gate a CI job.
+
+Usage:
+    python bench/compare.py bench/results/<before>.json bench/results/<after>.json --threshold 10
+"""
+
+import argparse
+import json
+import sys
+
+# Metric, and whether a higher value is better
+METRICS = (
+    ("rps", True),
+    ("errors", False),
+    ("p50_ms", False),
+    ("p95_ms", False),
+    ("p99_ms", False),
+    ("ttfb_p50_ms", False),
+    ("ttfb_p95_ms", False),
+    ("rss_peak_mb", False),
+)
+
+
+def load(path: str) -> dict:
+    with open(path) as results:
+        return json.load(results)
+
+
+def change(before: float, after: float) -> float:
+    if not before:
+        return 0.0 if not after else float("inf")
+    return (after - before) / before * 100
+
+
+def main(args) -> int:
+    before, after = load(args.before), load(args.after)
+    print(f"before: {before['commit']}{' (dirty)' if before['dirty'] else ''} {before['subject']}")
+    print(f"after:  {after['commit']}{' (dirty)' if after['dirty'] else ''} {after['subject']}")
+    if any(before.get(key) != after.get(key) for key in ("upstream_args", "rps", "workers")):
+        print("warning: the runs used different upstream profiles, rates or worker counts")
+
+    previous = {result["scenario"]: result for result in before["results"]}
+    regressions = 0
+    for result in after["results"]:
+        base = previous.get(result["scenario"])
+        if base is None:
+            continue
+        print(f"\n{result['scenario']}")
+        for metric, higher_is_better in METRICS:
+            if base.get(metric) is None or result.get(metric) is None:
+                continue
+            delta = change(base[metric], result[metric])
+            worse = delta < -args.threshold if higher_is_better else delta > args.threshold
+            regressions += worse
+            print(f"  {metric:<12} {base[metric]:>10.1f} -> {result[metric]:>10.1f}  {delta:+7.1f}%"
+                  f"{'  REGRESSION' if worse else ''}")
+    print(f"\n{regressions} regression(s) beyond {args.threshold:g}%")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change counted as a regression")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,390 @@
+"""
+Fake OpenAI + ElevenLabs server for local benchmarks.
+Answers chat completions and TTS streams after a configurable delay so the
+backend can be load-tested without spending real credits. Latency is drawn
+from a fixed, uniform, exponential or lognormal distribution around
+--latency; it is the time to the first token of a streamed completion, the
+whole time of a non-streamed one, and the time to the first TTS byte.
+Settings can be changed while it runs with POST /settings, to degrade or
+restore a model mid-benchmark.
+
+Usage:
+    python bench/fake_upstream.py --port 9000 --latency 0.5
+    python bench/fake_upstream.py --latency 0.4 --latency-dist lognormal --latency-jitter 0.5 \\
+        --tokens-per-sec 40 --chunk-tokens 3 --completion-error-rate 0.02 --error-status 500
+
+Then start the backend with:
+    OPENAI_BASE_URL=http://127.0.0.1:9000/v1 ELEVENLABS_BASE_URL=http://127.0.0.1:9000 \\
+    OPENAI_API_KEY=test ELEVENLABS_API_KEY=test python main.py
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+import uuid
+from collections import OrderedDict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Fake Upstream")
+
+# Overridden from the command line
+settings = {
+    "latency": 0.5,
+    "latency_dist": "fixed",
+    "latency_jitter": 0.3,
+    "token_delay": 0.01,
+    "chunk_tokens": 1,
+    "completion_words": 0,
+    "audio_chunks": 8,
+    "audio_chunk_size": 4096,
+    "audio_chunk_delay": 0.05,
+    "tts_fail_status": 0,
+    "tts_abort_after": 0,
+    "completion_rate_limit": 0,
+    "completion_error_rate": 0.0,
+    "error_status": 503,
+    "tts_error_rate": 0.0,
+    "slow_rate": 0.0,
+    "slow_latency": 3.0,
+    "fail_models": (),
+    "reject_keys": (),
+    "model_latency": {},
+    "model_error_rate": {},
+}
+
+# Start times of completions accepted in the last second, for --completion-rate-limit
+completion_window = []
+completion_stats = {"accepted": 0, "rate_limited": 0, "failed": 0, "slow": 0, "truncated": 0,
+                    "prompt_tokens": 0, "cached_prompt_tokens": 0, "models": {}}
+
+# Last prompt seen per first message, to emulate OpenAI's automatic prompt caching
+recent_prompts: "OrderedDict[str, str]" = OrderedDict()
+
+# TTS stream lifecycle counters, exposed at /stats
+tts_stats = {"started": 0, "completed": 0, "cancelled": 0, "aborted": 0, "failed": 0, "active": 0}
+
+SUMMARY_TEXT = (
+    "• The product is a lightweight running shoe built for daily training.\n"
+    "• It uses a responsive foam midsole and a breathable knit upper.\n"
+    "• Reviewers praise the comfort but note the sizing runs slightly small."
+)
+
+
+def sample_latency(mean: float) -> float:
+    """
+    One latency draw with the given mean. --latency-jitter is the relative
+    spread for uniform and the sigma of the underlying normal for lognormal,
+    whose long right tail is closest to real upstream latencies.
+    """
+    dist = settings["latency_dist"]
+    jitter = settings["latency_jitter"]
+    if mean <= 0 or dist == "fixed":
+        return max(0.0, mean)
+    if dist == "uniform":
+        return mean * random.uniform(max(0.0, 1 - jitter), 1 + jitter)
+    if dist == "exponential":
+        return random.expovariate(1 / mean)
+    return mean * random.lognormvariate(-jitter * jitter / 2, jitter)
+
+
+def cached_prompt_tokens(messages: list, prompt_tokens: int) -> int:
+    """
+    Prompt tokens an OpenAI-style prefix cache would serve: the prefix shared
+    with the last prompt that opened with the same 1024 tokens, counted from
+    1024 tokens in 128-token steps.
+    """
+    if not messages or prompt_tokens < 1024:
+        return 0
+    prompt = "".join(f"{m.get('role')}:{m.get('content', '')}" for m in messages)
+    first = hashlib.sha256(prompt[:4096].encode("utf-8")).hexdigest()
+    previous = recent_prompts.pop(first, "")
+    recent_prompts[first] = prompt
+    if len(recent_prompts) > 10000:
+        recent_prompts.popitem(last=False)
+    shared = len(os.path.commonprefix([previous, prompt])) // 4
+    return 0 if shared < 1024 else 1024 + (shared - 1024) // 128 * 128
+
+
+def summary_for(messages: list) -> str:
+    """Canned summary tagged with a hash of the prompt, so distinct pages get distinct audio."""
+    digest = hashlib.sha256(json.dumps(messages).encode("utf-8")).hexdigest()[:8]
+    summary = f"{SUMMARY_TEXT}\n• Reference {digest}."
+    if settings["completion_words"]:
+        # Longer answers for token-rate runs, still one bullet per line
+        words = (SUMMARY_TEXT.replace("•", "").split() * (settings["completion_words"] // 30 + 1))
+        summary += "\n• " + " ".join(words[:settings["completion_words"]]).rstrip(".") + "."
+    return summary
+
+
+@app.middleware("http")
+async def reject_keys(request: Request, call_next):
+    """Answer 401 to any call made with a key from --reject-key, as for a revoked key."""
+    key = request.headers.get("xi-api-key") or request.headers.get("authorization", "").removeprefix("Bearer ")
+    if key and key in settings["reject_keys"]:
+        return JSONResponse(status_code=401,
+                            content={"error": {"message": "Invalid API key", "code": "invalid_api_key"}})
+    return await call_next(request)
+
+
+@app.get("/v1/models")
+async def models(request: Request):
+    """Model list, as both upstreams serve it; the backend's health checks call this."""
+    if "xi-api-key" in request.headers:
+        return [{"model_id": "eleven_multilingual_v2"}, {"model_id": "eleven_flash_v2_5"}]
+    return {"object": "list", "data": [{"id": model, "object": "model"} for model in ("gpt-3.5-turbo", "gpt-4o-mini")]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    """Return a canned chat completion after the configured latency."""
+    body = await request.json()
+    headers = {}
+    if settings["completion_rate_limit"]:
+        limit = settings["completion_rate_limit"]
+        now = time.monotonic()
+        completion_window[:] = [started for started in completion_window if now - started < 1.0]
+        if len(completion_window) >= limit:
+            completion_stats["rate_limited"] += 1
+            retry_after = 1.0 - (now - completion_window[0])
+            return JSONResponse(
+                status_code=429,
+                headers={"retry-after-ms": str(int(retry_after * 1000))},
+                content={"error": {"message": "Rate limit reached for requests", "type": "requests",
+                                   "code": "rate_limit_exceeded"}},
+            )
+        completion_window.append(now)
+        # OpenAI-style request limit headers (per minute), derived from the per-second window
+        headers = {
+            "x-ratelimit-limit-requests": str(limit * 60),
+            "x-ratelimit-remaining-requests": str(limit - len(completion_window)),
+            "x-ratelimit-reset-requests": f"{int((1.0 - (now - completion_window[0])) * 1000)}ms",
+        }
+    completion_stats["accepted"] += 1
+    model = body.get("model", "gpt-3.5-turbo")
+    completion_stats["models"][model] = completion_stats["models"].get(model, 0) + 1
+    error_rate = settings["model_error_rate"].get(model, settings["completion_error_rate"])
+    if model in settings["fail_models"] or random.random() < error_rate:
+        completion_stats["failed"] += 1
+        await asyncio.sleep(settings["latency"] / 10)
+        status = 503 if model in settings["fail_models"] else settings["error_status"]
+        return JSONResponse(
+            status_code=status,
+            headers={"retry-after-ms": "1000"} if status == 429 else {},
+            content={"error": {"message": "The server is overloaded or not ready yet.", "type": "server_error",
+                               "code": None}},
+        )
+    latency = sample_latency(settings["model_latency"].get(model, settings["latency"]))
+    if random.random() < settings["slow_rate"]:
+        completion_stats["slow"] += 1
+        latency = settings["slow_latency"]
+    await asyncio.sleep(latency)
+    prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+    summary = summary_for(body.get("messages", []))
+    finish_reason = "stop"
+    if body.get("max_tokens") and len(summary) // 4 > body["max_tokens"]:
+        # Cut off at max_tokens, about 4 characters per token
+        completion_stats["truncated"] += 1
+        summary = summary[:body["max_tokens"] * 4]
+        finish_reason = "length"
+    completion_tokens = len(summary) // 4
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+    cached_tokens = cached_prompt_tokens(body.get("messages", []), prompt_tokens)
+    completion_stats["prompt_tokens"] += prompt_tokens
+    completion_stats["cached_prompt_tokens"] += cached_tokens
+    if cached_tokens:
+        usage["prompt_tokens_details"] = {"cached_tokens": cached_tokens}
+
+    if body.get("stream"):
+        return StreamingResponse(
+            stream_completion(summary, completion_id, model, usage, finish_reason),
+            media_type="text/event-stream",
+            headers=headers,
+        )
+
+    return JSONResponse(headers=headers, content={
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": summary},
+            "finish_reason": finish_reason,
+        }],
+        "usage": usage,
+    })
+
+
+async def stream_completion(summary: str, completion_id: str, model: str, usage: dict, finish_reason: str = "stop"):
+    """Yield chat.completion.chunk frames of --chunk-tokens words at --tokens-per-sec."""
+    def frame(delta: dict, usage: dict = None, finish_reason: str = None) -> str:
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            "usage": usage,
+        }
+        return f"data: {json.dumps(chunk)}\n\n"
+
+    yield frame({"role": "assistant", "content": ""})
+    words = summary.split(" ")
+    size = max(1, settings["chunk_tokens"])
+    for start in range(0, len(words), size):
+        chunk = words[start:start + size]
+        await asyncio.sleep(settings["token_delay"] * len(chunk))
+        yield frame({"content": " ".join(chunk) + " "})
+    yield frame({}, finish_reason=finish_reason)
+    yield frame({}, usage=usage)
+    yield "data: [DONE]\n\n"
+
+
+def format_kbps(output_format: str) -> float:
+    """Bitrate of a TTS output format such as mp3_44100_128, pcm_16000 or opus_48000_32."""
+    codec, _, rest = output_format.partition("_")
+    parts = rest.split("_")
+    try:
+        if codec == "pcm":
+            return int(parts[0]) * 16 / 1000
+        if codec == "ulaw":
+            return int(parts[0]) * 8 / 1000
+        return float(parts[1])
+    except (IndexError, ValueError):
+        return 128.0
+
+
+@app.post("/v1/text-to-speech/{voice_id}/stream")
+async def text_to_speech_stream(voice_id: str, request: Request):
+    """
+    Stream fake audio in fixed-size chunks. --audio-chunk-size is the size at
+    128 kbit/s; other output formats get chunks scaled to their bitrate, so
+    the same speech takes as many bytes as it would from ElevenLabs.
+    """
+    await request.body()
+    output_format = request.query_params.get("output_format", "mp3_44100_128")
+    chunk_size = max(16, int(settings["audio_chunk_size"] * format_kbps(output_format) / 128))
+    header = b"OggS" if output_format.startswith("opus") else b"\xff\xfb"
+    media_type = {"opus": "audio/ogg", "pcm": "audio/L16", "ulaw": "audio/basic"}.get(
+        output_format.split("_")[0], "audio/mpeg"
+    )
+
+    if settings["tts_fail_status"] or random.random() < settings["tts_error_rate"]:
+        await asyncio.sleep(settings["latency"])
+        tts_stats["failed"] += 1
+        return JSONResponse(
+            status_code=settings["tts_fail_status"] or settings["error_status"],
+            content={"detail": {"status": "injected_failure", "message": "Injected failure"}},
+        )
+
+    async def audio():
+        tts_stats["started"] += 1
+        tts_stats["active"] += 1
+        try:
+            await asyncio.sleep(sample_latency(settings["latency"]))
+            for index in range(settings["audio_chunks"]):
+                if settings["tts_abort_after"] and index == settings["tts_abort_after"]:
+                    tts_stats["aborted"] += 1
+                    raise RuntimeError("Injected mid-stream abort")
+                yield header + b"\x00" * (chunk_size - len(header))
+                await asyncio.sleep(settings["audio_chunk_delay"])
+            tts_stats["completed"] += 1
+        except asyncio.CancelledError:
+            tts_stats["cancelled"] += 1
+            raise
+        finally:
+            tts_stats["active"] -= 1
+
+    return StreamingResponse(audio(), media_type=media_type)
+
+
+@app.get("/stats")
+async def stats():
+    """TTS stream lifecycle counters, plus completion outcomes."""
+    return {**tts_stats, "completions": completion_stats}
+
+
+@app.post("/settings")
+async def update_settings(request: Request):
+    """Change settings mid-run, e.g. {"model_latency": {"gpt-4o-mini": 3.0}} to slow a model down."""
+    changes = await request.json()
+    unknown = set(changes) - set(settings)
+    if unknown:
+        return JSONResponse(status_code=400, content={"error": f"unknown settings: {sorted(unknown)}"})
+    settings.update(changes)
+    return {key: value for key, value in settings.items() if key in changes}
+
+
+def parse_model_values(values: list) -> dict:
+    """{"gpt-4o-mini": 2.0} from ["gpt-4o-mini=2.0"]."""
+    return {model: float(value) for model, _, value in (item.partition("=") for item in values)}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean seconds before each response")
+    parser.add_argument("--latency-dist", choices=("fixed", "uniform", "exponential", "lognormal"), default="fixed")
+    parser.add_argument("--latency-jitter", type=float, default=0.3,
+                        help="relative spread (uniform) or sigma (lognormal) of the latency")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="seconds between streamed tokens")
+    parser.add_argument("--tokens-per-sec", type=float, default=0, help="streamed token rate; overrides --token-delay")
+    parser.add_argument("--chunk-tokens", type=int, default=1, help="tokens per streamed completion chunk")
+    parser.add_argument("--completion-words", type=int, default=0, help="extra words appended to every completion")
+    parser.add_argument("--audio-chunks", type=int, default=8, help="TTS chunks per stream")
+    parser.add_argument("--audio-chunk-size", type=int, default=4096, help="bytes per TTS chunk at 128 kbit/s")
+    parser.add_argument("--audio-chunk-delay", type=float, default=0.05, help="seconds between TTS chunks")
+    parser.add_argument("--tts-fail-status", type=int, default=0, help="answer every TTS call with this HTTP status")
+    parser.add_argument("--tts-abort-after", type=int, default=0, help="abort TTS streams after this many chunks")
+    parser.add_argument("--completion-rate-limit", type=int, default=0,
+                        help="answer completions beyond this many per second with 429")
+    parser.add_argument("--completion-error-rate", type=float, default=0.0,
+                        help="share of completions answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of injected errors")
+    parser.add_argument("--tts-error-rate", type=float, default=0.0, help="share of TTS calls answered with --error-status")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of completions that take --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=3.0, help="seconds before a slow completion responds")
+    parser.add_argument("--fail-model", action="append", default=[], help="answer every completion for this model with 503")
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SECONDS",
+                        help="mean latency of one model's completions, instead of --latency")
+    parser.add_argument("--model-error-rate", action="append", default=[], metavar="MODEL=RATE",
+                        help="share of one model's completions answered with --error-status")
+    parser.add_argument("--reject-key", action="append", default=[], help="answer every call with this API key with 401")
+    args = parser.parse_args()
+
+    settings["latency"] = args.latency
+    settings["latency_dist"] = args.latency_dist
+    settings["latency_jitter"] = args.latency_jitter
+    settings["token_delay"] = 1 / args.tokens_per_sec if args.tokens_per_sec else args.token_delay
+    settings["chunk_tokens"] = args.chunk_tokens
+    settings["completion_words"] = args.completion_words
+    settings["audio_chunks"] = args.audio_chunks
+    settings["audio_chunk_size"] = args.audio_chunk_size
+    settings["audio_chunk_delay"] = args.audio_chunk_delay
+    settings["tts_fail_status"] = args.tts_fail_status
+    settings["tts_abort_after"] = args.tts_abort_after
+    settings["completion_rate_limit"] = args.completion_rate_limit
+    settings["completion_error_rate"] = args.completion_error_rate
+    settings["error_status"] = args.error_status
+    settings["tts_error_rate"] = args.tts_error_rate
+    settings["slow_rate"] = args.slow_rate
+    settings["slow_latency"] = args.slow_latency
+    settings["fail_models"] = tuple(args.fail_model)
+    settings["model_latency"] = parse_model_values(args.model_latency)
+    settings["model_error_rate"] = parse_model_values(args.model_error_rate)
+    settings["reject_keys"] = tuple(args.reject_key)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,202 @@
+"""
+Load generator for the widget backend.
+Drives one endpoint either closed-loop (a fixed number of requests in flight)
+or open-loop at a target rate (--rps), and reports throughput, latency and
+time-to-first-byte percentiles and the backend's resident memory, sampled
+from process_resident_memory_bytes on /metrics during the run.
+
+Usage:
+    python bench/load.py --url http://127.0.0.1:8000 --endpoint /api/summarize \\
+        --concurrency 100 --duration 20
+    python bench/load.py --endpoint /api/chat --rps 20 --duration 30 --stream --unique --output chat.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Optional
+
+import httpx
+
+# Bearer token for the backend's /metrics and stats endpoints; the suite harness starts the backend with it
+OPS_API_TOKEN = os.getenv("OPS_API_TOKEN", "bench")
+OPS_HEADERS = {"Authorization": f"Bearer {OPS_API_TOKEN}"}
+
+SAMPLE_TEXT = (
+    "The Apex Runner is our lightest daily trainer. A responsive foam midsole "
+    "returns energy on every stride while the breathable knit upper keeps feet "
+    "cool over long distances. A reinforced heel counter adds stability, and the "
+    "rubber outsole grips wet pavement. Available in six colourways."
+)
+
+CHAT_QUESTIONS = (
+    "Does the Apex Runner run small?",
+    "Is the upper breathable enough for summer runs?",
+    "How does the outsole grip on wet roads?",
+    "Is it stable enough for heavier runners?",
+)
+
+ENDPOINTS = ("/api/chat", "/api/summarize", "/api/details", "/api/listen")
+
+
+def percentile(samples: list, pct: float) -> float:
+    """Nearest-rank percentile of a list of samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def request_body(endpoint: str, index: int, unique: bool = False, stream: bool = False) -> dict:
+    """
+    Payload for one request. With unique, every request carries a distinct
+    document so response, audio and semantic caches all miss.
+    """
+    text = f"Document {index}. {SAMPLE_TEXT}" if unique else SAMPLE_TEXT
+    if endpoint == "/api/chat":
+        body = {"message": CHAT_QUESTIONS[index % len(CHAT_QUESTIONS)], "context": text}
+    else:
+        body = {"message": text}
+    if stream and endpoint != "/api/listen":
+        body["stream"] = True
+    return body
+
+
+async def sample_memory(client: httpx.AsyncClient, samples: list, interval: float) -> None:
+    """Append the backend's resident memory from /metrics every interval until cancelled."""
+    while True:
+        try:
+            response = await client.get("/metrics", headers=OPS_HEADERS)
+            for line in response.text.splitlines():
+                if line.startswith("process_resident_memory_bytes "):
+                    samples.append(float(line.split()[1]))
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(interval)
+
+
+async def run_load(
+    url: str,
+    endpoint: str,
+    concurrency: int,
+    duration: float,
+    rps: Optional[float] = None,
+    stream: bool = False,
+    unique: bool = False,
+    first_index: int = 0,
+    memory_interval: float = 1.0
+) -> dict:
+    """
+    Drive the endpoint for `duration` seconds: with `concurrency` workers, or
+    at `rps` requests per second whatever the response times (open loop).
+    Latency is to the last response byte, TTFB to the first one. Request
+    numbers, and so unique documents, start at first_index.
+    """
+    latencies, ttfbs, memory = [], [], []
+    statuses = {}
+    errors = 0
+    limits = httpx.Limits(max_connections=max(concurrency, 1000 if rps else 0),
+                          max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=120.0) as client:
+        async def one(index: int) -> None:
+            nonlocal errors
+            started = time.perf_counter()
+            first_byte = None
+            try:
+                async with client.stream("POST", endpoint, json=request_body(endpoint, index, unique, stream)) as response:
+                    async for _ in response.aiter_raw():
+                        if first_byte is None:
+                            first_byte = time.perf_counter() - started
+                    status = response.status_code
+            except httpx.HTTPError:
+                errors += 1
+                statuses["transport_error"] = statuses.get("transport_error", 0) + 1
+                return
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status != 200:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - started)
+            ttfbs.append(first_byte if first_byte is not None else latencies[-1])
+
+        sampler = asyncio.ensure_future(sample_memory(client, memory, memory_interval))
+        started = time.perf_counter()
+        deadline = started + duration
+        if rps:
+            tasks = []
+            for index in range(int(rps * duration)):
+                delay = started + index / rps - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.ensure_future(one(first_index + index)))
+            await asyncio.gather(*tasks)
+        else:
+            counter = iter(range(first_index, 1 << 62))
+
+            async def worker():
+                while time.perf_counter() < deadline:
+                    await one(next(counter))
+
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+
+    return {
+        "endpoint": endpoint,
+        "mode": "open" if rps else "closed",
+        "target_rps": rps,
+        "concurrency": None if rps else concurrency,
+        "stream": stream,
+        "unique": unique,
+        "duration_s": round(elapsed, 3),
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": statuses,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "ttfb_p50_ms": percentile(ttfbs, 50) * 1000,
+        "ttfb_p95_ms": percentile(ttfbs, 95) * 1000,
+        "ttfb_p99_ms": percentile(ttfbs, 99) * 1000,
+        "rss_start_mb": memory[0] / 2 ** 20 if memory else None,
+        "rss_peak_mb": max(memory) / 2 ** 20 if memory else None,
+        "rss_end_mb": memory[-1] / 2 ** 20 if memory else None,
+    }
+
+
+def format_result(result: dict) -> str:
+    line = (f"{result['endpoint']}{' (stream)' if result['stream'] else ''}: "
+            f"{result['requests']} ok, {result['errors']} errors, {result['rps']:.1f} req/s, "
+            f"p50 {result['p50_ms']:.0f} ms, p95 {result['p95_ms']:.0f} ms, p99 {result['p99_ms']:.0f} ms, "
+            f"TTFB p50 {result['ttfb_p50_ms']:.0f} ms")
+    if result["rss_peak_mb"] is not None:
+        line += f", RSS peak {result['rss_peak_mb']:.0f} MB"
+    return line + (f" (target {result['target_rps']:g}/s)" if result["target_rps"]
+                   else f" (concurrency {result['concurrency']})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoint", default="/api/summarize", choices=ENDPOINTS)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rps", type=float, default=None, help="open-loop request rate instead of --concurrency")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--stream", action="store_true", help="request SSE token streams")
+    parser.add_argument("--unique", action="store_true", help="distinct document per request, so caches miss")
+    parser.add_argument("--output", help="write the result as JSON to this file")
+    args = parser.parse_args()
+
+    result = asyncio.run(run_load(
+        args.url, args.endpoint, args.concurrency, args.duration,
+        rps=args.rps, stream=args.stream, unique=args.unique
+    ))
+    print(format_result(result))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(result, output, indent=2)
@@ -0,0 +1,71 @@
+"""
+Local TCP proxy that emulates a slow network link, for the benchmarks.
+Every chunk is delivered half the round trip time after it was sent, and
+with a bandwidth cap it first waits for the link to carry its bytes, so a
+large response arrives as slowly as it would over a mobile connection. TCP
+handshakes are not delayed.
+"""
+
+import asyncio
+import time
+from typing import Optional, Tuple
+
+from suite import free_port
+
+
+async def pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, delay: float,
+               bandwidth: Optional[float] = None) -> None:
+    """Copy one direction of a connection over a link with `delay` seconds of latency and `bandwidth` bit/s."""
+    queue: asyncio.Queue = asyncio.Queue()
+    link_free_at = 0.0
+
+    async def deliver():
+        while True:
+            due, chunk = await queue.get()
+            await asyncio.sleep(max(0.0, due - time.perf_counter()))
+            if not chunk:
+                writer.close()
+                return
+            writer.write(chunk)
+            await writer.drain()
+
+    delivering = asyncio.create_task(deliver())
+    try:
+        while True:
+            chunk = await reader.read(16384)
+            sent = time.perf_counter()
+            if bandwidth:
+                link_free_at = max(sent, link_free_at) + len(chunk) * 8 / bandwidth
+                sent = link_free_at
+            queue.put_nowait((sent + delay, chunk))
+            if not chunk:
+                break
+        await delivering
+    except (ConnectionError, asyncio.CancelledError):
+        delivering.cancel()
+
+
+async def start_proxy(target_port: int, rtt: float, bandwidth: Optional[float] = None) -> Tuple[asyncio.Server, int]:
+    """
+    A proxy to target_port adding rtt to every round trip and capping the
+    download direction at bandwidth bit/s; returns (server, port).
+    """
+
+    async def connect(client_reader, client_writer):
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection("127.0.0.1", target_port)
+        except OSError:
+            client_writer.close()
+            return
+        try:
+            await asyncio.gather(
+                pipe(client_reader, upstream_writer, rtt / 2),
+                pipe(upstream_reader, client_writer, rtt / 2, bandwidth),
+                return_exceptions=True,
+            )
+        except asyncio.CancelledError:
+            pass  # Connections still open when the benchmark ends
+
+    port = free_port()
+    server = await asyncio.start_server(connect, "127.0.0.1", port)
+    return server, port
@@ -0,0 +1,203 @@
+"""
+End-to-end benchmark suite against a local fake upstream.
+Starts bench/fake_upstream.py and the backend (with placeholder API keys,
+per-client admission off and caches in a temporary directory), runs each
+scenario open-loop at its target rate and writes all results, the upstream
+profile and the current commit to one JSON file for bench/compare.py.
+
+Usage:
+    python bench/suite.py                                   # bench/results/<commit>.json
+    python bench/suite.py --rps 10 --duration 20 --scenario chat --scenario listen
+    python bench/suite.py --upstream-args "--latency 0.4 --latency-dist lognormal --tokens-per-sec 40"
+    python bench/suite.py --workers 4 --rps 200          # through serve.py instead of a single uvicorn process
+    python bench/compare.py bench/results/<before>.json bench/results/<after>.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from load import OPS_API_TOKEN, format_result, run_load  # noqa: E402
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# name: (endpoint, stream, unique); unique documents miss every cache
+SCENARIOS = {
+    "chat": ("/api/chat", False, True),
+    "chat_stream": ("/api/chat", True, True),
+    "summarize": ("/api/summarize", False, True),
+    "summarize_stream": ("/api/summarize", True, True),
+    "summarize_cached": ("/api/summarize", False, False),
+    "details": ("/api/details", False, True),
+    "listen": ("/api/listen", False, True),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with status {process.returncode} before it was ready")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f}s")
+
+
+@contextmanager
+def harness(upstream_args: list, backend_env: dict, log_dir: str, workers: int = 0):
+    """
+    Run the fake upstream and the backend on free ports; yields (backend url, upstream url).
+    With workers, the backend is started through serve.py with that many worker processes.
+    """
+    upstream_port, backend_port = free_port(), free_port()
+    upstream_url = f"http://127.0.0.1:{upstream_port}"
+    backend_url = f"http://127.0.0.1:{backend_port}"
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "bench",
+        "ELEVENLABS_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"{upstream_url}/v1",
+        "ELEVENLABS_BASE_URL": upstream_url,
+        "ADMISSION_CLIENT_RATE": "0",
+        "OPS_API_TOKEN": OPS_API_TOKEN,
+        "AUDIO_CACHE_DIR": os.path.join(log_dir, "audio_cache"),
+        "PAGE_STORE_PATH": os.path.join(log_dir, "pages.sqlite3"),
+        "LOG_FILE": os.path.join(log_dir, "widget_backend.log"),
+        **backend_env,
+    }
+    processes = []
+    try:
+        with open(os.path.join(log_dir, "upstream.log"), "w") as upstream_log, \
+                open(os.path.join(log_dir, "backend.log"), "w") as backend_log:
+            upstream = subprocess.Popen(
+                [sys.executable, os.path.join(BACKEND_DIR, "bench", "fake_upstream.py"),
+                 "--port", str(upstream_port), *upstream_args],
+                stdout=upstream_log, stderr=subprocess.STDOUT
+            )
+            processes.append(upstream)
+            wait_until_up(f"{upstream_url}/stats", upstream)
+            if workers:
+                command = ["serve.py", "--port", str(backend_port), "--workers", str(workers),
+                           "--state-dir", os.path.join(log_dir, "state")]
+            else:
+                command = ["-m", "uvicorn", "main:app", "--port", str(backend_port), "--log-level", "warning"]
+            backend = subprocess.Popen(
+                [sys.executable, *command], cwd=BACKEND_DIR, env=env, stdout=backend_log, stderr=subprocess.STDOUT
+            )
+            processes.append(backend)
+            wait_until_up(f"{backend_url}/health", backend)
+            yield backend_url, upstream_url
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def git_revision() -> dict:
+    def git(*args) -> str:
+        return subprocess.run(["git", *args], cwd=BACKEND_DIR, capture_output=True, text=True).stdout.strip()
+    return {
+        "commit": git("rev-parse", "--short", "HEAD") or "unknown",
+        "subject": git("log", "-1", "--format=%s"),
+        "dirty": bool(git("status", "--porcelain", "--", ".")),
+    }
+
+
+def stats_delta(before: dict, after: dict) -> dict:
+    """Per-scenario change in the fake upstream's counters."""
+    return {
+        key: stats_delta(before.get(key, {}), value) if isinstance(value, dict) else value - before.get(key, 0)
+        for key, value in after.items() if key != "active"
+    }
+
+
+async def run_scenarios(backend_url: str, upstream_url: str, args) -> list:
+    results = []
+    upstream = httpx.AsyncClient(base_url=upstream_url)
+    for number, name in enumerate(args.scenario or list(SCENARIOS)):
+        endpoint, stream, unique = SCENARIOS[name]
+        if not unique:
+            # Warm the cache first so the scenario measures hits only
+            await run_load(backend_url, endpoint, 1, 1.0, rps=1, unique=False)
+        before = (await upstream.get("/stats")).json()
+        result = await run_load(
+            backend_url, endpoint, 1, args.duration,
+            rps=args.listen_rps if endpoint == "/api/listen" else args.rps, stream=stream, unique=unique,
+            first_index=number * 1_000_000  # Scenarios never share documents
+        )
+        result["upstream"] = stats_delta(before, (await upstream.get("/stats")).json())
+        result["scenario"] = name
+        results.append(result)
+        print(f"{name:>17}  {format_result(result)}", flush=True)
+    await upstream.aclose()
+    return results
+
+
+def main(args) -> None:
+    revision = git_revision()
+    upstream_args = shlex.split(args.upstream_args)
+    backend_env = dict(pair.split("=", 1) for pair in args.env)
+    output = args.output or os.path.join(
+        BACKEND_DIR, "bench", "results", f"{revision['commit']}{'-dirty' if revision['dirty'] else ''}.json"
+    )
+    print(f"Commit {revision['commit']}{' (uncommitted changes)' if revision['dirty'] else ''}: {revision['subject']}")
+
+    with tempfile.TemporaryDirectory(prefix="widget-bench-") as log_dir:
+        with harness(upstream_args, backend_env, log_dir, args.workers) as (backend_url, upstream_url):
+            results = asyncio.run(run_scenarios(backend_url, upstream_url, args))
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as out:
+        json.dump({
+            **revision,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": sys.version.split()[0],
+            "cpus": os.cpu_count(),
+            "upstream_args": upstream_args,
+            "backend_env": backend_env,
+            "workers": args.workers,
+            "rps": args.rps,
+            "listen_rps": args.listen_rps,
+            "duration_s": args.duration,
+            "results": results,
+        }, out, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="run only these scenarios")
+    parser.add_argument("--rps", type=float, default=20.0, help="target requests per second per scenario")
+    parser.add_argument("--listen-rps", type=float, default=5.0, help="target rate for /api/listen")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds per scenario")
+    parser.add_argument("--upstream-args", default="--latency 0.3 --latency-dist lognormal --tokens-per-sec 50",
+                        help="arguments for fake_upstream.py")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="extra backend environment, e.g. --env LISTEN_PIPELINE=true")
+    parser.add_argument("--workers", type=int, default=0, help="run the backend through serve.py with this many workers")
+    parser.add_argument("--output", help="results file (default bench/results/<commit>.json)")
+    main(parser.parse_args())
@@ -0,0 +1,272 @@
+"""
+Prompt token budgeting.
+Counts tokens with a cached local tokenizer per model (estimating until it has
+loaded, which may mean downloading its encoding) and fits page content
+into a per-endpoint prompt budget by extractive trimming: duplicate lines and
+navigation/footer boilerplate are dropped, headings are kept, and body text
+is kept in page order until the budget is spent. Content within the budget
+is passed through as is.
+"""
+
+import re
+import time
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from upstream import env_int
+
+try:
+    import tiktoken
+except ImportError:  # Token counts fall back to an estimate
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Prompt token budgets per endpoint (system prompt + page content + message)
+PROMPT_BUDGETS = {
+    "chat": env_int("PROMPT_BUDGET_CHAT", 3000),
+    "summarize": env_int("PROMPT_BUDGET_SUMMARIZE", 3000),
+    "details": env_int("PROMPT_BUDGET_DETAILS", 6000),
+}
+
+# Chat format overhead, per the OpenAI token counting guide
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+# At most this share of the budget is spent on headings
+HEADING_SHARE = 0.25
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+HEADING_PATTERN = re.compile(r"^#{1,6}\s")
+BOILERPLATE_PATTERN = re.compile(
+    r"^(home|menu|main menu|navigation|skip to (main )?content|search|sign in|sign up|log in|log out|register|"
+    r"my account|account|cart|basket|checkout|wishlist|share( this)?|subscribe|newsletter|follow us|contact us|"
+    r"back to top|accept( all)?( cookies)?|cookie (settings|policy|preferences)|privacy( policy)?|"
+    r"terms( of (use|service))?|terms (and|&) conditions|sitemap|careers|about us)\b",
+    re.IGNORECASE,
+)
+FOOTER_PATTERN = re.compile(r"(©|\(c\)\s*\d{4}|all rights reserved|we use cookies|this site uses cookies)", re.IGNORECASE)
+
+# Short lines are the only candidates for boilerplate and headings
+SHORT_LINE_WORDS = 10
+
+# Seconds before a tokenizer that failed to load is tried again
+ENCODER_RETRY_SECONDS = 300.0
+
+_encoders: Dict[str, Any] = {}
+_encoder_failures: Dict[str, float] = {}  # model -> when its last load failed
+_encoder_loads: Dict[str, asyncio.Task] = {}
+
+
+def get_encoder(model: str):
+    """
+    Tokenizer for a model, built once; None when tiktoken or its encoding
+    files are unavailable. A failed load is retried after
+    ENCODER_RETRY_SECONDS instead of being remembered. Loading may download
+    the encoding, so on the event loop use loaded_encoder instead.
+    """
+    encoder = _encoders.get(model)
+    if encoder is not None or tiktoken is None:
+        return encoder
+    failed_at = _encoder_failures.get(model)
+    if failed_at is not None and time.monotonic() - failed_at < ENCODER_RETRY_SECONDS:
+        return None
+    try:
+        try:
+            encoder = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoder = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning("Tokenizer unavailable for %s, estimating token counts: %s", model, str(e))
+        _encoder_failures[model] = time.monotonic()
+        return None
+    _encoder_failures.pop(model, None)
+    _encoders[model] = encoder
+    return encoder
+
+
+def loaded_encoder(model: str):
+    """
+    Tokenizer for a model without blocking the event loop. Inside a running
+    loop a tokenizer not yet loaded is loaded in a worker thread and None is
+    returned until it is ready; outside one it is loaded in place.
+    """
+    encoder = _encoders.get(model)
+    if encoder is not None or tiktoken is None:
+        return encoder
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return get_encoder(model)
+    if model not in _encoder_loads:
+        task = _encoder_loads[model] = loop.create_task(asyncio.to_thread(get_encoder, model))
+        task.add_done_callback(lambda _: _encoder_loads.pop(model, None))
+    return None
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count without a tokenizer: about 4 characters per token, more for non-Latin scripts."""
+    extra_bytes = len(text.encode("utf-8")) - len(text)
+    return (len(text) + 3) // 4 + extra_bytes // 2
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Number of tokens text encodes to for model; estimated while its tokenizer loads."""
+    encoder = loaded_encoder(model)
+    if encoder is None:
+        return estimate_tokens(text)
+    return len(encoder.encode_ordinary(text))
+
+
+def count_message_tokens(messages: List[Dict[str, str]], model: str) -> int:
+    """Prompt tokens for a chat completion request."""
+    return TOKENS_PER_REPLY + sum(
+        TOKENS_PER_MESSAGE + count_tokens(message["content"], model) for message in messages
+    )
+
+
+def is_heading(line: str) -> bool:
+    """Markdown headings and short title-like lines without sentence punctuation."""
+    if HEADING_PATTERN.match(line):
+        return True
+    return len(line.split()) <= SHORT_LINE_WORDS and line[-1] not in ".!?,;:" and line[0].isupper()
+
+
+def is_boilerplate(line: str) -> bool:
+    """Short navigation, account, cookie and footer lines."""
+    words = len(line.split())
+    if words <= 2 * SHORT_LINE_WORDS and FOOTER_PATTERN.search(line):
+        return True
+    return words <= SHORT_LINE_WORDS and bool(BOILERPLATE_PATTERN.match(line))
+
+
+def clean_lines(text: str) -> List[str]:
+    """Non-empty lines of text with duplicates and boilerplate removed."""
+    seen = set()
+    lines = []
+    for raw_line in text.splitlines():
+        line = " ".join(raw_line.split())
+        if not line:
+            continue
+        key = line.lower()
+        if key in seen or is_boilerplate(line):
+            continue
+        seen.add(key)
+        lines.append(line)
+    return lines
+
+
+def leading_sentences(line: str, max_tokens: int, model: str) -> str:
+    """Leading whole sentences of line that fit in max_tokens."""
+    kept = []
+    used = 0
+    for sentence in SENTENCE_SPLIT.split(line):
+        tokens = count_tokens(sentence, model) + 1
+        if used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+    return " ".join(kept)
+
+
+def leading_words(line: str, max_tokens: int, model: str) -> str:
+    """Leading words of line that fit in max_tokens."""
+    words = []
+    used = 0
+    for word in line.split():
+        used += count_tokens(word, model) + 1
+        if used > max_tokens:
+            break
+        words.append(word)
+    return " ".join(words)
+
+
+def trim_to_budget(text: str, max_tokens: int, model: str, text_tokens: Optional[int] = None) -> str:
+    """
+    Extractively shorten text to at most max_tokens.
+
+    Text within the budget is returned unchanged. Otherwise duplicate and
+    boilerplate lines are dropped first. Pages flattened to a
+    single line are split into sentences before trimming. Lines are only
+    tokenized when they are considered, so a long page costs roughly as much
+    as the budget rather than its full length. text_tokens, when the caller
+    has already counted text, skips a recount.
+    """
+    if text_tokens is None:
+        text_tokens = count_tokens(text, model)
+    if text_tokens <= max_tokens:
+        return text
+    lines = clean_lines(text)
+    if len(lines) == 1:
+        lines = SENTENCE_SPLIT.split(lines[0])
+
+    keep: Dict[int, str] = {}
+    remaining = max_tokens
+
+    # Headings first, so the outline of the page survives
+    heading_budget = int(max_tokens * HEADING_SHARE)
+    for index, line in enumerate(lines):
+        if heading_budget <= 0:
+            break
+        if is_heading(line):
+            cost = count_tokens(line, model) + 1  # +1 for the joining newline
+            if cost <= heading_budget:
+                keep[index] = line
+                heading_budget -= cost
+                remaining -= cost
+
+    # Then body text in page order until the budget runs out
+    for index, line in enumerate(lines):
+        if index in keep:
+            continue
+        cost = count_tokens(line, model) + 1
+        if cost <= remaining:
+            keep[index] = line
+            remaining -= cost
+            continue
+        # Cut the first block that does not fit at a sentence end; mid-sentence only if nothing else was kept
+        partial = leading_sentences(line, remaining, model)
+        if not partial and not keep:
+            partial = leading_words(line, remaining, model)
+        if partial:
+            keep[index] = partial
+        break
+
+    return "\n".join(keep[index] for index in sorted(keep))
+
+
+def fit_prompt(
+    endpoint: str,
+    model: str,
+    build_messages: Callable[[str], List[Dict[str, str]]],
+    text: str,
+    budget: Optional[int] = None,
+) -> Tuple[List[Dict[str, str]], Dict[str, int]]:
+    """
+    Build the messages for text, trimming text so the prompt fits the endpoint's budget.
+
+    Returns the messages and a usage report with the prompt token counts
+    before and after trimming.
+    """
+    budget = budget or PROMPT_BUDGETS[endpoint]
+    messages = build_messages(text)
+    tokens_before = count_message_tokens(messages, model)
+
+    overhead = count_message_tokens(build_messages(""), model)
+    trimmed = trim_to_budget(text, max(budget - overhead, 0), model, text_tokens=tokens_before - overhead)
+    if trimmed != text:
+        # Empty when the rest of the prompt leaves no room for text at all
+        messages = build_messages(trimmed)
+
+    tokens_after = count_message_tokens(messages, model)
+    if tokens_after < tokens_before:
+        logger.info("Prompt trimmed - Endpoint: %s, Tokens: %s -> %s, "
+                   "Budget: %s",
+                   endpoint, tokens_before, tokens_after, budget)
+
+    return messages, {
+        "prompt_budget": budget,
+        "prompt_tokens_before_trim": tokens_before,
+        "prompt_tokens_after_trim": tokens_after,
+    }
@@ -0,0 +1,181 @@
+"""
+Content-addressed response cache for deterministic completions.
+Entries live in a bounded in-process LRU, optionally backed by a SQLite file
+so several workers on one host share hits.
+"""
+
+import json
+import time
+import hashlib
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different page scrapes share a key."""
+    return " ".join(text.split())
+
+
+def make_cache_key(endpoint: str, model: str, text: str, prompt_version: str) -> str:
+    """Hash the inputs that determine a completion into a cache key."""
+    payload = json.dumps([endpoint, model, prompt_version, normalize_text(text)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def prompt_fingerprint(messages: list) -> str:
+    """Short hash of a prompt template, so editing a prompt invalidates old entries."""
+    return hashlib.sha256(json.dumps(messages).encode("utf-8")).hexdigest()[:12]
+
+
+class SQLiteCacheStore:
+    """Shared cache backend stored in a local SQLite file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """The stored JSON and its expiry time, or None when missing or expired."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row[0], row[1]
+
+    def set(self, key: str, value: str, expires_at: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (time.time(),))
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """In-process LRU bounded by entry count and bytes, with TTLs and an optional shared store."""
+
+    PURGE_INTERVAL = 500  # Writes between sweeps of expired rows in the shared store
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 32 * 1024 * 1024,
+        default_ttl: float = 86400.0,
+        store: Optional[SQLiteCacheStore] = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.store = store
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._writes = 0
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached payload for key, or None."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[2] >= time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self._remove(key)
+            self.expirations += 1
+
+        if self.store is not None:
+            try:
+                row = await asyncio.to_thread(self.store.get, key)
+            except sqlite3.Error as e:
+                logger.warning("Shared cache read failed: %s", str(e))
+                row = None
+            if row is not None:
+                raw, expires_at = row
+                value = json.loads(raw)
+                # Kept only until the shared entry expires, and sized in bytes like local writes
+                self._insert(key, value, len(raw.encode("utf-8")), expires_at)
+                self.shared_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        """Store a JSON-serializable payload under key."""
+        ttl = self.default_ttl if ttl is None else ttl
+        raw = json.dumps(value, ensure_ascii=False)
+        expires_at = time.time() + ttl
+        self._insert(key, value, len(raw.encode("utf-8")), expires_at)
+
+        if self.store is not None:
+            self._writes += 1
+            try:
+                await asyncio.to_thread(self.store.set, key, raw, expires_at)
+                if self._writes % self.PURGE_INTERVAL == 0:
+                    await asyncio.to_thread(self.store.purge_expired)
+            except sqlite3.Error as e:
+                logger.warning("Shared cache write failed: %s", str(e))
+
+    def _insert(self, key: str, value: Dict[str, Any], size: int, expires_at: float) -> None:
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, size, expires_at)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters and current size."""
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "shared_store": self.store.path if self.store else None,
+        }
+
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.close()
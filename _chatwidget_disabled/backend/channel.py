@@ -0,0 +1,307 @@
+"""
+Multiplexed request channel over one WebSocket.
+The widget sends its chat, summarize, details and listen requests as frames
+on one long-lived connection instead of a CORS preflight and a fresh request
+each. Every request carries a client-chosen id; responses, stream events and
+audio chunks come back tagged with it, in whatever order they are ready, and
+a request can be cancelled by id.
+
+Client frames are JSON text:
+    {"type": "request", "id": "7", "op": "chat", "body": {...}}   same body as the REST endpoint
+    {"type": "cancel", "id": "7"}
+    {"type": "ack", "id": "7", "bytes": 65536}                    binary bytes consumed
+    {"type": "ping", "t": 1712345678901}
+
+Server frames are JSON text, except audio:
+    {"type": "response", "id": "7", "status": 200, "headers": {...}, "body": {...}}
+    {"type": "event", "id": "7", "event": "token", "data": {...}}  one per SSE event of a stream
+    {"type": "start", "id": "7", "status": 200, "headers": {...}}  a binary body follows
+    binary: one byte id length, the id, then a chunk of the body
+    {"type": "end", "id": "7"}                                     after the events or the body
+    {"type": "abort", "id": "7", "error": {...}}                    a stream failed part-way
+    {"type": "cancelled", "id": "7"}
+    {"type": "pong", "t": 1712345678901}
+
+Errors arrive as a "response" frame with the REST status and body. Binary
+bodies are flow controlled per request: at most send_window bytes go out
+before the client acks them, so one slow audio stream cannot fill the
+connection's buffers or the server's memory ahead of the other requests.
+"""
+
+import json
+import time
+import uuid
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple, Type
+
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, ValidationError
+from starlette.responses import FileResponse, Response, StreamingResponse
+
+from logging_setup import bind_request
+
+logger = logging.getLogger(__name__)
+
+# Ids travel in a one-byte length prefix on binary frames
+MAX_ID_LENGTH = 64
+FILE_CHUNK_SIZE = 64 * 1024
+
+# op -> (request model, endpoint function taking the parsed body and the connection)
+Routes = Dict[str, Tuple[Type[BaseModel], Callable[..., Any]]]
+
+
+def error_body(message: str, code: str) -> Dict[str, Any]:
+    """Error in the body FastAPI gives an HTTPException raised by the REST endpoints."""
+    return {"detail": {"error": {"message": message, "code": code}}}
+
+
+async def iterate_file(path: str) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, FILE_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+async def close_iterator(iterator: Any) -> None:
+    """Stop a response body early, so the upstream call behind it is released at once."""
+    aclose = getattr(iterator, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
+async def iterate_events(body: AsyncIterator) -> AsyncIterator[Tuple[str, Any]]:
+    """(event, data) for each Server-Sent Event in a text/event-stream body."""
+    buffer = ""
+    async for chunk in body:
+        buffer += chunk.decode("utf-8") if isinstance(chunk, bytes) else chunk
+        while "\n\n" in buffer:
+            frame, buffer = buffer.split("\n\n", 1)
+            event, data = "message", ""
+            for line in frame.split("\n"):
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data += line[5:].strip()
+            if data:  # Comments and keep-alives carry no data
+                yield event, json.loads(data)
+
+
+class SendWindow:
+    """Binary bytes of one response sent but not yet acked by the client."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.unacked = 0
+        self._acked = asyncio.Event()
+
+    async def reserve(self, nbytes: int) -> None:
+        # A chunk larger than the window still goes out once everything before it is acked
+        while self.unacked and self.unacked + nbytes > self.size:
+            self._acked.clear()
+            await self._acked.wait()
+        self.unacked += nbytes
+
+    def ack(self, nbytes: int) -> None:
+        self.unacked = max(0, self.unacked - nbytes)
+        self._acked.set()
+
+
+class Channel:
+    """
+    Serves one WebSocket connection: reads frames, runs each request as its
+    own task through the matching REST endpoint, and writes the results back.
+    At most max_in_flight requests run at once; a connection the client has
+    sent nothing on, pings included, for idle_timeout seconds is closed.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        routes: Routes,
+        max_in_flight: int = 8,
+        send_window: int = 256 * 1024,
+        idle_timeout: float = 75.0,
+        observe: Optional[Callable[[str, int, float], None]] = None,
+    ):
+        self.websocket = websocket
+        self.routes = routes
+        self.max_in_flight = max_in_flight
+        self.send_window = send_window
+        self.idle_timeout = idle_timeout
+        self.observe = observe
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.windows: Dict[str, SendWindow] = {}
+        self.requests = 0
+        self._send_lock = asyncio.Lock()
+
+    async def serve(self) -> None:
+        await self.websocket.accept()
+        opened = time.perf_counter()
+        try:
+            while True:
+                message = await asyncio.wait_for(self.websocket.receive(), self.idle_timeout)
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("text") is None:
+                    await self.send({"type": "error", "message": "Frames from the client must be JSON text"})
+                    continue
+                try:
+                    frame = json.loads(message["text"])
+                except ValueError:
+                    await self.send({"type": "error", "message": "Frames from the client must be JSON text"})
+                    continue
+                await self.dispatch(frame)
+        except asyncio.TimeoutError:
+            logger.info("WebSocket idle for %.0fs, closing", self.idle_timeout)
+            try:
+                await self.websocket.close(code=1001)
+            except RuntimeError:
+                pass
+        except WebSocketDisconnect:
+            pass
+        finally:
+            tasks = list(self.tasks.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            logger.info("WebSocket closed after %.1fs and %s requests", time.perf_counter() - opened, self.requests)
+
+    async def send(self, frame: Dict[str, Any]) -> None:
+        async with self._send_lock:
+            await self.websocket.send_text(json.dumps(frame))
+
+    async def send_bytes(self, request_id: str, chunk: bytes) -> None:
+        prefix = request_id.encode("ascii")
+        async with self._send_lock:
+            await self.websocket.send_bytes(bytes((len(prefix),)) + prefix + chunk)
+
+    async def dispatch(self, frame: Any) -> None:
+        if not isinstance(frame, dict):
+            await self.send({"type": "error", "message": "Frames from the client must be JSON objects"})
+            return
+        kind = frame.get("type")
+        request_id = str(frame.get("id", ""))
+        if kind == "ping":
+            await self.send({"type": "pong", "t": frame.get("t")})
+        elif kind == "ack":
+            try:
+                nbytes = int(frame.get("bytes", 0))
+            except (TypeError, ValueError):
+                await self.send({"type": "error", "id": request_id, "message": "Ack bytes must be an integer"})
+                return
+            window = self.windows.get(request_id)
+            if window is not None:
+                window.ack(nbytes)
+        elif kind == "cancel":
+            task = self.tasks.get(request_id)
+            if task is not None:
+                task.cancel()
+        elif kind == "request":
+            await self.start(request_id, frame.get("op"), frame.get("body") or {})
+        else:
+            await self.send({"type": "error", "id": request_id, "message": f"Unknown frame type {kind!r}"})
+
+    async def start(self, request_id: str, op: Any, body: Any) -> None:
+        if not request_id or len(request_id) > MAX_ID_LENGTH or not request_id.isascii() or request_id in self.tasks:
+            status, detail = 400, error_body("Request ids must be unique ASCII of up to 64 characters", "INVALID_ID")
+        elif op not in self.routes:
+            status, detail = 404, error_body(f"Unknown operation {op!r}", "UNKNOWN_OPERATION")
+        elif len(self.tasks) >= self.max_in_flight:
+            status, detail = 429, error_body("Too many requests in flight on this connection", "TOO_MANY_IN_FLIGHT")
+        else:
+            self.requests += 1
+            task = asyncio.create_task(self.run(request_id, op, body))
+            self.tasks[request_id] = task
+            task.add_done_callback(lambda _, request_id=request_id: self.tasks.pop(request_id, None))
+            return
+        await self.send({"type": "response", "id": request_id, "status": status, "headers": {}, "body": detail})
+
+    async def run(self, request_id: str, op: str, body: Dict[str, Any]) -> None:
+        """Run one request through its REST endpoint; logged and timed like a REST request."""
+        bind_request(str(uuid.uuid4())[:8])
+        started = time.perf_counter()
+        status = 500
+        try:
+            model, endpoint = self.routes[op]
+            try:
+                result = await endpoint(model.model_validate(body), self.websocket)
+            except HTTPException as e:
+                status = e.status_code
+                await self.send({"type": "response", "id": request_id, "status": status,
+                                 "headers": e.headers or {}, "body": {"detail": e.detail}})
+            except ValidationError as e:
+                status = 422
+                await self.send({"type": "response", "id": request_id, "status": status, "headers": {},
+                                 "body": {"detail": jsonable_encoder(e.errors(include_url=False))}})
+            else:
+                status = await self.send_result(request_id, result)
+        except asyncio.CancelledError:
+            status = 499  # Client closed request, as nginx logs it
+            try:
+                await self.send({"type": "cancelled", "id": request_id})
+            except Exception:
+                pass  # The connection is gone
+            raise
+        except Exception as e:
+            logger.exception("WS %s failed: %s", op, str(e))
+            try:
+                await self.send({"type": "response", "id": request_id, "status": 500, "headers": {},
+                                 "body": error_body("Internal server error", "INTERNAL_ERROR")})
+            except Exception:
+                pass
+        finally:
+            self.windows.pop(request_id, None)
+            elapsed = time.perf_counter() - started
+            logger.info("WS %s - Status: %s - Time: %.3fs", op, status, elapsed,
+                        extra={"method": "WS", "path": op, "status": status, "duration_ms": round(elapsed * 1000, 1)})
+            if self.observe is not None:
+                self.observe(op, status, elapsed)
+
+    async def send_result(self, request_id: str, result: Any) -> int:
+        """Send an endpoint's return value as response, event or binary frames; returns its status."""
+        if not isinstance(result, Response):
+            await self.send({"type": "response", "id": request_id, "status": 200, "headers": {},
+                             "body": jsonable_encoder(result)})
+            return 200
+
+        headers = {key: value for key, value in result.headers.items() if key != "content-length"}
+        if isinstance(result, StreamingResponse) and (result.media_type or "").startswith("text/event-stream"):
+            try:
+                async for event, data in iterate_events(result.body_iterator):
+                    await self.send({"type": "event", "id": request_id, "event": event, "data": data})
+            except Exception as e:
+                # The stream was answered with 200 when it opened, so a failure ends it like a binary body
+                logger.warning("WS event stream failed part-way: %s", str(e))
+                await self.send({"type": "abort", "id": request_id,
+                                 "error": {"message": "Stream interrupted", "code": "STREAM_ERROR"}})
+                return result.status_code
+            finally:
+                await close_iterator(result.body_iterator)
+        elif isinstance(result, (StreamingResponse, FileResponse)):
+            body = result.body_iterator if isinstance(result, StreamingResponse) else iterate_file(result.path)
+            window = self.windows[request_id] = SendWindow(self.send_window)
+            await self.send({"type": "start", "id": request_id, "status": result.status_code, "headers": headers})
+            try:
+                async for chunk in body:
+                    chunk = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+                    await window.reserve(len(chunk))
+                    await self.send_bytes(request_id, chunk)
+            except Exception as e:
+                # Headers are out, so the failure can only end the stream, as it would end a REST body
+                logger.warning("WS stream failed part-way: %s", str(e))
+                await self.send({"type": "abort", "id": request_id,
+                                 "error": {"message": "Stream interrupted", "code": "STREAM_ERROR"}})
+                return result.status_code
+            finally:
+                await close_iterator(body)
+        else:
+            content = json.loads(result.body) if result.body and "json" in (result.media_type or "") else None
+            await self.send({"type": "response", "id": request_id, "status": result.status_code,
+                             "headers": headers, "body": content})
+            return result.status_code
+        await self.send({"type": "end", "id": request_id})
+        return result.status_code
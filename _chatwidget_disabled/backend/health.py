@@ -0,0 +1,175 @@
+"""
+Liveness and readiness for load balancer probes.
+A background task checks each upstream with a cheap authenticated call every
+few seconds and samples event-loop lag in between. Probes only read those
+cached results plus the circuit breakers and upstream limiters, so they cost
+the same under load as when idle and never wait on an upstream.
+"""
+
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Answers to a health check that mean the upstream works: 429 still proves the key and the network path
+HEALTHY_STATUSES = {200, 429}
+
+
+class UpstreamCheck:
+    """
+    Last known state of one upstream. `check` makes one call and returns its
+    HTTP status. The upstream is "failing" after one failed check and "down"
+    after failure_threshold in a row; one good check makes it "ok" again.
+    """
+
+    def __init__(self, name: str, check: Callable[[], Awaitable[int]], required: bool, failure_threshold: int = 2):
+        self.name = name
+        self.check = check
+        self.required = required
+        self.failure_threshold = failure_threshold
+        self.status = "unknown"
+        self.latency: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_error_at: Optional[float] = None
+        self.checked_at: Optional[float] = None
+        self.failures = 0
+
+    async def refresh(self, timeout: float) -> None:
+        started = time.perf_counter()
+        try:
+            status = await asyncio.wait_for(self.check(), timeout)
+            error = None if status in HEALTHY_STATUSES else f"HTTP {status}"
+        except asyncio.TimeoutError:
+            error = f"no answer in {timeout:g}s"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        self.latency = time.perf_counter() - started
+        self.checked_at = time.time()
+        if error is None:
+            if self.status not in ("ok", "unknown"):
+                logger.info("Upstream %s healthy again", self.name)
+            self.status = "ok"
+            self.failures = 0
+            return
+        self.failures += 1
+        self.last_error, self.last_error_at = error, self.checked_at
+        status = "down" if self.failures >= self.failure_threshold else "failing"
+        if status != self.status:
+            logger.warning("Upstream %s %s: %s", self.name, status, error)
+        self.status = status
+
+    def snapshot(self) -> dict:
+        return {
+            "status": self.status,
+            "required": self.required,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "checked_at": self.checked_at,
+            "last_error": self.last_error,
+            "last_error_at": self.last_error_at,
+        }
+
+
+class HealthMonitor:
+    """
+    Refreshes the upstream checks every `interval` seconds and measures
+    event-loop lag every `lag_interval` seconds, from one background task.
+
+    A worker is ready unless the worst lag of the last `lag_window` samples
+    exceeds `max_loop_lag`, more than `max_waiting` calls queue for one
+    upstream's limiter, or a required upstream is down: its check failed
+    repeatedly or every circuit breaker for it is open. Upstreams that are not
+    required are reported but never make the worker unready.
+    """
+
+    def __init__(
+        self,
+        checks: Sequence[UpstreamCheck],
+        limiters: Sequence,
+        breakers: Callable[[], List],
+        interval: float = 15.0,
+        timeout: float = 5.0,
+        lag_interval: float = 0.5,
+        lag_window: int = 10,
+        max_loop_lag: float = 0.5,
+        max_waiting: int = 64,
+    ):
+        self.checks = {check.name: check for check in checks}
+        self.limiters = limiters
+        self.breakers = breakers
+        self.interval = interval
+        self.timeout = timeout
+        self.lag_interval = lag_interval
+        self.max_loop_lag = max_loop_lag
+        self.max_waiting = max_waiting
+        self.lags: Deque[float] = deque(maxlen=lag_window)
+        self.started_at = time.time()
+        self.warmup: Optional[asyncio.Task] = None  # First checks wait for it, e.g. the upstream prewarm
+        self._refreshing: Optional[asyncio.Task] = None
+
+    @property
+    def loop_lag(self) -> float:
+        return max(self.lags, default=0.0)
+
+    async def refresh(self) -> None:
+        await asyncio.gather(*(check.refresh(self.timeout) for check in self.checks.values()))
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_refresh = loop.time()
+        try:
+            while True:
+                expected = loop.time() + self.lag_interval
+                await asyncio.sleep(self.lag_interval)
+                self.lags.append(max(0.0, loop.time() - expected))
+                if loop.time() < next_refresh or (self.warmup is not None and not self.warmup.done()):
+                    continue
+                # Checks run beside the lag sampling, and a slow round is never overlapped by the next
+                if self._refreshing is None or self._refreshing.done():
+                    self._refreshing = asyncio.create_task(self.refresh())
+                next_refresh = loop.time() + self.interval
+        finally:
+            if self._refreshing is not None:
+                self._refreshing.cancel()
+
+    def upstream_circuits(self) -> Dict[str, Dict[str, str]]:
+        """Circuit breaker states grouped by upstream; OpenAI breakers are named openai:<model>."""
+        circuits: Dict[str, Dict[str, str]] = {}
+        for breaker in self.breakers():
+            circuits.setdefault(breaker.name.split(":")[0], {})[breaker.name] = breaker.state
+        return circuits
+
+    def readiness(self) -> dict:
+        """Whether this worker should receive traffic, with the reasons when it should not."""
+        reasons = []
+        lag = self.loop_lag
+        if lag > self.max_loop_lag:
+            reasons.append(f"event loop lag {lag * 1000:.0f}ms")
+
+        pools = {}
+        for limiter in self.limiters:
+            pools[limiter.name] = limiter.stats()
+            if limiter.waiting > self.max_waiting:
+                reasons.append(f"{limiter.waiting} calls waiting for {limiter.name}")
+
+        circuits = self.upstream_circuits()
+        upstreams = {}
+        for name, check in self.checks.items():
+            upstream = {**check.snapshot(), "circuits": circuits.get(name, {})}
+            all_open = bool(upstream["circuits"]) and all(state == "open" for state in upstream["circuits"].values())
+            if all_open:
+                upstream["status"] = "down"
+            if check.required and upstream["status"] == "down":
+                reasons.append(f"{name} down: {'circuit open' if all_open else check.last_error}")
+            upstreams[name] = upstream
+
+        return {
+            "status": "not_ready" if reasons else "ready",
+            "reasons": reasons,
+            "loop_lag_ms": round(lag * 1000, 1),
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "pools": pools,
+            "upstreams": upstreams,
+        }
@@ -0,0 +1,123 @@
+"""
+Ingest the site's pages into the widget backend.
+Discovers routes from the Next.js app/ directory, fetches each rendered page
+from the running site and posts it to /api/pages, which extracts the main
+content once and precomputes its summary and details.
+
+Usage:
+    INGEST_API_TOKEN=... python ingest_pages.py --site http://localhost:3000 --backend http://localhost:8000
+    python ingest_pages.py --route /product/4001 --route /product/4002 --no-discover
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+from typing import List
+
+import httpx
+
+DEFAULT_APP_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "app")
+
+
+def discover_routes(app_dir: str) -> List[str]:
+    """
+    Static routes of a Next.js app directory.
+
+    Dynamic segments ([id]) cannot be enumerated from the file tree and are
+    skipped; pass those pages with --route. Route groups ((group)) do not
+    appear in URLs, and private folders (_name) are not routable.
+    """
+    routes = []
+    for directory, subdirectories, files in os.walk(app_dir):
+        subdirectories[:] = [name for name in subdirectories if name != "api" and not name.startswith("_")]
+        if not any(name in files for name in ("page.tsx", "page.jsx", "page.ts", "page.js")):
+            continue
+        segments = os.path.relpath(directory, app_dir).split(os.sep)
+        if any(segment.startswith("[") for segment in segments):
+            continue
+        path = "/".join(segment for segment in segments if segment != "." and not segment.startswith("("))
+        routes.append(f"/{path}")
+    return sorted(set(routes))
+
+
+async def ingest(
+    site: httpx.AsyncClient,
+    backend: httpx.AsyncClient,
+    route: str,
+    site_url: str,
+    args,
+    limit: asyncio.Semaphore
+) -> bool:
+    """Fetch one rendered page and post it to the backend; True on success."""
+    async with limit:
+        started = time.perf_counter()
+        try:
+            page = await site.get(route)
+            page.raise_for_status()
+            response = await backend.post("/api/pages", json={
+                "url": f"{site_url}{route}",
+                "html": page.text,
+                "model": args.model,
+                "precompute": not args.no_precompute,
+                "force": args.force
+            })
+        except httpx.HTTPError as e:
+            print(f"FAIL {route}: {e}")
+            return False
+
+        elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            error = response.json().get("detail", {}).get("error", {})
+            print(f"FAIL {route}: {response.status_code} {error.get('code')} {error.get('message')}")
+            return False
+
+        data = response.json()["data"]
+        if data["generated"]:
+            status = "generated " + ", ".join(data["generated"])
+        else:
+            status = "unchanged" if data["unchanged"] else "stored"
+        print(f"OK   {route} -> {data['page_id']} ({data['content_chars']} chars, "
+              f"{data['content_tokens']} tokens, {status}, {elapsed:.1f}s)")
+        return True
+
+
+async def main(args) -> int:
+    token = os.getenv("INGEST_API_TOKEN")
+    if not token:
+        print("INGEST_API_TOKEN must be set")
+        return 2
+
+    routes = discover_routes(args.app_dir) if not args.no_discover else []
+    routes = sorted(set(routes + args.route))
+    if not routes:
+        print("No routes to ingest")
+        return 2
+
+    site_url = args.site.rstrip("/")
+    limit = asyncio.Semaphore(args.concurrency)
+    started = time.perf_counter()
+    async with httpx.AsyncClient(base_url=site_url, timeout=30.0, follow_redirects=True) as site, \
+            httpx.AsyncClient(base_url=args.backend, timeout=300.0,
+                              headers={"Authorization": f"Bearer {token}"}) as backend:
+        results = await asyncio.gather(*(ingest(site, backend, route, site_url, args, limit) for route in routes))
+
+    failed = results.count(False)
+    print(f"{len(routes) - failed}/{len(routes)} pages ingested in {time.perf_counter() - started:.1f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--site", default="http://localhost:3000", help="base URL of the running site")
+    parser.add_argument("--backend", default="http://localhost:8000", help="base URL of the widget backend")
+    parser.add_argument("--app-dir", default=DEFAULT_APP_DIR, help="Next.js app/ directory to discover routes from")
+    parser.add_argument("--route", action="append", default=[], help="extra route to ingest, e.g. /product/4001")
+    parser.add_argument("--no-discover", action="store_true", help="only ingest --route paths")
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    parser.add_argument("--no-precompute", action="store_true", help="store content without generating summaries")
+    parser.add_argument("--force", action="store_true", help="regenerate summaries for unchanged pages")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args)))
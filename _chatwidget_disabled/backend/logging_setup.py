@@ -0,0 +1,144 @@
+"""
+Non-blocking structured logging.
+Log calls on the event loop only put the record on a queue; a background
+thread formats it and writes it to a size-rotated JSON log file (one per
+worker process when serve.py runs several) and the console. Records carry
+the id of the request they were logged in, and INFO logs can be sampled per
+request, so a busy period keeps every line of some requests rather than
+random lines of all of them.
+"""
+
+import os
+import json
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Dict, Optional
+
+from upstream import env_float, env_int
+
+LOG_FILE = os.getenv("LOG_FILE", "widget_backend.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_MAX_BYTES = env_int("LOG_MAX_BYTES", 10 * 1024 * 1024)
+LOG_BACKUP_COUNT = env_int("LOG_BACKUP_COUNT", 5)
+# Records waiting for the writer thread; beyond this, records are dropped rather than blocking
+LOG_QUEUE_SIZE = env_int("LOG_QUEUE_SIZE", 10000)
+# Share of requests whose INFO logs are kept; warnings and errors are always kept
+LOG_INFO_SAMPLE_RATE = env_float("LOG_INFO_SAMPLE_RATE", 1.0)
+
+CONSOLE_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - [%(request_id)s] %(message)s"
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+request_sampled_var: contextvars.ContextVar[bool] = contextvars.ContextVar("request_sampled", default=True)
+
+# Attributes every LogRecord has; anything else was passed with extra= and becomes a JSON field
+RESERVED_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+
+def bind_request(request_id: str) -> None:
+    """Tag logs from the current request (and tasks it starts) with its id, and decide whether to sample it."""
+    request_id_var.set(request_id)
+    request_sampled_var.set(LOG_INFO_SAMPLE_RATE >= 1.0 or random.random() < LOG_INFO_SAMPLE_RATE)
+
+
+class RequestContextFilter(logging.Filter):
+    """Adds the current request id to each record and drops INFO logs of unsampled requests."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get() or "-"
+        return record.levelno > logging.INFO or request_sampled_var.get()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with extra= fields as top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+            "location": f"{record.filename}:{record.lineno}",
+        }
+        for key in record.__dict__.keys() - RESERVED_ATTRS:
+            entry[key] = record.__dict__[key]
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queues records without formatting them, so message formatting happens on
+    the writer thread. Log arguments must therefore not be mutated after the
+    call, which holds for the ids, counts and timings logged here. When the
+    queue is full the record is dropped and counted instead of blocking.
+    """
+
+    def __init__(self, log_queue: queue.SimpleQueue, max_size: int):
+        super().__init__(log_queue)
+        self.max_size = max_size
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # SimpleQueue is unbounded but much cheaper than queue.Queue; bound it here
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+
+# The handler installed by setup_logging, so a second call does not add another writer
+_queue_handler: Optional[DeferredQueueHandler] = None
+
+
+def worker_log_file(path: str = LOG_FILE) -> str:
+    """
+    Log file of this process. Worker processes started by serve.py each get
+    their own file, suffixed with the pid, since rotating one shared file from
+    several processes loses and interleaves records.
+    """
+    if env_int("WIDGET_WORKERS", 1) <= 1:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.{os.getpid()}{extension or '.log'}"
+
+
+def setup_logging() -> DeferredQueueHandler:
+    """
+    Route all logging through a queue to a background writer thread; returns
+    the queue handler. Calling it again returns the handler already installed.
+    """
+    global _queue_handler
+    if _queue_handler is not None:
+        return _queue_handler
+    file_handler = RotatingFileHandler(
+        worker_log_file(), maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8",
+        delay=True,  # Opened by the writer thread on the first record, not at import
+    )
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue, LOG_QUEUE_SIZE)
+    queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    # Flush what is still queued when the process exits
+    atexit.register(listener.stop)
+    _queue_handler = queue_handler
+    return queue_handler
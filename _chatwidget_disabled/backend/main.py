@@ -4,36 +4,145 @@ Proxies requests to OpenAI API while keeping the API key secure.
 """
 
 import os
+import json
+import math
+import asyncio
+import contextvars
 import logging
+import secrets
 import time
 import uuid
-from typing import Optional, Dict, Any
-from contextlib import asynccontextmanager
+import importlib
+from typing import TYPE_CHECKING, Optional, Dict, Any, AsyncIterator, Awaitable, Callable, List, Tuple
+from urllib.parse import urlparse
+from contextlib import AsyncExitStack, asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, Request
+import httpx
+from fastapi import FastAPI, HTTPException, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
-from openai import OpenAI
-from elevenlabs.client import ElevenLabs
 from dotenv import load_dotenv
 
+from upstream import (
+    env_int,
+    env_float,
+    build_http_client,
+    openai_limiter,
+    elevenlabs_limiter,
+    OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE,
+    ELEVENLABS_MAX_CONNECTIONS,
+    ELEVENLABS_MAX_KEEPALIVE,
+    UPSTREAM_READ_TIMEOUT,
+    is_retryable,
+    is_sdk_error,
+    retry_after_seconds,
+)
+from admission import AdmissionController, SQLiteBucketStore
+from resilience import CircuitBreaker, CircuitOpenError, Hedger, RetryPolicy
+from router import AUTO, ModelRouter, Route, parse_candidates, parse_numbers
+from health import HealthMonitor, UpstreamCheck
+from channel import Channel
+from scheduler import (
+    BACKGROUND,
+    INTERACTIVE,
+    PRIORITIES,
+    DeadlineExceeded,
+    deadline_var,
+    priority_var,
+    schedule_as,
+    tenant_var,
+)
+from logging_setup import bind_request, setup_logging
+from metrics import (
+    Registry,
+    RequestMetricsMiddleware,
+    SharedMetrics,
+    resident_memory_bytes,
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+)
+from cache import ResponseCache, SQLiteCacheStore, make_cache_key, prompt_fingerprint
+from singleflight import SingleFlight, StreamFlight
+from audio_cache import AudioCache, cached_audio_response, format_type, make_audio_id
+from audio_formats import OUTPUT_FORMATS, negotiate_format
+from speech_pipeline import split_segments, pipelined_speech
+from budget import (
+    PROMPT_BUDGETS,
+    clean_lines,
+    count_message_tokens,
+    count_tokens,
+    fit_prompt,
+    get_encoder,
+    trim_to_budget,
+)
+from batch import BatchRunner
+from prefetch import Prefetcher
+from pages import PageStore, MAX_CONTENT_CHARS, content_hash, extract_main_content, make_page_id
+from sessions import (
+    SessionStore,
+    SQLiteSessionStore,
+    add_turn,
+    build_session_messages,
+    format_turns,
+    history_tokens,
+    turns_to_compact,
+)
+
+if TYPE_CHECKING:
+    # Imported on first use, or by the background prewarm; together they add ~0.6s to a cold start
+    from openai import AsyncOpenAI
+    from elevenlabs.client import AsyncElevenLabs
+
 # Load environment variables
 load_dotenv()
 
-# Configure enhanced logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('widget_backend.log')
-    ]
-)
+# Configure enhanced logging: JSON lines to a rotated widget_backend.log, written off the event loop
+log_handler = setup_logging()
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start serving at once, and warm the upstream SDKs, connections and
+    tokenizer in the background (see prewarm_upstreams). Upstream health
+    checks start once the prewarm is done.
+    
+    Shutdown starts once the server has stopped accepting connections and
+    in-flight requests, including audio streams, have finished or hit the
+    graceful shutdown timeout. Background session compactions get
+    SHUTDOWN_TASK_TIMEOUT seconds to finish before connections are closed;
+    prefetches still running are cancelled.
+    """
+    prewarm_task = asyncio.create_task(prewarm_upstreams()) if UPSTREAM_PREWARM else None
+    health_monitor.warmup = prewarm_task
+    health_task = asyncio.create_task(health_monitor.run())
+    metrics_task = asyncio.create_task(shared_metrics.run()) if shared_metrics is not None else None
+    logger.info("Worker %s ready", os.getpid())
+    yield
+    prefetches = set(prefetch_tasks.values())
+    for task in prefetches:
+        task.cancel()
+    await asyncio.gather(*prefetches, return_exceptions=True)
+    if session_compaction_tasks:
+        logger.info("Waiting for %s session compactions", len(session_compaction_tasks))
+        await asyncio.wait(list(session_compaction_tasks.values()), timeout=SHUTDOWN_TASK_TIMEOUT)
+    for task in (prewarm_task, health_task, metrics_task):
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    for http_client in (openai_http_client, elevenlabs_http_client):
+        if http_client is not None:
+            await http_client.aclose()
+    response_cache.close()
+    page_store.close()
+    session_store.close()
+    if admission.client_store is not None:
+        admission.client_store.close()
+    logger.info("Worker %s stopped", os.getpid())
+
 # Initialize FastAPI app
-app = FastAPI(title="ChatGPT Widget API", version="1.0.0")
+app = FastAPI(title="ChatGPT Widget API", version="1.0.0", lifespan=lifespan)
 
 # Configure CORS for widget access from any domain
 app.add_middleware(
@@ -42,17 +151,237 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Audio-Id", "X-Audio-Cache", "X-Audio-Format", "Content-Location", "Content-Range", "ETag", "Retry-After"],
 )
 
+# Prometheus metrics, served at /metrics
+metrics = Registry()
+request_seconds = metrics.histogram(
+    "widget_http_request_duration_seconds", "Time from request start to the last response byte.",
+    ("method", "route", "status")
+)
+requests_in_flight = metrics.gauge(
+    "widget_http_requests_in_flight", "Requests being handled, including responses still streaming."
+)
+openai_seconds = metrics.histogram(
+    "widget_openai_request_duration_seconds", "OpenAI completion time; streams are timed to their last token.",
+    ("endpoint", "model", "stream")
+)
+openai_first_token_seconds = metrics.histogram(
+    "widget_openai_time_to_first_token_seconds", "Time to the first token of a streamed OpenAI completion.",
+    ("endpoint", "model")
+)
+elevenlabs_first_byte_seconds = metrics.histogram(
+    "widget_elevenlabs_time_to_first_byte_seconds", "Time to the first audio byte of an ElevenLabs TTS stream.",
+    ("model",)
+)
+elevenlabs_stream_seconds = metrics.histogram(
+    "widget_elevenlabs_stream_duration_seconds", "Time to the last audio byte of a completed ElevenLabs TTS stream.",
+    ("model",)
+)
+llm_tokens = metrics.counter(
+    "widget_llm_tokens", "OpenAI tokens used, by endpoint, model and kind (prompt or completion).",
+    ("endpoint", "model", "kind")
+)
+errors = metrics.counter(
+    "widget_errors", "Upstream errors returned to clients, by endpoint and error code.",
+    ("endpoint", "code")
+)
+fallbacks = metrics.counter(
+    "widget_fallbacks", "Completions served by an endpoint's fallback model, by endpoint and fallback model.",
+    ("endpoint", "model")
+)
+model_routes = metrics.counter(
+    "widget_model_routes", "Completions routed, by endpoint, model picked and reason (see router.py).",
+    ("endpoint", "model", "reason")
+)
+truncated_completions = metrics.counter(
+    "widget_completions_truncated", "Completions cut off at max_tokens, by endpoint and model.",
+    ("endpoint", "model")
+)
+semantic_lookup_seconds = metrics.histogram(
+    "widget_semantic_cache_lookup_seconds", "Time to embed a chat question and search its page's semantic cache.",
+    ("result",), buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05)
+)
+# Counters the caches, limiters and coalescers keep anyway are read at scrape time
+metrics.callback(
+    "widget_cache_lookups", "Cache lookups by cache and result.", "counter", ("cache", "result"),
+    lambda: [
+        (("response", "hit"), response_cache.hits),
+        (("response", "shared_hit"), response_cache.shared_hits),
+        (("response", "miss"), response_cache.misses),
+        (("audio", "hit"), audio_cache.hits),
+        (("audio", "miss"), audio_cache.misses),
+        *([(("semantic", "hit"), semantic_cache.hits), (("semantic", "miss"), semantic_cache.misses)]
+          if semantic_cache is not None else []),
+    ]
+)
+metrics.callback(
+    "widget_semantic_cache_entries", "Chat answers held in the semantic cache.", "gauge", (),
+    lambda: [((), semantic_cache.entries)] if semantic_cache is not None else []
+)
+metrics.callback(
+    "widget_semantic_cache_audited", "Semantic cache hits sampled for false-hit review.", "counter", (),
+    lambda: [((), semantic_cache.audited)] if semantic_cache is not None else []
+)
+metrics.callback(
+    "widget_upstream_in_flight", "Upstream calls holding a concurrency slot.", "gauge", ("upstream",),
+    lambda: [((limiter.name,), limiter.in_flight) for limiter in (openai_limiter, elevenlabs_limiter)]
+)
+metrics.callback(
+    "widget_upstream_waiting", "Upstream calls waiting for a concurrency slot.", "gauge", ("upstream",),
+    lambda: [((limiter.name,), limiter.waiting) for limiter in (openai_limiter, elevenlabs_limiter)]
+)
+upstream_wait_seconds = metrics.histogram(
+    "widget_upstream_queue_wait_seconds", "Time upstream calls waited for a concurrency slot.",
+    ("upstream", "priority"), buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+metrics.callback(
+    "widget_upstream_queue_depth", "Upstream calls waiting for a concurrency slot, by priority class.", "gauge",
+    ("upstream", "priority"),
+    lambda: [((limiter.name, priority), limiter.queued[priority])
+             for limiter in (openai_limiter, elevenlabs_limiter) for priority in PRIORITIES]
+)
+metrics.callback(
+    "widget_upstream_dropped", "Queued upstream calls dropped because their deadline could not be met.", "counter",
+    ("upstream", "priority"),
+    lambda: [((limiter.name, priority), limiter.dropped[priority])
+             for limiter in (openai_limiter, elevenlabs_limiter) for priority in PRIORITIES]
+)
+metrics.callback(
+    "widget_upstream_preempted", "Background upstream calls cancelled and requeued for interactive ones.", "counter",
+    ("upstream",),
+    lambda: [((limiter.name,), limiter.preempted) for limiter in (openai_limiter, elevenlabs_limiter)]
+)
+for limiter in (openai_limiter, elevenlabs_limiter):
+    limiter.observe = lambda priority, seconds, name=limiter.name: upstream_wait_seconds.observe(seconds, name, priority)
+metrics.callback(
+    "widget_model_degraded", "Whether the router is failing over from a model on an endpoint: 1 degraded, 0 healthy.",
+    "gauge", ("endpoint", "model"),
+    lambda: [((endpoint, model), int(model_router.degraded(endpoint, model))) for endpoint, model in model_router.health],
+    aggregate="max"
+)
+metrics.callback(
+    "widget_admission_rejected", "Requests shed by admission control, by scope.", "counter", ("scope",),
+    lambda: [(("client",), admission.rejected_clients), (("upstream",), admission.rejected_upstream)]
+)
+metrics.callback(
+    "widget_admission_waited", "Requests that queued for upstream capacity before proceeding.", "counter", (),
+    lambda: [((), admission.waited)]
+)
+metrics.callback(
+    "widget_admission_upstream_rate", "Current admitted OpenAI call rate per model, in calls per second.",
+    "gauge", ("model",),
+    lambda: [((model,), bucket.rate) for model, bucket in admission.upstreams.items()]
+)
+metrics.callback(
+    "widget_upstream_retries", "Upstream calls retried after a transient failure.", "counter", ("upstream",),
+    lambda: [((policy.name,), policy.retries) for policy in (openai_retry, elevenlabs_retry)]
+)
+metrics.callback(
+    "widget_circuit_state", "Circuit breaker state: 0 closed, 1 half-open, 2 open.", "gauge", ("breaker",),
+    lambda: [((breaker.name,), CIRCUIT_STATE_VALUES[breaker.state]) for breaker in circuit_breakers()],
+    aggregate="max"
+)
+metrics.callback(
+    "widget_circuit_opened", "Times a circuit breaker opened.", "counter", ("breaker",),
+    lambda: [((breaker.name,), breaker.opened) for breaker in circuit_breakers()]
+)
+metrics.callback(
+    "widget_circuit_rejected", "Calls failed fast by an open circuit breaker.", "counter", ("breaker",),
+    lambda: [((breaker.name,), breaker.rejected) for breaker in circuit_breakers()]
+)
+metrics.callback(
+    "widget_hedged_requests", "Hedged OpenAI calls by whether the hedge answered first.", "counter",
+    ("endpoint", "model", "result"),
+    lambda: [
+        ((endpoint, model, result), count)
+        for (endpoint, model), hedged in hedger.hedged.items()
+        for result, count in (("won", hedger.won.get((endpoint, model), 0)),
+                              ("lost", hedged - hedger.won.get((endpoint, model), 0)))
+    ]
+)
+metrics.callback(
+    "widget_sessions", "Conversation sessions held in memory.", "gauge", (),
+    lambda: [((), len(session_store._sessions))]
+)
+metrics.callback(
+    "widget_session_compactions", "Session histories folded into their rolling summary, by result.", "counter",
+    ("result",),
+    lambda: [((result,), count) for result, count in session_compactions.items()]
+)
+metrics.callback(
+    "widget_prefetch_requests", "Prefetch requests by kind (summary or audio) and outcome.", "counter",
+    ("kind", "result"),
+    lambda: [((kind, result), count) for (kind, result), count in prefetcher.results.items()]
+)
+metrics.callback(
+    "widget_prefetch_hits", "Prefetched summaries and audio a later request was served, by kind.", "counter",
+    ("kind",),
+    lambda: [((kind,), count) for kind, count in prefetcher.hits.items()]
+)
+metrics.callback(
+    "widget_prefetch_wasted", "Prefetched summaries and audio that expired without being requested, by kind.",
+    "counter", ("kind",),
+    lambda: [((kind,), count) for kind, count in prefetcher.expire().items()]
+)
+metrics.callback(
+    "widget_log_records_dropped", "Log records dropped because the log writer fell behind.", "counter", (),
+    lambda: [((), log_handler.dropped)]
+)
+metrics.callback(
+    "widget_coalesced_requests", "Requests that joined an identical in-flight upstream call.", "counter", ("flight",),
+    lambda: [((flight.name,), flight.coalesced) for flight in (completion_flights, completion_streams, audio_streams)]
+)
+metrics.callback(
+    "process_resident_memory_bytes", "Resident memory of the backend process, in bytes.", "gauge", (),
+    lambda: [((), resident_memory_bytes())]
+)
+metrics.callback(
+    "widget_ready", "1 while the worker reports ready on /readyz.", "gauge", (),
+    lambda: [((), 1 if health_monitor.readiness()["status"] == "ready" else 0)]
+)
+metrics.callback(
+    "widget_event_loop_lag_seconds", "Worst event-loop lag over the recent samples.", "gauge", (),
+    lambda: [((), health_monitor.loop_lag)], aggregate="max"
+)
+metrics.callback(
+    "widget_upstream_health", "Last upstream health check: 0 ok or unknown, 1 failing, 2 down.", "gauge",
+    ("upstream",),
+    lambda: [((check.name,), UPSTREAM_HEALTH_VALUES[check.status]) for check in health_monitor.checks.values()],
+    aggregate="max"
+)
+metrics.callback(
+    "widget_ws_connections", "Open widget WebSocket connections.", "gauge", (),
+    lambda: [((), len(ws_channels))]
+)
+metrics.callback(
+    "widget_ws_requests_in_flight", "Requests running on widget WebSocket connections.", "gauge", (),
+    lambda: [((), sum(len(channel.tasks) for channel in ws_channels))]
+)
+app.add_middleware(RequestMetricsMiddleware, duration=request_seconds, in_flight=requests_in_flight)
+# Set by serve.py when running several workers, so /metrics on any worker covers all of them
+METRICS_DIR = os.getenv("METRICS_DIR")
+shared_metrics = SharedMetrics(metrics, METRICS_DIR, env_float("METRICS_SNAPSHOT_INTERVAL", 5.0)) if METRICS_DIR else None
+
+# Load balancer probes arrive every few seconds from every balancer; they are not logged
+PROBE_PATHS = {"/health", "/livez", "/readyz"}
+
 # Request logging middleware
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     """Log all incoming requests with timing and error handling."""
+    if request.url.path in PROBE_PATHS:
+        return await call_next(request)
     request_id = str(uuid.uuid4())[:8]
     start_time = time.time()
     
+    # Every log line of this request carries its id
+    bind_request(request_id)
+    
     # Log incoming request
-    logger.info(f"[{request_id}] {request.method} {request.url.path} - Request started")
+    logger.info("%s %s - Request started", request.method, request.url.path,
+                extra={"method": request.method, "path": request.url.path})
     
     try:
         # Process request
@@ -62,8 +391,10 @@ async def log_requests(request: Request, call_next):
         process_time = time.time() - start_time
         
         # Log successful response
-        logger.info(f"[{request_id}] {request.method} {request.url.path} - "
-                   f"Status: {response.status_code} - Time: {process_time:.3f}s")
+        logger.info("%s %s - Status: %s - Time: %.3fs",
+                   request.method, request.url.path, response.status_code, process_time,
+                   extra={"method": request.method, "path": request.url.path,
+                          "status": response.status_code, "duration_ms": round(process_time * 1000, 1)})
         
         return response
         
@@ -72,8 +403,10 @@ async def log_requests(request: Request, call_next):
         process_time = time.time() - start_time
         
         # Log error
-        logger.error(f"[{request_id}] {request.method} {request.url.path} - "
-                    f"Error: {str(e)} - Time: {process_time:.3f}s")
+        logger.error("%s %s - Error: %s - Time: %.3fs",
+                    request.method, request.url.path, str(e), process_time,
+                    extra={"method": request.method, "path": request.url.path,
+                           "duration_ms": round(process_time * 1000, 1)})
         
         # Re-raise the exception
         raise
@@ -90,19 +423,305 @@ if not ELEVENLABS_API_KEY:
     logger.error("ELEVENLABS_API_KEY not found in environment variables")
     raise ValueError("ELEVENLABS_API_KEY must be set")
 
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-elevenlabs_client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
+# Worker processes serving this app (set by serve.py); upstream budgets are split between them
+WIDGET_WORKERS = env_int("WIDGET_WORKERS", 1)
+# Client buckets in SQLite, so a client's quota holds across workers; per-process when unset
+ADMISSION_SQLITE_PATH = os.getenv("ADMISSION_SQLITE_PATH")
+# Admission control: per-client quotas, and per-model upstream buckets that adapt to OpenAI's rate limits
+admission = AdmissionController(
+    client_rate=env_float("ADMISSION_CLIENT_RATE", 5.0),  # Requests/s per client IP; 0 disables
+    client_burst=env_float("ADMISSION_CLIENT_BURST", 20.0),
+    upstream_rate=env_float("ADMISSION_UPSTREAM_RATE", 20.0),  # Starting OpenAI calls/s per model; 0 disables
+    upstream_burst=env_float("ADMISSION_UPSTREAM_BURST", 10.0),
+    upstream_min_rate=env_float("ADMISSION_UPSTREAM_MIN_RATE", 0.5),
+    upstream_max_rate=env_float("ADMISSION_UPSTREAM_MAX_RATE", 200.0),
+    increase=env_float("ADMISSION_AIMD_INCREASE", 1.0),
+    decrease=env_float("ADMISSION_AIMD_DECREASE", 0.5),
+    max_wait=env_float("ADMISSION_MAX_WAIT", 2.0),  # Longest a request queues for upstream capacity
+    workers=WIDGET_WORKERS,
+    client_store=SQLiteBucketStore(ADMISSION_SQLITE_PATH) if ADMISSION_SQLITE_PATH else None,
+)
+# Take the client address from X-Forwarded-For; only enable behind a proxy that sets it
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true"
+# Time a request's upstream calls have to finish in; calls still queued when it cannot be met are dropped
+INTERACTIVE_DEADLINE = env_float("INTERACTIVE_DEADLINE", 30.0)
+BACKGROUND_DEADLINE = env_float("BACKGROUND_DEADLINE", 300.0)
+# Upstream admission tokens background work leaves in each model's bucket for interactive calls
+ADMISSION_BACKGROUND_SPARE = env_float("ADMISSION_BACKGROUND_SPARE", 5.0)
+# Model of the OpenAI call in progress, so response hooks know which bucket to update
+openai_model_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("openai_model", default=None)
+
+async def observe_openai_response(response) -> None:
+    """Feed every OpenAI response, including the SDK's own retries, into admission control."""
+    model = openai_model_var.get()
+    if model is not None:
+        admission.observe_upstream(model, response.status_code, response.headers)
+
+# Resilience: jittered retries for transient failures, a circuit breaker per OpenAI model and for
+# ElevenLabs, and optional hedging of slow non-streamed completions
+UPSTREAM_RETRY_ATTEMPTS = env_int("UPSTREAM_RETRY_ATTEMPTS", 3)
+UPSTREAM_RETRY_BASE_DELAY = env_float("UPSTREAM_RETRY_BASE_DELAY", 0.25)
+UPSTREAM_RETRY_MAX_DELAY = env_float("UPSTREAM_RETRY_MAX_DELAY", 4.0)
+UPSTREAM_RETRY_BUDGET = env_float("UPSTREAM_RETRY_BUDGET", 0.2)  # Retries allowed per call, on average
+openai_retry = RetryPolicy(
+    "openai", UPSTREAM_RETRY_ATTEMPTS, UPSTREAM_RETRY_BASE_DELAY, UPSTREAM_RETRY_MAX_DELAY, UPSTREAM_RETRY_BUDGET
+)
+elevenlabs_retry = RetryPolicy(
+    "elevenlabs", UPSTREAM_RETRY_ATTEMPTS, UPSTREAM_RETRY_BASE_DELAY, UPSTREAM_RETRY_MAX_DELAY, UPSTREAM_RETRY_BUDGET
+)
+BREAKER_FAILURE_THRESHOLD = env_int("BREAKER_FAILURE_THRESHOLD", 5)  # Consecutive failures that open a circuit
+BREAKER_RESET_TIMEOUT = env_float("BREAKER_RESET_TIMEOUT", 30.0)  # Seconds before an open circuit is probed
+openai_breakers: Dict[str, CircuitBreaker] = {}
+elevenlabs_breaker = CircuitBreaker("elevenlabs", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+CIRCUIT_STATE_VALUES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+hedger = Hedger(
+    percentile=env_float("HEDGE_PERCENTILE", 0.0),  # Hedge calls slower than this percentile (e.g. 95); 0 disables
+    min_delay=env_float("HEDGE_MIN_DELAY", 0.05),
+    max_ratio=env_float("HEDGE_MAX_RATIO", 0.05),  # Largest share of calls that may be hedged
+)
+
+# Seconds shutdown waits for background work (session compactions) once requests have drained
+SHUTDOWN_TASK_TIMEOUT = env_float("SHUTDOWN_TASK_TIMEOUT", 10.0)
+
+# Upstream clients, built per worker on first use so their pools belong to that worker's event loop
+# and a cold start does not wait for the SDK imports
+openai_http_client: Optional[httpx.AsyncClient] = None
+elevenlabs_http_client: Optional[httpx.AsyncClient] = None
+openai_client: Optional["AsyncOpenAI"] = None
+elevenlabs_client: Optional["AsyncElevenLabs"] = None
+ELEVENLABS_BASE_URL = os.getenv("ELEVENLABS_BASE_URL") or "https://api.elevenlabs.io"
+
+# Right after startup, import the SDKs and load the tokenizer off the event loop and open this many
+# keep-alive connections to each upstream, so the first requests skip the imports and TLS handshakes
+UPSTREAM_PREWARM = os.getenv("UPSTREAM_PREWARM", "true").lower() == "true"
+UPSTREAM_PREWARM_CONNECTIONS = env_int("UPSTREAM_PREWARM_CONNECTIONS", 2)
+
+def get_openai_client() -> "AsyncOpenAI":
+    """The worker's OpenAI client, built on first use over a pooled keep-alive HTTP client."""
+    global openai_http_client, openai_client
+    if openai_client is None:
+        from openai import AsyncOpenAI
+        openai_http_client = build_http_client(
+            OPENAI_MAX_CONNECTIONS, OPENAI_MAX_KEEPALIVE, event_hooks={"response": [observe_openai_response]}
+        )
+        # The SDK's own retries are off; every attempt goes through the retry policy and circuit breakers below
+        openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=openai_http_client, max_retries=0)
+    return openai_client
+
+def get_elevenlabs_client() -> "AsyncElevenLabs":
+    """The worker's ElevenLabs client, built on first use over a pooled keep-alive HTTP client."""
+    global elevenlabs_http_client, elevenlabs_client
+    if elevenlabs_client is None:
+        from elevenlabs.client import AsyncElevenLabs
+        elevenlabs_http_client = build_http_client(ELEVENLABS_MAX_CONNECTIONS, ELEVENLABS_MAX_KEEPALIVE)
+        elevenlabs_client = AsyncElevenLabs(
+            api_key=ELEVENLABS_API_KEY,
+            base_url=ELEVENLABS_BASE_URL,
+            timeout=UPSTREAM_READ_TIMEOUT,
+            httpx_client=elevenlabs_http_client,
+        )
+    return elevenlabs_client
+
+async def open_connections(http_client: httpx.AsyncClient, url: str) -> None:
+    """Open keep-alive connections to an upstream with unauthenticated GETs; any response will do."""
+    async def connect():
+        try:
+            response = await http_client.get(url)
+            await response.aclose()
+        except httpx.HTTPError as e:
+            logger.warning("Prewarming %s failed: %s", url, str(e))
+    
+    await asyncio.gather(*(connect() for _ in range(UPSTREAM_PREWARM_CONNECTIONS)))
+
+async def prewarm_upstreams() -> None:
+    """
+    Import the SDKs and load the default model's tokenizer in threads, then
+    build the clients and open connections to both upstreams. Requests that
+    arrive first build what they need themselves; connections left idle for
+    longer than UPSTREAM_KEEPALIVE_EXPIRY are closed again.
+    """
+    started = time.perf_counter()
+    await asyncio.gather(
+        asyncio.to_thread(importlib.import_module, "openai"),
+        asyncio.to_thread(importlib.import_module, "elevenlabs.client"),
+        asyncio.to_thread(get_encoder, DEFAULT_MODEL),
+    )
+    imported = time.perf_counter()
+    openai = get_openai_client()
+    get_elevenlabs_client()
+    await asyncio.gather(
+        open_connections(openai_http_client, str(openai.base_url)),
+        open_connections(elevenlabs_http_client, ELEVENLABS_BASE_URL),
+    )
+    logger.info(
+        "Upstreams prewarmed in %.3fs (imports and tokenizer %.3fs)",
+        time.perf_counter() - started, imported - started
+    )
+
+# Response cache for deterministic completions; set RESPONSE_CACHE_SQLITE_PATH to share hits across workers
+RESPONSE_CACHE_SQLITE_PATH = os.getenv("RESPONSE_CACHE_SQLITE_PATH")
+response_cache = ResponseCache(
+    max_entries=env_int("RESPONSE_CACHE_MAX_ENTRIES", 1024),
+    max_bytes=env_int("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024),
+    default_ttl=env_float("RESPONSE_CACHE_TTL", 86400.0),
+    store=SQLiteCacheStore(RESPONSE_CACHE_SQLITE_PATH) if RESPONSE_CACHE_SQLITE_PATH else None,
+)
+
+# Identical in-flight upstream calls are coalesced so a traffic spike costs one call per key
+completion_flights = SingleFlight("completions")
+completion_streams = StreamFlight("completion_streams")
+audio_streams = StreamFlight(
+    "audio",
+    max_lag=env_int("AUDIO_STREAM_MAX_LAG_CHUNKS", 32),
+    max_replay_bytes=env_int("AUDIO_STREAM_MAX_REPLAY_BYTES", 8 * 1024 * 1024),
+)
+
+# Generated audio is kept on disk so repeat listens skip both OpenAI and ElevenLabs
+audio_cache = AudioCache(
+    directory=os.getenv("AUDIO_CACHE_DIR", "audio_cache"),
+    max_bytes=env_int("AUDIO_CACHE_MAX_BYTES", 512 * 1024 * 1024),
+)
+
+# Near-duplicate chat questions on the same page reuse an earlier answer; opt in with SEMANTIC_CACHE=true
+semantic_cache = None
+if os.getenv("SEMANTIC_CACHE", "false").lower() == "true":
+    # Only imported when enabled: NumPy adds ~0.1s to a cold start
+    from semantic_cache import SemanticCache, make_scope, available as semantic_cache_available
+    if semantic_cache_available():
+        semantic_cache = SemanticCache(
+            threshold=env_float("SEMANTIC_CACHE_THRESHOLD", 0.8),  # Cosine similarity needed for a hit
+            ttl=env_float("SEMANTIC_CACHE_TTL", 3600.0),
+            max_entries=env_int("SEMANTIC_CACHE_MAX_ENTRIES", 10000),
+            max_per_scope=env_int("SEMANTIC_CACHE_MAX_PER_PAGE", 256),
+            audit_rate=env_float("SEMANTIC_CACHE_AUDIT_RATE", 0.01),  # Share of hits kept for false-hit review
+        )
+    else:
+        logger.warning("SEMANTIC_CACHE is set but NumPy is not installed; semantic cache disabled")
+
+# Site pages ingested ahead of time; the widget refers to them by page_id instead of re-sending text
+page_store = PageStore(os.getenv("PAGE_STORE_PATH", "pages.sqlite3"))
+# Multi-turn chat history kept server-side; set SESSION_SQLITE_PATH to persist sessions and share them across workers
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH")
+session_store = SessionStore(
+    max_sessions=env_int("SESSION_MAX_SESSIONS", 10000),
+    ttl=env_float("SESSION_TTL", 86400.0),  # Idle seconds before a session expires
+    store=SQLiteSessionStore(SESSION_SQLITE_PATH) if SESSION_SQLITE_PATH else None,
+)
+SESSION_CONTEXT_TOKENS = env_int("SESSION_CONTEXT_TOKENS", 2000)  # Page context, trimmed once per session
+SESSION_HISTORY_TOKENS = env_int("SESSION_HISTORY_TOKENS", 1500)  # Recent turns sent verbatim
+SESSION_TURN_CONTEXT_TOKENS = env_int("SESSION_TURN_CONTEXT_TOKENS", 500)  # Context sent with one turn, such as selected text
+SESSION_SUMMARY_TOKENS = env_int("SESSION_SUMMARY_TOKENS", 300)  # Rolling summary of older turns
+SESSION_MAX_TURNS = env_int("SESSION_MAX_TURNS", 50)
+# In-flight background compactions by session id, and their outcomes
+session_compaction_tasks: Dict[str, asyncio.Task] = {}
+session_compactions = {"completed": 0, "failed": 0}
+
+# Bearer token for page ingestion; ingestion is disabled when unset
+INGEST_API_TOKEN = os.getenv("INGEST_API_TOKEN")
+# Bearer token for the operational endpoints (/metrics, /cache/stats and /router/stats); they are disabled when unset
+OPS_API_TOKEN = os.getenv("OPS_API_TOKEN")
+
+# Batch summarization for offline pre-warm jobs
+BATCH_MAX_DOCUMENTS = env_int("BATCH_MAX_DOCUMENTS", 100)
+BATCH_MAX_PARALLEL = env_int("BATCH_MAX_PARALLEL", 8)
+BATCH_RETRY_ATTEMPTS = env_int("BATCH_RETRY_ATTEMPTS", 3)
+
+# Speculative prefetch of a page's summary (and audio) when the widget loads; budgets are split between workers
+PREFETCH_ENABLED = os.getenv("PREFETCH", "true").lower() == "true"
+prefetcher = Prefetcher(
+    site_per_minute=env_float("PREFETCH_SITE_PER_MINUTE", 30.0) / WIDGET_WORKERS,  # 0 is no limit
+    per_minute=env_float("PREFETCH_PER_MINUTE", 120.0) / WIDGET_WORKERS,  # Across sites; 0 is no limit
+    ttl=env_float("PREFETCH_TTL", 600.0),  # Seconds a prefetch waits for its click before it counts as wasted
+)
+# In-flight prefetches by the cache keys they produce
+prefetch_tasks: Dict[str, asyncio.Task] = {}
+
+# Pipelined listen starts TTS on each finished bullet instead of waiting for the whole summary
+LISTEN_PIPELINE = os.getenv("LISTEN_PIPELINE", "false").lower() == "true"
+LISTEN_PIPELINE_PARALLEL = env_int("LISTEN_PIPELINE_PARALLEL", 2)
+# Audio format for clients that give no codec or network hint; hinted clients get one from audio_formats.py
+LISTEN_OUTPUT_FORMAT = os.getenv("LISTEN_OUTPUT_FORMAT", "mp3_44100_128")
+# Formats clients may get, e.g. to leave out those the ElevenLabs plan does not include
+LISTEN_OUTPUT_FORMATS = set(filter(None, os.getenv("LISTEN_OUTPUT_FORMATS", "").split(","))) or OUTPUT_FORMATS
+
+# Model used when a request does not name one and routing is off
+DEFAULT_MODEL = "gpt-3.5-turbo"
+
+# Cheaper model an endpoint degrades to while its model is failing or over its rate limit; empty disables
+FALLBACK_MODELS = {
+    "chat": os.getenv("FALLBACK_MODEL_CHAT"),
+    "summarize": os.getenv("FALLBACK_MODEL_SUMMARIZE"),
+    "details": os.getenv("FALLBACK_MODEL_DETAILS", DEFAULT_MODEL),
+    "listen": os.getenv("FALLBACK_MODEL_LISTEN"),
+}
+
+# Output token caps per endpoint; with routing on, lowered to what recent answers needed
+MAX_OUTPUT_TOKENS = {
+    "chat": 1000,
+    "summarize": 500,
+    "details": 1500,
+    "listen": 500,
+    "session_summary": SESSION_SUMMARY_TOKENS,
+}
+
+# Model routing picks the model and max_tokens of requests that name no model, and fails over from degraded models
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "false").lower() == "true"
+# Models requests may name; empty allows any
+ALLOWED_MODELS = set(filter(None, os.getenv("ALLOWED_MODELS", "").split(",")))
+# Model of completions no request named one for
+IMPLICIT_MODEL = AUTO if MODEL_ROUTING else DEFAULT_MODEL
+model_router = ModelRouter(
+    # Candidates per endpoint in order of preference, e.g. ROUTER_MODELS_CHAT=gpt-4o-mini<2000,gpt-4o
+    candidates={
+        endpoint: parse_candidates(os.getenv(f"ROUTER_MODELS_{endpoint.upper()}", "")) or [(DEFAULT_MODEL, None)]
+        for endpoint in MAX_OUTPUT_TOKENS
+    },
+    fallbacks=FALLBACK_MODELS,
+    max_tokens=MAX_OUTPUT_TOKENS,
+    # p95 seconds of a non-streamed completion above which a model counts as degraded on the endpoint
+    latency_targets={
+        "chat": 10.0, "summarize": 10.0, "details": 20.0, "session_summary": 15.0,
+        **parse_numbers(os.getenv("ROUTER_LATENCY_TARGETS", "")),
+    },
+    first_token_target=env_float("ROUTER_FIRST_TOKEN_TARGET", 3.0),  # p95 seconds to the first streamed token
+    max_error_rate=env_float("ROUTER_MAX_ERROR_RATE", 0.2),
+    min_samples=env_int("ROUTER_MIN_SAMPLES", 5),
+    probe_interval=env_float("ROUTER_PROBE_INTERVAL", 15.0),
+    output_headroom=env_float("ROUTER_OUTPUT_HEADROOM", 1.5),  # max_tokens as a multiple of the p99 answer length
+    allowed=ALLOWED_MODELS,
+    context_windows={
+        model: int(tokens) for model, tokens in parse_numbers(os.getenv("ROUTER_CONTEXT_WINDOWS", "")).items()
+    },
+    is_open=lambda model: model in openai_breakers and openai_breakers[model].state == CircuitBreaker.OPEN,
+    enabled=MODEL_ROUTING,
+)
+
+# Raw input cap; prompts are fitted to the per-endpoint token budgets in budget.py
+MAX_INPUT_CHARS = env_int("MAX_INPUT_CHARS", 20000)
 
 # Helper function for OpenAI error handling
 def handle_openai_error(e: Exception, endpoint: str, request_id: str = None) -> HTTPException:
+    """Map an OpenAI error to an HTTP error and count it by endpoint and error code."""
+    error = openai_error_response(e, endpoint, request_id)
+    errors.inc(endpoint, error.detail["error"]["code"])
+    return error
+
+def openai_error_response(e: Exception, endpoint: str, request_id: str = None) -> HTTPException:
     """Handle OpenAI API errors with detailed logging and appropriate HTTP responses."""
     error_str = str(e).lower()
     request_prefix = f"[{request_id}] " if request_id else ""
     
-    logger.error(f"{request_prefix}OpenAI API error in {endpoint}: {str(e)}")
+    logger.error("%sOpenAI API error in %s: %s", request_prefix, endpoint, str(e))
     
-    if "api_key" in error_str or "authentication" in error_str:
-        logger.error(f"{request_prefix}Authentication error - check API key configuration")
+    if isinstance(e, CircuitOpenError):
+        logger.warning("%sOpenAI call failed fast in %s - circuit open", request_prefix, endpoint)
+        return upstream_unavailable_error(
+            "AI service temporarily unavailable. Please try again later.", "UPSTREAM_UNAVAILABLE", e.retry_after
+        )
+    elif isinstance(e, DeadlineExceeded):
+        return upstream_unavailable_error("AI service busy. Please try again shortly.", "UPSTREAM_BUSY", 1.0)
+    elif "api_key" in error_str or "authentication" in error_str:
+        logger.error("%sAuthentication error - check API key configuration", request_prefix)
         return HTTPException(
             status_code=500,
             detail={
@@ -113,18 +732,12 @@ def handle_openai_error(e: Exception, endpoint: str, request_id: str = None) ->
             }
         )
     elif "rate" in error_str or "quota" in error_str:
-        logger.warning(f"{request_prefix}Rate limit exceeded in {endpoint}")
-        return HTTPException(
-            status_code=429,
-            detail={
-                "error": {
-                    "message": "Rate limit exceeded. Please try again later.",
-                    "code": "RATE_LIMIT_ERROR"
-                }
-            }
+        logger.warning("%sRate limit exceeded in %s", request_prefix, endpoint)
+        return rate_limited_error(
+            "Rate limit exceeded. Please try again later.", "RATE_LIMIT_ERROR", retry_after_seconds(e) or 1.0
         )
     elif "model" in error_str:
-        logger.error(f"{request_prefix}Invalid model specified in {endpoint}")
+        logger.error("%sInvalid model specified in %s", request_prefix, endpoint)
         return HTTPException(
             status_code=400,
             detail={
@@ -135,7 +748,7 @@ def handle_openai_error(e: Exception, endpoint: str, request_id: str = None) ->
             }
         )
     elif "maximum context length" in error_str or "token" in error_str:
-        logger.warning(f"{request_prefix}Token limit exceeded in {endpoint}")
+        logger.warning("%sToken limit exceeded in %s", request_prefix, endpoint)
         return HTTPException(
             status_code=400,
             detail={
@@ -146,7 +759,7 @@ def handle_openai_error(e: Exception, endpoint: str, request_id: str = None) ->
             }
         )
     else:
-        logger.error(f"{request_prefix}Unexpected OpenAI error in {endpoint}: {str(e)}")
+        logger.error("%sUnexpected OpenAI error in %s: %s", request_prefix, endpoint, str(e))
         return HTTPException(
             status_code=500,
             detail={
@@ -157,18 +770,929 @@ def handle_openai_error(e: Exception, endpoint: str, request_id: str = None) ->
             }
         )
 
+# Prompt builders shared by the summarize, details and listen endpoints
+SUMMARY_SYSTEM_PROMPT = "You are a helpful assistant that provides clear, concise summaries in exactly 3 bullet points. Focus on the most important information."
+
+DETAILS_SYSTEM_PROMPT = "You are an expert analyst who provides thorough, insightful analyses of texts. Focus on being comprehensive yet clear and well-organized."
+
+def build_summary_messages(text: str) -> list:
+    """Build the chat messages for a 3-bullet summary of the text."""
+    prompt = f"""Please summarize the following text in exactly 3 bullet points. Each bullet point should be concise and capture a key aspect of the content. Format your response as:
+• First key point
+• Second key point  
+• Third key point
+
+Text to summarize:
+{text}"""
+    return [
+        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def build_details_messages(text: str) -> list:
+    """Build the chat messages for a sectioned detailed analysis of the text."""
+    prompt = f"""Please provide a comprehensive analysis of the following text. Structure your analysis with these sections:
+
+📋 **Overview**
+Brief summary of what this content is about.
+
+🎯 **Key Themes & Concepts**
+Identify and explain the main themes and important concepts.
+
+💡 **Main Arguments**
+List the primary arguments or points being made.
+
+📊 **Supporting Evidence**
+Note any data, examples, or evidence used to support the arguments.
+
+✍️ **Style & Tone**
+Describe the writing style, tone, and approach.
+
+👥 **Target Audience**
+Who is this content intended for?
+
+🔍 **Critical Analysis**
+Provide insights about strengths, weaknesses, or notable aspects.
+
+🎓 **Implications & Takeaways**
+What are the key takeaways or implications of this content?
+
+Text to analyze:
+{text}"""
+    return [
+        {"role": "system", "content": DETAILS_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def build_chat_messages(message: str, context: Optional[str] = None) -> list:
+    """Build the chat messages for a user message with optional page context."""
+    messages = []
+    if context:
+        messages.append({"role": "system", "content": f"Context: {context}"})
+    messages.append({"role": "user", "content": message})
+    return messages
+
+# Prompt versions are part of the cache key, so editing a prompt invalidates its cached responses
+SUMMARY_PROMPT_VERSION = prompt_fingerprint(build_summary_messages(""))
+DETAILS_PROMPT_VERSION = prompt_fingerprint(build_details_messages(""))
+
+# Server-Sent Events helpers for token streaming
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_completion_events(
+    endpoint: str,
+    response_type: str,
+    route: Route,
+    cache_key: Optional[str] = None,
+    prompt_usage: Optional[Dict[str, int]] = None,
+    on_complete: Optional[Callable[[str, str], Awaitable[None]]] = None,
+    **params
+) -> AsyncIterator[str]:
+    """
+    Stream a chat completion on the route's model as SSE frames.
+    
+    The first frame is a comment sent once the upstream stream is open, so
+    failures before that point still surface as normal HTTP errors. Later
+    failures are reported in-band as an `error` event. Completed streams are
+    stored in the response cache when a cache_key is given, and passed to
+    on_complete with the model that answered when one is given. prompt_usage (prompt budget and token
+    counts before and after trimming) and the routing decision are merged
+    into the usage of the `done` frame.
+    
+    Frames:
+        event: token  data: {"delta": "..."}
+        event: done   data: {"model": ..., "type": ..., "usage": {...}}
+        event: error  data: {"error": {"message": ..., "code": ...}}
+    """
+    start_time = time.time()
+    
+    async with AsyncExitStack() as upstream_slot:
+        upstream_start = time.perf_counter()
+        try:
+            stream, model = await open_completion_stream(endpoint, route, params, upstream_slot)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise handle_openai_error(e, endpoint)
+        
+        yield ": stream opened\n\n"
+        
+        usage = None
+        finish_reason = None
+        first_token_time = None
+        parts = []
+        try:
+            async for chunk in stream:
+                if chunk.usage:
+                    usage = completion_usage(chunk)
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    finish_reason = chunk.choices[0].finish_reason
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                        first_token_seconds = time.perf_counter() - upstream_start
+                        openai_first_token_seconds.observe(first_token_seconds, endpoint, model)
+                        model_router.observe(endpoint, model, first_token_seconds, ok=True, streamed=True)
+                    parts.append(chunk.choices[0].delta.content)
+                    yield sse_event("token", {"delta": chunk.choices[0].delta.content})
+        except Exception as e:
+            if is_retryable(e):
+                model_router.observe(endpoint, model, None, ok=False, streamed=True)
+            yield sse_event("error", handle_openai_error(e, endpoint).detail)
+            return
+        finally:
+            await stream.close()
+    
+    openai_seconds.observe(time.perf_counter() - upstream_start, endpoint, model, "true")
+    record_usage(endpoint, model, usage, finish_reason)
+    logger.info("Streamed %s request successful - "
+               "Time to first token: %.3fs, "
+               "Total time: %.3fs",
+               endpoint, (first_token_time or 0), time.time() - start_time)
+    
+    # A fallback model's answer is not cached as the requested model's
+    if cache_key and not route.is_fallback(model):
+        await response_cache.set(cache_key, {"message": "".join(parts), "type": response_type})
+    if on_complete:
+        await on_complete("".join(parts), model)
+    
+    yield sse_event("done", {
+        "model": model,
+        "type": response_type,
+        "usage": {**(usage or {}), **(prompt_usage or {}), **route.usage(model)},
+        **({"fallback": True} if route.is_fallback(model) else {})
+    })
+
+async def open_event_stream(events: AsyncIterator[str]) -> StreamingResponse:
+    """Open the upstream stream, then hand the remaining frames to the client."""
+    await events.__anext__()
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+def cached_event_stream(data: Dict[str, Any]) -> StreamingResponse:
+    """Replay a cached response in the same SSE framing as a live stream."""
+    async def events():
+        yield sse_event("token", {"delta": data["message"]})
+        yield sse_event("done", {"type": data.get("type"), "usage": None, "cached": True})
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# Admission control
+def rate_limited_error(message: str, code: str, retry_after: float) -> HTTPException:
+    """429 telling the client when to come back."""
+    return HTTPException(
+        status_code=429,
+        detail={
+            "error": {
+                "message": message,
+                "code": code
+            }
+        },
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+def upstream_unavailable_error(message: str, code: str, retry_after: float) -> HTTPException:
+    """503 for an upstream whose circuit is open, telling the client when it will be tried again."""
+    return HTTPException(
+        status_code=503,
+        detail={
+            "error": {
+                "message": message,
+                "code": code
+            }
+        },
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+async def admit_client(http_request: Request) -> None:
+    """Shed requests from a client that is over its request quota."""
+    if TRUST_FORWARDED_FOR and "x-forwarded-for" in http_request.headers:
+        client = http_request.headers["x-forwarded-for"].split(",")[0].strip()
+    else:
+        client = http_request.client.host if http_request.client else "unknown"
+    
+    retry_after = await admission.admit_client(client)
+    if retry_after is not None:
+        logger.warning("Client rate limited - %s, retry after %.1fs", client, retry_after)
+        raise rate_limited_error("Too many requests. Please slow down.", "CLIENT_RATE_LIMITED", retry_after)
+
+def request_site(http_request: Request) -> str:
+    """The site embedding the widget: the Origin host, or "direct" for requests without one."""
+    origin = http_request.headers.get("origin")
+    return (urlparse(origin).hostname if origin else None) or "direct"
+
+def schedule_request(http_request: Request, priority: str = INTERACTIVE) -> None:
+    """
+    Schedule this request's upstream calls in the given priority class, for
+    the site embedding the widget, under the class deadline. The class comes
+    from the endpoint, never from the request body: visitor requests are
+    interactive, while prefetch, batch and ingestion pass BACKGROUND.
+    """
+    deadline = BACKGROUND_DEADLINE if priority == BACKGROUND else INTERACTIVE_DEADLINE
+    schedule_as(priority, request_site(http_request), deadline)
+
+def requested_model(request: BaseModel) -> str:
+    """
+    The model a request's completions are for: the one it names, or the
+    implicit model (routed with MODEL_ROUTING on) when it names none. Models
+    outside ALLOWED_MODELS are refused.
+    """
+    if "model" not in request.model_fields_set:
+        return IMPLICIT_MODEL
+    if not model_router.is_allowed(request.model):
+        logger.warning("Request rejected - model not allowed: %s", request.model)
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "error": {
+                    "message": f"Model {request.model} is not allowed",
+                    "code": "VALIDATION_ERROR"
+                }
+            }
+        )
+    return request.model
+
+async def admit_openai(model: str, max_wait: Optional[float] = None) -> None:
+    """Wait briefly for OpenAI capacity for model, or shed the request before it costs a round trip."""
+    openai_model_var.set(model)
+    # Fail fast while the model's circuit is open, without queueing for capacity first
+    openai_breaker(model).check()
+    if priority_var.get() == BACKGROUND and openai_limiter.enabled:
+        # Background work waits as long as its deadline allows, and only for capacity interactive calls leave over
+        deadline = deadline_var.get()
+        if max_wait is None and deadline is not None:
+            max_wait = max(0.0, deadline - time.monotonic())
+        retry_after = await admission.admit_upstream(model, max_wait, spare=ADMISSION_BACKGROUND_SPARE)
+    else:
+        retry_after = await admission.admit_upstream(model, max_wait)
+    if retry_after is not None:
+        logger.warning("OpenAI call shed by admission control - Model: %s, retry after %.1fs", model, retry_after)
+        raise rate_limited_error("Rate limit exceeded. Please try again later.", "RATE_LIMIT_ERROR", retry_after)
+
+# Upstream calls shared by the endpoints
+def openai_breaker(model: str) -> CircuitBreaker:
+    """Circuit breaker for one OpenAI model; models fail and recover independently."""
+    breaker = openai_breakers.get(model)
+    if breaker is None:
+        breaker = openai_breakers[model] = CircuitBreaker(
+            f"openai:{model}", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT
+        )
+    return breaker
+
+def circuit_breakers() -> List[CircuitBreaker]:
+    return [elevenlabs_breaker, *openai_breakers.values()]
+
+async def check_openai() -> int:
+    """List models with the configured key: free, and fails with 401 when the key is invalid."""
+    client = get_openai_client()
+    response = await openai_http_client.get(
+        f"{client.base_url}models", headers={"Authorization": f"Bearer {OPENAI_API_KEY}"}
+    )
+    return response.status_code
+
+async def check_elevenlabs() -> int:
+    """List TTS models with the configured key: free, and fails with 401 when the key is invalid."""
+    get_elevenlabs_client()
+    response = await elevenlabs_http_client.get(
+        f"{ELEVENLABS_BASE_URL}/v1/models", headers={"xi-api-key": ELEVENLABS_API_KEY}
+    )
+    return response.status_code
+
+# Readiness for load balancers, from cached upstream checks, event-loop lag and limiter queues. Only the
+# upstreams in READY_REQUIRED_UPSTREAMS make a worker unready; others are reported on /readyz only
+READY_REQUIRED_UPSTREAMS = set(os.getenv("READY_REQUIRED_UPSTREAMS", "openai").split(","))
+UPSTREAM_HEALTH_VALUES = {"unknown": 0, "ok": 0, "failing": 1, "down": 2}
+health_monitor = HealthMonitor(
+    checks=[
+        UpstreamCheck("openai", check_openai, "openai" in READY_REQUIRED_UPSTREAMS),
+        UpstreamCheck("elevenlabs", check_elevenlabs, "elevenlabs" in READY_REQUIRED_UPSTREAMS),
+    ],
+    limiters=(openai_limiter, elevenlabs_limiter),
+    breakers=circuit_breakers,
+    interval=env_float("HEALTH_CHECK_INTERVAL", 15.0),
+    timeout=env_float("HEALTH_CHECK_TIMEOUT", 5.0),
+    max_loop_lag=env_float("READY_MAX_LOOP_LAG", 0.5),  # Seconds
+    max_waiting=env_int("READY_MAX_UPSTREAM_WAITING", 64),  # Calls queued for one upstream's limiter
+)
+
+def is_transient(error: Exception) -> bool:
+    """Upstream failures worth retrying; requests shed by our own admission control are not."""
+    return not isinstance(error, HTTPException) and is_retryable(error)
+
+def route_completion(endpoint: str, model: str, input_tokens: int) -> Route:
+    """Pick the model and max_tokens of one completion with input_tokens of prompt, and count the decision."""
+    route = model_router.route(endpoint, model, input_tokens)
+    model_routes.inc(endpoint, route.model, route.reason)
+    if route.model != model:
+        logger.info("Completion routed - Endpoint: %s, Requested: %s, Model: %s, Reason: %s, "
+                   "Input tokens: %s, Max tokens: %s",
+                   endpoint, model, route.model, route.reason, input_tokens, route.max_tokens)
+    return route
+
+async def with_fallback(endpoint: str, route: Route, call: Callable[[str], Awaitable[Any]]) -> Tuple[Any, str]:
+    """
+    Run call with the route's model, and run it again with the route's
+    fallback (the next healthy candidate, or the endpoint's fallback model)
+    if the model's circuit is open, it is over its rate limit or it keeps
+    failing. Returns the result and the model that produced it.
+    """
+    model, fallback = route.model, route.fallback
+    try:
+        return await call(model), model
+    except Exception as e:
+        if not fallback or fallback == model or not (isinstance(e, CircuitOpenError) or is_retryable(e)):
+            raise
+        logger.warning("%s failed on %s, falling back to %s: %s", endpoint, model, fallback, str(e))
+        fallbacks.inc(endpoint, fallback)
+        return await call(fallback), fallback
+
+async def completion_attempt(endpoint: str, model: str, params: Dict[str, Any], admit: bool = True):
+    """
+    One non-streamed OpenAI call through admission control, the model's
+    circuit breaker and the limiter. Its latency, or its failure, is
+    reported to the model router.
+    """
+    if admit:
+        await admit_openai(model)
+    else:
+        openai_model_var.set(model)
+    async def call():
+        upstream_start = time.perf_counter()
+        try:
+            response = await get_openai_client().chat.completions.create(model=model, **params)
+        except Exception as e:
+            if is_retryable(e):
+                model_router.observe(endpoint, model, None, ok=False)
+            raise
+        seconds = time.perf_counter() - upstream_start
+        openai_seconds.observe(seconds, endpoint, model, "false")
+        model_router.observe(endpoint, model, seconds, ok=True)
+        return response
+    
+    # Background calls may be preempted and run again, which is safe before any output is returned
+    with openai_breaker(model).guard():
+        return await openai_limiter.call(call)
+
+async def create_completion(endpoint: str, route: Route, **params) -> Tuple[Any, str]:
+    """
+    Non-streamed completion on the route's model with retries, hedging and
+    the route's fallback model.
+    
+    Returns the response and the model that produced it. A hedge is only
+    sent when the model's admission bucket has a token to spare.
+    """
+    async def complete(model: str):
+        return await openai_retry.call(
+            lambda: hedger.run(
+                (endpoint, model),
+                lambda hedge: completion_attempt(endpoint, model, params, admit=not hedge),
+                # Background work is not worth a second upstream call
+                may_hedge=lambda: priority_var.get() != BACKGROUND and admission.try_upstream(model)
+            ),
+            retry_on=is_transient
+        )
+    
+    return await with_fallback(endpoint, route, complete)
+
+async def open_completion_stream(
+    endpoint: str, route: Route, params: Dict[str, Any], upstream_slot: AsyncExitStack
+) -> Tuple[Any, str]:
+    """
+    Open a streamed completion on the route's model, retrying until the
+    stream is open and falling back to the route's fallback model. A limiter
+    slot is taken only once admission control lets the call through, and is
+    handed to upstream_slot so the caller holds it for the life of the
+    stream. The caller reports the time to the first token to the model
+    router. Returns the stream and the model serving it.
+    """
+    async def open_stream(stream_model: str):
+        # The fallback is only used if it has capacity right away
+        await admit_openai(stream_model, max_wait=None if stream_model == route.model else 0.0)
+        
+        async def attempt():
+            with openai_breaker(stream_model).guard():
+                try:
+                    return await get_openai_client().chat.completions.create(
+                        model=stream_model,
+                        stream=True,
+                        stream_options={"include_usage": True},
+                        **params
+                    )
+                except Exception as e:
+                    if is_retryable(e):
+                        model_router.observe(endpoint, stream_model, None, ok=False, streamed=True)
+                    raise
+        
+        # A failed attempt gives its slot back before the fallback queues for one
+        async with AsyncExitStack() as attempt_slot:
+            await attempt_slot.enter_async_context(openai_limiter.slot())
+            stream = await openai_retry.call(attempt, retry_on=is_transient)
+            upstream_slot.push_async_exit(attempt_slot.pop_all())
+            return stream
+    
+    return await with_fallback(endpoint, route, open_stream)
+
+def record_usage(
+    endpoint: str, model: str, usage: Optional[Dict[str, int]], finish_reason: Optional[str] = None
+) -> None:
+    """Count the prompt and completion tokens of one completion, and report its length to the model router."""
+    if usage:
+        llm_tokens.inc(endpoint, model, "prompt", amount=usage["prompt_tokens"])
+        llm_tokens.inc(endpoint, model, "completion", amount=usage["completion_tokens"])
+        if usage.get("cached_tokens"):
+            llm_tokens.inc(endpoint, model, "cached_prompt", amount=usage["cached_tokens"])
+        model_router.observe_output(endpoint, usage["completion_tokens"])
+    if finish_reason == "length":
+        truncated_completions.inc(endpoint, model)
+        logger.warning("Completion cut off at max_tokens - Endpoint: %s, Model: %s", endpoint, model)
+
+def completion_usage(response) -> Dict[str, int]:
+    """Token usage reported by OpenAI for a completion, including prompt tokens served from its prompt cache."""
+    usage = {
+        "prompt_tokens": response.usage.prompt_tokens,
+        "completion_tokens": response.usage.completion_tokens,
+        "total_tokens": response.usage.total_tokens
+    }
+    details = getattr(response.usage, "prompt_tokens_details", None)
+    cached = details.get("cached_tokens") if isinstance(details, dict) else getattr(details, "cached_tokens", None)
+    if cached is not None:
+        usage["cached_tokens"] = cached
+    return usage
+
+async def generate_summary(text: str, model: str, cache_key: str) -> Dict[str, Any]:
+    """Generate a 3-bullet summary with OpenAI and store it in the response cache."""
+    start_time = time.time()
+    messages, prompt_usage = fit_prompt("summarize", model, build_summary_messages, text)
+    route = route_completion("summarize", model, prompt_usage["prompt_tokens_after_trim"])
+    
+    response, used_model = await create_completion(
+        "summarize", route,
+        messages=messages,
+        max_tokens=route.max_tokens,
+        temperature=0.3
+    )
+    record_usage("summarize", used_model, completion_usage(response), response.choices[0].finish_reason)
+    
+    summary = response.choices[0].message.content
+    processing_time = time.time() - start_time
+    
+    # Validate bullet points in response
+    bullet_count = summary.count('•')
+    logger.info("Summary generated - Processing time: %.3fs, "
+               "Tokens used: %s, "
+               "Bullet points found: %s",
+               processing_time, response.usage.total_tokens, bullet_count)
+    
+    if bullet_count != 3:
+        logger.warning("Summary doesn't contain exactly 3 bullet points, found: %s", bullet_count)
+    
+    data = {
+        "message": summary,
+        "type": "summary"
+    }
+    usage = {**completion_usage(response), **prompt_usage, **route.usage(used_model)}
+    if route.is_fallback(used_model):
+        # A fallback model's answer is not cached as the requested model's
+        return {**data, "model": used_model, "fallback": True, "usage": usage}
+    await response_cache.set(cache_key, data)
+    return {**data, "usage": usage}
+
+async def generate_details(text: str, model: str, cache_key: str) -> Dict[str, Any]:
+    """Generate a sectioned detailed analysis with OpenAI and store it in the response cache."""
+    start_time = time.time()
+    messages, prompt_usage = fit_prompt("details", model, build_details_messages, text)
+    route = route_completion("details", model, prompt_usage["prompt_tokens_after_trim"])
+    
+    # Higher token limit for detailed response
+    response, used_model = await create_completion(
+        "details", route,
+        messages=messages,
+        max_tokens=route.max_tokens,
+        temperature=0.4
+    )
+    record_usage("details", used_model, completion_usage(response), response.choices[0].finish_reason)
+    
+    analysis = response.choices[0].message.content
+    processing_time = time.time() - start_time
+    
+    # Validate analysis sections
+    section_count = analysis.count('**')
+    logger.info("Detailed analysis generated - Processing time: %.3fs, "
+               "Tokens used: %s, "
+               "Analysis sections found: %s, "
+               "Response length: %s chars",
+               processing_time, response.usage.total_tokens, section_count//2, len(analysis))
+    
+    if section_count < 16:  # 8 sections × 2 (opening and closing **)
+        logger.warning("Analysis may be incomplete, expected 8 sections but found %s", section_count//2)
+    
+    data = {
+        "message": analysis,
+        "type": "detailed_analysis"
+    }
+    usage = {**completion_usage(response), **prompt_usage, **route.usage(used_model)}
+    if route.is_fallback(used_model):
+        return {**data, "model": used_model, "fallback": True, "usage": usage}
+    await response_cache.set(cache_key, data)
+    return {**data, "usage": usage}
+
+async def synthesize_speech(
+    text: str,
+    voice_id: str,
+    model_id: str,
+    output_format: str,
+    previous_text: Optional[str] = None
+) -> AsyncIterator[bytes]:
+    """Stream TTS audio bytes from ElevenLabs."""
+    # previous_text keeps intonation continuous when a summary is voiced in segments
+    continuity = {"previous_text": previous_text} if previous_text else {}
+    
+    async with elevenlabs_limiter.slot():
+        upstream_start = time.perf_counter()
+        
+        async def open_audio():
+            # Retried until the first audio byte arrives; after that a failure ends the stream
+            with elevenlabs_breaker.guard():
+                audio_stream = get_elevenlabs_client().text_to_speech.convert_as_stream(
+                    text=text,
+                    voice_id=voice_id,
+                    model_id=model_id,
+                    output_format=output_format,
+                    **continuity
+                )
+                async for chunk in audio_stream:
+                    if isinstance(chunk, bytes):
+                        return audio_stream, chunk
+                return audio_stream, b""
+        
+        audio_stream, first_chunk = await elevenlabs_retry.call(open_audio)
+        if first_chunk:
+            elevenlabs_first_byte_seconds.observe(time.perf_counter() - upstream_start, model_id)
+            yield first_chunk
+        
+        async for chunk in audio_stream:
+            if isinstance(chunk, bytes):
+                yield chunk
+        elevenlabs_stream_seconds.observe(time.perf_counter() - upstream_start, model_id)
+
+async def stream_summary_deltas(text: str, model: str, cache_key: str, parts: list) -> AsyncIterator[str]:
+    """Stream summary tokens from OpenAI, collecting them into parts and caching the full summary."""
+    messages, prompt_usage = fit_prompt("summarize", model, build_summary_messages, text)
+    route = route_completion("listen", model, prompt_usage["prompt_tokens_after_trim"])
+    
+    async with AsyncExitStack() as upstream_slot:
+        upstream_start = time.perf_counter()
+        stream, model = await open_completion_stream(
+            "listen", route, {"messages": messages, "max_tokens": route.max_tokens, "temperature": 0.3}, upstream_slot
+        )
+        usage = None
+        finish_reason = None
+        try:
+            async for chunk in stream:
+                if chunk.usage:
+                    usage = {
+                        "prompt_tokens": chunk.usage.prompt_tokens,
+                        "completion_tokens": chunk.usage.completion_tokens
+                    }
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    finish_reason = chunk.choices[0].finish_reason
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if not parts:
+                        first_token_seconds = time.perf_counter() - upstream_start
+                        openai_first_token_seconds.observe(first_token_seconds, "listen", model)
+                        model_router.observe("listen", model, first_token_seconds, ok=True, streamed=True)
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+    
+    openai_seconds.observe(time.perf_counter() - upstream_start, "listen", model, "true")
+    record_usage("listen", model, usage, finish_reason)
+    
+    if not route.is_fallback(model):
+        await response_cache.set(cache_key, {"message": "".join(parts), "type": "summary"})
+
+async def pipelined_listen_audio(
+    text: str,
+    model: str,
+    voice_id: str,
+    model_id: str,
+    output_format: str,
+    summary_cache_key: str,
+    request_key: str
+) -> AsyncIterator[bytes]:
+    """
+    Voice a summary while it is still being generated.
+    
+    Each finished bullet is sent to TTS immediately and the audio segments are
+    concatenated in order. The full summary and audio are cached at the end.
+    """
+    start_time = time.time()
+    first_byte_time = None
+    summary_parts = []
+    audio_chunks = []
+    
+    async for chunk in pipelined_speech(
+        split_segments(stream_summary_deltas(text, model, summary_cache_key, summary_parts)),
+        lambda segment, previous_text: synthesize_speech(segment, voice_id, model_id, output_format, previous_text),
+        max_parallel=LISTEN_PIPELINE_PARALLEL
+    ):
+        if first_byte_time is None:
+            first_byte_time = time.time() - start_time
+        audio_chunks.append(chunk)
+        yield chunk
+    
+    logger.info("Pipelined listen audio complete - Time to first audio byte: %.3fs, "
+               "Total time: %.3fs",
+               (first_byte_time or 0), time.time() - start_time)
+    
+    audio_id = make_audio_id("".join(summary_parts), voice_id, model_id, output_format)
+    await audio_cache.store(audio_id, b"".join(audio_chunks), request_key)
+
+async def open_audio_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Wait for the first audio chunk, then relay the rest.
+    
+    Upstream failures before any audio is produced propagate to the caller
+    and become a normal HTTP error. Once audio has been sent, a failure ends
+    the stream at the last complete chunk instead of tearing down the
+    connection with a traceback; the partial audio is never cached.
+    """
+    try:
+        first_chunk = await chunks.__anext__()
+    except StopAsyncIteration:
+        first_chunk = b""
+    
+    async def relay():
+        if first_chunk:
+            yield first_chunk
+        try:
+            async for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            logger.error("Audio stream interrupted by upstream error: %s", str(e))
+    
+    return relay()
+
+# Ingested pages
+PAGE_RESPONSE_TYPES = {"summary": "summary", "details": "detailed_analysis"}
+
+async def load_page(page_id: str) -> Dict[str, Any]:
+    """Ingested page by id, or a 404 error."""
+    page = await page_store.get(page_id)
+    if page is None:
+        logger.warning("Page not found: %s", page_id)
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "error": {
+                    "message": "Page not found",
+                    "code": "PAGE_NOT_FOUND"
+                }
+            }
+        )
+    return page
+
+async def restore_page_response(
+    page: Optional[Dict[str, Any]],
+    kind: str,
+    model: str,
+    prompt_version: str,
+    cache_key: str
+) -> Optional[Dict[str, Any]]:
+    """Summary or details precomputed at ingestion, put back into the response cache after it expired there."""
+    if not page or not page[kind] or page["model"] != model or page[f"{kind}_version"] != prompt_version:
+        return None
+    data = {"message": page[kind], "type": PAGE_RESPONSE_TYPES[kind]}
+    await response_cache.set(cache_key, data)
+    return data
+
+def page_info(page: Dict[str, Any]) -> Dict[str, Any]:
+    """Public description of a stored page."""
+    return {
+        "page_id": page["page_id"],
+        "url": page["url"],
+        "title": page["title"],
+        "content_chars": len(page["content"]),
+        "has_summary": page["summary_version"] == SUMMARY_PROMPT_VERSION and bool(page["summary"]),
+        "has_details": page["details_version"] == DETAILS_PROMPT_VERSION and bool(page["details"]),
+        "model": page["model"],
+        "updated_at": page["updated_at"]
+    }
+
+def require_ingest_token(http_request: Request) -> None:
+    """Reject ingestion calls without the configured bearer token."""
+    if not INGEST_API_TOKEN:
+        raise HTTPException(
+            status_code=403,
+            detail={
+                "error": {
+                    "message": "Page ingestion is disabled",
+                    "code": "INGEST_DISABLED"
+                }
+            }
+        )
+    
+    authorization = http_request.headers.get("authorization", "")
+    if not secrets.compare_digest(authorization, f"Bearer {INGEST_API_TOKEN}"):
+        logger.warning("Page ingestion rejected - invalid token")
+        raise HTTPException(
+            status_code=401,
+            detail={
+                "error": {
+                    "message": "Invalid ingestion token",
+                    "code": "UNAUTHORIZED"
+                }
+            }
+        )
+
+def require_ops_token(http_request: Request) -> None:
+    """Reject calls to the operational endpoints without the configured bearer token."""
+    if not OPS_API_TOKEN:
+        raise HTTPException(
+            status_code=403,
+            detail={
+                "error": {
+                    "message": "Operational endpoints are disabled",
+                    "code": "OPS_DISABLED"
+                }
+            }
+        )
+    
+    authorization = http_request.headers.get("authorization", "")
+    if not secrets.compare_digest(authorization, f"Bearer {OPS_API_TOKEN}"):
+        logger.warning("Operational endpoint rejected - invalid token")
+        raise HTTPException(
+            status_code=401,
+            detail={
+                "error": {
+                    "message": "Invalid ops token",
+                    "code": "UNAUTHORIZED"
+                }
+            }
+        )
+
+# Conversation sessions
+SESSION_SUMMARY_SYSTEM_PROMPT = "You keep a running summary of a conversation between a website visitor and an assistant. Merge the previous summary and the new exchanges into one concise summary that keeps the facts, preferences and open questions needed to continue the conversation. Reply with the summary only."
+
+def page_context(page: Dict[str, Any]) -> str:
+    """Chat context for an ingested page."""
+    return f"Page: {page['title']}\nURL: {page['url']}\n\n{page['content']}"
+
+async def load_session(session_id: str) -> Dict[str, Any]:
+    """Session by id, or a 404 error."""
+    session = await session_store.get(session_id)
+    if session is None:
+        logger.warning("Session not found: %s", session_id)
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "error": {
+                    "message": "Session not found or expired",
+                    "code": "SESSION_NOT_FOUND"
+                }
+            }
+        )
+    return session
+
+def session_info(session: Dict[str, Any]) -> Dict[str, Any]:
+    """Public view of a session, for restoring the conversation in the widget."""
+    return {
+        "session_id": session["session_id"],
+        "page_id": session["page_id"],
+        "summary": session["summary"],
+        "summarized_turns": session["summarized_turns"],
+        "turns": [{"role": turn["role"], "content": turn["content"]} for turn in session["turns"]],
+        "history_tokens": history_tokens(session),
+        "created_at": session["created_at"],
+        "updated_at": session["updated_at"]
+    }
+
+async def record_session_turn(session_id: str, message: str, reply: str, model: str) -> None:
+    """Store a finished exchange, and start compacting the history once it outgrows its budget."""
+    # Re-read the session: with a shared store another worker may have changed it during the call
+    session = await session_store.get(session_id)
+    if session is None:
+        return
+    add_turn(session, message, reply, lambda text: count_tokens(text, model), SESSION_MAX_TURNS)
+    await session_store.save(session)
+    
+    if turns_to_compact(session, SESSION_HISTORY_TOKENS) and session_id not in session_compaction_tasks:
+        task = asyncio.create_task(compact_session(session_id))
+        session_compaction_tasks[session_id] = task
+        task.add_done_callback(lambda _: session_compaction_tasks.pop(session_id, None))
+
+async def compact_session(session_id: str) -> None:
+    """Fold the oldest turns of a session into its rolling summary, off the request path."""
+    schedule_as(BACKGROUND, tenant_var.get(), BACKGROUND_DEADLINE)
+    session = await session_store.get(session_id)
+    if session is None:
+        return
+    count = turns_to_compact(session, SESSION_HISTORY_TOKENS)
+    if not count:
+        return
+    summarized_turns = session["summarized_turns"]
+    
+    messages = [
+        {"role": "system", "content": SESSION_SUMMARY_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Previous summary: {session['summary'] or 'none'}\n\n"
+                                    f"New exchanges:\n{format_turns(session['turns'][:count])}"}
+    ]
+    
+    try:
+        route = route_completion("session_summary", IMPLICIT_MODEL, count_message_tokens(messages, DEFAULT_MODEL))
+        response, model = await create_completion(
+            "session_summary", route,
+            messages=messages,
+            max_tokens=route.max_tokens,
+            temperature=0.2
+        )
+    except Exception as e:
+        # The history stays as it is; prompts leave out the oldest turns until a later compaction succeeds
+        session_compactions["failed"] += 1
+        logger.warning("Session compaction failed - Session: %s: %s", session_id, str(e))
+        return
+    record_usage("session_summary", model, completion_usage(response), response.choices[0].finish_reason)
+    
+    # Turns added meanwhile are kept; the summary is dropped if the session was compacted or deleted meanwhile
+    session = await session_store.get(session_id)
+    if session is None or session["summarized_turns"] != summarized_turns:
+        return
+    session["summary"] = response.choices[0].message.content.strip()
+    del session["turns"][:count]
+    session["summarized_turns"] += count
+    await session_store.save(session)
+    session_compactions["completed"] += 1
+    logger.info("Session compacted - Session: %s, Turns summarized: %s, "
+               "History tokens left: %s",
+               session_id, count, history_tokens(session))
+
 # Request/Response models
 class ChatRequest(BaseModel):
     """Chat request model."""
-    message: str = Field(..., min_length=1, max_length=4000)
-    context: Optional[str] = Field(None, max_length=4000)
-    model: str = Field(default="gpt-3.5-turbo")
+    message: str = Field(default="", max_length=MAX_INPUT_CHARS)
+    context: Optional[str] = Field(None, max_length=MAX_INPUT_CHARS)
+    page_id: Optional[str] = Field(None, max_length=64)  # Ingested page used as content (or chat context)
+    session_id: Optional[str] = Field(None, max_length=64)  # Chat session holding the conversation history
+    model: str = Field(default=DEFAULT_MODEL)
+    stream: bool = Field(default=False)  # Stream tokens as Server-Sent Events
+
+class SessionRequest(BaseModel):
+    """Session creation request model: the page or context the conversation is about."""
+    page_id: Optional[str] = Field(None, max_length=64)
+    context: Optional[str] = Field(None, max_length=MAX_INPUT_CHARS)
 
 class ListenRequest(BaseModel):
     """Listen (TTS) request model."""
-    message: str = Field(..., min_length=1, max_length=4000)
+    message: str = Field(default="", max_length=MAX_INPUT_CHARS)
+    page_id: Optional[str] = Field(None, max_length=64)  # Ingested page to voice instead of message
+    model: str = Field(default=DEFAULT_MODEL)  # OpenAI model of the summary that is voiced
     voice_id: str = Field(default="JBFqnCBsd6RMkjVDRZzb")  # Default voice
     model_id: str = Field(default="eleven_multilingual_v2")
+    pipeline: bool = Field(default=LISTEN_PIPELINE)  # Start TTS on the first finished bullet
+    output_format: Optional[str] = Field(None, max_length=32)  # Exact TTS format, e.g. opus_48000_32
+    formats: Optional[List[str]] = Field(None, max_length=8)  # Codecs the client can play, best first: opus, mp3, pcm
+    network: Optional[str] = Field(None, max_length=16)  # effectiveType of the client's connection, or save-data
+
+class PrefetchRequest(BaseModel):
+    """Prefetch request model: the page the widget was loaded on, and the listen request it may lead to."""
+    message: str = Field(default="", max_length=MAX_INPUT_CHARS)
+    page_id: Optional[str] = Field(None, max_length=64)  # Ingested page used as content
+    model: str = Field(default=DEFAULT_MODEL)
+    audio: bool = Field(default=False)  # Voice the summary too, as /api/listen would with the fields below
+    voice_id: str = Field(default="JBFqnCBsd6RMkjVDRZzb")
+    model_id: str = Field(default="eleven_multilingual_v2")
+    formats: Optional[List[str]] = Field(None, max_length=8)
+    network: Optional[str] = Field(None, max_length=16)
+
+class BatchDocument(BaseModel):
+    """One document in a batch summarization request."""
+    id: str = Field(..., min_length=1, max_length=200)
+    text: str = Field(..., min_length=1, max_length=MAX_INPUT_CHARS)
+
+class BatchSummarizeRequest(BaseModel):
+    """Batch summarization request model."""
+    documents: List[BatchDocument] = Field(..., min_length=1, max_length=BATCH_MAX_DOCUMENTS)
+    model: str = Field(default=DEFAULT_MODEL)
+    max_parallel: int = Field(default=BATCH_MAX_PARALLEL, ge=1, le=BATCH_MAX_PARALLEL)
+
+class PageIngestRequest(BaseModel):
+    """Page ingestion request model: rendered HTML or already extracted text."""
+    url: str = Field(..., min_length=1, max_length=2048)
+    html: Optional[str] = Field(None, max_length=4 * 1024 * 1024)
+    content: Optional[str] = Field(None, max_length=MAX_CONTENT_CHARS)
+    title: Optional[str] = Field(None, max_length=500)
+    model: str = Field(default=DEFAULT_MODEL)
+    precompute: bool = Field(default=True)  # Generate summary and details now
+    force: bool = Field(default=False)  # Regenerate even if the page is unchanged
 
 class ChatResponse(BaseModel):
     """Chat response model."""
@@ -182,43 +1706,132 @@ class HealthResponse(BaseModel):
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
-    """Health check endpoint."""
-    logger.info("Health check requested")
+    """Overall status for humans and old monitors; always 200. Load balancers should use /readyz."""
+    ready = health_monitor.readiness()["status"] == "ready"
+    return HealthResponse(status="healthy" if ready else "unhealthy", version="1.0.0")
+
+@app.get("/livez")
+async def liveness():
+    """Liveness: answering at all means the event loop is running. Never checks upstreams."""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readiness():
+    """
+    Readiness: 503 while this worker should get no traffic. Reads only state
+    the health monitor keeps up to date in the background.
+    """
+    report = health_monitor.readiness()
+    return JSONResponse(status_code=200 if report["status"] == "ready" else 503, content=report)
+
+@app.get("/cache/stats")
+async def cache_stats(http_request: Request):
+    """Response cache hit/miss/eviction counters and request coalescing counts; needs the OPS_API_TOKEN bearer token."""
+    require_ops_token(http_request)
+    return {
+        **({"semantic_cache": semantic_cache.stats()} if semantic_cache is not None else {}),
+        **response_cache.stats(),
+        "coalescing": {
+            "completions": completion_flights.stats(),
+            "completion_streams": completion_streams.stats(),
+            "audio": audio_streams.stats()
+        },
+        "audio_cache": audio_cache.stats(),
+        "prefetch": prefetcher.stats()
+    }
+
+@app.get("/router/stats")
+async def router_stats(http_request: Request):
+    """
+    Model router estimates: latency, error rate and degraded state per endpoint and model, answer lengths.
     
-    try:
-        # Test OpenAI client configuration
-        if not OPENAI_API_KEY:
-            logger.error("Health check failed - OpenAI API key not configured")
-            return HealthResponse(status="unhealthy", version="1.0.0")
-        
-        # Test ElevenLabs client configuration
-        if not ELEVENLABS_API_KEY:
-            logger.error("Health check failed - ElevenLabs API key not configured")
-            return HealthResponse(status="unhealthy", version="1.0.0")
-        
-        logger.info("Health check passed - all systems operational")
-        return HealthResponse(status="healthy", version="1.0.0")
-        
-    except Exception as e:
-        logger.error(f"Health check failed with exception: {str(e)}")
-        return HealthResponse(status="unhealthy", version="1.0.0")
+    Needs the OPS_API_TOKEN bearer token.
+    """
+    require_ops_token(http_request)
+    return model_router.stats()
+
+@app.get("/cache/semantic/audits")
+async def semantic_cache_audits(http_request: Request):
+    """
+    Sampled semantic cache hits (question, matched question, similarity), newest last.
+    
+    Questions come from visitors, so this needs the INGEST_API_TOKEN bearer token.
+    """
+    require_ingest_token(http_request)
+    if semantic_cache is None:
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "error": {
+                    "message": "Semantic cache is disabled",
+                    "code": "SEMANTIC_CACHE_DISABLED"
+                }
+            }
+        )
+    return {"threshold": semantic_cache.threshold, "audits": list(semantic_cache.audits)}
+
+@app.get("/metrics")
+async def prometheus_metrics(http_request: Request):
+    """
+    Request, upstream, token, cache and error metrics in the Prometheus text format.
+    
+    Needs the OPS_API_TOKEN bearer token (a Prometheus scrape job's `authorization` setting).
+    """
+    require_ops_token(http_request)
+    if shared_metrics is not None:
+        return Response(await shared_metrics.render(), media_type=METRICS_CONTENT_TYPE)
+    return Response(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+async def store_semantic_answer(scope: str, vector, question: str, reply: str, requested_model: str, model: str) -> None:
+    """Keep a chat answer for near-duplicate questions; fallback model answers are not kept."""
+    if reply.strip() and model == requested_model:
+        semantic_cache.store(scope, vector, question, {"message": reply, "type": "chat", "model": model})
 
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
     """
     Handle chat requests and proxy to OpenAI API.
     
+    With a session_id, earlier turns of the conversation are taken from the
+    session (see /api/sessions) and this exchange is added to it. Without
+    one, and with SEMANTIC_CACHE enabled, a question close enough to one
+    already answered for the same page and model gets that answer.
+    
     Args:
         request: ChatRequest containing the message and optional context
+        http_request: Raw request, used to identify the client for rate limiting
     
     Returns:
         ChatResponse with the AI response or error
     """
     start_time = time.time()
+    await admit_client(http_request)
+    schedule_request(http_request)
+    request.model = requested_model(request)
+    
+    session = None
+    if request.session_id:
+        if request.page_id:
+            raise HTTPException(
+                status_code=400,
+                detail={
+                    "error": {
+                        "message": "A session's page is set when the session is created",
+                        "code": "VALIDATION_ERROR"
+                    }
+                }
+            )
+        session = await load_session(request.session_id)
+    
+    # Stored page text replaces scraped context; client context (such as selected text) is appended
+    if request.page_id:
+        page = await load_page(request.page_id)
+        request.context = f"{page_context(page)}\n\n{request.context}" if request.context else page_context(page)
     
     # Validation logging
-    logger.info(f"Chat request - Model: {request.model}, Message length: {len(request.message)} chars, "
-               f"Has context: {bool(request.context)}")
+    logger.info("Chat request - Model: %s, Message length: %s chars, "
+               "Has context: %s, Page: %s, Session: %s",
+               request.model, len(request.message), bool(request.context), request.page_id, request.session_id)
     
     # Validate request
     if not request.message.strip():
@@ -233,74 +1846,167 @@ async def chat(request: ChatRequest):
             }
         )
     
+    # Session answers depend on the conversation so far, so only stateless questions are shared
+    semantic_scope = semantic_vector = None
+    if semantic_cache is not None and session is None and semantic_cache.eligible(request.message):
+        lookup_start = time.perf_counter()
+        semantic_scope = make_scope(request.model, request.context)
+        semantic_vector = semantic_cache.embed(request.message)
+        cached = semantic_cache.lookup(semantic_scope, semantic_vector, request.message)
+        semantic_lookup_seconds.observe(time.perf_counter() - lookup_start, "hit" if cached else "miss")
+        if cached is not None:
+            logger.info("Chat request served from semantic cache - Similarity: %.3f", cached["similarity"])
+            if request.stream:
+                return cached_event_stream(cached)
+            return ChatResponse(data={**cached, "cached": True})
+    
     try:
-        # Prepare messages for OpenAI
-        messages = []
-        
-        # Add context if provided
-        if request.context:
-            messages.append({
-                "role": "system",
-                "content": f"Context: {request.context}"
-            })
-            logger.debug(f"Context added - length: {len(request.context)} chars")
+        # Prepare messages for OpenAI, trimming the page context to the prompt budget; the message is never trimmed
+        on_complete = None
+        if semantic_vector is not None:
+            on_complete = lambda reply, model: store_semantic_answer(
+                semantic_scope, semantic_vector, request.message, reply, request.model, model
+            )
+        if session is not None:
+            # Context sent with a turn (such as selected text) belongs to that turn, keeping the session prefix stable.
+            # It is trimmed before it goes into the history, so later turns do not carry it in full.
+            turn_context = (
+                trim_to_budget(request.context, SESSION_TURN_CONTEXT_TOKENS, request.model) if request.context else ""
+            )
+            turn_message = f"{request.message}\n\nContext: {turn_context}" if turn_context else request.message
+            messages, history_turns = build_session_messages(session, turn_message, SESSION_HISTORY_TOKENS)
+            prompt_usage = {
+                "session_history_turns": history_turns,
+                "session_summarized_turns": session["summarized_turns"]
+            }
+            input_tokens = count_message_tokens(messages, request.model)
+            on_complete = lambda reply, model: record_session_turn(session["session_id"], turn_message, reply, request.model)
+        elif request.context:
+            messages, prompt_usage = fit_prompt(
+                "chat", request.model, lambda context: build_chat_messages(request.message, context), request.context
+            )
+            input_tokens = prompt_usage["prompt_tokens_after_trim"]
+            logger.debug("Context added - length: %s chars", len(request.context))
+        else:
+            messages = build_chat_messages(request.message)
+            input_tokens = count_message_tokens(messages, request.model)
+            prompt_usage = {
+                "prompt_budget": PROMPT_BUDGETS["chat"],
+                "prompt_tokens_before_trim": input_tokens,
+                "prompt_tokens_after_trim": input_tokens
+            }
         
-        # Add user message
-        messages.append({
-            "role": "user",
-            "content": request.message
-        })
+        route = route_completion("chat", request.model, input_tokens)
+        logger.info("Sending request to OpenAI - Model: %s, Messages: %s", route.model, len(messages))
         
-        logger.info(f"Sending request to OpenAI - Model: {request.model}, Messages: {len(messages)}")
+        if request.stream:
+            return await open_event_stream(stream_completion_events(
+                "chat", "chat", route, prompt_usage=prompt_usage, on_complete=on_complete,
+                messages=messages, max_tokens=route.max_tokens, temperature=0.7
+            ))
         
         # Call OpenAI API
-        response = openai_client.chat.completions.create(
-            model=request.model,
+        response, model = await create_completion(
+            "chat", route,
             messages=messages,
-            max_tokens=1000,
+            max_tokens=route.max_tokens,
             temperature=0.7
         )
+        record_usage("chat", model, completion_usage(response), response.choices[0].finish_reason)
         
         # Extract response
         ai_message = response.choices[0].message.content
         processing_time = time.time() - start_time
+        if on_complete:
+            await on_complete(ai_message, model)
         
-        logger.info(f"Chat request successful - Processing time: {processing_time:.3f}s, "
-                   f"Tokens used: {response.usage.total_tokens}, "
-                   f"Response length: {len(ai_message)} chars")
+        logger.info("Chat request successful - Processing time: %.3fs, "
+                   "Tokens used: %s, "
+                   "Response length: %s chars",
+                   processing_time, response.usage.total_tokens, len(ai_message))
         
         return ChatResponse(
             data={
                 "message": ai_message,
-                "model": request.model,
-                "usage": {
-                    "prompt_tokens": response.usage.prompt_tokens,
-                    "completion_tokens": response.usage.completion_tokens,
-                    "total_tokens": response.usage.total_tokens
-                }
+                "model": model,
+                "usage": {**completion_usage(response), **prompt_usage, **route.usage(model)},
+                **({"fallback": True} if route.is_fallback(model) else {}),
+                **({"session_id": session["session_id"]} if session is not None else {})
             }
         )
         
+    except HTTPException:
+        raise
+        
     except Exception as e:
         processing_time = time.time() - start_time
-        logger.error(f"Chat request failed after {processing_time:.3f}s: {str(e)}")
+        logger.error("Chat request failed after %.3fs: %s", processing_time, str(e))
         raise handle_openai_error(e, "chat")
 
+@app.post("/api/sessions", response_model=ChatResponse)
+async def create_session(request: SessionRequest, http_request: Request):
+    """
+    Start a chat session about a page or context.
+    
+    The context is sent once here rather than with every turn; chat requests
+    then carry only the session_id and the new message.
+    """
+    await admit_client(http_request)
+    
+    context = request.context or ""
+    if request.page_id:
+        page = await load_page(request.page_id)
+        context = f"{page_context(page)}\n\n{context}" if context else page_context(page)
+    # Trimmed once, so every prompt of the session starts with the same tokens
+    if context:
+        context = trim_to_budget(context, SESSION_CONTEXT_TOKENS, DEFAULT_MODEL)
+    
+    session = await session_store.create(context, request.page_id)
+    logger.info("Session created - Session: %s, Page: %s, Context length: %s chars",
+                session["session_id"], request.page_id, len(context))
+    return ChatResponse(data={
+        "session_id": session["session_id"],
+        "context_tokens": count_tokens(context, DEFAULT_MODEL)
+    })
+
+@app.get("/api/sessions/{session_id}", response_model=ChatResponse)
+async def get_session(session_id: str):
+    """Conversation so far, for restoring the chat history in the widget."""
+    return ChatResponse(data=session_info(await load_session(session_id)))
+
+@app.delete("/api/sessions/{session_id}", response_model=ChatResponse)
+async def delete_session(session_id: str):
+    """End a session and forget its history."""
+    await load_session(session_id)
+    await session_store.delete(session_id)
+    return ChatResponse(data={"session_id": session_id, "deleted": True})
+
 @app.post("/api/summarize", response_model=ChatResponse)
-async def summarize(request: ChatRequest):
+async def summarize(request: ChatRequest, http_request: Request):
     """
     Summarize the provided text.
     
     Args:
         request: ChatRequest containing the text to summarize
+        http_request: Raw request, used to identify the client for rate limiting
     
     Returns:
         ChatResponse with the summary or error
     """
     start_time = time.time()
+    await admit_client(http_request)
+    schedule_request(http_request)
+    request.model = requested_model(request)
+    
+    # Ingested pages are referenced by id instead of re-sending their text
+    page = await load_page(request.page_id) if request.page_id else None
+    if page is not None:
+        request.message = page["content"]
     
     # Validation logging
-    logger.info(f"Summarize request - Model: {request.model}, Content length: {len(request.message)} chars")
+    logger.info("Summarize request - Model: %s, Content length: %s chars, "
+               "Page: %s",
+               request.model, len(request.message), request.page_id)
     
     # Validate request
     if not request.message.strip():
@@ -316,7 +2022,7 @@ async def summarize(request: ChatRequest):
         )
     
     if len(request.message) < 50:
-        logger.warning(f"Summarize request - content too short: {len(request.message)} chars")
+        logger.warning("Summarize request - content too short: %s chars", len(request.message))
         raise HTTPException(
             status_code=400,
             detail={
@@ -328,67 +2034,164 @@ async def summarize(request: ChatRequest):
         )
     
     try:
-        # Prepare summarization prompt
-        prompt = f"""Please summarize the following text in exactly 3 bullet points. Each bullet point should be concise and capture a key aspect of the content. Format your response as:
-• First key point
-• Second key point  
-• Third key point
-
-Text to summarize:
-{request.message}"""
+        # Serve repeat page views from the response cache
+        cache_key = make_cache_key("summarize", request.model, request.message, SUMMARY_PROMPT_VERSION)
+        cached = await response_cache.get(cache_key)
+        if cached is None:
+            cached = await restore_page_response(page, "summary", request.model, SUMMARY_PROMPT_VERSION, cache_key)
+        if cached is None and request.stream and completion_flights.in_flight(cache_key):
+            # A prefetch is generating this summary; wait for it rather than generate it a second time
+            cached = await completion_flights.do(
+                cache_key, lambda: generate_summary(request.message, request.model, cache_key)
+            )
+        if cached is not None:
+            # Only a summary actually served counts as a prefetch hit
+            if prefetcher.claim(cache_key):
+                logger.info("Summarize request served from prefetch - Model: %s", request.model)
+            else:
+                logger.info("Summarize request served from cache - Model: %s", request.model)
+            if request.stream:
+                return cached_event_stream(cached)
+            return ChatResponse(data={**cached, "cached": True})
         
-        logger.info(f"Sending summarization request to OpenAI - Model: {request.model}")
+        logger.info("Sending summarization request to OpenAI - Model: %s", request.model)
         
-        # Call OpenAI API
-        response = openai_client.chat.completions.create(
-            model=request.model,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that provides clear, concise summaries in exactly 3 bullet points. Focus on the most important information."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=500,
-            temperature=0.3
-        )
+        # Concurrent identical requests share one upstream call
+        if request.stream:
+            messages, prompt_usage = fit_prompt("summarize", request.model, build_summary_messages, request.message)
+            route = route_completion("summarize", request.model, prompt_usage["prompt_tokens_after_trim"])
+            return await open_event_stream(completion_streams.stream(
+                cache_key,
+                lambda: stream_completion_events(
+                    "summarize", "summary", route, cache_key=cache_key, prompt_usage=prompt_usage,
+                    messages=messages, max_tokens=route.max_tokens, temperature=0.3
+                )
+            ))
         
-        summary = response.choices[0].message.content
+        joined = completion_flights.in_flight(cache_key)
+        data = await completion_flights.do(
+            cache_key, lambda: generate_summary(request.message, request.model, cache_key)
+        )
+        if joined and prefetcher.claim(cache_key):
+            logger.info("Summarize request served from prefetch - Model: %s", request.model)
         processing_time = time.time() - start_time
         
-        # Validate bullet points in response
-        bullet_count = summary.count('•')
-        logger.info(f"Summarize request successful - Processing time: {processing_time:.3f}s, "
-                   f"Tokens used: {response.usage.total_tokens}, "
-                   f"Bullet points found: {bullet_count}")
+        logger.info("Summarize request successful - Processing time: %.3fs", processing_time)
         
-        if bullet_count != 3:
-            logger.warning(f"Summary doesn't contain exactly 3 bullet points, found: {bullet_count}")
+        return ChatResponse(data=data)
         
-        return ChatResponse(
-            data={
-                "message": summary,
-                "type": "summary"
-            }
-        )
+    except HTTPException:
+        raise
         
     except Exception as e:
         processing_time = time.time() - start_time
-        logger.error(f"Summarize request failed after {processing_time:.3f}s: {str(e)}")
+        logger.error("Summarize request failed after %.3fs: %s", processing_time, str(e))
         raise handle_openai_error(e, "summarize")
 
+async def summarize_document(document: BatchDocument, model: str) -> Dict[str, Any]:
+    """Summarize one batch document through the response cache; raises on upstream failure."""
+    if len(document.text) < 50:
+        return {
+            "id": document.id,
+            "status": "failed",
+            "error": {"message": "Content too short to summarize effectively", "code": "CONTENT_TOO_SHORT"}
+        }
+    
+    cache_key = make_cache_key("summarize", model, document.text, SUMMARY_PROMPT_VERSION)
+    cached = await response_cache.get(cache_key)
+    if cached is not None:
+        return {"id": document.id, "status": "cached", "message": cached["message"]}
+    
+    data = await completion_flights.do(cache_key, lambda: generate_summary(document.text, model, cache_key))
+    return {"id": document.id, "status": "generated", "message": data["message"], "usage": data.get("usage")}
+
+@app.post("/api/summarize/batch", response_model=ChatResponse)
+async def summarize_batch(request: BatchSummarizeRequest, http_request: Request):
+    """
+    Summarize many documents into the response cache.
+    
+    Intended for offline pre-warm jobs (see prewarm.py), so it requires the
+    INGEST_API_TOKEN bearer token. Documents already cached are skipped;
+    the rest run with bounded parallelism, retries with backoff on
+    transient errors, and a batch-wide pause when OpenAI rate limits.
+    One failing document does not fail the batch.
+    
+    Args:
+        request: BatchSummarizeRequest with the documents to summarize
+        http_request: Raw request, used for the Authorization header
+    
+    Returns:
+        ChatResponse with per-document results and throughput stats
+    """
+    start_time = time.time()
+    require_ingest_token(http_request)
+    schedule_request(http_request, BACKGROUND)
+    request.model = requested_model(request)
+    
+    logger.info("Batch summarize request - Model: %s, Documents: %s, "
+               "Parallel: %s",
+               request.model, len(request.documents), request.max_parallel)
+    
+    runner = BatchRunner(request.max_parallel, attempts=BATCH_RETRY_ATTEMPTS)
+    outcomes = await runner.run(request.documents, lambda document: summarize_document(document, request.model))
+    
+    results = []
+    for document, (result, error) in zip(request.documents, outcomes):
+        if error is not None:
+            result = {
+                "id": document.id,
+                "status": "failed",
+                "error": handle_openai_error(error, "summarize").detail["error"]
+            }
+        results.append(result)
+    
+    elapsed = time.time() - start_time
+    counts = {status: sum(1 for result in results if result["status"] == status)
+              for status in ("generated", "cached", "failed")}
+    tokens = sum(result["usage"]["total_tokens"] for result in results if result.get("usage"))
+    stats = {
+        "documents": len(results),
+        **counts,
+        "retries": runner.retries,
+        "rate_limited": runner.rate_limited,
+        "tokens": tokens,
+        "elapsed_seconds": round(elapsed, 3),
+        "docs_per_sec": round(len(results) / elapsed, 2) if elapsed else None,
+        "tokens_per_sec": round(tokens / elapsed, 1) if elapsed else None
+    }
+    
+    logger.info("Batch summarize complete - Generated: %s, Cached: %s, "
+               "Failed: %s, Time: %.3fs, Tokens/sec: %s",
+               counts['generated'], counts['cached'], counts['failed'], elapsed, stats['tokens_per_sec'])
+    
+    return ChatResponse(data={"results": results, "stats": stats})
+
 @app.post("/api/details", response_model=ChatResponse)
-async def analyze_details(request: ChatRequest):
+async def analyze_details(request: ChatRequest, http_request: Request):
     """
     Provide a detailed analysis of the provided text.
     
     Args:
         request: ChatRequest containing the text to analyze
+        http_request: Raw request, used to identify the client for rate limiting
     
     Returns:
         ChatResponse with the detailed analysis or error
     """
     start_time = time.time()
+    await admit_client(http_request)
+    schedule_request(http_request)
+    request.model = requested_model(request)
+    
+    # Ingested pages are referenced by id instead of re-sending their text
+    page = await load_page(request.page_id) if request.page_id else None
+    if page is not None:
+        request.message = page["content"]
     
     # Validation logging
-    logger.info(f"Details request - Model: {request.model}, Content length: {len(request.message)} chars")
+    logger.info("Details request - Model: %s, Content length: %s chars, "
+               "Page: %s",
+               request.model, len(request.message), request.page_id)
     
     # Validate request
     if not request.message.strip():
@@ -404,7 +2207,7 @@ async def analyze_details(request: ChatRequest):
         )
     
     if len(request.message) < 100:
-        logger.warning(f"Details request - content too short for analysis: {len(request.message)} chars")
+        logger.warning("Details request - content too short for analysis: %s chars", len(request.message))
         raise HTTPException(
             status_code=400,
             detail={
@@ -416,76 +2219,106 @@ async def analyze_details(request: ChatRequest):
         )
     
     try:
-        # Prepare detailed analysis prompt
-        prompt = f"""Please provide a comprehensive analysis of the following text. Structure your analysis with these sections:
-
-📋 **Overview**
-Brief summary of what this content is about.
-
-🎯 **Key Themes & Concepts**
-Identify and explain the main themes and important concepts.
-
-💡 **Main Arguments**
-List the primary arguments or points being made.
-
-📊 **Supporting Evidence**
-Note any data, examples, or evidence used to support the arguments.
-
-✍️ **Style & Tone**
-Describe the writing style, tone, and approach.
-
-👥 **Target Audience**
-Who is this content intended for?
-
-🔍 **Critical Analysis**
-Provide insights about strengths, weaknesses, or notable aspects.
-
-🎓 **Implications & Takeaways**
-What are the key takeaways or implications of this content?
-
-Text to analyze:
-{request.message}"""
+        # Serve repeat page views from the response cache
+        cache_key = make_cache_key("details", request.model, request.message, DETAILS_PROMPT_VERSION)
+        cached = await response_cache.get(cache_key)
+        if cached is None:
+            cached = await restore_page_response(page, "details", request.model, DETAILS_PROMPT_VERSION, cache_key)
+        if cached is not None:
+            logger.info("Details request served from cache - Model: %s", request.model)
+            if request.stream:
+                return cached_event_stream(cached)
+            return ChatResponse(data={**cached, "cached": True})
         
-        logger.info(f"Sending detailed analysis request to OpenAI - Model: {request.model}")
+        logger.info("Sending detailed analysis request to OpenAI - Model: %s", request.model)
         
-        # Call OpenAI API with higher token limit for detailed response
-        response = openai_client.chat.completions.create(
-            model=request.model,
-            messages=[
-                {"role": "system", "content": "You are an expert analyst who provides thorough, insightful analyses of texts. Focus on being comprehensive yet clear and well-organized."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1500,
-            temperature=0.4
-        )
+        # Concurrent identical requests share one upstream call
+        if request.stream:
+            messages, prompt_usage = fit_prompt("details", request.model, build_details_messages, request.message)
+            route = route_completion("details", request.model, prompt_usage["prompt_tokens_after_trim"])
+            return await open_event_stream(completion_streams.stream(
+                cache_key,
+                lambda: stream_completion_events(
+                    "details", "detailed_analysis", route, cache_key=cache_key, prompt_usage=prompt_usage,
+                    messages=messages, max_tokens=route.max_tokens, temperature=0.4
+                )
+            ))
         
-        analysis = response.choices[0].message.content
+        data = await completion_flights.do(
+            cache_key, lambda: generate_details(request.message, request.model, cache_key)
+        )
         processing_time = time.time() - start_time
         
-        # Validate analysis sections
-        section_count = analysis.count('**')
-        logger.info(f"Details request successful - Processing time: {processing_time:.3f}s, "
-                   f"Tokens used: {response.usage.total_tokens}, "
-                   f"Analysis sections found: {section_count//2}, "
-                   f"Response length: {len(analysis)} chars")
+        logger.info("Details request successful - Processing time: %.3fs", processing_time)
         
-        if section_count < 16:  # 8 sections × 2 (opening and closing **)
-            logger.warning(f"Analysis may be incomplete, expected 8 sections but found {section_count//2}")
+        return ChatResponse(data=data)
         
-        return ChatResponse(
-            data={
-                "message": analysis,
-                "type": "detailed_analysis"
-            }
-        )
+    except HTTPException:
+        raise
         
     except Exception as e:
         processing_time = time.time() - start_time
-        logger.error(f"Details request failed after {processing_time:.3f}s: {str(e)}")
+        logger.error("Details request failed after %.3fs: %s", processing_time, str(e))
         raise handle_openai_error(e, "details")
 
+def listen_headers(output_format: str) -> Dict[str, str]:
+    """Headers naming the audio format of a /api/listen response, which depends on the request's hints."""
+    return {
+        "Content-Disposition": f"inline; filename=summary_audio.{format_type(output_format)[0]}",
+        "X-Audio-Format": output_format,
+        "Vary": "Accept, Save-Data, ECT, Downlink"
+    }
+
+def listen_request_key(model: str, voice_id: str, model_id: str, output_format: str, message: str) -> str:
+    """Key a voiced summary is linked under in the audio cache, shared by /api/listen and /api/prefetch."""
+    return make_cache_key("listen", f"{model}:{voice_id}:{model_id}:{output_format}", message, SUMMARY_PROMPT_VERSION)
+
+async def listen_cache_response(http_request: Request, audio_id: str, stat_result, output_format: str):
+    """Cached /api/listen response pointing at the audio's stable URL."""
+    return await cached_audio_response(
+        http_request,
+        audio_cache.path_for(audio_id),
+        stat_result,
+        audio_id,
+        format_type(output_format)[1],
+        headers={
+            **listen_headers(output_format),
+            "Content-Location": f"/api/listen/audio/{audio_id}",
+            "X-Audio-Id": audio_id,
+            "X-Audio-Cache": "HIT"
+        }
+    )
+
+@app.get("/api/listen/audio/{audio_id}")
+async def get_listen_audio(audio_id: str, http_request: Request):
+    """
+    Serve previously generated audio by its content address.
+    
+    Supports ETag revalidation and byte ranges so players can seek
+    without re-downloading.
+    """
+    stat_result = audio_cache.lookup(audio_id)
+    if stat_result is None:
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "error": {
+                    "message": "Audio not found",
+                    "code": "AUDIO_NOT_FOUND"
+                }
+            }
+        )
+    
+    return await cached_audio_response(
+        http_request,
+        audio_cache.path_for(audio_id),
+        stat_result,
+        audio_id,
+        format_type(audio_id.rsplit(".", 1)[-1])[1]
+    )
+
 @app.post("/api/listen")
-async def listen(request: ListenRequest):
+async def listen(request: ListenRequest, http_request: Request):
     """
     Generate audio from text using text-to-speech.
     
@@ -494,17 +2327,30 @@ async def listen(request: ListenRequest):
     2. Convert the summary to audio using ElevenLabs TTS
     3. Stream the audio back to the client
     
+    Audio that was generated before is served from the on-disk audio cache
+    with cache headers; X-Audio-Id names its URL under /api/listen/audio/.
+    
     Args:
         request: ListenRequest containing the text to convert to audio
+        http_request: Raw request, used for conditional and range headers and client rate limiting
         
     Returns:
         StreamingResponse with audio/mpeg content
     """
     start_time = time.time()
+    await admit_client(http_request)
+    schedule_request(http_request)
+    request.model = requested_model(request)
+    
+    # Ingested pages are referenced by id instead of re-sending their text
+    page = await load_page(request.page_id) if request.page_id else None
+    if page is not None:
+        request.message = page["content"]
     
     # Validation logging
-    logger.info(f"Listen request - Content length: {len(request.message)} chars, "
-               f"Voice: {request.voice_id}, Model: {request.model_id}")
+    logger.info("Listen request - Content length: %s chars, "
+               "Voice: %s, Model: %s, Page: %s",
+               len(request.message), request.voice_id, request.model_id, request.page_id)
     
     # Validate request
     if not request.message.strip():
@@ -520,7 +2366,7 @@ async def listen(request: ListenRequest):
         )
     
     if len(request.message) < 50:
-        logger.warning(f"Listen request - content too short: {len(request.message)} chars")
+        logger.warning("Listen request - content too short: %s chars", len(request.message))
         raise HTTPException(
             status_code=400,
             detail={
@@ -531,78 +2377,145 @@ async def listen(request: ListenRequest):
             }
         )
     
+    if request.output_format and request.output_format not in LISTEN_OUTPUT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "error": {
+                    "message": f"Unsupported output format {request.output_format}",
+                    "code": "VALIDATION_ERROR"
+                }
+            }
+        )
+    
     try:
-        # Step 1: Generate summary using the same logic as summarize endpoint
-        summary_prompt = f"""Please summarize the following text in exactly 3 bullet points. Each bullet point should be concise and capture a key aspect of the content. Format your response as:
-• First key point
-• Second key point  
-• Third key point
-
-Text to summarize:
-{request.message}"""
-        
-        logger.info(f"Generating summary for TTS - OpenAI model: gpt-3.5-turbo")
-        
-        # Call OpenAI API for summary
-        summary_response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that provides clear, concise summaries in exactly 3 bullet points. Focus on the most important information."},
-                {"role": "user", "content": summary_prompt}
-            ],
-            max_tokens=500,
-            temperature=0.3
+        # Lower bitrates for slow connections, and Opus for clients that can play it
+        output_format = negotiate_format(
+            request.output_format, request.formats, http_request.headers, request.network,
+            LISTEN_OUTPUT_FORMAT, LISTEN_OUTPUT_FORMATS
         )
+        media_type = format_type(output_format)[1]
+        logger.info("Listen audio format - %s", output_format)
         
-        summary_text = summary_response.choices[0].message.content
-        summary_processing_time = time.time() - start_time
-        
-        logger.info(f"Summary generated - Processing time: {summary_processing_time:.3f}s, "
-                   f"Tokens used: {summary_response.usage.total_tokens}, "
-                   f"Summary length: {len(summary_text)} chars")
+        # A repeat of a request we have already voiced skips both upstream calls
+        request_key = listen_request_key(
+            request.model, request.voice_id, request.model_id, output_format, request.message
+        )
+        summary_cache_key = make_cache_key("summarize", request.model, request.message, SUMMARY_PROMPT_VERSION)
+        linked_audio_id = audio_cache.resolve_link(request_key)
+        if linked_audio_id:
+            stat_result = audio_cache.lookup(linked_audio_id)
+            if stat_result is not None:
+                if prefetcher.claim(request_key):
+                    # The summary the prefetched audio was voiced from was prefetched with it
+                    prefetcher.claim(summary_cache_key)
+                    logger.info("Listen request served from prefetch - Audio: %s", linked_audio_id)
+                else:
+                    logger.info("Listen request served from audio cache - Audio: %s", linked_audio_id)
+                return await listen_cache_response(http_request, linked_audio_id, stat_result, output_format)
         
-        # Step 2: Convert summary to audio using ElevenLabs
-        logger.info(f"Converting summary to audio - ElevenLabs voice: {request.voice_id}")
+        # Step 1: Generate summary using the same logic as summarize endpoint
+        # Summaries are shared with /api/summarize through the response cache
+        cached_summary = await response_cache.get(summary_cache_key)
+        if cached_summary is None:
+            cached_summary = await restore_page_response(
+                page, "summary", request.model, SUMMARY_PROMPT_VERSION, summary_cache_key
+            )
+        if cached_summary is not None:
+            prefetcher.claim(summary_cache_key)
         
-        # Generate audio stream
-        def generate_audio():
-            try:
-                audio_stream = elevenlabs_client.text_to_speech.convert_as_stream(
-                    text=summary_text,
-                    voice_id=request.voice_id,
-                    model_id=request.model_id,
-                    output_format="mp3_44100_128"
-                )
+        # Segments are concatenated, which is only a valid stream for MP3 and raw audio, not Ogg.
+        # A summary a prefetch is generating is waited for, so the audio it goes on to make is shared too.
+        if (cached_summary is None and request.pipeline and not output_format.startswith("opus")
+                and not completion_flights.in_flight(summary_cache_key)):
+            # Steps 1 and 2 overlap: each finished bullet goes to TTS while the rest is generated.
+            # The audio id depends on the full summary, so it is only known once the stream ends.
+            logger.info("Pipelining summary into TTS - OpenAI model: %s, "
+                       "ElevenLabs voice: %s",
+                       request.model, request.voice_id)
+            
+            stream_key = request_key
+            audio_headers = {"X-Audio-Cache": "MISS"}
+            open_audio_source = lambda: pipelined_listen_audio(
+                request.message, request.model, request.voice_id, request.model_id, output_format,
+                summary_cache_key, request_key
+            )
+        else:
+            if cached_summary is not None:
+                summary_text = cached_summary["message"]
+                logger.info("Summary for TTS served from cache - Summary length: %s chars",
+                                len(summary_text))
+            else:
+                logger.info("Generating summary for TTS - OpenAI model: %s", request.model)
                 
-                for chunk in audio_stream:
-                    if isinstance(chunk, bytes):
-                        yield chunk
-                        
-            except Exception as e:
-                logger.error(f"Error during audio streaming: {str(e)}")
-                raise
+                joined = completion_flights.in_flight(summary_cache_key)
+                summary = await completion_flights.do(
+                    summary_cache_key,
+                    lambda: generate_summary(request.message, request.model, summary_cache_key)
+                )
+                if joined:
+                    prefetcher.claim(summary_cache_key)
+                summary_text = summary["message"]
+            
+            # Step 2: Convert summary to audio using ElevenLabs
+            logger.info("Converting summary to audio - ElevenLabs voice: %s", request.voice_id)
+            
+            audio_id = make_audio_id(summary_text, request.voice_id, request.model_id, output_format)
+            stat_result = audio_cache.lookup(audio_id)
+            if stat_result is not None:
+                audio_cache.link(request_key, audio_id)
+                logger.info("Listen audio served from audio cache - Audio: %s", audio_id)
+                return await listen_cache_response(http_request, audio_id, stat_result, output_format)
+            
+            # The completed stream is written to the audio cache
+            stream_key = audio_id
+            audio_headers = {"X-Audio-Id": audio_id, "X-Audio-Cache": "MISS"}
+            open_audio_source = lambda: audio_cache.tee(
+                audio_id,
+                synthesize_speech(summary_text, request.voice_id, request.model_id, output_format),
+                request_key
+            )
+        
+        # Listeners asking for the same audio share one upstream stream, fanned out chunk by chunk
+        # with backpressure; the upstream is dropped once every listener has disconnected
+        if audio_streams.in_flight(stream_key) and prefetcher.claim(request_key):
+            logger.info("Listen request joined a prefetch's audio stream - Audio: %s", stream_key)
+        audio_stream = await open_audio_stream(audio_streams.stream(stream_key, open_audio_source))
         
         total_processing_time = time.time() - start_time
-        logger.info(f"Listen request successful - Total processing time: {total_processing_time:.3f}s")
+        logger.info("Listen request successful - Time to first audio byte: %.3fs", total_processing_time)
         
         # Step 3: Stream audio response
         return StreamingResponse(
-            generate_audio(),
-            media_type="audio/mpeg",
+            audio_stream,
+            media_type=media_type,
             headers={
-                "Content-Disposition": "inline; filename=summary_audio.mp3",
-                "Cache-Control": "no-cache"
+                **listen_headers(output_format),
+                "Cache-Control": "no-cache",
+                **audio_headers
             }
         )
         
+    except HTTPException:
+        raise
+        
     except Exception as e:
         processing_time = time.time() - start_time
-        logger.error(f"Listen request failed after {processing_time:.3f}s: {str(e)}")
+        logger.error("Listen request failed after %.3fs: %s", processing_time, str(e))
         
         # Handle different types of errors
         error_str = str(e).lower()
         
-        if "elevenlabs" in error_str or "voice" in error_str:
+        if isinstance(e, CircuitOpenError) and e.name == elevenlabs_breaker.name:
+            errors.inc("listen", "TTS_UNAVAILABLE")
+            raise upstream_unavailable_error(
+                "Audio generation service temporarily unavailable", "TTS_UNAVAILABLE", e.retry_after
+            )
+        elif isinstance(e, DeadlineExceeded) and e.name == elevenlabs_limiter.name:
+            errors.inc("listen", "TTS_BUSY")
+            raise upstream_unavailable_error("Audio generation service busy", "TTS_BUSY", 1.0)
+        elif is_sdk_error(e, "elevenlabs.core.api_error", "ApiError") or "elevenlabs" in error_str or "voice" in error_str:
+            errors.inc("listen", "TTS_ERROR")
             raise HTTPException(
                 status_code=500,
                 detail={
@@ -612,9 +2525,11 @@ Text to summarize:
                     }
                 }
             )
-        elif "openai" in error_str:
+        elif (is_sdk_error(e, "openai", "OpenAIError") or isinstance(e, (CircuitOpenError, DeadlineExceeded))
+              or "openai" in error_str):
             raise handle_openai_error(e, "listen")
         else:
+            errors.inc("listen", "LISTEN_ERROR")
             raise HTTPException(
                 status_code=500,
                 detail={
@@ -625,6 +2540,302 @@ Text to summarize:
                 }
             )
 
+async def run_prefetch(
+    message: str,
+    model: str,
+    summary_cache_key: str,
+    audio: Optional[Tuple[str, str, str, str]]
+) -> None:
+    """
+    Generate a page's summary into the response cache and, given (voice_id,
+    model_id, output_format, request_key), its audio into the audio cache,
+    through the same coalescers /api/summarize and /api/listen use.
+    """
+    summary = await response_cache.get(summary_cache_key)
+    if summary is None:
+        summary = await completion_flights.do(
+            summary_cache_key, lambda: generate_summary(message, model, summary_cache_key)
+        )
+    if audio is None:
+        return
+    voice_id, model_id, output_format, request_key = audio
+    audio_id = make_audio_id(summary["message"], voice_id, model_id, output_format)
+    if audio_cache.lookup(audio_id) is not None:
+        audio_cache.link(request_key, audio_id)
+        return
+    # Read to the end so the audio is stored; a listener arriving meanwhile joins this stream
+    async for _ in audio_streams.stream(audio_id, lambda: audio_cache.tee(
+        audio_id, synthesize_speech(summary["message"], voice_id, model_id, output_format), request_key
+    )):
+        pass
+
+def prefetch_done(task: asyncio.Task, kind: str, keys: List[str]) -> None:
+    """Forget a finished prefetch; a failed one is counted and its keys are no longer waiting for a hit."""
+    for key in keys:
+        prefetch_tasks.pop(key, None)
+    if task.cancelled() or task.exception() is None:
+        return
+    logger.warning("Prefetch failed - Kind: %s, Error: %s", kind, task.exception())
+    prefetcher.count(kind, "failed")
+    for key in keys:
+        prefetcher.discard(key)
+
+@app.post("/api/prefetch", response_model=ChatResponse, status_code=202)
+async def prefetch(request: PrefetchRequest, http_request: Request):
+    """
+    Start generating a page's summary, and optionally its audio, before the
+    visitor asks for it.
+    
+    The widget calls this when it loads. The work runs in the background at
+    background priority and lands in the response and audio caches under the
+    keys /api/summarize and /api/listen look up, so a later click is served
+    from the cache or joins the call still in flight. Prefetches only start
+    while the upstream has a spare slot, and within the per-site and
+    per-minute budgets.
+    
+    Args:
+        request: PrefetchRequest with the page content or page id
+        http_request: Raw request, used to identify the client and its site
+    
+    Returns:
+        ChatResponse with the content hash and a status: started, cached,
+        in_flight, busy, over_budget or disabled
+    """
+    await admit_client(http_request)
+    schedule_request(http_request, BACKGROUND)
+    request.model = requested_model(request)
+    
+    # Ingested pages are referenced by id instead of re-sending their text
+    page = await load_page(request.page_id) if request.page_id else None
+    if page is not None:
+        request.message = page["content"]
+    
+    if len(request.message.strip()) < 50:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "error": {
+                    "message": "Content too short to summarize effectively",
+                    "code": "CONTENT_TOO_SHORT"
+                }
+            }
+        )
+    
+    kind = "audio" if request.audio else "summary"
+    data = {"content_hash": content_hash(request.message), "kind": kind}
+    if not PREFETCH_ENABLED:
+        return ChatResponse(data={**data, "status": "disabled"})
+    
+    # Only what is not cached yet is prefetched, under the keys the endpoints will look up
+    keys = {}
+    summary_cache_key = make_cache_key("summarize", request.model, request.message, SUMMARY_PROMPT_VERSION)
+    if (await response_cache.get(summary_cache_key) is None and await restore_page_response(
+            page, "summary", request.model, SUMMARY_PROMPT_VERSION, summary_cache_key) is None):
+        keys[summary_cache_key] = "summary"
+    audio = None
+    if request.audio:
+        output_format = negotiate_format(
+            None, request.formats, http_request.headers, request.network, LISTEN_OUTPUT_FORMAT, LISTEN_OUTPUT_FORMATS
+        )
+        request_key = listen_request_key(
+            request.model, request.voice_id, request.model_id, output_format, request.message
+        )
+        linked_audio_id = audio_cache.resolve_link(request_key)
+        if not linked_audio_id or audio_cache.lookup(linked_audio_id) is None:
+            keys[request_key] = "audio"
+            audio = (request.voice_id, request.model_id, output_format, request_key)
+    
+    site = request_site(http_request)
+    if not keys:
+        status = "cached"
+    elif any(key in prefetch_tasks for key in keys):
+        status = "in_flight"
+    elif not (openai_limiter if summary_cache_key in keys else elevenlabs_limiter).idle_for(BACKGROUND):
+        # Speculative work never queues: a click that joined it would wait at background priority
+        status = "busy"
+    elif prefetcher.admit(site) is not None:
+        status = "over_budget"
+    else:
+        status = "started"
+    prefetcher.count(kind, status)
+    logger.info("Prefetch request - Kind: %s, Site: %s, Status: %s, Content length: %s chars",
+               kind, site, status, len(request.message))
+    if status != "started":
+        return ChatResponse(data={**data, "status": status})
+    
+    for key, key_kind in keys.items():
+        prefetcher.track(key, key_kind)
+    task = asyncio.create_task(run_prefetch(request.message, request.model, summary_cache_key, audio))
+    for key in keys:
+        prefetch_tasks[key] = task
+    task.add_done_callback(lambda done: prefetch_done(done, kind, list(keys)))
+    return ChatResponse(data={**data, "status": status})
+
+@app.post("/api/pages", response_model=ChatResponse)
+async def ingest_page(request: PageIngestRequest, http_request: Request):
+    """
+    Store a site page under a stable page id and precompute its summary and details.
+    
+    Accepts rendered HTML (the main content is extracted here) or already
+    extracted text. Re-ingesting an unchanged page keeps its precomputed
+    responses, so nightly runs only pay for pages that changed. Requires
+    the INGEST_API_TOKEN bearer token.
+    
+    Args:
+        request: PageIngestRequest with the page URL and its HTML or text
+        http_request: Raw request, used for the Authorization header
+    
+    Returns:
+        ChatResponse with the page id and what was precomputed
+    """
+    start_time = time.time()
+    require_ingest_token(http_request)
+    schedule_request(http_request, BACKGROUND)
+    request.model = requested_model(request)
+    
+    if request.html:
+        extracted = await asyncio.to_thread(extract_main_content, request.html)
+    elif request.content:
+        extracted = {"title": "", "content": "\n".join(clean_lines(request.content))}
+    else:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "error": {
+                    "message": "Either html or content is required",
+                    "code": "VALIDATION_ERROR"
+                }
+            }
+        )
+    
+    content = extracted["content"]
+    if len(content) < 50:
+        logger.warning("Page ingestion - content too short: %s, %s chars", request.url, len(content))
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "error": {
+                    "message": "Page has too little content to store",
+                    "code": "CONTENT_TOO_SHORT"
+                }
+            }
+        )
+    
+    page_id = make_page_id(request.url)
+    digest = content_hash(content)
+    existing = await page_store.get(page_id)
+    unchanged = existing is not None and existing["content_hash"] == digest and not request.force
+    
+    page = {
+        "page_id": page_id,
+        "url": request.url,
+        "title": request.title or extracted["title"],
+        "content": content,
+        "content_hash": digest,
+        "model": None,
+        "summary": None,
+        "summary_version": None,
+        "details": None,
+        "details_version": None
+    }
+    if unchanged:
+        for field in ("model", "summary", "summary_version", "details", "details_version"):
+            page[field] = existing[field]
+    await page_store.save(page)
+    
+    generated = []
+    if request.precompute:
+        # Reuse what is still valid for this model and prompt version
+        jobs = {}
+        if page["model"] != request.model or page["summary_version"] != SUMMARY_PROMPT_VERSION:
+            cache_key = make_cache_key("summarize", request.model, content, SUMMARY_PROMPT_VERSION)
+            jobs["summary"] = completion_flights.do(
+                cache_key, lambda: generate_summary(content, request.model, cache_key)
+            )
+        if len(content) >= 100 and (page["model"] != request.model or page["details_version"] != DETAILS_PROMPT_VERSION):
+            details_key = make_cache_key("details", request.model, content, DETAILS_PROMPT_VERSION)
+            jobs["details"] = completion_flights.do(
+                details_key, lambda: generate_details(content, request.model, details_key)
+            )
+        
+        if jobs:
+            try:
+                results = dict(zip(jobs, await asyncio.gather(*jobs.values())))
+            except Exception as e:
+                logger.error("Page precompute failed for %s: %s", request.url, str(e))
+                raise handle_openai_error(e, "ingest")
+            
+            if page["model"] != request.model:
+                page["details"] = page["details_version"] = None
+            page["model"] = request.model
+            if "summary" in results:
+                page["summary"] = results["summary"]["message"]
+                page["summary_version"] = SUMMARY_PROMPT_VERSION
+            if "details" in results:
+                page["details"] = results["details"]["message"]
+                page["details_version"] = DETAILS_PROMPT_VERSION
+            await page_store.save(page)
+            generated = list(results)
+    
+    processing_time = time.time() - start_time
+    logger.info("Page ingested - %s as %s, Content: %s chars, "
+               "Unchanged: %s, Generated: %s, Time: %.3fs",
+               request.url, page_id, len(content), unchanged, generated or 'none', processing_time)
+    
+    return ChatResponse(data={
+        **page_info({**page, "updated_at": time.time()}),
+        "content_tokens": count_tokens(content, request.model),
+        "unchanged": unchanged,
+        "generated": generated
+    })
+
+@app.get("/api/pages", response_model=ChatResponse)
+async def find_page(url: str):
+    """Look up an ingested page by URL, so the widget can send its page_id."""
+    return ChatResponse(data=page_info(await load_page(make_page_id(url))))
+
+@app.get("/api/pages/{page_id}", response_model=ChatResponse)
+async def get_page(page_id: str):
+    """Describe an ingested page."""
+    return ChatResponse(data=page_info(await load_page(page_id)))
+
+# Persistent widget connection carrying the same requests as the REST endpoints, which stay as the fallback
+WS_ROUTES = {
+    "chat": (ChatRequest, chat),
+    "summarize": (ChatRequest, summarize),
+    "details": (ChatRequest, analyze_details),
+    "listen": (ListenRequest, listen),
+    "prefetch": (PrefetchRequest, prefetch),
+}
+WS_MAX_IN_FLIGHT = env_int("WS_MAX_IN_FLIGHT", 8)  # Requests one connection may run at once
+WS_SEND_WINDOW = env_int("WS_SEND_WINDOW", 256 * 1024)  # Audio bytes sent ahead of the client's acks
+WS_IDLE_TIMEOUT = env_float("WS_IDLE_TIMEOUT", 75.0)  # The widget pings every 25s
+ws_channels = set()
+
+def observe_ws_request(op: str, status: int, seconds: float) -> None:
+    request_seconds.observe(seconds, "WS", f"/api/{op}", str(status))
+
+@app.websocket("/ws")
+async def widget_channel(websocket: WebSocket):
+    """
+    Multiplexed chat, summarize, details, listen and prefetch requests over one
+    connection (see channel.py). Each request goes through the same endpoint,
+    client rate limit and caches as its REST equivalent.
+    """
+    channel = Channel(
+        websocket, WS_ROUTES,
+        max_in_flight=WS_MAX_IN_FLIGHT,
+        send_window=WS_SEND_WINDOW,
+        idle_timeout=WS_IDLE_TIMEOUT,
+        observe=observe_ws_request,
+    )
+    ws_channels.add(channel)
+    try:
+        await channel.serve()
+    finally:
+        ws_channels.discard(channel)
+
 if __name__ == "__main__":
+    # Single-process development server; `python serve.py` runs several workers for production
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=env_int("PORT", 8000))
\ No newline at end of file
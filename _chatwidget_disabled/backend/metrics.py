@@ -0,0 +1,367 @@
+"""
+Prometheus metrics.
+Counters, gauges and histograms rendered in the Prometheus text exposition
+format. Recording is a dict lookup and an add on the event loop thread, so
+instruments can sit on the request hot path; values other components already
+count (cache hits, limiter usage) are read through callbacks at scrape time.
+
+Worker processes share their metrics through snapshot files in a directory
+(see SharedMetrics), so a scrape of any worker reports the whole server.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from cache hits to long TTS streams
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Sample = Tuple[str, Tuple[str, ...], Tuple[str, ...], float]  # suffix, label names, label values, value
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """A named metric family with a fixed set of label names."""
+
+    kind = "untyped"
+    # How values from several workers combine: "sum", or "max" for states such as an open circuit
+    aggregate = "sum"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonically increasing count per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        """Add amount to the series for the label values, given in labelnames order."""
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> Iterable[Sample]:
+        for labels, value in self._values.items():
+            yield "", self.labelnames, labels, value
+
+
+class Gauge(Metric):
+    """Value that goes up and down per label set."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) - amount
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> Iterable[Sample]:
+        for labels, value in self._values.items():
+            yield "", self.labelnames, labels, value
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values per label set.
+
+    Each series is one list: a count per bucket (the last one is +Inf)
+    followed by the running sum, so an observation is a bisect and two adds.
+    Buckets are made cumulative only when rendered.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        """Record value in the series for the label values, given in labelnames order."""
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self) -> Iterable[Sample]:
+        bucket_labelnames = self.labelnames + ("le",)
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                yield "_bucket", bucket_labelnames, labels + (_format_value(bound),), cumulative
+            yield "_sum", self.labelnames, labels, series[-1]
+            yield "_count", self.labelnames, labels, cumulative
+
+
+class CallbackMetric(Metric):
+    """Counter or gauge whose series are read from collect() at scrape time."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        kind: str,
+        labelnames: Sequence[str],
+        collect: Callable[[], Iterable[Tuple[Tuple[str, ...], float]]],
+        aggregate: str = "sum"
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.collect = collect
+        self.aggregate = aggregate
+
+    def samples(self) -> Iterable[Sample]:
+        for labels, value in self.collect():
+            yield "", self.labelnames, tuple(labels), value
+
+
+class Registry:
+    """The metrics served at /metrics."""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(
+        self,
+        name: str,
+        documentation: str,
+        kind: str,
+        labelnames: Sequence[str],
+        collect: Callable[[], Iterable[Tuple[Tuple[str, ...], float]]],
+        aggregate: str = "sum"
+    ) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, kind, labelnames, collect, aggregate))
+
+    def snapshot(self) -> Dict[str, List[list]]:
+        """Current samples of every metric, as JSON-friendly lists keyed by metric name."""
+        return {
+            metric.name: [[suffix, list(labelnames), list(labels), value]
+                          for suffix, labelnames, labels, value in metric.samples()]
+            for metric in self._metrics
+        }
+
+    def render(self, others: Sequence[Dict[str, List[list]]] = ()) -> str:
+        """
+        All metrics in the Prometheus text exposition format.
+
+        Snapshots from other workers are merged in: counters and histograms
+        (whose cumulative buckets add up) are summed, gauges combined by
+        their aggregate.
+        """
+        lines = []
+        for metric in self._metrics:
+            # Counter samples carry the _total suffix; the family is named after the sample
+            name = f"{metric.name}_total" if metric.kind == "counter" else metric.name
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            samples = metric.samples()
+            if others:
+                samples = self._merge(metric, samples, others)
+            for suffix, labelnames, labels, value in samples:
+                if labelnames:
+                    pairs = ",".join(f"{key}=\"{_escape(str(label))}\"" for key, label in zip(labelnames, labels))
+                    lines.append(f"{name}{suffix}{{{pairs}}} {_format_value(value)}")
+                else:
+                    lines.append(f"{name}{suffix} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _merge(metric: Metric, samples: Iterable[Sample], others: Sequence[Dict[str, List[list]]]) -> List[Sample]:
+        merged: Dict[Tuple[str, Tuple[str, ...], Tuple[str, ...]], float] = {}
+        combine = max if metric.kind == "gauge" and metric.aggregate == "max" else lambda a, b: a + b
+        for suffix, labelnames, labels, value in samples:
+            merged[(suffix, tuple(labelnames), tuple(labels))] = value
+        for snapshot in others:
+            for suffix, labelnames, labels, value in snapshot.get(metric.name, ()):
+                key = (suffix, tuple(labelnames), tuple(labels))
+                merged[key] = combine(merged[key], value) if key in merged else value
+        return [(suffix, labelnames, labels, value) for (suffix, labelnames, labels), value in merged.items()]
+
+
+class SharedMetrics:
+    """
+    Metrics of all worker processes, exchanged through snapshot files.
+
+    Every worker writes its registry to <directory>/<pid>.json every
+    interval and on shutdown, and /metrics in any worker merges the other
+    workers' latest snapshots into its own live values. Snapshots of workers
+    that have exited still count towards counters and histograms, so totals
+    never go backwards, but not towards gauges.
+    """
+
+    def __init__(self, registry: Registry, directory: str, interval: float = 5.0):
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self.pid = os.getpid()
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, snapshot: Optional[Dict[str, List[list]]] = None) -> None:
+        path = os.path.join(self.directory, f"{self.pid}.json")
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as out:
+            json.dump(self.registry.snapshot() if snapshot is None else snapshot, out)
+        os.replace(temporary, path)
+
+    def others(self) -> List[Dict[str, List[list]]]:
+        gauges = {metric.name for metric in self.registry._metrics if metric.kind == "gauge"}
+        snapshots = []
+        for filename in os.listdir(self.directory):
+            pid = filename[:-5]
+            if not filename.endswith(".json") or not pid.isdigit() or int(pid) == self.pid:
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as snapshot:
+                    data = json.load(snapshot)
+            except (OSError, ValueError):
+                continue
+            if not _alive(int(pid)):
+                data = {name: samples for name, samples in data.items() if name not in gauges}
+            snapshots.append(data)
+        return snapshots
+
+    async def render(self) -> str:
+        # Files are read off the event loop; live samples are read on it, where they change
+        return self.registry.render(await asyncio.to_thread(self.others))
+
+    async def run(self) -> None:
+        """Write this worker's snapshot every interval until cancelled, then once more."""
+        try:
+            while True:
+                await asyncio.to_thread(self.write, self.registry.snapshot())
+                await asyncio.sleep(self.interval)
+        finally:
+            try:
+                self.write()
+            except OSError as e:
+                logger.warning("Final metrics snapshot failed: %s", str(e))
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def resident_memory_bytes() -> float:
+    """Resident set size of this process; its peak where /proc is not available (macOS)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware recording each HTTP request's duration and the number in flight.
+
+    Requests end when the last response byte is sent, so streamed responses
+    are timed in full. Routes are labelled by their path template (for
+    example /api/listen/audio/{audio_id}) to keep the series count bounded.
+    """
+
+    def __init__(self, app, duration: Histogram, in_flight: Gauge):
+        self.app = app
+        self.duration = duration
+        self.in_flight = in_flight
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        self.in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.in_flight.dec()
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.duration.observe(time.perf_counter() - start, scope["method"], route, status)
@@ -0,0 +1,175 @@
+"""
+Stored site pages.
+Page HTML is reduced to its main text once at ingestion and kept under a
+stable page id, together with the summary and details precomputed for it,
+so the widget can refer to a page instead of re-sending its scraped text.
+"""
+
+import time
+import hashlib
+import sqlite3
+import asyncio
+import threading
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from budget import clean_lines
+
+# Elements whose text is never page content
+SKIP_TAGS = {
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe",
+    "nav", "header", "footer", "aside", "form", "button", "select", "dialog",
+}
+# Elements that start a new line of text
+BLOCK_TAGS = {
+    "p", "div", "section", "article", "main", "li", "ul", "ol", "dl", "dt", "dd",
+    "h1", "h2", "h3", "h4", "h5", "h6", "br", "tr", "td", "th", "table",
+    "blockquote", "pre", "figure", "figcaption", "hr",
+}
+HEADING_TAGS = {"h1", "h2", "h3"}
+MAIN_TAGS = {"main", "article"}
+
+# Stored content is capped; prompts are trimmed further to each endpoint's budget
+MAX_CONTENT_CHARS = 100_000
+
+
+def normalize_url(url: str) -> str:
+    """Host and path of a page URL, ignoring scheme, query, fragment and trailing slash."""
+    parts = urlsplit(url if "//" in url else f"//{url}")
+    path = parts.path.rstrip("/") or "/"
+    return f"{parts.netloc.lower()}{path}"
+
+
+def make_page_id(url: str) -> str:
+    """Stable id for a page URL."""
+    return hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()[:16]
+
+
+def content_hash(content: str) -> str:
+    """Hash of extracted page text, used to skip re-summarizing unchanged pages."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class MainContentParser(HTMLParser):
+    """Collects the title and visible text of a page, separately for <main>/<article>."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self.body_lines: List[str] = []
+        self.main_lines: List[str] = []
+        self._skip_depth = 0
+        self._main_depth = 0
+        self._in_title = False
+        self._line: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag == "title":
+            self._in_title = True
+        if tag in BLOCK_TAGS:
+            self._flush()
+        if tag in MAIN_TAGS:
+            self._main_depth += 1
+        if tag in HEADING_TAGS and not self._skip_depth:
+            self._line.append("# ")
+
+    def handle_endtag(self, tag):
+        if tag in BLOCK_TAGS:
+            self._flush()
+        if tag in SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag == "title":
+            self._in_title = False
+        if tag in MAIN_TAGS and self._main_depth:
+            self._main_depth -= 1
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skip_depth:
+            self._line.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+    def _flush(self):
+        # Inline siblings are often rendered without whitespace between them
+        line = " ".join(" ".join(self._line).split())
+        self._line = []
+        if not line or line == "#":
+            return
+        self.body_lines.append(line)
+        if self._main_depth:
+            self.main_lines.append(line)
+
+
+def extract_main_content(html: str) -> Dict[str, str]:
+    """
+    Title and cleaned main text of an HTML page.
+
+    Text inside <main> or <article> is preferred when there is enough of it;
+    navigation, headers, footers, scripts and forms are dropped either way.
+    h1-h3 headings are kept as Markdown headings.
+    """
+    parser = MainContentParser()
+    parser.feed(html)
+    parser.close()
+
+    lines = parser.main_lines if sum(map(len, parser.main_lines)) > 100 else parser.body_lines
+    content = "\n".join(clean_lines("\n".join(lines)))[:MAX_CONTENT_CHARS]
+    return {"title": " ".join(parser.title.split()), "content": content}
+
+
+class PageStore:
+    """Ingested pages and their precomputed responses, stored in a local SQLite file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "page_id TEXT PRIMARY KEY, url TEXT NOT NULL, title TEXT NOT NULL, "
+            "content TEXT NOT NULL, content_hash TEXT NOT NULL, "
+            "model TEXT, summary TEXT, summary_version TEXT, details TEXT, details_version TEXT, "
+            "updated_at REAL NOT NULL)"
+        )
+
+    def _get(self, page_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM pages WHERE page_id = ?", (page_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def _save(self, page: Dict[str, Any]) -> None:
+        columns = ", ".join(page)
+        placeholders = ", ".join("?" for _ in page)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO pages ({columns}) VALUES ({placeholders})", tuple(page.values())
+            )
+
+    def _count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    async def get(self, page_id: str) -> Optional[Dict[str, Any]]:
+        """Stored page by id, or None."""
+        return await asyncio.to_thread(self._get, page_id)
+
+    async def save(self, page: Dict[str, Any]) -> None:
+        """Insert or replace a page record."""
+        await asyncio.to_thread(self._save, {**page, "updated_at": time.time()})
+
+    async def count(self) -> int:
+        return await asyncio.to_thread(self._count)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,113 @@
+"""
+Speculative prefetch bookkeeping.
+The widget asks for a page's summary (and optionally its audio) as soon as
+it loads, before the visitor clicks. Prefetches are bounded by a budget per
+site and one for the whole worker, both per minute, so pages that are viewed
+but never summarized cannot run up the upstream bill.
+
+Every prefetch that starts work is remembered by the cache key of what it
+produces until ttl passes. A request that is then served for the same key
+claims it and counts as a hit, whether the prefetch had finished or was
+still in flight; prefetches that expire unclaimed count as wasted. Counts are
+per worker: a click served by another worker than the prefetch is a hit
+there only as a cache hit.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from admission import TokenBucket
+
+
+class Prefetcher:
+    """Per-minute budgets for prefetches, and the record of which were used."""
+
+    def __init__(
+        self,
+        site_per_minute: float,
+        per_minute: float,
+        ttl: float = 600.0,
+        max_sites: int = 10000,
+        max_entries: int = 10000,
+    ):
+        self.site_per_minute = site_per_minute
+        self.ttl = ttl
+        self.max_sites = max_sites
+        self.max_entries = max_entries
+        # A budget of 0 is no limit
+        self.bucket = TokenBucket(per_minute / 60.0, per_minute) if per_minute > 0 else None
+        self.sites: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        # Cache key -> (kind, expiry); insertion order is expiry order
+        self.entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.results: Dict[Tuple[str, str], int] = {}
+        self.hits: Dict[str, int] = {}
+        self.wasted: Dict[str, int] = {}
+
+    def count(self, kind: str, result: str) -> None:
+        """
+        Count a prefetch request's outcome: started, cached, in_flight, busy
+        or over_budget; a started prefetch that fails is counted again as failed.
+        """
+        self.results[(kind, result)] = self.results.get((kind, result), 0) + 1
+
+    def admit(self, site: str) -> Optional[str]:
+        """None if site may start a prefetch now, otherwise the budget it is over: "site" or "global"."""
+        if self.bucket is not None and self.bucket.wait_time() > 0:
+            return "global"
+        if self.site_per_minute > 0:
+            bucket = self.sites.get(site)
+            if bucket is None:
+                bucket = self.sites[site] = TokenBucket(self.site_per_minute / 60.0, self.site_per_minute)
+                if len(self.sites) > self.max_sites:
+                    # Least recently seen site; if it comes back it starts with a full budget
+                    self.sites.popitem(last=False)
+            else:
+                self.sites.move_to_end(site)
+            if bucket.reserve(0.0) is None:
+                return "site"
+        if self.bucket is not None:
+            self.bucket.reserve(0.0)
+        return None
+
+    def track(self, key: str, kind: str) -> None:
+        """Remember that a prefetch is producing the result cached under key."""
+        self.expire()
+        self.entries.pop(key, None)
+        self.entries[key] = (kind, time.monotonic() + self.ttl)
+        while len(self.entries) > self.max_entries:
+            _, (evicted_kind, _) = self.entries.popitem(last=False)
+            self.wasted[evicted_kind] = self.wasted.get(evicted_kind, 0) + 1
+
+    def discard(self, key: str) -> None:
+        """Forget a prefetch that failed; it is neither a hit nor wasted."""
+        self.entries.pop(key, None)
+
+    def claim(self, key: str) -> bool:
+        """Count a hit if a request is being served what a prefetch produced under key."""
+        self.expire()
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+        self.hits[entry[0]] = self.hits.get(entry[0], 0) + 1
+        return True
+
+    def expire(self) -> Dict[str, int]:
+        """Count the prefetches nobody claimed within ttl as wasted; returns the wasted counts by kind."""
+        now = time.monotonic()
+        while self.entries:
+            key, (kind, expiry) = next(iter(self.entries.items()))
+            if expiry > now:
+                break
+            del self.entries[key]
+            self.wasted[kind] = self.wasted.get(kind, 0) + 1
+        return self.wasted
+
+    def stats(self) -> Dict[str, object]:
+        wasted = self.expire()
+        return {
+            "pending": len(self.entries),
+            "results": {f"{kind}:{result}": count for (kind, result), count in sorted(self.results.items())},
+            "hits": dict(self.hits),
+            "wasted": dict(wasted),
+        }
@@ -0,0 +1,152 @@
+"""
+Pre-warm the summary cache for a document catalog.
+Reads documents from a JSONL file ({"id": ..., "text": ...} per line), posts
+them in chunks to /api/summarize/batch and appends each document's outcome to
+an output JSONL file. With --resume, documents already summarized (with the
+same text) in a previous run's output are skipped, so a run that stopped
+part-way can be picked up where it failed.
+
+Usage:
+    INGEST_API_TOKEN=... python prewarm.py catalog.jsonl --output prewarm_results.jsonl
+    python prewarm.py catalog.jsonl --output prewarm_results.jsonl --resume
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+from typing import Any, Dict, List
+
+import httpx
+
+DONE_STATUSES = {"generated", "cached"}
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def load_documents(path: str) -> List[Dict[str, str]]:
+    """Documents from a JSONL file; lines without an id and text are reported and skipped."""
+    documents = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if not record.get("id") or not record.get("text"):
+                print(f"SKIP line {number}: needs id and text")
+                continue
+            documents.append({"id": str(record["id"]), "text": record["text"]})
+    return documents
+
+
+def load_done(path: str) -> Dict[str, str]:
+    """id -> text hash of documents a previous run summarized successfully."""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if record["status"] in DONE_STATUSES:
+                    done[record["id"]] = record["text_hash"]
+    return done
+
+
+async def post_chunk(client: httpx.AsyncClient, chunk: List[Dict[str, str]], args) -> Dict[str, Any]:
+    """Summarize one chunk of documents; a failed request marks every document in it failed."""
+    try:
+        response = await client.post("/api/summarize/batch", json={
+            "documents": chunk,
+            "model": args.model,
+            "max_parallel": args.parallel
+        })
+    except httpx.HTTPError as e:
+        error = {"message": str(e), "code": "REQUEST_ERROR"}
+    else:
+        try:
+            body = response.json()
+        except ValueError:
+            # Not JSON, such as a proxy's error page
+            body = None
+        if response.status_code == 200 and isinstance(body, dict) and "data" in body:
+            return body["data"]
+        if isinstance(body, dict):
+            error = body.get("detail", {})
+            error = error.get("error", {}) if isinstance(error, dict) else {"message": str(error)}
+            error = {"message": error.get("message"), "code": error.get("code", str(response.status_code))}
+        else:
+            error = {"message": response.text[:200], "code": str(response.status_code)}
+    return {
+        "results": [{"id": document["id"], "status": "failed", "error": error} for document in chunk],
+        "stats": {"tokens": 0, "retries": 0, "rate_limited": 0}
+    }
+
+
+async def main(args) -> int:
+    token = os.getenv("INGEST_API_TOKEN")
+    if not token:
+        print("INGEST_API_TOKEN must be set")
+        return 2
+
+    documents = load_documents(args.input)
+    if args.resume:
+        done = load_done(args.output)
+        pending = [document for document in documents if done.get(document["id"]) != text_hash(document["text"])]
+        print(f"Resuming: {len(documents) - len(pending)} of {len(documents)} documents already done")
+        documents = pending
+    if not documents:
+        print("Nothing to summarize")
+        return 0
+
+    hashes = {document["id"]: text_hash(document["text"]) for document in documents}
+    totals = {"generated": 0, "cached": 0, "failed": 0, "tokens": 0, "retries": 0, "rate_limited": 0}
+    started = time.perf_counter()
+    async with httpx.AsyncClient(base_url=args.backend, timeout=args.timeout,
+                                 headers={"Authorization": f"Bearer {token}"}) as client:
+        with open(args.output, "a" if args.resume else "w", encoding="utf-8") as output:
+            for start in range(0, len(documents), args.chunk_size):
+                chunk = documents[start:start + args.chunk_size]
+                data = await post_chunk(client, chunk, args)
+                for result in data["results"]:
+                    totals[result["status"]] += 1
+                    record = {"id": result["id"], "status": result["status"], "text_hash": hashes[result["id"]]}
+                    if result.get("error"):
+                        record["error"] = result["error"]
+                        print(f"FAIL {result['id']}: {result['error'].get('code')} {result['error'].get('message')}")
+                    output.write(json.dumps(record) + "\n")
+                output.flush()
+                for key in ("tokens", "retries", "rate_limited"):
+                    totals[key] += data["stats"].get(key) or 0
+
+                elapsed = time.perf_counter() - started
+                finished = start + len(chunk)
+                print(f"{finished}/{len(documents)} documents, {finished / elapsed:.2f} docs/s, "
+                      f"{totals['tokens'] / elapsed:.0f} tokens/s")
+
+    elapsed = time.perf_counter() - started
+    print(f"Done in {elapsed:.1f}s: {totals['generated']} generated, {totals['cached']} cached, "
+          f"{totals['failed']} failed, {totals['retries']} retries ({totals['rate_limited']} rate limited)")
+    print(f"Throughput: {len(documents) / elapsed:.2f} docs/s, {totals['tokens'] / elapsed:.0f} tokens/s")
+    if totals["failed"]:
+        print("Re-run with --resume to retry the failed documents")
+    return 1 if totals["failed"] else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("input", help="JSONL file of {\"id\", \"text\"} documents")
+    parser.add_argument("--output", default="prewarm_results.jsonl", help="JSONL file of per-document results")
+    parser.add_argument("--resume", action="store_true", help="skip documents already done in --output")
+    parser.add_argument("--backend", default="http://localhost:8000", help="base URL of the widget backend")
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    parser.add_argument("--chunk-size", type=int, default=50, help="documents per batch request")
+    parser.add_argument("--parallel", type=int, default=8, help="summaries in flight per batch request")
+    parser.add_argument("--timeout", type=float, default=600.0, help="seconds to wait for one batch request")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,282 @@
+"""
+Resilience policies for upstream calls.
+Transient failures are retried with jittered exponential backoff under a
+retry budget, slow calls can be hedged with a second request once they pass
+a latency percentile, and a circuit breaker per upstream fails calls fast
+while that upstream is down instead of letting every request time out.
+"""
+
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+
+from upstream import is_connection_error, is_rate_limited, is_retryable, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+# Upstream statuses that mean the upstream itself is failing, as opposed to rejecting our request
+OUTAGE_STATUSES = {408, 500, 502, 503, 504}
+
+
+def is_outage(error: Exception) -> bool:
+    """Whether a failure counts against the upstream's circuit breaker."""
+    if is_connection_error(error):
+        return True
+    return getattr(error, "status_code", None) in OUTAGE_STATUSES
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit open, retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive outage failures.
+
+    While open, calls fail at once with CircuitOpenError. After reset_timeout
+    a single probe call is let through (half-open): its success closes the
+    circuit, its failure opens it for another reset_timeout. Errors that do
+    not indicate an outage, such as a 400 or a rate limit, count as the
+    upstream being up.
+    """
+
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.opened = 0
+        self.rejected = 0
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def check(self) -> None:
+        """Raise CircuitOpenError if a call would be rejected right now."""
+        state = self.state
+        if state == self.OPEN or (state == self.HALF_OPEN and self._probing):
+            self.rejected += 1
+            retry_after = max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+            raise CircuitOpenError(self.name, retry_after)
+
+    @contextmanager
+    def guard(self):
+        """Run one upstream call through the breaker and record its outcome."""
+        self.check()
+        probe = self.state == self.HALF_OPEN
+        if probe:
+            self._probing = True
+        try:
+            yield
+        except Exception as e:
+            if is_outage(e):
+                self._on_failure()
+            else:
+                self._on_success()
+            raise
+        except BaseException:
+            # Cancelled before the upstream answered: no verdict, let another probe through
+            if probe:
+                self._probing = False
+            raise
+        else:
+            self._on_success()
+
+    def _on_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info("%s circuit closed", self.name)
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def _on_failure(self) -> None:
+        self.failures += 1
+        if self._probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+            if self.opened_at is None:
+                self.opened += 1
+            logger.warning("%s circuit open after %s failures, probing again in %.0fs",
+                           self.name, self.failures, self.reset_timeout)
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "opened": self.opened, "rejected": self.rejected}
+
+
+class RetryPolicy:
+    """
+    Retries transient failures with jittered exponential backoff.
+
+    Retries are limited by a budget that earns budget_ratio of a retry per
+    call, so during an outage at most that share of extra load is sent on
+    top of the original calls. A retry-after hint longer than max_delay ends
+    the retries rather than holding the request.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        attempts: int = 3,
+        base_delay: float = 0.25,
+        max_delay: float = 4.0,
+        budget_ratio: float = 0.2,
+        budget_cap: float = 10.0
+    ):
+        self.name = name
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.budget_cap = budget_cap
+        self.retries = 0
+        self.budget_exhausted = 0
+        self._budget = budget_cap
+
+    def _delay(self, error: Exception, attempt: int) -> float:
+        delay = retry_after_seconds(error)
+        if delay is None:
+            delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+        return delay
+
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        retry_on: Callable[[Exception], bool] = is_retryable
+    ) -> Any:
+        self._budget = min(self.budget_cap, self._budget + self.budget_ratio)
+        for attempt in range(self.attempts):
+            try:
+                return await fn()
+            except Exception as e:
+                if attempt == self.attempts - 1 or not retry_on(e):
+                    raise
+                delay = self._delay(e, attempt)
+                if delay > self.max_delay:
+                    raise
+                if self._budget < 1:
+                    self.budget_exhausted += 1
+                    raise
+                self._budget -= 1
+                self.retries += 1
+                logger.warning("%s call failed (attempt %s/%s%s), "
+                               "retrying in %.2fs: %s",
+                               self.name, attempt + 1, self.attempts,
+                               ", rate limited" if is_rate_limited(e) else "", delay, str(e))
+                await asyncio.sleep(delay)
+
+
+class Hedger:
+    """
+    Sends a second, identical request when the first is slower than the
+    given latency percentile of recent calls, and takes whichever answers
+    first; the other is cancelled.
+
+    Hedging starts once min_samples calls have been timed for a key, and at
+    most max_ratio of calls are hedged so a slow upstream is not sent twice
+    the load. Latencies are tracked per key (endpoint and model).
+    """
+
+    def __init__(
+        self,
+        percentile: float,
+        min_delay: float = 0.05,
+        max_ratio: float = 0.05,
+        window: int = 200,
+        min_samples: int = 20
+    ):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_ratio = max_ratio
+        self.window = window
+        self.min_samples = min_samples
+        self.latencies: Dict[Hashable, Deque[float]] = {}
+        self.calls = 0
+        self.hedged: Dict[Hashable, int] = {}
+        self.won: Dict[Hashable, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.percentile > 0
+
+    def delay(self, key: Hashable) -> Optional[float]:
+        """Seconds after which a call for key is hedged, or None while too few calls have been timed."""
+        samples = self.latencies.get(key)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return max(self.min_delay, ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))])
+
+    def _observe(self, key: Hashable, seconds: float) -> None:
+        samples = self.latencies.get(key)
+        if samples is None:
+            samples = self.latencies[key] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    async def _timed(self, key: Hashable, fn: Callable[[bool], Awaitable[Any]], hedge: bool) -> Any:
+        started = time.perf_counter()
+        result = await fn(hedge)
+        self._observe(key, time.perf_counter() - started)
+        return result
+
+    async def run(
+        self,
+        key: Hashable,
+        fn: Callable[[bool], Awaitable[Any]],
+        may_hedge: Callable[[], bool] = lambda: True
+    ) -> Any:
+        """
+        Await fn(False), hedging it with fn(True) if it is slow.
+
+        may_hedge is asked just before the hedge is sent, so it can check
+        for spare upstream capacity; a failed hedge leaves the first call
+        running, and the call only fails if both do.
+        """
+        self.calls += 1
+        delay = self.delay(key) if self.enabled else None
+        if delay is None:
+            return await self._timed(key, fn, False)
+
+        first = asyncio.ensure_future(self._timed(key, fn, False))
+        pending: List[asyncio.Future] = [first]
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done or sum(self.hedged.values()) >= self.max_ratio * self.calls or not may_hedge():
+                return await first
+            self.hedged[key] = self.hedged.get(key, 0) + 1
+            second = asyncio.ensure_future(self._timed(key, fn, True))
+            pending.append(second)
+            error = None
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.remove(task)
+                    if task.exception() is None:
+                        if task is second:
+                            self.won[key] = self.won.get(key, 0) + 1
+                        return task.result()
+                    if task is first:
+                        error = task.exception()
+            raise error or second.exception()
+        finally:
+            for task in pending:
+                task.cancel()
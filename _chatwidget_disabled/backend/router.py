@@ -0,0 +1,365 @@
+"""
+Model routing.
+Picks the model and output token budget of each completion. Every endpoint
+has an ordered list of candidate models, and a candidate can be limited to
+inputs below a number of tokens, so short inputs go to a small, fast model
+and long ones to a larger one. A request that names a model gets it, as
+long as that model is healthy; one that names none ("auto") gets the first
+candidate that fits its input and is healthy.
+
+A model is degraded on an endpoint while its circuit is open, while its
+recent error rate is over a limit, or while the exponentially weighted
+estimate of its p95 latency there is over the endpoint's target. Requests
+then fail over to the next healthy candidate. A degraded model gets a single
+probe request once it has gone probe_interval without one, and takes its
+traffic back when the probe is fast and succeeds.
+
+max_tokens is the endpoint's cap, lowered to what the model's context
+window leaves after the prompt and, once enough answers have been seen, to
+a multiple of the longest answers the endpoint has recently produced, so a
+model that runs on cannot hold a slot for ten times the usual time.
+"""
+
+import math
+import time
+import logging
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Model name a request gives, or is given, to be routed
+AUTO = "auto"
+
+# Why a route picked its model
+REQUESTED = "requested"  # The model the request named
+PREFERRED = "preferred"  # The endpoint's first candidate
+SIZE = "size"  # Earlier candidates do not take inputs this large
+FAILOVER = "failover"  # Earlier candidates are degraded
+PROBE = "probe"  # A degraded model tried again to see if it has recovered
+DEGRADED = "degraded"  # Every candidate is degraded; the one with the lowest latency
+
+# Context windows in tokens, prompt and answer together
+CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4.1": 1047576,
+    "gpt-4.1-mini": 1047576,
+    "gpt-4.1-nano": 1047576,
+}
+# For models not listed above
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Standard normal quantiles for the latency and answer length estimates
+P95 = 1.645
+P99 = 2.326
+
+Candidate = Tuple[str, Optional[int]]  # Model, and the largest input in tokens it takes (None: any)
+
+
+def parse_candidates(value: str) -> List[Candidate]:
+    """Candidates from a setting such as "gpt-4o-mini<2000,gpt-4o": models in order, some for inputs under N tokens."""
+    candidates = []
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        model, _, limit = item.partition("<")
+        candidates.append((model.strip(), int(limit) if limit else None))
+    return candidates
+
+
+def parse_numbers(value: str) -> Dict[str, float]:
+    """Numbers by name from a setting such as "chat=8,details=20"."""
+    numbers = {}
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        name, _, number = item.partition("=")
+        numbers[name.strip()] = float(number)
+    return numbers
+
+
+class Estimate:
+    """Exponentially weighted mean and variance of a measurement, and the quantiles they imply."""
+
+    __slots__ = ("alpha", "mean", "variance", "samples")
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.mean = 0.0
+        self.variance = 0.0
+        self.samples = 0
+
+    def observe(self, value: float) -> None:
+        if not self.samples:
+            self.mean = value
+        else:
+            delta = value - self.mean
+            self.mean += self.alpha * delta
+            self.variance = (1 - self.alpha) * (self.variance + self.alpha * delta * delta)
+        self.samples += 1
+
+    def reset(self, value: float, samples: int) -> None:
+        """Forget the history and start over from one measurement, counted as `samples`."""
+        self.mean = value
+        self.variance = 0.0
+        self.samples = samples
+
+    def quantile(self, z: float) -> float:
+        return self.mean + z * math.sqrt(self.variance)
+
+
+class ModelHealth:
+    """Recent latency and errors of one model on one endpoint."""
+
+    __slots__ = ("latency", "first_token", "errors", "last_sample", "probe_started")
+
+    def __init__(self, alpha: float):
+        self.latency = Estimate(alpha)  # Non-streamed completions, whole call
+        self.first_token = Estimate(alpha)  # Streamed completions, to the first token
+        self.errors = Estimate(alpha)  # 1 for a failed call, 0 for a successful one
+        self.last_sample = 0.0
+        self.probe_started: Optional[float] = None
+
+
+class Route:
+    """The model and max_tokens picked for one completion, and why."""
+
+    __slots__ = ("endpoint", "requested", "model", "fallback", "max_tokens", "input_tokens", "reason")
+
+    def __init__(self, endpoint: str, requested: str, model: str, fallback: Optional[str],
+                 max_tokens: int, input_tokens: int, reason: str):
+        self.endpoint = endpoint
+        self.requested = requested
+        self.model = model
+        self.fallback = fallback
+        self.max_tokens = max_tokens
+        self.input_tokens = input_tokens
+        self.reason = reason
+
+    def is_fallback(self, model: str) -> bool:
+        """Whether an answer by model is a stand-in, not to be cached as the requested model's."""
+        return model != self.model or self.reason in (FAILOVER, DEGRADED)
+
+    def usage(self, model: str) -> Dict[str, object]:
+        """The routing decision, for the usage report of the answer model gave."""
+        return {
+            "route": {
+                "requested": self.requested,
+                "model": model,
+                "reason": self.reason if model == self.model else FAILOVER,
+                "max_tokens": self.max_tokens,
+                "input_tokens": self.input_tokens,
+            }
+        }
+
+
+class ModelRouter:
+    """
+    Routes completions among each endpoint's candidate models.
+
+    With enabled False, requests get the model they name (the endpoint's
+    first candidate for "auto") and the endpoint's max_tokens cap, and fall
+    back only to the endpoint's fallback model, as before routing.
+    """
+
+    def __init__(
+        self,
+        candidates: Mapping[str, Sequence[Candidate]],
+        fallbacks: Mapping[str, Optional[str]],
+        max_tokens: Mapping[str, int],
+        latency_targets: Mapping[str, float],
+        first_token_target: float,
+        max_error_rate: float = 0.2,
+        min_samples: int = 5,
+        probe_interval: float = 15.0,
+        alpha: float = 0.1,
+        output_headroom: float = 1.5,
+        min_output_tokens: int = 64,
+        allowed: Optional[Sequence[str]] = None,
+        context_windows: Optional[Mapping[str, int]] = None,
+        is_open: Optional[Callable[[str], bool]] = None,
+        enabled: bool = True,
+    ):
+        self.candidates = {endpoint: list(models) for endpoint, models in candidates.items()}
+        self.fallbacks = dict(fallbacks)
+        self.max_tokens = dict(max_tokens)
+        self.latency_targets = dict(latency_targets)
+        self.first_token_target = first_token_target
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.probe_interval = probe_interval
+        self.alpha = alpha
+        self.output_headroom = output_headroom
+        self.min_output_tokens = min_output_tokens
+        self.allowed = set(allowed or ())
+        self.context_windows = {**CONTEXT_WINDOWS, **(context_windows or {})}
+        # Whether a model's circuit breaker is open; set by main.py
+        self.is_open = is_open or (lambda model: False)
+        self.enabled = enabled
+        self.health: Dict[Tuple[str, str], ModelHealth] = {}
+        # Completion tokens of recent answers, per endpoint
+        self.output: Dict[str, Estimate] = {}
+
+    def is_allowed(self, model: str) -> bool:
+        """Whether requests may name model; every model is allowed when there is no allow-list."""
+        return not self.allowed or model == AUTO or model in self.allowed
+
+    def context_window(self, model: str) -> int:
+        return self.context_windows.get(model, DEFAULT_CONTEXT_WINDOW)
+
+    def _health(self, endpoint: str, model: str) -> ModelHealth:
+        health = self.health.get((endpoint, model))
+        if health is None:
+            health = self.health[(endpoint, model)] = ModelHealth(self.alpha)
+        return health
+
+    def degraded(self, endpoint: str, model: str) -> bool:
+        """Whether model is failing or too slow on endpoint, going by its recent calls."""
+        if self.is_open(model):
+            return True
+        health = self.health.get((endpoint, model))
+        if health is None:
+            return False
+        if health.errors.samples >= self.min_samples and health.errors.mean > self.max_error_rate:
+            return True
+        target = self.latency_targets.get(endpoint)
+        if target and health.latency.samples >= self.min_samples and health.latency.quantile(P95) > target:
+            return True
+        return (health.first_token.samples >= self.min_samples
+                and health.first_token.quantile(P95) > self.first_token_target)
+
+    def _probe_due(self, endpoint: str, model: str, now: float) -> bool:
+        """Whether a degraded model has gone long enough without a call to be tried again."""
+        if self.is_open(model):
+            # The circuit breaker sends its own probe
+            return False
+        health = self._health(endpoint, model)
+        if health.probe_started is not None and now - health.probe_started < self.probe_interval:
+            return False
+        return now - health.last_sample >= self.probe_interval
+
+    def _output_budget(self, endpoint: str, model: str, input_tokens: int) -> int:
+        cap = min(self.max_tokens[endpoint], self.context_window(model) - input_tokens)
+        output = self.output.get(endpoint)
+        if self.enabled and output is not None and output.samples >= 4 * self.min_samples:
+            cap = min(cap, math.ceil(output.quantile(P99) * self.output_headroom))
+        return max(cap, self.min_output_tokens)
+
+    def _fits(self, candidate: Candidate, input_tokens: int) -> bool:
+        model, limit = candidate
+        if limit is not None and input_tokens >= limit:
+            return False
+        return input_tokens + self.min_output_tokens <= self.context_window(model)
+
+    def route(self, endpoint: str, requested: str, input_tokens: int) -> Route:
+        """Pick the model and max_tokens for a completion with input_tokens of prompt."""
+        if not self.enabled:
+            model = self.candidates[endpoint][0][0] if requested == AUTO else requested
+            fallback = self.fallbacks.get(endpoint)
+            return Route(endpoint, requested, model, fallback if fallback != model else None,
+                         self.max_tokens[endpoint], input_tokens, REQUESTED if requested != AUTO else PREFERRED)
+
+        candidates = [] if requested == AUTO else [(requested, None)]
+        fallback = self.fallbacks.get(endpoint)
+        for candidate in [*self.candidates[endpoint], *([(fallback, None)] if fallback else [])]:
+            if candidate[0] not in (model for model, _ in candidates) and self.is_allowed(candidate[0]):
+                candidates.append(candidate)
+
+        fitting = [model for model, limit in candidates if self._fits((model, limit), input_tokens)]
+        if not fitting:
+            # Nothing takes an input this large; the largest window comes closest
+            fitting = [max((model for model, _ in candidates), key=self.context_window)]
+        healthy = [model for model in fitting if not self.degraded(endpoint, model)]
+        now = time.monotonic()
+
+        probe = next((model for model in fitting if model not in healthy and self._probe_due(endpoint, model, now)),
+                     None)
+        if probe is not None and (not healthy or fitting.index(probe) < fitting.index(healthy[0])):
+            self._health(endpoint, probe).probe_started = now
+            model, reason = probe, PROBE
+            others = healthy
+        elif healthy:
+            model = healthy[0]
+            if fitting[0] != model:
+                reason = FAILOVER
+            elif model != candidates[0][0]:
+                reason = SIZE
+            else:
+                reason = PREFERRED if requested == AUTO else REQUESTED
+            others = healthy[1:]
+        else:
+            model = self._least_degraded(endpoint, fitting)
+            reason = DEGRADED
+            others = fitting
+        next_model = next((other for other in others if other != model), None)
+        return Route(endpoint, requested, model, next_model, self._output_budget(endpoint, model, input_tokens),
+                     input_tokens, reason)
+
+    def _latency(self, endpoint: str, model: str) -> float:
+        """p95 latency estimate of model on endpoint; 0 before its first call."""
+        health = self.health.get((endpoint, model))
+        if health is None:
+            return 0.0
+        estimate = health.latency if health.latency.samples else health.first_token
+        return estimate.quantile(P95) if estimate.samples else 0.0
+
+    def _least_degraded(self, endpoint: str, models: Sequence[str]) -> str:
+        """Of degraded models, one whose circuit is closed and that mostly succeeds, with the lowest latency."""
+        def badness(model: str) -> Tuple[bool, bool, float]:
+            health = self.health.get((endpoint, model))
+            failing = health is not None and health.errors.mean > self.max_error_rate
+            return self.is_open(model), failing, self._latency(endpoint, model)
+        return min(models, key=badness)
+
+    def observe(self, endpoint: str, model: str, seconds: Optional[float], ok: bool, streamed: bool = False) -> None:
+        """
+        Record one call: its latency (to the first token when streamed) if it
+        succeeded, and whether it failed. The first call after a probe was
+        sent replaces the model's history, so one good answer brings it back.
+        """
+        health = self._health(endpoint, model)
+        latency = health.first_token if streamed else health.latency
+        if health.probe_started is not None:
+            health.probe_started = None
+            health.errors.reset(0.0 if ok else 1.0, self.min_samples)
+            if ok and seconds is not None:
+                latency.reset(seconds, self.min_samples)
+            logger.info("Model probe %s - Endpoint: %s, Model: %s, Latency: %s",
+                        "succeeded" if ok and not self.degraded(endpoint, model) else "failed",
+                        endpoint, model, f"{seconds:.2f}s" if seconds is not None else "-")
+        else:
+            was_degraded = self.degraded(endpoint, model)
+            health.errors.observe(0.0 if ok else 1.0)
+            if ok and seconds is not None:
+                latency.observe(seconds)
+            if not was_degraded and self.degraded(endpoint, model):
+                logger.warning("Model degraded, failing over - Endpoint: %s, Model: %s, "
+                               "Error rate: %.2f, Latency p95: %.2fs",
+                               endpoint, model, health.errors.mean, self._latency(endpoint, model))
+        health.last_sample = time.monotonic()
+
+    def observe_output(self, endpoint: str, completion_tokens: int) -> None:
+        """Record the length of one answer, for the endpoint's max_tokens."""
+        output = self.output.get(endpoint)
+        if output is None:
+            output = self.output[endpoint] = Estimate(self.alpha)
+        output.observe(completion_tokens)
+
+    def stats(self) -> dict:
+        """Latency and error estimates per endpoint and model, and answer lengths per endpoint."""
+        return {
+            "enabled": self.enabled,
+            "models": {
+                f"{endpoint}:{model}": {
+                    "degraded": self.degraded(endpoint, model),
+                    "error_rate": round(health.errors.mean, 3),
+                    "latency_p95": round(health.latency.quantile(P95), 3) if health.latency.samples else None,
+                    "first_token_p95": (round(health.first_token.quantile(P95), 3)
+                                        if health.first_token.samples else None),
+                    "samples": health.errors.samples,
+                }
+                for (endpoint, model), health in self.health.items()
+            },
+            "output_tokens_p99": {
+                endpoint: math.ceil(output.quantile(P99)) for endpoint, output in self.output.items()
+            },
+        }
@@ -0,0 +1,309 @@
+"""
+Priority scheduling of upstream calls.
+Interactive requests (a visitor waiting on a chat answer, a summary or audio)
+and background work (batch pre-warm, precompute at ingestion, prefetch) share
+each upstream's concurrency slots. Waiting calls are served strictly by
+priority class, and within a class sites share the slots by weighted fair
+queuing, so one busy site cannot starve the others. Background calls never
+take the slots reserved for interactive ones and are preempted when an
+interactive call would otherwise wait. A call is dropped instead of sent once
+its request's deadline can no longer be met.
+
+The priority, site and deadline of a request's calls are set once per request
+with schedule_as and read from context variables at every call.
+"""
+
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import contextvars
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BACKGROUND)  # Highest first
+
+priority_var: contextvars.ContextVar[str] = contextvars.ContextVar("upstream_priority", default=INTERACTIVE)
+tenant_var: contextvars.ContextVar[str] = contextvars.ContextVar("upstream_tenant", default="default")
+# time.monotonic() by which the request's upstream calls must be done
+deadline_var: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("upstream_deadline", default=None)
+
+
+def schedule_as(priority: str, tenant: str = "default", deadline: Optional[float] = None) -> None:
+    """Set the priority class, site and deadline (seconds from now) of the current request's upstream calls."""
+    priority_var.set(priority)
+    tenant_var.set(tenant)
+    deadline_var.set(time.monotonic() + deadline if deadline else None)
+
+
+def parse_weights(value: str) -> Dict[str, float]:
+    """Site weights from a setting such as "shop.example.com=2,blog.example.com=0.5"."""
+    weights = {}
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        tenant, _, weight = item.partition("=")
+        weights[tenant.strip()] = float(weight)
+    return weights
+
+
+class DeadlineExceeded(Exception):
+    """Raised instead of calling an upstream when the request's deadline can no longer be met."""
+
+    def __init__(self, name: str, priority: str, waited: float):
+        super().__init__(f"{name} {priority} call dropped after {waited:.2f}s in queue: deadline cannot be met")
+        self.name = name
+        self.priority = priority
+        self.waited = waited
+
+
+class _Waiter:
+    """One call queued for a slot, ordered by its fair-queuing start tag."""
+
+    __slots__ = ("tag", "seq", "priority", "tenant", "deadline", "enqueued", "future", "queued")
+
+    def __init__(self, tag: float, seq: int, priority: str, tenant: str, deadline: Optional[float], future: asyncio.Future):
+        self.tag = tag
+        self.seq = seq
+        self.priority = priority
+        self.tenant = tenant
+        self.deadline = deadline
+        self.enqueued = time.monotonic()
+        self.future = future
+        self.queued = True
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.tag, self.seq) < (other.tag, other.seq)
+
+
+class _Holder:
+    """A background call holding a slot through UpstreamScheduler.call, which can be preempted."""
+
+    __slots__ = ("task", "started", "preempted")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.started = time.monotonic()
+        self.preempted = False
+
+
+class UpstreamScheduler:
+    """
+    Caps the number of concurrent calls made to a single upstream and decides
+    which waiting call gets the next free slot.
+
+    Interactive calls may use all `limit` slots; background calls at most
+    `limit - reserve`. Each site's calls are tagged with start-time fair
+    queuing tags that advance by 1/weight per call, so under contention a
+    site with weight 2 gets twice the slots of a site with weight 1. A queued
+    call is dropped with DeadlineExceeded when its deadline passes, or when
+    it reaches the head of the queue with less time left than calls of its
+    class have recently held a slot for. With enabled False every call is
+    served first come, first served, like a plain semaphore.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limit: int,
+        reserve: int = 0,
+        weights: Optional[Mapping[str, float]] = None,
+        enabled: bool = True,
+    ):
+        self.name = name
+        self.limit = limit
+        self.reserve = max(0, min(reserve, limit - 1))  # Background work always keeps one slot
+        self.weights = dict(weights or {})
+        self.enabled = enabled
+        # Called with (priority, seconds waited) for every call that got a slot; set by main.py for metrics
+        self.observe: Optional[Callable[[str, float], None]] = None
+        self.in_flight = 0
+        self.running = {priority: 0 for priority in PRIORITIES}
+        self.queued = {priority: 0 for priority in PRIORITIES}
+        self.dropped = {priority: 0 for priority in PRIORITIES}
+        self.preempted = 0
+        self.service_time: Dict[str, Optional[float]] = {priority: None for priority in PRIORITIES}
+        self._queues: Dict[str, List[_Waiter]] = {priority: [] for priority in PRIORITIES}
+        self._virtual_time = {priority: 0.0 for priority in PRIORITIES}
+        self._finish_tags: Dict[str, Dict[str, float]] = {priority: {} for priority in PRIORITIES}
+        self._holders: Set[_Holder] = set()
+        self._seq = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(self.queued.values())
+
+    def _context(self) -> Tuple[str, str, Optional[float]]:
+        if not self.enabled:
+            return INTERACTIVE, "default", None
+        priority = priority_var.get()
+        return (priority if priority in PRIORITIES else INTERACTIVE), tenant_var.get(), deadline_var.get()
+
+    def _has_room(self, priority: str) -> bool:
+        return self.in_flight < (self.limit if priority == INTERACTIVE else self.limit - self.reserve)
+
+    def idle_for(self, priority: str) -> bool:
+        """Whether a call of the class would get a slot at once, with nothing else waiting for one."""
+        return not self.waiting and self._has_room(priority)
+
+    def _tag(self, priority: str, tenant: str) -> float:
+        finish_tags = self._finish_tags[priority]
+        start = max(self._virtual_time[priority], finish_tags.get(tenant, 0.0))
+        finish_tags[tenant] = start + 1.0 / self.weights.get(tenant, 1.0)
+        if len(finish_tags) > 1000:
+            # Sites idle long enough to be behind the virtual clock start from it anyway
+            virtual_time = self._virtual_time[priority]
+            for idle in [name for name, tag in finish_tags.items() if tag <= virtual_time]:
+                del finish_tags[idle]
+        return start
+
+    def _leave(self, waiter: _Waiter) -> None:
+        if waiter.queued:
+            waiter.queued = False
+            self.queued[waiter.priority] -= 1
+
+    def _head(self, priority: str) -> Optional[_Waiter]:
+        """First live waiter of a class; waiters that expired or gave up are discarded."""
+        queue = self._queues[priority]
+        while queue and queue[0].future.done():
+            heapq.heappop(queue)
+        return queue[0] if queue else None
+
+    def _drop(self, waiter: _Waiter) -> None:
+        self._leave(waiter)
+        self.dropped[waiter.priority] += 1
+        waiter.future.set_exception(DeadlineExceeded(self.name, waiter.priority, time.monotonic() - waiter.enqueued))
+
+    def _dispatch(self) -> None:
+        """Grant free slots to waiting calls, highest class first."""
+        while True:
+            priority = next((priority for priority in PRIORITIES if self._head(priority) is not None), None)
+            if priority is None or not self._has_room(priority):
+                # A higher class waiting for a slot holds back every lower one
+                return
+            waiter = heapq.heappop(self._queues[priority])
+            if waiter.deadline is not None:
+                remaining = waiter.deadline - time.monotonic()
+                if remaining <= 0 or (self.service_time[priority] or 0.0) > remaining:
+                    self._drop(waiter)
+                    continue
+            self._leave(waiter)
+            self._virtual_time[priority] = waiter.tag
+            self.in_flight += 1
+            self.running[priority] += 1
+            waiter.future.set_result(None)
+
+    def _preempt(self) -> None:
+        """Cancel the youngest background calls, one per interactive call waiting beyond the ones already going."""
+        if self._has_room(INTERACTIVE):
+            return
+        needed = self.queued[INTERACTIVE] - sum(holder.preempted for holder in self._holders)
+        candidates = sorted((holder for holder in self._holders if not holder.preempted),
+                            key=lambda holder: holder.started, reverse=True)
+        for holder in candidates[:max(0, needed)]:
+            holder.preempted = True
+            holder.task.cancel()
+
+    async def _acquire(self, priority: str, tenant: str, deadline: Optional[float], tag: Optional[float]) -> float:
+        """Wait for a slot; returns the call's fair-queuing tag, which a preempted call keeps when it requeues."""
+        loop = asyncio.get_running_loop()
+        if tag is None:
+            tag = self._tag(priority, tenant)
+        waiter = _Waiter(tag, next(self._seq), priority, tenant, deadline, loop.create_future())
+        heapq.heappush(self._queues[priority], waiter)
+        self.queued[priority] += 1
+        self._dispatch()
+        if not waiter.future.done() and priority == INTERACTIVE:
+            self._preempt()
+        expiry = None
+        if deadline is not None and not waiter.future.done():
+            expiry = loop.call_later(
+                max(0.0, deadline - time.monotonic()),
+                lambda: None if waiter.future.done() else self._drop(waiter)
+            )
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            self._leave(waiter)
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                # Granted a slot just as the caller went away
+                self._release(priority, None)
+            raise
+        finally:
+            if expiry is not None:
+                expiry.cancel()
+        if self.observe is not None:
+            self.observe(priority, time.monotonic() - waiter.enqueued)
+        return tag
+
+    def _release(self, priority: str, held: Optional[float]) -> None:
+        self.in_flight -= 1
+        self.running[priority] -= 1
+        if held is not None:
+            previous = self.service_time[priority]
+            self.service_time[priority] = held if previous is None else 0.8 * previous + 0.2 * held
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one upstream slot for the duration of the block. Calls made this way are never preempted."""
+        priority, tenant, deadline = self._context()
+        await self._acquire(priority, tenant, deadline, None)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(priority, time.monotonic() - started)
+
+    async def call(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run fn holding one upstream slot. A background call made this way is
+        cancelled when an interactive call needs its slot, and run again
+        from the front of the background queue once there is room. Use it
+        only for calls that are safe to repeat and have not returned any
+        output yet, such as non-streamed completions.
+        """
+        priority, tenant, deadline = self._context()
+        preemptible = self.enabled and priority == BACKGROUND
+        tag = None
+        while True:
+            tag = await self._acquire(priority, tenant, deadline, tag)
+            task = asyncio.ensure_future(fn())
+            holder = _Holder(task)
+            if preemptible:
+                self._holders.add(holder)
+            preempted = False
+            try:
+                return await task
+            except asyncio.CancelledError:
+                current = asyncio.current_task()
+                if not holder.preempted or (current is not None and current.cancelling()):
+                    raise
+                preempted = True
+                self.preempted += 1
+                logger.info("%s background call preempted after %.2fs, requeued",
+                            self.name, time.monotonic() - holder.started)
+            finally:
+                self._holders.discard(holder)
+                self._release(priority, None if preempted else time.monotonic() - holder.started)
+
+    def stats(self) -> dict:
+        """Snapshot of slot usage and queues."""
+        return {
+            "limit": self.limit,
+            "reserve": self.reserve,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "preempted": self.preempted,
+            "classes": {
+                priority: {
+                    "running": self.running[priority],
+                    "queued": self.queued[priority],
+                    "dropped": self.dropped[priority],
+                }
+                for priority in PRIORITIES
+            },
+        }
@@ -0,0 +1,260 @@
+"""
+Semantic cache for chat questions.
+Questions are embedded with a deterministic hashing vectorizer (stemmed
+words, word pairs and character trigrams), so "do these run small?" and
+"does the sizing run small" land close together without a model download.
+Each page context has its own index, a NumPy matrix of unit vectors searched
+with one matrix-vector product; a question whose nearest cached neighbour is
+at least `threshold` similar gets that neighbour's answer.
+"""
+
+import re
+import time
+import zlib
+import random
+import hashlib
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # The semantic cache is disabled without NumPy
+    np = None
+
+logger = logging.getLogger(__name__)
+
+WORD = re.compile(r"[a-z0-9]+")
+# Words that carry no meaning for matching shopper questions
+STOPWORDS = frozenset((
+    "a an the this these that those it its they them their is are was were be been do does did "
+    "i me my we our you your he she to of for in on at by with and or as so if can could would "
+    "should will shall may might any some please tell know there here what about just really"
+).split())
+# Negations, including the halves of contractions ("doesn't" -> "doesn", "t"), become one "not" term
+NEGATIONS = frozenset("not no never without t doesn don isn aren didn wasn weren won wouldn shouldn couldn".split())
+SUFFIXES = ("ing", "ed", "es", "ly", "s", "e")
+# Stems shoppers use interchangeably, mapped to one feature
+SYNONYMS = {
+    "deliver": "ship", "delivery": "ship", "arriv": "ship", "dispatch": "ship",
+    "refund": "return", "exchang": "return",
+    "fit": "siz", "sizing": "siz",
+    "cost": "price", "expensive": "price", "cheap": "price",
+}
+
+# Feature weights: words matter most, trigrams make "sizing" and "size" overlap
+WORD_WEIGHT = 1.0
+# "is it waterproof" and "is it not waterproof" share every other feature
+NEGATION_WEIGHT = 2.0
+PAIR_WEIGHT = 0.5
+TRIGRAM_WEIGHT = 0.3
+
+
+def stem(word: str) -> str:
+    """Strip one common English suffix, so "runs"/"running" and "size"/"sizing" share a stem."""
+    for suffix in SUFFIXES:
+        if len(word) > len(suffix) + 2 and word.endswith(suffix):
+            word = word[:-len(suffix)]
+            # "running" -> "runn" -> "run"
+            if suffix in ("ing", "ed") and word[-1] == word[-2] and word[-1] not in "aeiouls":
+                word = word[:-1]
+            return word
+    return word
+
+
+def question_terms(text: str) -> List[str]:
+    """Stemmed content words of a question, in order, with common synonyms and negations merged."""
+    terms = []
+    for word in WORD.findall(text.lower()):
+        if word in NEGATIONS:
+            if not terms or terms[-1] != "not":
+                terms.append("not")
+        elif word not in STOPWORDS:
+            term = stem(word)
+            terms.append(SYNONYMS.get(term, term))
+    return terms
+
+
+def available() -> bool:
+    return np is not None
+
+
+def make_scope(model: str, context: Optional[str]) -> str:
+    """Index a question belongs to: answers are only reused for the same model and page context."""
+    return hashlib.sha256(f"{model}\0{' '.join((context or '').split())}".encode("utf-8")).hexdigest()
+
+
+class HashingVectorizer:
+    """
+    Maps text to a unit vector of `dim` hashed features.
+
+    Features are hashed with CRC32, which unlike hash() is the same in every
+    process, and given a sign from another hash bit so collisions cancel out
+    on average instead of adding up.
+    """
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+
+    def _add(self, vector, feature: str, weight: float) -> None:
+        digest = zlib.crc32(feature.encode("utf-8"))
+        vector[digest % self.dim] += weight if digest & 0x80000000 else -weight
+
+    def embed(self, text: str):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        terms = question_terms(text)
+        for term in terms:
+            self._add(vector, f"w:{term}", NEGATION_WEIGHT if term == "not" else WORD_WEIGHT)
+            padded = f"<{term}>"
+            for i in range(len(padded) - 2):
+                self._add(vector, f"c:{padded[i:i + 3]}", TRIGRAM_WEIGHT)
+        for first, second in zip(terms, terms[1:]):
+            self._add(vector, f"p:{first} {second}", PAIR_WEIGHT)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+
+class ScopeIndex:
+    """Cached questions of one page context: unit vectors in a matrix that grows by doubling."""
+
+    def __init__(self, dim: int):
+        self.vectors = np.zeros((8, dim), dtype=np.float32)
+        self.expires = np.zeros(8, dtype=np.float64)
+        self.entries: List[Optional[Dict[str, Any]]] = [None] * 8
+        self.size = 0
+
+    def nearest(self, vector, now: float):
+        """Slot and similarity of the closest live entry, or (None, 0.0)."""
+        if not self.size:
+            return None, 0.0
+        similarities = self.vectors[:self.size] @ vector
+        similarities[self.expires[:self.size] <= now] = -1.0
+        slot = int(np.argmax(similarities))
+        if similarities[slot] < 0:
+            return None, 0.0
+        return slot, float(similarities[slot])
+
+    def free_slot(self, now: float, capacity: int) -> int:
+        """A slot for a new entry: an expired one, a new one, or the oldest when the index is full."""
+        if self.size:
+            expired = np.flatnonzero(self.expires[:self.size] <= now)
+            if expired.size:
+                return int(expired[0])
+        if self.size < capacity:
+            if self.size == len(self.entries):
+                grow = min(capacity, self.size * 2) - self.size
+                self.vectors = np.vstack([self.vectors, np.zeros((grow, self.vectors.shape[1]), dtype=np.float32)])
+                self.expires = np.concatenate([self.expires, np.zeros(grow)])
+                self.entries.extend([None] * grow)
+            self.size += 1
+            return self.size - 1
+        return int(np.argmin(self.expires[:self.size]))
+
+
+class SemanticCache:
+    """
+    Near-duplicate question cache, bounded by ttl, entries per scope and total entries.
+
+    Expired entries are skipped by lookups and their slots reused. Scopes are
+    kept in LRU order; when the slots in use pass max_entries the least
+    recently used scope is dropped whole. A share audit_rate of hits is kept
+    (question, matched question, similarity) for review, since a false hit
+    serves a plausible but wrong answer.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        ttl: float = 3600.0,
+        max_entries: int = 10000,
+        max_per_scope: int = 256,
+        dim: int = 1024,
+        max_question_chars: int = 300,
+        audit_rate: float = 0.01,
+        audit_size: int = 100
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_per_scope = max_per_scope
+        self.max_question_chars = max_question_chars
+        self.audit_rate = audit_rate
+        self.vectorizer = HashingVectorizer(dim)
+        self.scopes: "OrderedDict[str, ScopeIndex]" = OrderedDict()
+        self.entries = 0
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evictions = 0
+        self.audits: Deque[Dict[str, Any]] = deque(maxlen=audit_size)
+        self.audited = 0
+
+    def eligible(self, question: str) -> bool:
+        """Long messages are pasted text rather than questions, and unlikely to recur."""
+        return len(question) <= self.max_question_chars and bool(question_terms(question))
+
+    def embed(self, question: str):
+        return self.vectorizer.embed(question)
+
+    def lookup(self, scope: str, vector, question: str) -> Optional[Dict[str, Any]]:
+        """
+        Cached answer for the nearest question at or above the threshold, with its similarity.
+
+        The matched question is another visitor's, so it only goes to the audit sample.
+        """
+        index = self.scopes.get(scope)
+        slot, similarity = (None, 0.0) if index is None else index.nearest(vector, time.time())
+        if slot is None or similarity < self.threshold:
+            self.misses += 1
+            return None
+        self.scopes.move_to_end(scope)
+        self.hits += 1
+        entry = index.entries[slot]
+        if self.audit_rate > 0 and random.random() < self.audit_rate:
+            self.audited += 1
+            self.audits.append({
+                "question": question,
+                "matched_question": entry["question"],
+                "similarity": round(similarity, 4),
+                "time": time.time(),
+            })
+            logger.info("Semantic cache audit - Similarity: %.3f, Question: %r, Matched: %r",
+                        similarity, question, entry["question"])
+        return {**entry["data"], "similarity": round(similarity, 4)}
+
+    def store(self, scope: str, vector, question: str, data: Dict[str, Any]) -> None:
+        """Cache data as the answer to question; a near-identical cached question is replaced."""
+        now = time.time()
+        index = self.scopes.get(scope)
+        if index is None:
+            index = self.scopes[scope] = ScopeIndex(self.vectorizer.dim)
+        self.scopes.move_to_end(scope)
+
+        slot, similarity = index.nearest(vector, now)
+        if slot is None or similarity < 0.999:
+            size = index.size
+            slot = index.free_slot(now, self.max_per_scope)
+            self.entries += index.size - size
+        index.vectors[slot] = vector
+        index.expires[slot] = now + self.ttl
+        index.entries[slot] = {"question": question, "data": data}
+        self.stored += 1
+
+        while self.entries > self.max_entries and len(self.scopes) > 1:
+            _, dropped = self.scopes.popitem(last=False)
+            self.entries -= dropped.size
+            self.evictions += dropped.size
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "scopes": len(self.scopes),
+            "entries": self.entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stored": self.stored,
+            "evictions": self.evictions,
+            "audited": self.audited,
+            "threshold": self.threshold,
+        }
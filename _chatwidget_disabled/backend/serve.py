@@ -0,0 +1,82 @@
+"""
+Production entry point for the widget backend.
+Runs several uvicorn worker processes on one port, using uvloop and httptools
+when they are installed. With more than one worker, state is shared through
+files under --state-dir: the response cache, sessions and per-client rate
+limit buckets in SQLite, and metrics as per-worker snapshots merged by
+/metrics. Audio and page stores are already on disk. Upstream admission
+budgets are split between the workers.
+
+On SIGTERM or SIGINT the server stops accepting connections, and each worker
+waits up to --graceful-timeout seconds for in-flight requests, including
+audio streams, before shutting down.
+
+Usage:
+    python serve.py --workers 4 --port 8000
+    WEB_CONCURRENCY=4 PORT=8000 python serve.py
+"""
+
+import argparse
+import os
+import shutil
+
+import uvicorn
+from dotenv import load_dotenv
+
+from upstream import env_float, env_int
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def share_state(state_dir: str, workers: int) -> None:
+    """Point the workers at shared stores, unless the environment already names them."""
+    os.environ["WIDGET_WORKERS"] = str(workers)
+    if workers <= 1:
+        return
+    os.makedirs(state_dir, exist_ok=True)
+    os.environ.setdefault("RESPONSE_CACHE_SQLITE_PATH", os.path.join(state_dir, "response_cache.sqlite3"))
+    os.environ.setdefault("SESSION_SQLITE_PATH", os.path.join(state_dir, "sessions.sqlite3"))
+    os.environ.setdefault("ADMISSION_SQLITE_PATH", os.path.join(state_dir, "admission.sqlite3"))
+    metrics_dir = os.environ.setdefault("METRICS_DIR", os.path.join(state_dir, "metrics"))
+    # Snapshots of a previous run's workers would be counted as this run's
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def main() -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=env_int("PORT", 8000))
+    parser.add_argument("--workers", type=int, default=env_int("WEB_CONCURRENCY", os.cpu_count() or 1))
+    parser.add_argument("--state-dir", default=os.getenv("WIDGET_STATE_DIR", os.path.join(BACKEND_DIR, "state")),
+                        help="directory for state shared between workers")
+    parser.add_argument("--graceful-timeout", type=float, default=env_float("SHUTDOWN_GRACE_SECONDS", 30.0),
+                        help="seconds in-flight requests get to finish on shutdown")
+    parser.add_argument("--keep-alive", type=int, default=env_int("KEEP_ALIVE_TIMEOUT", 5),
+                        help="seconds an idle keep-alive connection stays open")
+    parser.add_argument("--proxy-headers", action="store_true",
+                        help="trust X-Forwarded-* from --forwarded-allow-ips (behind a proxy)")
+    parser.add_argument("--forwarded-allow-ips", default=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"))
+    args = parser.parse_args()
+
+    workers = max(1, args.workers)
+    share_state(args.state_dir, workers)
+    uvicorn.run(
+        "main:app",
+        app_dir=BACKEND_DIR,
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        loop="auto",  # uvloop when installed
+        http="auto",  # httptools when installed
+        timeout_graceful_shutdown=args.graceful_timeout,
+        timeout_keep_alive=args.keep_alive,
+        proxy_headers=args.proxy_headers,
+        forwarded_allow_ips=args.forwarded_allow_ips,
+        access_log=False,  # main.py logs every request itself
+    )
+
+
+if __name__ == "__main__":
+    main()
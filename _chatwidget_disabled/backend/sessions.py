@@ -0,0 +1,253 @@
+"""
+Conversation sessions.
+Chat history is kept server-side under a session id, so the widget sends only
+the new message each turn. Old turns are folded into a rolling summary, and
+prompts are laid out stable-first (page context, then the summary, then the
+recent turns in order) so that consecutive turns share a long prompt prefix
+the upstream can serve from its prompt cache.
+"""
+
+import json
+import time
+import secrets
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def make_session_id() -> str:
+    """Unguessable session id; knowing it is what grants access to the conversation."""
+    return secrets.token_urlsafe(16)
+
+
+class SQLiteSessionStore:
+    """Session persistence in a local SQLite file, shared by workers on one host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def get(self, session_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row[0]
+
+    def set(self, session_id: str, value: str, expires_at: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, value, expires_at) VALUES (?, ?, ?)",
+                (session_id, value, expires_at),
+            )
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),))
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SessionStore:
+    """
+    Sessions in an in-process LRU bounded by count, expiring after ttl idle seconds.
+
+    With a SQLite store every read goes to the store, so workers sharing the
+    file always see each other's latest turns; the LRU then only saves
+    decoding. Without one, sessions evicted from the LRU are gone.
+    """
+
+    PURGE_INTERVAL = 500  # Writes between sweeps of expired rows in the store
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 86400.0, store: Optional[SQLiteSessionStore] = None):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.store = store
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._writes = 0
+        self.created = 0
+        self.evictions = 0
+
+    async def create(self, context: str, page_id: Optional[str] = None) -> Dict[str, Any]:
+        """Start a session whose prompts open with context."""
+        now = time.time()
+        session = {
+            "session_id": make_session_id(),
+            "page_id": page_id,
+            "context": context,
+            "summary": "",
+            "summarized_turns": 0,
+            "turns": [],
+            "created_at": now,
+            "updated_at": now,
+        }
+        self.created += 1
+        await self.save(session)
+        return session
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Session by id, or None if it is unknown or has expired."""
+        if self.store is not None:
+            try:
+                raw = await asyncio.to_thread(self.store.get, session_id)
+            except sqlite3.Error as e:
+                logger.warning("Session store read failed: %s", str(e))
+                raw = None
+            if raw is None:
+                self._sessions.pop(session_id, None)
+                return None
+            session = json.loads(raw)
+            self._insert(session)
+            return session
+
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if session["updated_at"] + self.ttl < time.time():
+            del self._sessions[session_id]
+            return None
+        self._sessions.move_to_end(session_id)
+        return session
+
+    async def save(self, session: Dict[str, Any]) -> None:
+        """Store session, refreshing its expiry."""
+        session["updated_at"] = time.time()
+        self._insert(session)
+        if self.store is not None:
+            self._writes += 1
+            try:
+                await asyncio.to_thread(
+                    self.store.set, session["session_id"], json.dumps(session, ensure_ascii=False),
+                    session["updated_at"] + self.ttl
+                )
+                if self._writes % self.PURGE_INTERVAL == 0:
+                    await asyncio.to_thread(self.store.purge_expired)
+            except sqlite3.Error as e:
+                logger.warning("Session store write failed: %s", str(e))
+
+    async def delete(self, session_id: str) -> bool:
+        """Forget a session; returns whether it existed."""
+        existed = await self.get(session_id) is not None
+        self._sessions.pop(session_id, None)
+        if self.store is not None:
+            try:
+                await asyncio.to_thread(self.store.delete, session_id)
+            except sqlite3.Error as e:
+                logger.warning("Session store delete failed: %s", str(e))
+        return existed
+
+    def _insert(self, session: Dict[str, Any]) -> None:
+        self._sessions[session["session_id"]] = session
+        self._sessions.move_to_end(session["session_id"])
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "created": self.created,
+            "evictions": self.evictions,
+            "max_sessions": self.max_sessions,
+            "store": self.store.path if self.store else None,
+        }
+
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.close()
+
+
+def history_tokens(session: Dict[str, Any]) -> int:
+    return sum(turn["tokens"] for turn in session["turns"])
+
+
+def build_session_messages(
+    session: Dict[str, Any],
+    message: str,
+    history_budget: int
+) -> Tuple[List[Dict[str, str]], int]:
+    """
+    Prompt for the next turn of a session, and the number of past turns in it.
+
+    The page context and summary come first and change only when the
+    session is compacted, and turns are appended in order, so each prompt
+    extends the previous one. Normally every stored turn fits the history
+    budget; if compaction has fallen behind, the oldest turns are left out.
+    """
+    messages = []
+    if session["context"]:
+        messages.append({"role": "system", "content": f"Context: {session['context']}"})
+    if session["summary"]:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation: {session['summary']}"})
+
+    turns = session["turns"]
+    start = len(turns)
+    used = 0
+    while start > 0 and used + turns[start - 1]["tokens"] <= history_budget:
+        start -= 1
+        used += turns[start]["tokens"]
+    # Never open the history with an assistant reply to a question that was left out
+    if start < len(turns) and turns[start]["role"] == "assistant":
+        start += 1
+
+    messages.extend({"role": turn["role"], "content": turn["content"]} for turn in turns[start:])
+    messages.append({"role": "user", "content": message})
+    return messages, len(turns) - start
+
+
+def add_turn(session: Dict[str, Any], message: str, reply: str, count: Callable[[str], int], max_turns: int) -> None:
+    """Append a user message and the assistant's reply, with their token counts."""
+    session["turns"].append({"role": "user", "content": message, "tokens": count(message)})
+    session["turns"].append({"role": "assistant", "content": reply, "tokens": count(reply)})
+    # Turns beyond max_turns are already outside every prompt; drop them if compaction keeps failing
+    overflow = len(session["turns"]) - max_turns
+    if overflow > 0:
+        overflow += overflow % 2
+        del session["turns"][:overflow]
+        session["summarized_turns"] += overflow
+
+
+def turns_to_compact(session: Dict[str, Any], history_budget: int) -> int:
+    """
+    Number of oldest turns to fold into the summary, 0 while the history fits.
+
+    Compaction leaves at most half the budget in turns, so it happens once
+    every few turns rather than every turn, keeping the prompt prefix stable
+    in between. Only whole exchanges are folded.
+    """
+    total = history_tokens(session)
+    if total <= history_budget:
+        return 0
+    count = 0
+    for turn in session["turns"]:
+        if total <= history_budget // 2:
+            break
+        total -= turn["tokens"]
+        count += 1
+    return count + count % 2
+
+
+def format_turns(turns: List[Dict[str, Any]]) -> str:
+    """Turns as a plain transcript, for summarization."""
+    return "\n".join(f"{'User' if turn['role'] == 'user' else 'Assistant'}: {turn['content']}" for turn in turns)
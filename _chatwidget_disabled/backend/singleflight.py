@@ -0,0 +1,199 @@
+"""
+Single-flight request coalescing.
+Concurrent callers asking for the same key share one upstream call; streamed
+results are fanned out to every subscriber as chunks arrive.
+"""
+
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _consume_exception(task: asyncio.Task) -> None:
+    """Mark a failed task's exception as retrieved when every waiter has gone away."""
+    if not task.cancelled():
+        task.exception()
+
+
+class SingleFlight:
+    """Shares one in-flight call between concurrent callers with the same key."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.leaders = 0
+        self.coalesced = 0
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run fn once per key at a time and return its result to every caller.
+
+        The call runs as its own task, so a caller disconnecting does not
+        cancel the work the other callers are waiting on.
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            task.add_done_callback(_consume_exception)
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
+
+    def in_flight(self, key: str) -> bool:
+        """Whether a call for key is running, so a caller would join it instead of starting one."""
+        return key in self._calls
+
+    def stats(self) -> Dict[str, int]:
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+class SharedStream:
+    """
+    Relays one upstream stream to any number of subscribers.
+
+    The upstream is read only while the slowest subscriber is within max_lag
+    chunks of the head, so a slow client applies backpressure instead of the
+    relay buffering without bound. Chunks are kept for late joiners until the
+    retained bytes exceed max_replay_bytes; after that the stream stops
+    accepting new subscribers and drops chunks every subscriber has sent.
+    When the last subscriber leaves early, the upstream is cancelled.
+    """
+
+    def __init__(self, source: AsyncIterator[Any], max_lag: int = 32, max_replay_bytes: int = 8 * 1024 * 1024):
+        self.max_lag = max_lag
+        self.max_replay_bytes = max_replay_bytes
+        self.done = False
+        self.joinable = True
+        self.error: Optional[BaseException] = None
+        self._chunks: List[Any] = []
+        self._base = 0  # Stream index of self._chunks[0]
+        self._bytes = 0
+        self._positions: Dict[int, int] = {}  # subscriber id -> next stream index to send
+        self._next_subscriber = 0
+        self._changed = asyncio.Condition()
+        self._task = asyncio.ensure_future(self._pump(source))
+
+    @property
+    def head(self) -> int:
+        return self._base + len(self._chunks)
+
+    def _has_room(self) -> bool:
+        return not self._positions or self.head - min(self._positions.values()) < self.max_lag
+
+    async def _pump(self, source: AsyncIterator[Any]) -> None:
+        try:
+            async for chunk in source:
+                async with self._changed:
+                    await self._changed.wait_for(self._has_room)
+                    self._chunks.append(chunk)
+                    self._bytes += len(chunk)
+                    if self._bytes > self.max_replay_bytes:
+                        self.joinable = False
+                        self._release_sent()
+                    self._changed.notify_all()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+        except Exception as e:
+            self.error = e
+        finally:
+            await source.aclose()
+            async with self._changed:
+                self.done = True
+                self._changed.notify_all()
+
+    def _release_sent(self) -> None:
+        """Drop chunks that every subscriber has already sent."""
+        if not self._positions:
+            return
+        sent = min(self._positions.values()) - self._base
+        if sent > 0:
+            self._bytes -= sum(len(chunk) for chunk in self._chunks[:sent])
+            del self._chunks[:sent]
+            self._base += sent
+
+    async def _notify(self) -> None:
+        async with self._changed:
+            self._changed.notify_all()
+
+    def subscribe(self) -> AsyncIterator[Any]:
+        """Register a subscriber and return an iterator over the stream from its start."""
+        subscriber = self._next_subscriber
+        self._next_subscriber += 1
+        self._positions[subscriber] = self._base
+        return self._iterate(subscriber)
+
+    async def _iterate(self, subscriber: int) -> AsyncIterator[Any]:
+        try:
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(lambda: self._positions[subscriber] < self.head or self.done)
+                    pending = self._chunks[self._positions[subscriber] - self._base:]
+                    finished = self.done
+                for chunk in pending:
+                    yield chunk
+                async with self._changed:
+                    self._positions[subscriber] += len(pending)
+                    self._changed.notify_all()
+                if finished and self._positions[subscriber] >= self.head:
+                    if self.error is not None:
+                        raise self.error
+                    return
+        finally:
+            self._positions.pop(subscriber, None)
+            if not self.done:
+                if not self._positions:
+                    # Last listener is gone: stop reading from the upstream
+                    self._task.cancel()
+                else:
+                    # Wake the pump in case this was the slowest subscriber
+                    asyncio.ensure_future(self._notify())
+
+    def stats(self) -> Dict[str, int]:
+        return {"subscribers": len(self._positions), "buffered_chunks": len(self._chunks), "buffered_bytes": self._bytes}
+
+
+class StreamFlight:
+    """Shares one in-flight upstream stream between concurrent callers with the same key."""
+
+    def __init__(self, name: str, max_lag: int = 32, max_replay_bytes: int = 8 * 1024 * 1024):
+        self.name = name
+        self.max_lag = max_lag
+        self.max_replay_bytes = max_replay_bytes
+        self.leaders = 0
+        self.coalesced = 0
+        self._streams: Dict[str, SharedStream] = {}
+
+    def stream(self, key: str, open_source: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Subscribe to the stream for key, starting it if nobody else has."""
+        shared = self._streams.get(key)
+        if shared is not None and shared.joinable and not shared.done:
+            self.coalesced += 1
+        else:
+            self.leaders += 1
+            shared = SharedStream(open_source(), self.max_lag, self.max_replay_bytes)
+            self._streams[key] = shared
+            shared._task.add_done_callback(lambda _: self._release(key, shared))
+        return shared.subscribe()
+
+    def in_flight(self, key: str) -> bool:
+        """Whether a stream for key can still be joined, so a caller would subscribe instead of starting one."""
+        shared = self._streams.get(key)
+        return shared is not None and shared.joinable and not shared.done
+
+    def _release(self, key: str, shared: SharedStream) -> None:
+        if self._streams.get(key) is shared:
+            del self._streams[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._streams),
+            "subscribers": sum(len(shared._positions) for shared in self._streams.values()),
+            "buffered_bytes": sum(shared._bytes for shared in self._streams.values()),
+        }
@@ -0,0 +1,117 @@
+"""
+Pipelined summary-to-speech.
+Cuts a streaming completion into bullet or sentence segments and starts TTS
+for each segment as soon as it is complete, yielding the audio in order.
+"""
+
+import re
+import asyncio
+import logging
+from typing import AsyncIterator, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_END = re.compile(r"[.!?][\"')\]]?\s")
+
+# Segments shorter than this are merged with the next one so TTS has enough context
+MIN_SEGMENT_CHARS = 40
+# Without a bullet break, cut at the last sentence end once a segment grows this long
+MAX_SEGMENT_CHARS = 300
+
+
+def find_boundary(buffer: str) -> Optional[int]:
+    """Index just past the first usable segment boundary in buffer, or None."""
+    newline = buffer.find("\n", MIN_SEGMENT_CHARS)
+    if newline != -1:
+        return newline + 1
+    if len(buffer) >= MAX_SEGMENT_CHARS:
+        ends = list(SENTENCE_END.finditer(buffer, MIN_SEGMENT_CHARS))
+        if ends:
+            return ends[-1].end()
+    return None
+
+
+async def split_segments(deltas: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Group streamed text deltas into bullet- or sentence-sized segments."""
+    buffer = ""
+    async for delta in deltas:
+        buffer += delta
+        cut = find_boundary(buffer)
+        while cut is not None:
+            segment, buffer = buffer[:cut].strip(), buffer[cut:]
+            if segment:
+                yield segment
+            cut = find_boundary(buffer)
+    if buffer.strip():
+        yield buffer.strip()
+
+
+async def pipelined_speech(
+    segments: AsyncIterator[str],
+    synthesize: Callable[[str, str], AsyncIterator[bytes]],
+    max_parallel: int = 2,
+    max_buffered_chunks: int = 64,
+) -> AsyncIterator[bytes]:
+    """
+    Run TTS on each segment as soon as it arrives and yield the audio in segment order.
+
+    synthesize(segment, previous_text) streams the audio for one segment;
+    previous_text lets the TTS engine keep prosody consistent across cuts.
+    At most max_parallel segments, the one being sent included, hold a slot:
+    a segment keeps its slot until its last chunk has been sent, and each
+    buffers at most max_buffered_chunks, so a slow client holds back the TTS
+    calls instead of their audio piling up in memory.
+    """
+    order: asyncio.Queue = asyncio.Queue()
+    parallel = asyncio.Semaphore(max_parallel)
+    tasks = []
+
+    async def fill(segment: str, previous_text: str, output: asyncio.Queue) -> None:
+        # Released by the consumer once it has sent this segment
+        await parallel.acquire()
+        audio = synthesize(segment, previous_text)
+        try:
+            async for chunk in audio:
+                await output.put(chunk)
+            await output.put(None)
+        except Exception as e:
+            await output.put(e)
+        finally:
+            # Also when cancelled part-way, so the TTS request is closed at once
+            aclose = getattr(audio, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    async def schedule() -> None:
+        spoken = []
+        try:
+            async for segment in segments:
+                output: asyncio.Queue = asyncio.Queue(max_buffered_chunks)
+                tasks.append(asyncio.ensure_future(fill(segment, " ".join(spoken), output)))
+                order.put_nowait(output)
+                spoken.append(segment)
+            order.put_nowait(None)
+        except Exception as e:
+            order.put_nowait(e)
+
+    scheduler = asyncio.ensure_future(schedule())
+    try:
+        while True:
+            output = await order.get()
+            if output is None:
+                break
+            if isinstance(output, Exception):
+                raise output
+            while True:
+                chunk = await output.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+            parallel.release()
+    finally:
+        scheduler.cancel()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(scheduler, *tasks, return_exceptions=True)
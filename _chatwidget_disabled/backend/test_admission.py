@@ -0,0 +1,178 @@
+import asyncio
+
+import pytest
+
+import admission
+from admission import AdaptiveBucket, AdmissionController, TokenBucket
+
+
+class FakeClock:
+    """
+    Stands in for time.monotonic and asyncio.sleep, so simulated seconds pass
+    instantly. Sleeps advance the clock unless `frozen`, for callers that
+    sleep concurrently; they are recorded either way.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.frozen = False
+        self.sleeps = []
+        self._sleep = asyncio.sleep
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        if not self.frozen:
+            self.now += max(seconds, 0.0)
+        await self._sleep(0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(admission.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(admission.asyncio, "sleep", clock.sleep)
+    return clock
+
+
+class LimitedUpstream:
+    """Fake upstream that accepts `limit` calls per second and answers the rest with 429."""
+
+    def __init__(self, limit):
+        self.bucket = TokenBucket(limit, 1.0)
+        self.accepted = []
+        self.rejected = []
+
+    def call(self, now):
+        if self.bucket.reserve(0.0) is None:
+            self.rejected.append(now)
+            return 429, {"retry-after-ms": str(self.bucket.wait_time() * 1000)}
+        self.accepted.append(now)
+        return 200, {}
+
+
+def controller(rate=1.0, burst=2.0, max_wait=2.0, **settings):
+    return AdmissionController(
+        client_rate=0, client_burst=0, upstream_rate=rate, upstream_burst=burst,
+        upstream_min_rate=0.5, upstream_max_rate=settings.pop("max_rate", 100.0), max_wait=max_wait, **settings
+    )
+
+
+def test_token_bucket_admits_burst_then_paces_at_rate(clock):
+    bucket = TokenBucket(rate=10.0, burst=2.0)
+
+    assert bucket.reserve(1.0) == 0.0
+    assert bucket.reserve(1.0) == 0.0
+    assert bucket.reserve(1.0) == pytest.approx(0.1)
+    assert bucket.reserve(0.15) is None  # The next token is 0.2s away
+    clock.now += 0.2
+    assert bucket.reserve(0.0) == 0.0
+
+
+def test_rate_converges_to_the_upstream_limit(clock):
+    limit = 20.0
+    upstream = LimitedUpstream(limit)
+    admissions = controller(rate=1.0)
+    start = clock.now
+
+    async def drive():
+        while clock.now - start < 60:
+            if await admissions.admit_upstream("model") is None:
+                status, headers = upstream.call(clock.now)
+                admissions.observe_upstream("model", status, headers)
+
+    asyncio.run(drive())
+    bucket = admissions.upstream("model")
+
+    # Slow start reaches the limit within a few seconds, then the first 429 ends it
+    assert not bucket.slow_start
+    assert upstream.rejected[0] - start < 6
+    # Afterwards AIMD holds the accepted rate near the limit with few 429s
+    settled = [at for at in upstream.accepted if at - start >= 30]
+    settled_rejected = [at for at in upstream.rejected if at - start >= 30]
+    assert 0.7 * limit <= len(settled) / 30 <= limit
+    assert len(settled_rejected) <= 0.1 * len(settled)
+    assert 0.4 * limit <= bucket.rate <= 1.5 * limit
+
+
+def test_429_halves_the_rate_once_per_burst_and_pauses_for_retry_after(clock):
+    admissions = controller(rate=10.0)
+    bucket = admissions.upstream("model")
+    bucket.slow_start = False
+
+    admissions.observe_upstream("model", 429, {"retry-after": "3"})
+    admissions.observe_upstream("model", 429, {"retry-after": "3"})  # Same burst of in-flight calls
+    assert bucket.rate == pytest.approx(5.0)
+    assert bucket.rate_limited == 2
+
+    clock.now += 1.5
+    admissions.observe_upstream("model", 429, {})
+    assert bucket.rate == pytest.approx(2.5)
+
+
+def test_success_grows_rate_additively_after_slow_start(clock):
+    bucket = AdaptiveBucket(rate=4.0, burst=1.0, min_rate=0.5, max_rate=5.0, increase=1.0, decrease=0.5)
+
+    bucket.on_success()
+    assert bucket.rate == 5.0  # Slow start: one call/s more per success, up to max_rate
+    bucket.rate, bucket.slow_start = 4.0, False
+    bucket.on_success()
+    assert bucket.rate == pytest.approx(4.25)
+
+
+def test_reported_limits_cap_the_rate_and_pause_when_exhausted(clock):
+    admissions = controller(rate=10.0, max_rate=50.0)
+    bucket = admissions.upstream("model")
+
+    admissions.observe_upstream("model", 200, {
+        "x-ratelimit-limit-requests": "300",
+        "x-ratelimit-remaining-requests": "0",
+        "x-ratelimit-reset-requests": "1s500ms",
+    })
+
+    assert bucket.max_rate == pytest.approx(5.0)
+    assert bucket.rate == pytest.approx(5.0)
+    assert bucket.wait_time() == pytest.approx(1.5)
+
+
+def test_excess_load_is_shed_at_once_with_a_retry_estimate(clock):
+    admissions = controller(rate=2.0, burst=1.0, max_wait=1.0)
+
+    async def offer(count):
+        return await asyncio.gather(*(admissions.admit_upstream("model") for _ in range(count)))
+
+    clock.frozen = True
+    results = asyncio.run(offer(4))
+    # Queued calls wait their turn 0.5s apart; the fourth would wait longer than max_wait and is turned away
+    assert results[:3] == [None, None, None]
+    assert results[3] == pytest.approx(1.5)
+    assert clock.sleeps == [pytest.approx(0.5), pytest.approx(1.0)]
+    assert (admissions.waited, admissions.rejected_upstream) == (2, 1)
+
+
+def test_retry_after_from_the_upstream_sheds_until_it_passes(clock):
+    admissions = controller(rate=10.0, max_wait=2.0)
+    admissions.observe_upstream("model", 429, {"retry-after": "5"})
+
+    retry_after = asyncio.run(admissions.admit_upstream("model"))
+
+    assert retry_after == pytest.approx(5.0)
+    clock.now += 5
+    assert asyncio.run(admissions.admit_upstream("model")) is None
+
+
+def test_background_calls_leave_spare_tokens_for_interactive_ones(clock):
+    admissions = controller(rate=1.0, burst=3.0, max_wait=0.5)
+
+    async def scenario():
+        background = await admissions.admit_upstream("model", spare=2.0)
+        held_back = await admissions.admit_upstream("model", spare=2.0)
+        interactive = [await admissions.admit_upstream("model", max_wait=0.0) for _ in range(2)]
+        return background, held_back, interactive
+
+    background, held_back, interactive = asyncio.run(scenario())
+    assert background is None
+    assert held_back == pytest.approx(1.0)
+    assert interactive == [None, None]
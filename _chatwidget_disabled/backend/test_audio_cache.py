@@ -0,0 +1,74 @@
+import asyncio
+
+from starlette.requests import Request
+
+from audio_cache import AudioCache, cached_audio_response, make_audio_id
+
+
+def make_request(headers):
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+    }
+    return Request(scope)
+
+
+def store(cache, text, data, request_key=None):
+    audio_id = make_audio_id(text, "voice", "model", "mp3_44100_128")
+    asyncio.run(cache.store(audio_id, data, request_key))
+    return audio_id
+
+
+def test_store_links_and_looks_up(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=10_000)
+    audio_id = store(cache, "summary", b"x" * 100, "request-key")
+
+    assert cache.resolve_link("request-key") == audio_id
+    assert cache.lookup(audio_id).st_size == 100
+    assert cache.lookup(make_audio_id("other", "voice", "model", "mp3_44100_128")) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_request_links_are_not_audio_ids(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=10_000)
+    store(cache, "summary", b"x" * 100, "a" * 64)
+
+    assert cache.path_for("a" * 64 + ".link") is None
+    assert cache.lookup("a" * 64 + ".link") is None
+    assert cache.path_for(make_audio_id("summary", "voice", "model", "pcm_24000")).endswith(".pcm24000")
+
+
+def test_least_recently_used_files_are_evicted(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=2_500)
+    first = store(cache, "first", b"1" * 1000)
+    second = store(cache, "second", b"2" * 1000)
+    cache.lookup(first)
+    store(cache, "third", b"3" * 1000)
+
+    assert cache.evictions >= 1
+    assert cache.stats()["bytes"] <= 2_500
+    assert cache.lookup(second) is None
+    assert cache.lookup(first) is not None
+
+
+def test_range_and_conditional_responses(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=10_000)
+    audio_id = store(cache, "summary", bytes(range(100)))
+    path, stat_result = cache.path_for(audio_id), cache.lookup(audio_id)
+
+    def respond(headers):
+        return asyncio.run(cached_audio_response(make_request(headers), path, stat_result, audio_id, "audio/mpeg"))
+
+    partial = respond({"Range": "bytes=10-19"})
+    assert partial.status_code == 206
+    assert partial.body == bytes(range(10, 20))
+    assert partial.headers["content-range"] == "bytes 10-19/100"
+
+    assert respond({"Range": "bytes=-5"}).body == bytes(range(95, 100))
+    assert respond({"Range": "bytes=200-"}).status_code == 416
+
+    etag = partial.headers["etag"]
+    assert respond({"If-None-Match": etag}).status_code == 304
+    assert respond({}).status_code == 200
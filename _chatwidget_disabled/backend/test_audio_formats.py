@@ -0,0 +1,38 @@
+from audio_cache import format_type, make_audio_id
+from audio_formats import codecs_from_accept, negotiate_format, network_tier
+
+
+def test_explicit_format_wins():
+    assert negotiate_format("mp3_44100_192", ["opus"], {}, "2g", "mp3_44100_128") == "mp3_44100_192"
+
+
+def test_codec_list_and_accept_header_pick_the_tier_rung():
+    assert negotiate_format(None, ["opus", "mp3"], {}, "3g", "mp3_44100_128") == "opus_48000_32"
+    headers = {"accept": "audio/mpeg;q=0.5, audio/ogg", "save-data": "on"}
+    assert codecs_from_accept(headers["accept"]) == ["opus", "mp3"]
+    assert negotiate_format(None, None, headers, None, "mp3_44100_128") == "opus_48000_32"
+
+
+def test_without_a_tier_the_default_codec_keeps_the_default_format():
+    assert network_tier(None, {}) is None
+    assert negotiate_format(None, ["mp3"], {}, None, "mp3_44100_128") == "mp3_44100_128"
+
+
+def test_disallowed_rungs_are_skipped():
+    allowed = {"mp3_44100_128", "mp3_22050_32"}
+    assert negotiate_format(None, ["opus", "mp3"], {}, "2g", "mp3_44100_128", allowed) == "mp3_22050_32"
+
+
+def test_fallback_is_filtered_through_allowed():
+    assert negotiate_format(None, [], {"ect": "2g"}, None, "mp3_44100_128") == "mp3_22050_32"
+    allowed = {"mp3_44100_128"}
+    assert negotiate_format(None, [], {"ect": "2g"}, None, "mp3_44100_128", allowed) == "mp3_44100_128"
+    assert negotiate_format(None, ["opus"], {}, "4g", "mp3_44100_128", allowed) == "mp3_44100_128"
+
+
+def test_pcm_media_type_names_the_sample_rate():
+    assert format_type("pcm_24000") == ("pcm24000", "audio/L16;rate=24000;channels=1")
+    audio_id = make_audio_id("Summary", "voice", "model", "pcm_16000")
+    assert audio_id.endswith(".pcm16000")
+    assert format_type(audio_id.rsplit(".", 1)[-1])[1] == "audio/L16;rate=16000;channels=1"
+    assert format_type("mp3_44100_128") == ("mp3", "audio/mpeg")
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+
+import budget
+from budget import count_tokens, fit_prompt, trim_to_budget
+
+
+def build_messages(text):
+    return [{"role": "system", "content": "Summarize."}, {"role": "user", "content": text}]
+
+
+def test_text_within_budget_is_unchanged():
+    text = "Hi there\nCart total is wrong after I add a coupon\n    indented code\nThanks!\nThanks!"
+    assert trim_to_budget(text, 1000, "gpt-3.5-turbo") == text
+
+    messages, usage = fit_prompt("chat", "gpt-3.5-turbo", build_messages, text, budget=1000)
+    assert messages[1]["content"] == text
+    assert usage["prompt_tokens_before_trim"] == usage["prompt_tokens_after_trim"]
+
+
+def test_text_over_budget_drops_boilerplate_and_duplicates_first():
+    body = " ".join(f"Sentence number {index} about the product." for index in range(200))
+    text = f"Home\nSign in\n# Running shoe\n{body}\n{body}\nAll rights reserved ©2024"
+    trimmed = trim_to_budget(text, 100, "gpt-3.5-turbo")
+
+    assert count_tokens(trimmed, "gpt-3.5-turbo") <= 100
+    lines = trimmed.splitlines()
+    assert lines[0] == "# Running shoe"
+    assert "Home" not in lines and "Sign in" not in lines
+    assert lines[1].startswith("Sentence number 0 about the product.")
+
+
+def test_fit_prompt_reports_trimming():
+    text = "Word " * 5000
+    messages, usage = fit_prompt("summarize", "gpt-3.5-turbo", build_messages, text, budget=200)
+
+    assert usage["prompt_budget"] == 200
+    assert usage["prompt_tokens_after_trim"] <= 200 < usage["prompt_tokens_before_trim"]
+    assert messages[1]["content"].startswith("Word Word")
+
+
+class FakeTiktoken:
+    """Stands in for tiktoken: encodings fail to load until available is set."""
+
+    def __init__(self):
+        self.available = False
+        self.loads = []
+
+    def encoding_for_model(self, model):
+        self.loads.append(threading.current_thread())
+        if not self.available:
+            raise OSError("encoding download failed")
+        return FakeEncoding()
+
+    def get_encoding(self, name):
+        raise AssertionError("not reached")
+
+
+class FakeEncoding:
+    def encode_ordinary(self, text):
+        return text.split()
+
+
+def fake_tiktoken(monkeypatch):
+    fake = FakeTiktoken()
+    monkeypatch.setattr(budget, "tiktoken", fake)
+    monkeypatch.setattr(budget, "_encoders", {})
+    monkeypatch.setattr(budget, "_encoder_failures", {})
+    return fake
+
+
+def test_failed_tokenizer_load_is_retried(monkeypatch):
+    fake = fake_tiktoken(monkeypatch)
+    assert budget.get_encoder("gpt-test") is None
+    fake.available = True
+    assert budget.get_encoder("gpt-test") is None  # Within the retry interval
+
+    monkeypatch.setattr(budget, "ENCODER_RETRY_SECONDS", 0.0)
+    assert isinstance(budget.get_encoder("gpt-test"), FakeEncoding)
+    assert count_tokens("three word text", "gpt-test") == 3
+
+
+def test_tokenizer_loads_off_the_event_loop(monkeypatch):
+    fake = fake_tiktoken(monkeypatch)
+    fake.available = True
+
+    async def scenario():
+        text = "three word text"
+        estimated = count_tokens(text, "gpt-test")
+        await asyncio.gather(*budget._encoder_loads.values())
+        return estimated, count_tokens(text, "gpt-test")
+
+    estimated, counted = asyncio.run(scenario())
+    assert estimated == budget.estimate_tokens("three word text")
+    assert counted == 3
+    assert fake.loads and threading.main_thread() not in fake.loads
+
+
+def test_text_is_dropped_when_the_rest_of_the_prompt_fills_the_budget():
+    question = "Why " * 300
+    context = "Word " * 1000
+
+    def build(text):
+        messages = [{"role": "user", "content": question}]
+        return ([{"role": "system", "content": f"Context: {text}"}] if text else []) + messages
+
+    messages, usage = fit_prompt("chat", "gpt-3.5-turbo", build, context, budget=200)
+
+    assert messages == [{"role": "user", "content": question}]
+    assert usage["prompt_tokens_after_trim"] < usage["prompt_tokens_before_trim"]
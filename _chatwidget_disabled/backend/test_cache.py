@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+from cache import ResponseCache, SQLiteCacheStore, make_cache_key
+
+
+def test_make_cache_key_ignores_whitespace_differences():
+    assert make_cache_key("summarize", "m", "a  b\nc", "v1") == make_cache_key("summarize", "m", "a b c", "v1")
+    assert make_cache_key("summarize", "m", "a b c", "v1") != make_cache_key("summarize", "m", "a b c", "v2")
+
+
+def test_entries_expire_after_their_ttl():
+    async def scenario():
+        cache = ResponseCache(default_ttl=60.0)
+        await cache.set("short", {"message": "x"}, ttl=0.05)
+        await cache.set("long", {"message": "y"})
+        assert await cache.get("short") == {"message": "x"}
+        await asyncio.sleep(0.1)
+        assert await cache.get("short") is None
+        assert await cache.get("long") == {"message": "y"}
+        assert cache.expirations == 1
+
+    asyncio.run(scenario())
+
+
+def test_least_recently_used_entries_are_evicted():
+    async def scenario():
+        cache = ResponseCache(max_entries=2)
+        await cache.set("a", {"message": "a"})
+        await cache.set("b", {"message": "b"})
+        await cache.get("a")
+        await cache.set("c", {"message": "c"})
+        assert await cache.get("b") is None
+        assert await cache.get("a") is not None
+        assert cache.evictions == 1
+
+    asyncio.run(scenario())
+
+
+def test_byte_limit_counts_encoded_bytes():
+    async def scenario():
+        cache = ResponseCache(max_bytes=100)
+        await cache.set("a", {"message": "é" * 30})
+        await cache.set("b", {"message": "é" * 30})
+        assert cache.stats()["bytes"] <= 100
+        assert await cache.get("a") is None
+
+    asyncio.run(scenario())
+
+
+def test_shared_hits_keep_the_stored_expiry(tmp_path):
+    async def scenario():
+        store = SQLiteCacheStore(str(tmp_path / "cache.sqlite3"))
+        writer = ResponseCache(default_ttl=86400.0, store=store)
+        reader = ResponseCache(default_ttl=86400.0, store=store)
+        await writer.set("key", {"message": "é" * 10}, ttl=0.2)
+
+        assert await reader.get("key") == {"message": "é" * 10}
+        assert reader.shared_hits == 1
+        assert reader.stats()["bytes"] == len(json.dumps({"message": "é" * 10}, ensure_ascii=False).encode("utf-8"))
+
+        # Expired in the reader's LRU too, not kept for the default TTL
+        await asyncio.sleep(0.3)
+        assert await reader.get("key") is None
+        assert reader.expirations == 1
+        store.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,124 @@
+import asyncio
+import json
+
+from starlette.responses import StreamingResponse
+
+from channel import Channel, SendWindow, iterate_events
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def send_text(self, text):
+        self.frames.append(json.loads(text))
+
+    async def send_bytes(self, data):
+        self.frames.append(data)
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+async def chunks(*parts, error=None):
+    for part in parts:
+        yield part
+    if error is not None:
+        raise error
+
+
+def test_iterate_events_parses_split_frames_and_skips_comments():
+    body = chunks(": stream opened\n\n", 'event: token\ndata: {"delta"', ': "Hi"}\n\nevent: done\ndata: {}\n\n')
+    assert asyncio.run(collect(iterate_events(body))) == [("token", {"delta": "Hi"}), ("done", {})]
+
+
+def test_json_result_is_one_response_frame():
+    websocket = FakeWebSocket()
+    status = asyncio.run(Channel(websocket, {}).send_result("7", {"message": "Hi"}))
+    assert status == 200
+    assert websocket.frames == [{"type": "response", "id": "7", "status": 200, "headers": {}, "body": {"message": "Hi"}}]
+
+
+def test_event_stream_is_sent_as_event_frames_then_end():
+    websocket = FakeWebSocket()
+    result = StreamingResponse(chunks('event: token\ndata: {"delta": "Hi"}\n\n'), media_type="text/event-stream")
+    asyncio.run(Channel(websocket, {}).send_result("7", result))
+    assert websocket.frames == [
+        {"type": "event", "id": "7", "event": "token", "data": {"delta": "Hi"}},
+        {"type": "end", "id": "7"},
+    ]
+
+
+def test_event_stream_failing_part_way_is_aborted():
+    websocket = FakeWebSocket()
+    result = StreamingResponse(
+        chunks('event: token\ndata: {"delta": "Hi"}\n\n', error=RuntimeError("upstream reset")),
+        media_type="text/event-stream",
+    )
+    status = asyncio.run(Channel(websocket, {}).send_result("7", result))
+    assert status == 200
+    assert [frame["type"] for frame in websocket.frames] == ["event", "abort"]
+    assert websocket.frames[-1]["error"]["code"] == "STREAM_ERROR"
+
+
+def test_binary_body_is_prefixed_with_the_request_id_and_flow_controlled():
+    async def scenario():
+        websocket = FakeWebSocket()
+        channel = Channel(websocket, {}, send_window=8)
+        result = StreamingResponse(chunks(b"12345", b"67890", b"abc"), media_type="audio/mpeg")
+        sending = asyncio.create_task(channel.send_result("7", result))
+        await asyncio.sleep(0.01)
+        # The second chunk would overrun the window until the first is acked
+        assert [frame for frame in websocket.frames if isinstance(frame, bytes)] == [b"\x017" + b"12345"]
+        await channel.dispatch({"type": "ack", "id": "7", "bytes": 5})
+        await asyncio.sleep(0.01)
+        await channel.dispatch({"type": "ack", "id": "7", "bytes": 5})
+        await sending
+        return websocket.frames
+
+    frames = asyncio.run(scenario())
+    assert frames[0]["type"] == "start" and frames[0]["status"] == 200
+    assert frames[1:4] == [b"\x017" + b"12345", b"\x017" + b"67890", b"\x017" + b"abc"]
+    assert frames[-1] == {"type": "end", "id": "7"}
+
+
+def test_send_window_lets_an_oversized_chunk_through_once_drained():
+    async def scenario():
+        window = SendWindow(4)
+        await window.reserve(10)
+        waiter = asyncio.create_task(window.reserve(1))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        window.ack(10)
+        await waiter
+        return window.unacked
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_invalid_and_unknown_requests_are_rejected():
+    websocket = FakeWebSocket()
+    channel = Channel(websocket, {})
+    asyncio.run(channel.dispatch({"type": "request", "id": "", "op": "chat"}))
+    asyncio.run(channel.dispatch({"type": "request", "id": "8", "op": "nope"}))
+    assert [frame["status"] for frame in websocket.frames] == [400, 404]
+
+
+def test_malformed_frames_get_an_error_frame():
+    async def scenario():
+        websocket = FakeWebSocket()
+        channel = Channel(websocket, {})
+        channel.windows["7"] = window = SendWindow(8)
+        window.unacked = 5
+        await channel.dispatch([1])
+        await channel.dispatch("hi")
+        await channel.dispatch({"type": "ack", "id": "7", "bytes": "many"})
+        await channel.dispatch({"type": "ack", "id": "7", "bytes": None})
+        await channel.dispatch({"type": "ping", "t": 1})
+        return websocket.frames, window.unacked
+
+    frames, unacked = asyncio.run(scenario())
+    assert [frame["type"] for frame in frames] == ["error", "error", "error", "error", "pong"]
+    assert frames[2]["id"] == "7"
+    assert unacked == 5
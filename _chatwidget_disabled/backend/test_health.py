@@ -0,0 +1,107 @@
+import asyncio
+from types import SimpleNamespace
+
+from health import HealthMonitor, UpstreamCheck
+
+
+class FakeLimiter:
+    def __init__(self, name, waiting=0):
+        self.name = name
+        self.waiting = waiting
+
+    def stats(self):
+        return {"waiting": self.waiting}
+
+
+def answering(*statuses):
+    """Check that answers with the given statuses in turn; an exception instance is raised."""
+    answers = list(statuses)
+
+    async def check():
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+    return check
+
+
+def monitor(checks=(), limiters=(), breakers=()):
+    return HealthMonitor(list(checks), list(limiters), lambda: list(breakers), max_loop_lag=0.5, max_waiting=4)
+
+
+def refresh(check, times=1):
+    for _ in range(times):
+        asyncio.run(check.refresh(timeout=1.0))
+
+
+def test_ready_when_nothing_is_wrong():
+    openai = UpstreamCheck("openai", answering(200), required=True)
+    refresh(openai)
+
+    readiness = monitor([openai], [FakeLimiter("openai")]).readiness()
+
+    assert (readiness["status"], readiness["reasons"]) == ("ready", [])
+    assert readiness["upstreams"]["openai"]["status"] == "ok"
+
+
+def test_a_required_upstream_is_down_after_repeated_failures_and_recovers():
+    openai = UpstreamCheck("openai", answering(500, ConnectionError("refused"), 429), required=True)
+    health = monitor([openai])
+
+    refresh(openai)
+    assert openai.status == "failing"
+    assert health.readiness()["status"] == "ready"
+
+    refresh(openai)
+    readiness = health.readiness()
+    assert readiness["status"] == "not_ready"
+    assert readiness["reasons"] == ["openai down: ConnectionError: refused"]
+
+    refresh(openai)  # 429 still proves the key and the network path
+    assert health.readiness()["status"] == "ready"
+
+
+def test_optional_upstreams_are_reported_but_never_unready():
+    elevenlabs = UpstreamCheck("elevenlabs", answering(503, 503), required=False)
+    refresh(elevenlabs, 2)
+
+    readiness = monitor([elevenlabs]).readiness()
+
+    assert readiness["status"] == "ready"
+    assert readiness["upstreams"]["elevenlabs"]["status"] == "down"
+
+
+def test_every_circuit_open_marks_the_upstream_down():
+    openai = UpstreamCheck("openai", answering(200), required=True)
+    refresh(openai)
+    breakers = [SimpleNamespace(name="openai:gpt-4o-mini", state="open"),
+                SimpleNamespace(name="openai:gpt-4o", state="open")]
+
+    readiness = monitor([openai], breakers=breakers).readiness()
+    assert readiness["reasons"] == ["openai down: circuit open"]
+
+    breakers[1].state = "half_open"
+    assert monitor([openai], breakers=breakers).readiness()["status"] == "ready"
+
+
+def test_event_loop_lag_and_limiter_queues_make_the_worker_unready():
+    health = monitor(limiters=[FakeLimiter("openai", waiting=5), FakeLimiter("elevenlabs", waiting=4)])
+    health.lags.extend([0.01, 0.8, 0.02])
+
+    readiness = health.readiness()
+
+    assert readiness["status"] == "not_ready"
+    assert readiness["reasons"] == ["event loop lag 800ms", "5 calls waiting for openai"]
+    assert readiness["loop_lag_ms"] == 800.0
+
+
+def test_slow_checks_time_out_as_failures():
+    async def hang():
+        await asyncio.sleep(10)
+        return 200
+
+    openai = UpstreamCheck("openai", hang, required=True)
+    asyncio.run(openai.refresh(timeout=0.01))
+
+    assert openai.status == "failing"
+    assert openai.last_error == "no answer in 0.01s"
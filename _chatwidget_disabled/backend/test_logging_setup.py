@@ -0,0 +1,21 @@
+import os
+import logging
+
+from logging_setup import setup_logging, worker_log_file
+
+
+def test_setup_logging_installs_one_handler():
+    first = setup_logging()
+    second = setup_logging()
+
+    assert first is second
+    assert logging.getLogger().handlers.count(first) == 1
+
+
+def test_each_worker_gets_its_own_log_file(monkeypatch):
+    monkeypatch.setenv("WIDGET_WORKERS", "1")
+    assert worker_log_file("logs/widget_backend.log") == "logs/widget_backend.log"
+
+    monkeypatch.setenv("WIDGET_WORKERS", "4")
+    assert worker_log_file("logs/widget_backend.log") == f"logs/widget_backend.{os.getpid()}.log"
+    assert worker_log_file("widget_backend") == f"widget_backend.{os.getpid()}.log"
@@ -0,0 +1,117 @@
+import json
+import os
+
+from metrics import Registry, SharedMetrics
+
+# Beyond Linux's pid_max, so never a running process
+DEAD_PID = 4_999_999
+
+
+def make_registry():
+    registry = Registry()
+    requests = registry.counter("widget_requests", "Requests.", ("path",))
+    in_flight = registry.gauge("widget_in_flight", "Requests in flight.")
+    latency = registry.histogram("widget_latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    circuit = registry.callback("widget_circuit_open", "Open circuits.", "gauge", ("name",),
+                                lambda: [(("openai",), 0.0)], aggregate="max")
+    return registry, requests, in_flight, latency, circuit
+
+
+def lines(text, prefix):
+    return sorted(line for line in text.splitlines() if line.startswith(prefix))
+
+
+def test_samples_render_in_the_prometheus_text_format():
+    registry = Registry()
+    requests = registry.counter("widget_requests", "Requests.", ("path",))
+    in_flight = registry.gauge("widget_in_flight", "Requests in flight.")
+    latency = registry.histogram("widget_latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    registry.callback("widget_cache_entries", "Cache entries.", "gauge", ("cache",), lambda: [(("response",), 12)])
+    requests.inc("/api/chat", amount=2)
+    requests.inc('/say "hi"')
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+    for seconds in (0.05, 0.5, 5.0):
+        latency.observe(seconds)
+
+    text = registry.render()
+
+    assert "# TYPE widget_requests_total counter" in text
+    assert lines(text, "widget_requests_total{") == [
+        'widget_requests_total{path="/api/chat"} 2',
+        'widget_requests_total{path="/say \\"hi\\""} 1',
+    ]
+    assert lines(text, "widget_in_flight ") == ["widget_in_flight 1"]
+    # Buckets are cumulative and end with +Inf
+    assert lines(text, "widget_latency_seconds") == sorted([
+        'widget_latency_seconds_bucket{le="0.1"} 1',
+        'widget_latency_seconds_bucket{le="1"} 2',
+        'widget_latency_seconds_bucket{le="+Inf"} 3',
+        "widget_latency_seconds_sum 5.55",
+        "widget_latency_seconds_count 3",
+    ])
+    assert lines(text, "widget_cache_entries{") == ['widget_cache_entries{cache="response"} 12']
+
+
+def test_worker_snapshots_are_merged_by_metric_kind():
+    worker, requests, in_flight, latency, _ = make_registry()
+    requests.inc("/api/chat", amount=2)
+    in_flight.set(3)
+    latency.observe(0.05)
+    latency.observe(0.5)
+
+    other, other_requests, other_in_flight, other_latency, _ = make_registry()
+    other_requests.inc("/api/chat")
+    other_requests.inc("/api/listen")
+    other_in_flight.set(1)
+    other_latency.observe(5.0)
+    snapshot = other.snapshot()
+    snapshot["widget_circuit_open"] = [["", ["name"], ["openai"], 1.0]]
+
+    text = worker.render([snapshot])
+
+    assert lines(text, "widget_requests_total{") == [
+        'widget_requests_total{path="/api/chat"} 3',
+        'widget_requests_total{path="/api/listen"} 1',
+    ]
+    assert lines(text, "widget_in_flight ") == ["widget_in_flight 4"]
+    # Cumulative buckets add up across workers
+    assert lines(text, "widget_latency_seconds") == sorted([
+        'widget_latency_seconds_bucket{le="0.1"} 1',
+        'widget_latency_seconds_bucket{le="1"} 2',
+        'widget_latency_seconds_bucket{le="+Inf"} 3',
+        "widget_latency_seconds_sum 5.55",
+        "widget_latency_seconds_count 3",
+    ])
+    # A circuit open in any worker is open
+    assert lines(text, "widget_circuit_open{") == ['widget_circuit_open{name="openai"} 1']
+
+
+def test_exited_workers_keep_their_counts_but_not_their_gauges(tmp_path):
+    worker, requests, in_flight, _, _ = make_registry()
+    requests.inc("/api/chat")
+    in_flight.set(1)
+    shared = SharedMetrics(worker, str(tmp_path))
+
+    snapshot = make_registry()[0].snapshot()
+    snapshot["widget_requests"] = [["", ["path"], ["/api/chat"], 5.0]]
+    snapshot["widget_in_flight"] = [["", [], [], 7.0]]
+    for pid in (os.getppid(), DEAD_PID):
+        with open(tmp_path / f"{pid}.json", "w") as out:
+            json.dump(snapshot, out)
+    (tmp_path / "notes.txt").write_text("ignored")
+    shared.write()
+
+    text = worker.render(shared.others())
+
+    assert lines(text, "widget_requests_total{") == ['widget_requests_total{path="/api/chat"} 11']
+    assert lines(text, "widget_in_flight ") == ["widget_in_flight 8"]
+
+
+def test_unreadable_snapshots_are_skipped(tmp_path):
+    worker = make_registry()[0]
+    shared = SharedMetrics(worker, str(tmp_path))
+    (tmp_path / f"{os.getppid()}.json").write_text("{not json")
+
+    assert shared.others() == []
@@ -0,0 +1,81 @@
+import pytest
+
+import prefetch
+from prefetch import Prefetcher
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(prefetch.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_site_budget_then_global_budget(clock):
+    prefetcher = Prefetcher(site_per_minute=2, per_minute=3)
+
+    assert [prefetcher.admit("a.example") for _ in range(3)] == [None, None, "site"]
+    assert prefetcher.admit("b.example") is None
+    assert prefetcher.admit("c.example") == "global"
+    # Budgets refill per minute: one more prefetch every 20s worker-wide
+    clock[0] += 20
+    assert prefetcher.admit("c.example") is None
+
+
+def test_a_site_over_its_budget_does_not_spend_the_global_one(clock):
+    prefetcher = Prefetcher(site_per_minute=1, per_minute=2)
+    prefetcher.admit("a.example")
+    for _ in range(5):
+        assert prefetcher.admit("a.example") == "site"
+
+    assert prefetcher.admit("b.example") is None
+
+
+def test_zero_budgets_are_unlimited(clock):
+    prefetcher = Prefetcher(site_per_minute=0, per_minute=0)
+    assert all(prefetcher.admit("a.example") is None for _ in range(100))
+
+
+def test_claimed_prefetches_are_hits_and_unclaimed_ones_expire_as_wasted(clock):
+    prefetcher = Prefetcher(site_per_minute=0, per_minute=0, ttl=600)
+    prefetcher.track("summary-1", "summary")
+    prefetcher.track("audio-1", "audio")
+    prefetcher.track("summary-2", "summary")
+
+    assert prefetcher.claim("summary-1")
+    assert not prefetcher.claim("summary-1")  # One prefetch is one hit
+    prefetcher.discard("summary-2")  # Failed: neither a hit nor wasted
+    clock[0] += 601
+    assert not prefetcher.claim("audio-1")
+
+    stats = prefetcher.stats()
+    assert (stats["pending"], stats["hits"], stats["wasted"]) == (0, {"summary": 1}, {"audio": 1})
+
+
+def test_tracking_past_max_entries_wastes_the_oldest(clock):
+    prefetcher = Prefetcher(site_per_minute=0, per_minute=0, max_entries=2)
+    for key in ("one", "two", "three"):
+        prefetcher.track(key, "summary")
+
+    assert not prefetcher.claim("one")
+    assert prefetcher.claim("three")
+    assert prefetcher.stats()["wasted"] == {"summary": 1}
+
+
+def test_retracking_a_key_restarts_its_ttl(clock):
+    prefetcher = Prefetcher(site_per_minute=0, per_minute=0, ttl=600)
+    prefetcher.track("summary-1", "summary")
+    clock[0] += 500
+    prefetcher.track("summary-1", "summary")
+    clock[0] += 500
+
+    assert prefetcher.claim("summary-1")
+
+
+def test_results_are_counted_by_kind(clock):
+    prefetcher = Prefetcher(site_per_minute=0, per_minute=0)
+    prefetcher.count("summary", "started")
+    prefetcher.count("summary", "started")
+    prefetcher.count("audio", "over_budget")
+
+    assert prefetcher.stats()["results"] == {"audio:over_budget": 1, "summary:started": 2}
@@ -0,0 +1,30 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+
+from prewarm import post_chunk
+
+CHUNK = [{"id": "a", "text": "First page"}, {"id": "b", "text": "Second page"}]
+ARGS = SimpleNamespace(model="gpt-4o-mini", parallel=2)
+
+
+def post(response):
+    async def scenario():
+        transport = httpx.MockTransport(lambda request: response)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend") as client:
+            return await post_chunk(client, CHUNK, ARGS)
+    return asyncio.run(scenario())
+
+
+def test_backend_errors_mark_every_document_failed():
+    result = post(httpx.Response(401, json={"detail": {"error": {"message": "Invalid token", "code": "UNAUTHORIZED"}}}))
+
+    assert [item["status"] for item in result["results"]] == ["failed", "failed"]
+    assert result["results"][0]["error"] == {"message": "Invalid token", "code": "UNAUTHORIZED"}
+
+
+def test_non_json_error_pages_are_reported_by_status():
+    result = post(httpx.Response(502, text="<html>Bad Gateway</html>" + " " * 500))
+
+    assert result["results"][1]["error"] == {"message": "<html>Bad Gateway</html>" + " " * 176, "code": "502"}
@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpenError
+
+
+class UpstreamError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def fail(breaker, status_code=503):
+    with pytest.raises(UpstreamError):
+        with breaker.guard():
+            raise UpstreamError(status_code)
+
+
+def succeed(breaker):
+    with breaker.guard():
+        pass
+
+
+def open_breaker(reset_timeout=60.0):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=reset_timeout)
+    for _ in range(3):
+        fail(breaker)
+    return breaker
+
+
+def test_opens_after_consecutive_outage_failures_and_fails_fast():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=60.0)
+    fail(breaker)
+    fail(breaker)
+    assert breaker.state == CircuitBreaker.CLOSED
+    fail(breaker)
+    assert breaker.state == CircuitBreaker.OPEN and breaker.opened == 1
+
+    with pytest.raises(CircuitOpenError) as raised:
+        succeed(breaker)
+    assert 0 < raised.value.retry_after <= 60.0
+    assert breaker.rejected == 1
+
+
+def test_request_errors_count_as_the_upstream_being_up():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=60.0)
+    fail(breaker)
+    fail(breaker)
+    fail(breaker, status_code=400)
+    fail(breaker, status_code=429)
+    fail(breaker)
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 1
+
+
+def test_half_open_lets_one_probe_through_and_its_success_closes():
+    breaker = open_breaker(reset_timeout=0.05)
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    with breaker.guard():
+        # A second call while the probe is out is rejected
+        with pytest.raises(CircuitOpenError):
+            breaker.check()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 0
+
+
+def test_failed_probe_opens_the_circuit_again():
+    breaker = open_breaker(reset_timeout=0.05)
+    time.sleep(0.06)
+    fail(breaker)
+    assert breaker.state == CircuitBreaker.OPEN and breaker.opened == 1
+
+
+def test_cancelled_probe_lets_another_probe_through():
+    breaker = open_breaker(reset_timeout=0.05)
+    time.sleep(0.06)
+    with pytest.raises(KeyboardInterrupt):
+        with breaker.guard():
+            raise KeyboardInterrupt
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    succeed(breaker)
+    assert breaker.state == CircuitBreaker.CLOSED
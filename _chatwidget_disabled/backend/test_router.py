@@ -0,0 +1,121 @@
+import pytest
+
+import router
+from router import FAILOVER, PREFERRED, PROBE, REQUESTED, SIZE, ModelRouter, parse_candidates
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(router.time, "monotonic", lambda: now[0])
+    return now
+
+
+def make_router(**settings):
+    return ModelRouter(
+        candidates={"chat": parse_candidates("small<2000,large")},
+        fallbacks={"chat": None},
+        max_tokens={"chat": 1000},
+        latency_targets={"chat": 5.0},
+        first_token_target=2.0,
+        context_windows={"small": 8000, "large": 32000},
+        **settings,
+    )
+
+
+def observe(models, model, count, seconds=1.0, ok=True):
+    for _ in range(count):
+        models.observe("chat", model, seconds, ok)
+
+
+def test_candidates_are_chosen_by_input_size(clock):
+    models = make_router()
+
+    short = models.route("chat", "auto", 500)
+    long = models.route("chat", "auto", 2000)
+
+    assert (short.model, short.reason, short.fallback) == ("small", PREFERRED, "large")
+    assert (long.model, long.reason, long.fallback) == ("large", SIZE, None)
+    assert models.route("chat", "large", 500).reason == REQUESTED
+
+
+def test_fails_over_when_the_error_rate_is_over_the_limit(clock):
+    models = make_router()
+    observe(models, "small", 5)
+    assert not models.degraded("chat", "small")
+
+    observe(models, "small", 3, ok=False)
+    route = models.route("chat", "auto", 500)
+
+    assert models.degraded("chat", "small")
+    assert (route.model, route.reason) == ("large", FAILOVER)
+    assert route.is_fallback("large")
+
+
+def test_fails_over_when_p95_latency_is_over_the_target(clock):
+    models = make_router()
+    observe(models, "small", 5, seconds=1.0)
+    observe(models, "small", 10, seconds=12.0)
+
+    route = models.route("chat", "auto", 500)
+
+    assert (route.model, route.reason) == ("large", FAILOVER)
+
+
+def test_degraded_model_is_probed_after_the_interval_and_recovers(clock):
+    models = make_router(probe_interval=15.0)
+    observe(models, "small", 5, ok=False)
+    assert models.route("chat", "auto", 500).reason == FAILOVER
+
+    clock[0] += 15.0
+    probe = models.route("chat", "auto", 500)
+    assert (probe.model, probe.reason, probe.fallback) == ("small", PROBE, "large")
+    # One probe at a time: requests meanwhile keep failing over
+    assert models.route("chat", "auto", 500).reason == FAILOVER
+
+    models.observe("chat", "small", 0.8, ok=True)
+    route = models.route("chat", "auto", 500)
+    assert (route.model, route.reason) == ("small", PREFERRED)
+
+
+def test_failed_probe_keeps_the_model_degraded(clock):
+    models = make_router(probe_interval=15.0)
+    observe(models, "small", 5, ok=False)
+    clock[0] += 15.0
+    assert models.route("chat", "auto", 500).reason == PROBE
+
+    models.observe("chat", "small", None, ok=False)
+
+    assert models.route("chat", "auto", 500).reason == FAILOVER
+    clock[0] += 15.0
+    assert models.route("chat", "auto", 500).reason == PROBE
+
+
+def test_output_budget_is_clamped_to_the_context_window(clock):
+    models = make_router()
+
+    assert models.route("chat", "large", 1000).max_tokens == 1000
+    assert models.route("chat", "small", 7500).max_tokens == 500
+    # An input too large for small goes to large rather than leaving no room to answer
+    assert models.route("chat", "small", 7990).model == "large"
+    # Never below the minimum, even when the prompt alone fills the window
+    assert models._output_budget("chat", "small", 7990) == 64
+
+
+def test_output_budget_follows_recent_answer_lengths(clock):
+    models = make_router()
+    for _ in range(19):
+        models.observe_output("chat", 200)
+    assert models.route("chat", "auto", 500).max_tokens == 1000  # Too few answers seen yet
+
+    models.observe_output("chat", 200)
+    assert models.route("chat", "auto", 500).max_tokens == 300
+
+
+def test_disabled_routing_passes_the_requested_model_through(clock):
+    models = make_router(enabled=False)
+    observe(models, "small", 5, ok=False)
+
+    route = models.route("chat", "auto", 5000)
+
+    assert (route.model, route.reason, route.max_tokens) == ("small", PREFERRED, 1000)
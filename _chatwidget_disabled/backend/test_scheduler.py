@@ -0,0 +1,205 @@
+import asyncio
+
+import pytest
+
+from scheduler import BACKGROUND, INTERACTIVE, DeadlineExceeded, UpstreamScheduler, schedule_as
+
+
+async def hold(scheduler, released, priority=INTERACTIVE, tenant="default"):
+    schedule_as(priority, tenant)
+    async with scheduler.slot():
+        await released.wait()
+
+
+async def hold_for(scheduler, seconds, priority=INTERACTIVE):
+    schedule_as(priority)
+    async with scheduler.slot():
+        await asyncio.sleep(seconds)
+
+
+async def record(scheduler, order, name, priority=INTERACTIVE, tenant="default", deadline=None):
+    schedule_as(priority, tenant, deadline)
+    async with scheduler.slot():
+        order.append(name)
+        await asyncio.sleep(0)
+
+
+async def run_queued(scheduler, calls, blocker_tenant="a"):
+    """Queue calls (name, priority, tenant) behind one slot-holding call, then let them run; returns the order served."""
+    order, released = [], asyncio.Event()
+    blocker = asyncio.create_task(hold(scheduler, released, tenant=blocker_tenant))
+    await asyncio.sleep(0)
+    tasks = []
+    for name, priority, tenant in calls:
+        tasks.append(asyncio.create_task(record(scheduler, order, name, priority, tenant)))
+        await asyncio.sleep(0)
+    released.set()
+    await asyncio.gather(blocker, *tasks)
+    return order
+
+
+def test_sites_share_slots_fairly():
+    scheduler = UpstreamScheduler("test", limit=1)
+    calls = [(f"a{index}", INTERACTIVE, "a") for index in range(4)] + [("b0", INTERACTIVE, "b"), ("b1", INTERACTIVE, "b")]
+    order = asyncio.run(run_queued(scheduler, calls))
+    # Site b queued last but is not stuck behind all of site a's calls
+    assert order == ["b0", "a0", "b1", "a1", "a2", "a3"]
+
+
+def test_site_weights_scale_the_share():
+    scheduler = UpstreamScheduler("test", limit=1, weights={"b": 2})
+    calls = [(f"a{index}", INTERACTIVE, "a") for index in range(3)] + [(f"b{index}", INTERACTIVE, "b") for index in range(4)]
+    order = asyncio.run(run_queued(scheduler, calls))
+    assert order[:5] == ["b0", "b1", "a0", "b2", "b3"]
+
+
+def test_fifo_when_disabled():
+    scheduler = UpstreamScheduler("test", limit=1, enabled=False)
+    calls = [("background", BACKGROUND, "a"), ("a", INTERACTIVE, "a"), ("b", INTERACTIVE, "b")]
+    assert asyncio.run(run_queued(scheduler, calls)) == ["background", "a", "b"]
+
+
+def test_interactive_calls_go_before_background_ones():
+    scheduler = UpstreamScheduler("test", limit=1)
+    calls = [("background", BACKGROUND, "a"), ("interactive", INTERACTIVE, "b")]
+    assert asyncio.run(run_queued(scheduler, calls)) == ["interactive", "background"]
+
+
+def test_background_calls_leave_the_reserve_free():
+    async def scenario():
+        scheduler = UpstreamScheduler("test", limit=2, reserve=1)
+        released = asyncio.Event()
+        first = asyncio.create_task(hold(scheduler, released, BACKGROUND))
+        second = asyncio.create_task(hold(scheduler, released, BACKGROUND))
+        await asyncio.sleep(0.01)
+        assert scheduler.running[BACKGROUND] == 1 and scheduler.queued[BACKGROUND] == 1
+        assert not scheduler.idle_for(BACKGROUND)
+        interactive = asyncio.create_task(hold(scheduler, released, INTERACTIVE))
+        await asyncio.sleep(0.01)
+        assert scheduler.running[INTERACTIVE] == 1
+        released.set()
+        await asyncio.gather(first, second, interactive)
+        assert scheduler.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_background_call_is_preempted_and_requeued():
+    async def scenario():
+        scheduler = UpstreamScheduler("test", limit=1)
+        attempts = []
+
+        async def background():
+            schedule_as(BACKGROUND)
+
+            async def call():
+                attempts.append(len(attempts))
+                await asyncio.sleep(0.05 if len(attempts) == 1 else 0)
+                return "done"
+
+            return await scheduler.call(call)
+
+        task = asyncio.create_task(background())
+        await asyncio.sleep(0.01)
+        order = []
+        await record(scheduler, order, "interactive")
+        assert await task == "done"
+        return scheduler.preempted, attempts, order
+
+    preempted, attempts, order = asyncio.run(scenario())
+    assert preempted == 1 and attempts == [0, 1] and order == ["interactive"]
+
+
+def test_call_is_dropped_when_its_deadline_passes_in_the_queue():
+    async def scenario():
+        scheduler = UpstreamScheduler("test", limit=1)
+        released = asyncio.Event()
+        blocker = asyncio.create_task(hold(scheduler, released))
+        await asyncio.sleep(0)
+        with pytest.raises(DeadlineExceeded):
+            await record(scheduler, [], "late", deadline=0.02)
+        released.set()
+        await blocker
+        return scheduler.dropped[INTERACTIVE]
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_preempted_call_keeps_its_place_among_background_calls():
+    async def scenario():
+        scheduler = UpstreamScheduler("test", limit=1)
+        order = []
+
+        async def background(name, duration):
+            schedule_as(BACKGROUND, "a")
+
+            async def call():
+                order.append(name)
+                await asyncio.sleep(duration)
+                return name
+
+            return await scheduler.call(call)
+
+        first = asyncio.create_task(background("first", 0.05))
+        await asyncio.sleep(0.01)
+        # Queued while "first" runs; its tag is after the one "first" was given
+        second = asyncio.create_task(background("second", 0))
+        await asyncio.sleep(0.01)
+        await record(scheduler, order, "interactive")
+        await asyncio.gather(first, second)
+        return order, scheduler.preempted
+
+    order, preempted = asyncio.run(scenario())
+    # The requeued call goes ahead of "second", which a fresh tag would have put it behind
+    assert order == ["first", "interactive", "first", "second"]
+    assert preempted == 1
+
+
+def test_call_that_cannot_finish_in_time_is_dropped_at_the_head_of_the_queue():
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        scheduler = UpstreamScheduler("test", limit=1)
+        blocker = asyncio.create_task(hold_for(scheduler, 0.1))
+        await asyncio.sleep(0)
+        started = loop.time()
+        with pytest.raises(DeadlineExceeded):
+            # Slot-holders take 0.1s, and only 0.05s would be left when the slot frees up
+            await record(scheduler, [], "late", deadline=0.15)
+        await blocker
+        return loop.time() - started, scheduler.dropped[INTERACTIVE], scheduler.in_flight
+
+    waited, dropped, in_flight = asyncio.run(scenario())
+    assert waited < 0.14
+    assert (dropped, in_flight) == (1, 0)
+
+
+def test_cancelling_a_call_while_it_is_preempted_does_not_requeue_it():
+    async def scenario():
+        scheduler = UpstreamScheduler("test", limit=1)
+        attempts = []
+
+        async def background():
+            schedule_as(BACKGROUND)
+
+            async def call():
+                attempts.append(len(attempts))
+                await asyncio.sleep(1)
+
+            return await scheduler.call(call)
+
+        outer = asyncio.create_task(background())
+        await asyncio.sleep(0.01)
+        order = []
+        interactive = asyncio.create_task(record(scheduler, order, "interactive"))
+        await asyncio.sleep(0)  # The interactive call queues and preempts the background one
+        outer.cancel()
+        await interactive
+        with pytest.raises(asyncio.CancelledError):
+            await outer
+        return attempts, order, scheduler.preempted, scheduler.stats()
+
+    attempts, order, preempted, stats = asyncio.run(scenario())
+    assert attempts == [0]
+    assert order == ["interactive"]
+    assert preempted == 0
+    assert (stats["in_flight"], stats["waiting"]) == (0, 0)
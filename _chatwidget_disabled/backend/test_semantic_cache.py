@@ -0,0 +1,119 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+import semantic_cache  # noqa: E402
+from semantic_cache import SemanticCache, make_scope, question_terms  # noqa: E402
+
+SCOPE = make_scope("gpt-4o-mini", "Page: Apex Runner")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(semantic_cache.time, "time", lambda: now[0])
+    return now
+
+
+def store(cache, question, message, scope=SCOPE):
+    cache.store(scope, cache.embed(question), question, {"message": message})
+
+
+def lookup(cache, question, scope=SCOPE):
+    return cache.lookup(scope, cache.embed(question), question)
+
+
+def test_terms_are_stemmed_with_synonyms_and_negations_merged():
+    assert question_terms("Does the sizing run small?") == ["siz", "run", "small"]
+    assert question_terms("It doesn't ship to Canada") == ["not", "ship", "canada"]
+
+
+def test_paraphrases_hit_and_unrelated_questions_miss(clock):
+    cache = SemanticCache(threshold=0.8, audit_rate=0.0)
+    store(cache, "do these run small?", "Yes, order half a size up.")
+
+    hit = lookup(cache, "does the sizing run small")
+    assert hit["message"] == "Yes, order half a size up."
+    assert 0.8 <= hit["similarity"] < 1.0
+    assert lookup(cache, "what is the return policy?") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_a_negated_question_does_not_get_the_answer(clock):
+    cache = SemanticCache(threshold=0.8, audit_rate=0.0)
+    store(cache, "is it waterproof", "Yes, it has a waterproof membrane.")
+
+    assert lookup(cache, "is it not waterproof") is None
+
+
+def test_answers_are_kept_per_scope(clock):
+    cache = SemanticCache(audit_rate=0.0)
+    store(cache, "is it waterproof", "Yes.")
+
+    assert lookup(cache, "is it waterproof", scope=make_scope("gpt-4o-mini", "Page: Trail Boot")) is None
+    # Whitespace differences in the context do not change the scope
+    assert make_scope("gpt-4o-mini", "Page:  Apex\nRunner") == make_scope("gpt-4o-mini", "Page: Apex Runner")
+
+
+def test_entries_expire_and_their_slots_are_reused(clock):
+    cache = SemanticCache(ttl=60.0, audit_rate=0.0)
+    store(cache, "is it waterproof", "Yes.")
+
+    clock[0] += 61
+    assert lookup(cache, "is it waterproof") is None
+    store(cache, "how long does shipping take", "Two days.")
+    assert cache.entries == 1
+
+
+def test_storing_a_near_identical_question_replaces_its_answer(clock):
+    cache = SemanticCache(audit_rate=0.0)
+    store(cache, "Is it waterproof?", "Yes.")
+    store(cache, "is it waterproof", "Yes, up to ankle depth.")
+
+    assert cache.entries == 1
+    assert lookup(cache, "is it waterproof?")["message"] == "Yes, up to ankle depth."
+
+
+def test_full_scope_replaces_its_oldest_entry(clock):
+    cache = SemanticCache(max_per_scope=2, audit_rate=0.0)
+    store(cache, "is it waterproof", "Yes.")
+    clock[0] += 1
+    store(cache, "how long does shipping take", "Two days.")
+    clock[0] += 1
+    store(cache, "what is the return policy", "30 days.")
+
+    assert cache.entries == 2
+    assert lookup(cache, "is it waterproof") is None
+    assert lookup(cache, "how long does shipping take")["message"] == "Two days."
+
+
+def test_least_recently_used_scope_is_dropped_past_max_entries(clock):
+    cache = SemanticCache(max_entries=2, audit_rate=0.0)
+    first, second, third = (make_scope("gpt-4o-mini", page) for page in ("one", "two", "three"))
+    store(cache, "is it waterproof", "One.", scope=first)
+    store(cache, "is it waterproof", "Two.", scope=second)
+    lookup(cache, "is it waterproof", scope=first)
+    store(cache, "is it waterproof", "Three.", scope=third)
+
+    assert cache.evictions == 1
+    assert lookup(cache, "is it waterproof", scope=second) is None
+    assert lookup(cache, "is it waterproof", scope=first)["message"] == "One."
+
+
+def test_hits_are_sampled_for_audit(clock):
+    cache = SemanticCache(audit_rate=1.0, audit_size=1)
+    store(cache, "do these run small?", "Yes.")
+    lookup(cache, "does the sizing run small")
+    lookup(cache, "do these run small")
+
+    assert cache.audited == 2
+    assert [audit["question"] for audit in cache.audits] == ["do these run small"]
+    assert cache.audits[0]["matched_question"] == "do these run small?"
+
+
+def test_long_or_empty_messages_are_not_cached():
+    cache = SemanticCache(max_question_chars=50)
+
+    assert cache.eligible("is it waterproof")
+    assert not cache.eligible("x " * 40)
+    assert not cache.eligible("is it?")
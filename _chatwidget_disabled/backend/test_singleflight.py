@@ -0,0 +1,186 @@
+import asyncio
+
+from singleflight import SharedStream, SingleFlight, StreamFlight
+
+
+async def collect(iterator):
+    return [chunk async for chunk in iterator]
+
+
+class Source:
+    """Async byte source released one chunk at a time, recording whether it was closed."""
+
+    def __init__(self, *chunks, error=None):
+        self.chunks = list(chunks)
+        self.error = error
+        self.release = asyncio.Queue()
+        self.read = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await self.release.get()
+        if self.read == len(self.chunks):
+            if self.error is not None:
+                raise self.error
+            raise StopAsyncIteration
+        self.read += 1
+        return self.chunks[self.read - 1]
+
+    async def aclose(self):
+        self.closed = True
+
+    def open(self, count=None):
+        for _ in range(len(self.chunks) + 1 if count is None else count):
+            self.release.put_nowait(None)
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flight = SingleFlight("test")
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(flight.do("key", fetch) for _ in range(3)))
+        in_flight_after = flight.in_flight("key")
+        return results, calls, flight.stats(), in_flight_after
+
+    results, calls, stats, in_flight_after = asyncio.run(scenario())
+    assert results == ["answer"] * 3
+    assert len(calls) == 1
+    assert stats == {"leaders": 1, "coalesced": 2, "in_flight": 0}
+    assert not in_flight_after
+
+
+def test_errors_reach_every_caller_and_the_next_call_starts_over():
+    async def scenario():
+        flight = SingleFlight("test")
+        attempts = []
+
+        async def fetch():
+            attempts.append(1)
+            await asyncio.sleep(0.01)
+            if len(attempts) == 1:
+                raise RuntimeError("upstream down")
+            return "answer"
+
+        failed = await asyncio.gather(flight.do("key", fetch), flight.do("key", fetch), return_exceptions=True)
+        return failed, await flight.do("key", fetch)
+
+    failed, retried = asyncio.run(scenario())
+    assert [type(error) for error in failed] == [RuntimeError, RuntimeError]
+    assert retried == "answer"
+
+
+def test_a_cancelled_caller_does_not_cancel_the_shared_call():
+    async def scenario():
+        flight = SingleFlight("test")
+
+        async def fetch():
+            await asyncio.sleep(0.02)
+            return "answer"
+
+        leader = asyncio.ensure_future(flight.do("key", fetch))
+        follower = asyncio.ensure_future(flight.do("key", fetch))
+        await asyncio.sleep(0.005)
+        leader.cancel()
+        return await follower, leader.cancelled()
+
+    assert asyncio.run(scenario()) == ("answer", True)
+
+
+def test_stream_subscribers_share_one_source_and_late_joiners_replay_it():
+    async def scenario():
+        flight = StreamFlight("test")
+        source = Source(b"a", b"b", b"c")
+        opened = []
+
+        def open_source():
+            opened.append(1)
+            return source
+
+        first = flight.stream("key", open_source)
+        first_read = asyncio.ensure_future(collect(first))
+        source.open(2)
+        await asyncio.sleep(0.01)
+        assert flight.in_flight("key")
+        second_read = asyncio.ensure_future(collect(flight.stream("key", open_source)))
+        source.open()
+        results = await asyncio.gather(first_read, second_read)
+        await asyncio.sleep(0)
+        return results, opened, flight.stats(), source.closed
+
+    results, opened, stats, closed = asyncio.run(scenario())
+    assert results == [[b"a", b"b", b"c"], [b"a", b"b", b"c"]]
+    assert len(opened) == 1
+    assert (stats["leaders"], stats["coalesced"], stats["in_flight"]) == (1, 1, 0)
+    assert closed
+
+
+def test_upstream_errors_reach_every_subscriber():
+    async def scenario():
+        source = Source(b"a", error=RuntimeError("reset"))
+        shared = SharedStream(source)
+        reads = [asyncio.ensure_future(collect(shared.subscribe())) for _ in range(2)]
+        source.open()
+        return await asyncio.gather(*reads, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert [type(result) for result in results] == [RuntimeError, RuntimeError]
+
+
+def test_slow_subscriber_holds_back_the_upstream_within_max_lag():
+    async def scenario():
+        source = Source(*[bytes([i]) for i in range(10)])
+        shared = SharedStream(source, max_lag=3)
+        subscriber = shared.subscribe()
+        source.open()
+        await asyncio.sleep(0.01)
+        buffered = shared.head
+        rest = await collect(subscriber)
+        return buffered, len(rest)
+
+    buffered, received = asyncio.run(scenario())
+    assert buffered == 3
+    assert received == 10
+
+
+def test_last_subscriber_leaving_cancels_the_upstream():
+    async def scenario():
+        source = Source(b"a", b"b", b"c")
+        flight = StreamFlight("test")
+        subscriber = flight.stream("key", lambda: source)
+        source.open(1)
+        assert await subscriber.__anext__() == b"a"
+        await subscriber.aclose()
+        await asyncio.sleep(0.01)
+        return source.closed, flight.in_flight("key")
+
+    assert asyncio.run(scenario()) == (True, False)
+
+
+def test_streams_past_the_replay_limit_stop_taking_subscribers():
+    async def scenario():
+        source = Source(b"aaaa", b"bbbb", b"cccc")
+        flight = StreamFlight("test", max_replay_bytes=6)
+        first = flight.stream("key", lambda: source)
+        reading = asyncio.ensure_future(collect(first))
+        source.open(2)
+        await asyncio.sleep(0.01)
+        joinable = flight.in_flight("key")
+        second = Source(b"x")
+        late = flight.stream("key", lambda: second)
+        second.open()
+        source.open()
+        return joinable, await reading, await collect(late)
+
+    joinable, first, late = asyncio.run(scenario())
+    assert not joinable
+    assert first == [b"aaaa", b"bbbb", b"cccc"]
+    assert late == [b"x"]
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from speech_pipeline import pipelined_speech, split_segments
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+async def stream(*items, delay=0.0):
+    for item in items:
+        if delay:
+            await asyncio.sleep(delay)
+        yield item
+
+
+def test_deltas_are_cut_at_bullets_and_short_lines_are_merged():
+    deltas = stream("• Short.\n• The first bullet is long enough to ", "be voiced on its own.\n• Last")
+    segments = asyncio.run(collect(split_segments(deltas)))
+    assert segments == ["• Short.\n• The first bullet is long enough to be voiced on its own.", "• Last"]
+
+
+def test_audio_is_yielded_in_segment_order_with_earlier_text_as_context():
+    calls = []
+
+    async def synthesize(segment, previous_text):
+        calls.append((segment, previous_text))
+        # Later segments finish first; their audio must still wait its turn
+        await asyncio.sleep(0.03 if segment == "one" else 0.0)
+        yield f"{segment}-1".encode()
+        yield f"{segment}-2".encode()
+
+    audio = asyncio.run(collect(pipelined_speech(stream("one", "two", "three"), synthesize, max_parallel=3)))
+
+    assert audio == [b"one-1", b"one-2", b"two-1", b"two-2", b"three-1", b"three-2"]
+    assert calls == [("one", ""), ("two", "one"), ("three", "one two")]
+
+
+def test_a_segment_keeps_its_slot_until_the_consumer_has_read_it():
+    started = []
+
+    async def synthesize(segment, previous_text):
+        started.append(segment)
+        yield segment.encode()
+
+    async def scenario():
+        speech = pipelined_speech(stream("a", "b", "c", "d"), synthesize, max_parallel=2)
+        first = await speech.__anext__()
+        await asyncio.sleep(0.01)
+        # "a" is being sent and "b" is ready; "c" waits for "a" to be read to the end
+        held_back = list(started)
+        rest = await collect(speech)
+        return first, held_back, rest
+
+    first, held_back, rest = asyncio.run(scenario())
+    assert first == b"a"
+    assert held_back == ["a", "b"]
+    assert rest == [b"b", b"c", b"d"]
+
+
+def test_buffered_audio_per_segment_is_bounded():
+    produced = []
+
+    async def synthesize(segment, previous_text):
+        for index in range(10):
+            produced.append(index)
+            yield bytes([index])
+
+    async def scenario():
+        speech = pipelined_speech(stream("only"), synthesize, max_buffered_chunks=3)
+        first = await speech.__anext__()
+        await asyncio.sleep(0.01)
+        ahead = len(produced)
+        await speech.aclose()
+        return first, ahead
+
+    first, ahead = asyncio.run(scenario())
+    assert first == b"\x00"
+    assert ahead <= 1 + 3 + 1  # The chunk sent, a full queue, and one waiting to be put
+
+
+def test_closing_early_closes_every_tts_stream():
+    closed = []
+
+    async def synthesize(segment, previous_text):
+        try:
+            for _ in range(100):
+                yield segment.encode()
+        finally:
+            closed.append(segment)
+
+    async def scenario():
+        # Both TTS streams are left suspended at a yield, waiting for room in their queue
+        speech = pipelined_speech(stream("a", "b"), synthesize, max_parallel=2, max_buffered_chunks=2)
+        await speech.__anext__()
+        await asyncio.sleep(0.01)
+        await speech.aclose()
+        return list(closed)
+
+    assert sorted(asyncio.run(scenario())) == ["a", "b"]
+
+
+def test_synthesis_errors_end_the_stream():
+    async def synthesize(segment, previous_text):
+        if segment == "two":
+            raise RuntimeError("TTS failed")
+        yield segment.encode()
+
+    async def scenario():
+        received = []
+        with pytest.raises(RuntimeError):
+            async for chunk in pipelined_speech(stream("one", "two", "three"), synthesize):
+                received.append(chunk)
+        return received
+
+    assert asyncio.run(scenario()) == [b"one"]
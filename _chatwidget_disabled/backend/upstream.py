@@ -0,0 +1,121 @@
+"""
+Shared async upstream clients for the widget backend.
+Keeps one pooled HTTP client per upstream and caps in-flight calls so a slow
+OpenAI or ElevenLabs response never blocks the event loop; the scheduler in
+scheduler.py decides which waiting call goes next.
+"""
+
+import os
+import sys
+import logging
+from typing import Optional
+
+import httpx
+
+from scheduler import UpstreamScheduler, parse_weights
+
+logger = logging.getLogger(__name__)
+
+
+def env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment."""
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def env_float(name: str, default: float) -> float:
+    """Read a float setting from the environment."""
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+# Connection pool and concurrency settings, tunable per deployment
+OPENAI_MAX_CONNECTIONS = env_int("OPENAI_MAX_CONNECTIONS", 200)
+OPENAI_MAX_KEEPALIVE = env_int("OPENAI_MAX_KEEPALIVE", 50)
+OPENAI_MAX_CONCURRENCY = env_int("OPENAI_MAX_CONCURRENCY", 256)
+ELEVENLABS_MAX_CONNECTIONS = env_int("ELEVENLABS_MAX_CONNECTIONS", 100)
+ELEVENLABS_MAX_KEEPALIVE = env_int("ELEVENLABS_MAX_KEEPALIVE", 20)
+ELEVENLABS_MAX_CONCURRENCY = env_int("ELEVENLABS_MAX_CONCURRENCY", 64)
+UPSTREAM_KEEPALIVE_EXPIRY = env_float("UPSTREAM_KEEPALIVE_EXPIRY", 30.0)
+UPSTREAM_CONNECT_TIMEOUT = env_float("UPSTREAM_CONNECT_TIMEOUT", 5.0)
+UPSTREAM_READ_TIMEOUT = env_float("UPSTREAM_READ_TIMEOUT", 60.0)
+UPSTREAM_POOL_TIMEOUT = env_float("UPSTREAM_POOL_TIMEOUT", 10.0)
+# Priority scheduling of the concurrency slots; false serves calls first come, first served
+UPSTREAM_SCHEDULING = os.getenv("UPSTREAM_SCHEDULING", "true").lower() == "true"
+# Slots background work may never take, kept for interactive calls
+OPENAI_INTERACTIVE_RESERVE = env_int("OPENAI_INTERACTIVE_RESERVE", OPENAI_MAX_CONCURRENCY // 4)
+ELEVENLABS_INTERACTIVE_RESERVE = env_int("ELEVENLABS_INTERACTIVE_RESERVE", ELEVENLABS_MAX_CONCURRENCY // 4)
+# Fair-queuing weights per site (Origin host), e.g. "shop.example.com=2,blog.example.com=0.5"; others weigh 1
+UPSTREAM_SITE_WEIGHTS = parse_weights(os.getenv("UPSTREAM_SITE_WEIGHTS", ""))
+
+# HTTP statuses worth retrying: timeouts, rate limits and transient server errors
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+def build_http_client(max_connections: int, max_keepalive: int, event_hooks: Optional[dict] = None) -> httpx.AsyncClient:
+    """Create a pooled keep-alive HTTP client for one upstream."""
+    return httpx.AsyncClient(
+        event_hooks=event_hooks,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            UPSTREAM_READ_TIMEOUT,
+            connect=UPSTREAM_CONNECT_TIMEOUT,
+            pool=UPSTREAM_POOL_TIMEOUT,
+        ),
+    )
+
+
+def is_sdk_error(error: Exception, module: str, *names: str) -> bool:
+    """
+    Whether error is one of the named exception classes of an SDK module.
+    The SDKs are imported on first use, so this never imports one: an SDK
+    that is not loaded yet cannot have raised anything.
+    """
+    sdk = sys.modules.get(module)
+    return sdk is not None and isinstance(error, tuple(getattr(sdk, name) for name in names))
+
+
+def is_connection_error(error: Exception) -> bool:
+    """Whether the upstream could not be reached or stopped responding."""
+    return isinstance(error, httpx.TransportError) or is_sdk_error(error, "openai", "APIConnectionError")
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether an upstream failure is transient (connection problem, timeout, rate limit, 5xx)."""
+    if is_connection_error(error):
+        return True
+    status = getattr(error, "status_code", None)
+    return status in RETRYABLE_STATUSES
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """Whether the upstream rejected a call for exceeding its rate limit."""
+    return getattr(error, "status_code", None) == 429
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Delay the upstream (or our own admission control) asked for in Retry-After or retry-after-ms, if any."""
+    if is_sdk_error(error, "openai", "APIStatusError"):
+        headers = error.response.headers
+    else:
+        headers = {key.lower(): value for key, value in (getattr(error, "headers", None) or {}).items()}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+openai_limiter = UpstreamScheduler(
+    "openai", OPENAI_MAX_CONCURRENCY, OPENAI_INTERACTIVE_RESERVE, UPSTREAM_SITE_WEIGHTS, UPSTREAM_SCHEDULING
+)
+elevenlabs_limiter = UpstreamScheduler(
+    "elevenlabs", ELEVENLABS_MAX_CONCURRENCY, ELEVENLABS_INTERACTIVE_RESERVE, UPSTREAM_SITE_WEIGHTS, UPSTREAM_SCHEDULING
+)
@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef } from 'react';
-import { sendChatMessage, handleFeature, generateAudio, APIError } from '../services/api';
-import { extractPageContext, formatContextForAPI, getContentForSummarization } from '../utils/pageContext';
+import { streamChatMessage, streamSummary, streamDetails, sendSessionMessage, handleFeature, generateAudioUrl, prefetchPage, resolvePageId, APIError } from '../services/api';
+import { extractPageContext, formatContextForAPI, getContentForSummarization, getPageIdForSummarization } from '../utils/pageContext';
 import { detectWebsiteThemeWithCache } from '../utils/themeDetection';
 import { useSpeechRecognition } from '../hooks/useSpeechRecognition';
 import ShareMenu from './ShareMenu';
@@ -57,16 +57,14 @@ const ChatBar: React.FC = () => {
   const [isMinimized, setIsMinimized] = useState(true);
   const [isAnswerBoxClosing, setIsAnswerBoxClosing] = useState(false);
   const [isLoading, setIsLoading] = useState(false);
+  // Set once the first words of a streamed reply are shown, replacing the loading indicator
+  const [isStreaming, setIsStreaming] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [showShareMenu, setShowShareMenu] = useState(false);
   // Remove individual state variables as they're now part of ChatMessage
   // const [audioUrl, setAudioUrl] = useState<string | null>(null);
   // const [responseType, setResponseType] = useState<string>('text');
   // const [showCarouselInAnswer, setShowCarouselInAnswer] = useState(false);
-  // Audio caching for instant playback
-  const [cachedAudioUrl, setCachedAudioUrl] = useState<string | null>(null);
-  const [isPreparingAudio, setIsPreparingAudio] = useState(false);
-  const [audioCacheError, setAudioCacheError] = useState<string | null>(null);
   // Suppress unused variable warning - error is used for internal state tracking
   void error;
   const widgetRef = useRef<HTMLDivElement>(null);
@@ -74,6 +72,8 @@ const ChatBar: React.FC = () => {
   const shareMenuRef = useRef<HTMLDivElement>(null);
   const chatHistoryRef = useRef<HTMLDivElement>(null);
   const wasCarouselToggledRef = useRef<string | null>(null);
+  // Last message the history was scrolled to, so streamed text does not re-run the positioning
+  const lastScrolledMessageRef = useRef<string | null>(null);
   const cartSidebarRef = useRef<HTMLDivElement>(null);
   
   // Get cart state to check if cart is open
@@ -126,53 +126,22 @@ const ChatBar: React.FC = () => {
     }
   }, []);
 
-  // Pre-generate audio for instant playback
+  // Have the backend prepare the summary and its audio, so Summarize and Listen answer at once
   useEffect(() => {
-    const prepareAudio = async () => {
-      // Wait a bit for page to fully load
-      setTimeout(async () => {
-        try {
-          setIsPreparingAudio(true);
-          setAudioCacheError(null);
-          
-          // Get page content for summarization
-          const content = getContentForSummarization();
-          
-          // Only proceed if we have meaningful content
-          if (content && content.length > 100) {
-            console.log('Pre-generating audio for instant Listen experience...');
-            
-            // Generate audio in background
-            const audioBlob = await generateAudio(content);
-            const audioObjectUrl = URL.createObjectURL(audioBlob);
-            
-            setCachedAudioUrl(audioObjectUrl);
-            console.log('Audio pre-generation completed successfully');
-          } else {
-            console.log('Insufficient content for audio pre-generation');
-          }
-        } catch (err) {
-          console.warn('Audio pre-generation failed:', err);
-          setAudioCacheError(err instanceof Error ? err.message : 'Audio preparation failed');
-        } finally {
-          setIsPreparingAudio(false);
-        }
-      }, 2000); // Wait 2 seconds for page to stabilize
-    };
+    // Wait a bit for page to fully load
+    const timer = setTimeout(async () => {
+      const content = getContentForSummarization();
+      const pageId = await getPageIdForSummarization();
+
+      // Only proceed if we have meaningful content
+      if (pageId || (content && content.length > 100)) {
+        await prefetchPage(content, pageId);
+      }
+    }, 2000); // Wait 2 seconds for page to stabilize
 
-    prepareAudio();
+    return () => clearTimeout(timer);
   }, []); // Only run once on mount
 
-
-  // Cleanup cached audio URL on unmount
-  useEffect(() => {
-    return () => {
-      if (cachedAudioUrl) {
-        URL.revokeObjectURL(cachedAudioUrl);
-      }
-    };
-  }, [cachedAudioUrl]);
-
   // Handle click outside to hide answer box only
   useEffect(() => {
     const handleClickOutside = (event: MouseEvent) => {
@@ -203,7 +172,7 @@ const ChatBar: React.FC = () => {
   }, [showAnswerBox, cartState.isOpen]);
 
   // Message management functions
-  const addChatMessage = (userMsg: string, response: string, responseType: string, showCarousel?: boolean, audioUrl?: string, carouselId?: string) => {
+  const addChatMessage = (userMsg: string, response: string, responseType: string, showCarousel?: boolean, audioUrl?: string, carouselId?: string): string => {
     const messageId = Date.now().toString() + Math.random().toString(36).substr(2, 9);
     const newMessage: ChatMessage = {
       id: messageId,
@@ -242,6 +211,18 @@ const ChatBar: React.FC = () => {
       }
       return newHistory;
     });
+    return messageId;
+  };
+
+  // Replace a message's reply, e.g. with the text streamed so far
+  const updateChatResponse = (messageId: string, response: string) => {
+    setChatHistory(prev => prev.map(msg => (msg.id === messageId ? { ...msg, response } : msg)));
+  };
+
+  // Handler for a streamed reply: shows the text received so far in the message
+  const streamInto = (messageId: string) => (_delta: string, textSoFar: string) => {
+    setIsStreaming(true);
+    updateChatResponse(messageId, textSoFar);
   };
 
   const clearChatHistory = () => {
@@ -266,6 +247,12 @@ const ChatBar: React.FC = () => {
   // Smart scroll positioning to show last user message at top or keep carousel in view
   useEffect(() => {
     console.log('📜 Chat history changed, length:', chatHistory.length);
+    const lastMessageId = chatHistory[chatHistory.length - 1]?.id ?? null;
+    if (lastMessageId === lastScrolledMessageRef.current && !wasCarouselToggledRef.current) {
+      // Only the text of a message changed, as it does while a reply streams in
+      return;
+    }
+    lastScrolledMessageRef.current = lastMessageId;
     if (chatHistoryRef.current && chatHistory.length > 0) {
       // Use setTimeout to ensure DOM is updated after state change
       setTimeout(() => {
@@ -439,6 +426,8 @@ const ChatBar: React.FC = () => {
         messageToCheck.includes(trigger.toLowerCase())
       );
       const shouldShowCarousel = isMensCarousel || isWomensCarousel;
+      // Message a streamed reply is written into, once it has been added
+      let streamedMessageId: string | undefined;
       
       try {
         let response: string;
@@ -459,19 +448,41 @@ const ChatBar: React.FC = () => {
             response = "Here are our top men's hiking shoes! These boots are designed for durability, comfort, and performance on any terrain. Each model features waterproof construction, superior grip, and long-lasting materials. Browse through our selection to find the perfect pair for your next adventure.";
           }
         } else {
-          // Normal chat response
+          // Normal chat response, shown as it streams in
           responseType = 'text';
+          streamedMessageId = addChatMessage(currentMessage, '', responseType);
+          const onToken = streamInto(streamedMessageId);
           
           // Extract page context
           const pageContext = extractPageContext();
-          const contextString = formatContextForAPI(pageContext);
+          const pageId = (await resolvePageId()) ?? undefined;
+          
+          // The page goes to the backend once, when its session is created; each
+          // turn then carries only the message and any text selected for it
+          const sessionContext = pageId
+            ? undefined
+            : formatContextForAPI({ ...pageContext, selectedText: undefined });
+          const selection = pageContext.selectedText ? `Selected text: "${pageContext.selectedText}"` : undefined;
+          const sessionReply = await sendSessionMessage(
+            currentMessage,
+            { url: pageContext.url, context: sessionContext, pageId },
+            selection,
+            undefined,
+            onToken
+          );
           
-          // Send message to API with context
-          response = await sendChatMessage(currentMessage, contextString);
+          // Without a session, send the context with the message; ingested pages are referenced by id
+          response = sessionReply ?? (await streamChatMessage(
+            currentMessage, onToken, formatContextForAPI(pageContext, !pageId), undefined, pageId
+          )).message;
         }
         
         // Add message to chat history
-        addChatMessage(currentMessage, response, responseType, shouldShowCarousel, undefined, carouselId);
+        if (streamedMessageId) {
+          updateChatResponse(streamedMessageId, response);
+        } else {
+          addChatMessage(currentMessage, response, responseType, shouldShowCarousel, undefined, carouselId);
+        }
         console.log('💬 Message added to chat history, auto-show effect will handle display');
         // Remove explicit setShowAnswerBox - let useEffect handle it
       } catch (err) {
@@ -485,12 +496,17 @@ const ChatBar: React.FC = () => {
           errorMessage = 'Error: Failed to get response. Please try again.';
         }
         
-        // Add error message to chat history
-        addChatMessage(currentMessage, errorMessage, 'text', false, undefined, undefined);
+        // Add error message to chat history, replacing any partly streamed reply
+        if (streamedMessageId) {
+          updateChatResponse(streamedMessageId, errorMessage);
+        } else {
+          addChatMessage(currentMessage, errorMessage, 'text', false, undefined, undefined);
+        }
         console.log('❌ Error message added to chat history, auto-show effect will handle display');
         // Remove explicit setShowAnswerBox - let useEffect handle it
       } finally {
         setIsLoading(false);
+        setIsStreaming(false);
       }
     }
   };
@@ -505,60 +521,34 @@ const ChatBar: React.FC = () => {
       msg.showCarousel ? { ...msg, carouselExpanded: false } : msg
     ));
     
+    // Message a streamed reply is written into, once it has been added
+    let streamedMessageId: string | undefined;
+    
     try {
       let response: string;
       let responseType: string;
       let audioUrl: string | undefined;
       
       if (feature.toLowerCase() === 'listen') {
-        // Special handling for listen feature with caching
-        if (cachedAudioUrl) {
-          // Use cached audio for instant playback
-          console.log('Using cached audio for instant playback');
-          response = 'Audio summary ready';
-          responseType = 'audio';
-          audioUrl = cachedAudioUrl;
-        } else if (isPreparingAudio) {
-          // Audio is still being prepared
-          response = 'Audio is being prepared, please wait...';
-          responseType = 'text';
-        } else if (audioCacheError) {
-          // Audio preparation failed, show error and fallback to real-time
-          console.log('Audio cache failed, falling back to real-time generation');
-          response = `Audio preparation failed: ${audioCacheError}. Generating audio now...`;
-          responseType = 'text';
-          
-          // Try real-time generation as fallback
-          const content = getContentForSummarization();
-          const audioBlob = await generateAudio(content);
-          const audioObjectUrl = URL.createObjectURL(audioBlob);
-          
-          response = 'Audio summary generated';
-          responseType = 'audio';
-          audioUrl = audioObjectUrl;
-        } else {
-          // Fallback to real-time generation
-          console.log('No cached audio available, generating in real-time...');
-          const content = getContentForSummarization();
-          
-          // Generate audio in real-time
-          const audioBlob = await generateAudio(content);
-          const audioObjectUrl = URL.createObjectURL(audioBlob);
-          
-          response = 'Audio summary generated';
-          responseType = 'audio';
-          audioUrl = audioObjectUrl;
-        }
+        // Prefetched audio is served from the backend's cache, or joins its generation still in progress
+        const content = getContentForSummarization();
+        audioUrl = await generateAudioUrl(content, undefined, undefined, await getPageIdForSummarization());
+        response = 'Audio summary ready';
+        responseType = 'audio';
       } else if (feature.toLowerCase() === 'summarize') {
-        // Get content to summarize
+        // Get content to summarize; the summary is shown as it streams in
         const content = getContentForSummarization();
-        response = await handleFeature('summarize', content);
+        const pageId = await getPageIdForSummarization();
         responseType = 'text';
+        streamedMessageId = addChatMessage(`[${feature}]`, '', responseType);
+        response = (await streamSummary(content, streamInto(streamedMessageId), undefined, pageId)).message;
       } else if (feature.toLowerCase() === 'details') {
-        // Get full content for detailed analysis
+        // Get full content for detailed analysis; shown as it streams in
         const content = getContentForSummarization();
-        response = await handleFeature('details', content);
+        const pageId = await getPageIdForSummarization();
         responseType = 'text';
+        streamedMessageId = addChatMessage(`[${feature}]`, '', responseType);
+        response = (await streamDetails(content, streamInto(streamedMessageId), undefined, pageId)).message;
       } else if (feature.toLowerCase() === 'remix') {
         // Show coming soon message for remix feature
         response = 'Remix feature coming soon! 🎨\n\nThis feature will allow you to rephrase and rewrite content in different styles.';
@@ -570,7 +560,11 @@ const ChatBar: React.FC = () => {
       }
       
       // Add feature response to chat history
-      addChatMessage(`[${feature}]`, response, responseType, false, audioUrl, undefined);
+      if (streamedMessageId) {
+        updateChatResponse(streamedMessageId, response);
+      } else {
+        addChatMessage(`[${feature}]`, response, responseType, false, audioUrl, undefined);
+      }
       console.log('🎯 Feature response added to chat history, auto-show effect will handle display');
       // Remove explicit setShowAnswerBox - let useEffect handle it
     } catch (err) {
@@ -584,12 +578,17 @@ const ChatBar: React.FC = () => {
         errorMessage = `${feature}: Failed to activate. Please try again.`;
       }
       
-      // Add error message to chat history
-      addChatMessage(`[${feature}]`, errorMessage, 'text', false, undefined, undefined);
+      // Add error message to chat history, replacing any partly streamed reply
+      if (streamedMessageId) {
+        updateChatResponse(streamedMessageId, errorMessage);
+      } else {
+        addChatMessage(`[${feature}]`, errorMessage, 'text', false, undefined, undefined);
+      }
       console.log('❌ Feature error added to chat history, auto-show effect will handle display');
       // Remove explicit setShowAnswerBox - let useEffect handle it
     } finally {
       setIsLoading(false);
+      setIsStreaming(false);
     }
   };
 
@@ -713,8 +712,8 @@ const ChatBar: React.FC = () => {
               );
             })}
             
-            {/* Loading indicator for new messages */}
-            {isLoading && (
+            {/* Loading indicator for new messages, until a streamed reply starts */}
+            {isLoading && !isStreaming && (
               <div className="chat-message">
                 <div className="bot-message">
                   <div className="message-bubble bot-bubble">
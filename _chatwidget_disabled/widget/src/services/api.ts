@@ -1,16 +1,27 @@
 /**
  * API service for communicating with the backend.
- * Handles all API calls to the ChatGPT Widget backend.
+ * Handles all API calls to the ChatGPT Widget backend. Chat, summarize,
+ * details, listen and prefetch go over a persistent WebSocket channel when one can be
+ * opened, and through the REST endpoints otherwise.
  */
 
+import { ChannelUnavailable, StreamAborted, WidgetChannel } from './channel';
+import type { Operation, RequestHandlers } from './channel';
+
 // Get backend URL from environment or default to current domain for Next.js API routes
 const API_BASE_URL = import.meta.env.VITE_API_URL || window.location.origin;
 
+// Set VITE_USE_WEBSOCKET=false to always use REST
+const channel = import.meta.env.VITE_USE_WEBSOCKET === 'false' ? null : new WidgetChannel(API_BASE_URL);
+
 // Types
 interface ChatRequest {
   message: string;
   context?: string;
+  page_id?: string;
+  session_id?: string;
   model?: string;
+  stream?: boolean;
 }
 
 interface ChatResponse {
@@ -18,23 +29,67 @@ interface ChatResponse {
     message: string;
     model?: string;
     type?: string;
-    usage?: {
-      prompt_tokens: number;
-      completion_tokens: number;
-      total_tokens: number;
-    };
+    usage?: StreamUsage;
   };
   error?: {
     message: string;
     code: string;
   };
+  // HTTPException errors, such as an expired session
+  detail?: {
+    error?: {
+      message: string;
+      code: string;
+    };
+  };
+}
+
+interface StreamUsage {
+  prompt_tokens: number;
+  completion_tokens: number;
+  total_tokens: number;
+  // Server-side prompt budgeting (local token counts)
+  prompt_budget?: number;
+  prompt_tokens_before_trim?: number;
+  prompt_tokens_after_trim?: number;
 }
 
+interface StreamResult {
+  message: string;
+  model?: string;
+  type?: string;
+  usage?: StreamUsage;
+}
+
+type TokenHandler = (delta: string, textSoFar: string) => void;
+
 interface HealthResponse {
   status: string;
   version: string;
 }
 
+interface SessionResponse {
+  data?: {
+    session_id: string;
+    context_tokens: number;
+  };
+}
+
+// What a chat session is about: the page's URL and its context or ingested page id
+interface SessionSource {
+  url: string;
+  context?: string;
+  pageId?: string;
+}
+
+interface PageLookupResponse {
+  data?: {
+    page_id: string;
+    has_summary: boolean;
+    has_details: boolean;
+  };
+}
+
 // API error class
 export class APIError extends Error {
   public code: string;
@@ -61,33 +116,91 @@ export async function checkHealth(): Promise<HealthResponse> {
   }
 }
 
+interface JsonResult {
+  ok: boolean;
+  data: any;
+}
+
+/**
+ * Send a request over the WebSocket channel, or POST it to its REST endpoint
+ * when the channel is unavailable or dropped before answering. Returns null
+ * when the REST fallback should be used.
+ */
+async function viaChannel(
+  op: Operation,
+  body: object,
+  handlers?: RequestHandlers
+): Promise<JsonResult | null> {
+  if (!channel) return null;
+  try {
+    const response = await channel.request(op, body, handlers);
+    return { ok: response.status < 400, data: response.body };
+  } catch (error) {
+    if (error instanceof ChannelUnavailable) return null;
+    throw error;
+  }
+}
+
+async function postJson(op: Operation, body: object): Promise<JsonResult> {
+  const result = await viaChannel(op, body);
+  if (result) return result;
+
+  const response = await fetch(`${API_BASE_URL}/api/${op}`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify(body),
+  });
+  return { ok: response.ok, data: await response.json() };
+}
+
+const pageLookups = new Map<string, Promise<string | null>>();
+
+/**
+ * Look up the backend's ingested copy of a page.
+ * Resolves to its page id, or null when the page was not ingested; each URL
+ * is looked up once. Sending the id instead of the page text keeps request
+ * payloads small and hits the summaries precomputed at ingestion.
+ */
+export function resolvePageId(url: string = window.location.href): Promise<string | null> {
+  let lookup = pageLookups.get(url);
+  if (!lookup) {
+    lookup = fetch(`${API_BASE_URL}/api/pages?url=${encodeURIComponent(url)}`)
+      .then(response => (response.ok ? response.json() : null))
+      .then((data: PageLookupResponse | null) => data?.data?.page_id ?? null)
+      .catch(() => null);
+    pageLookups.set(url, lookup);
+  }
+  return lookup;
+}
+
 /**
  * Send a chat message to the backend.
+ * With a sessionId the backend already holds the page context and the
+ * conversation so far, so context only carries what changed this turn.
  */
 export async function sendChatMessage(
   message: string,
   context?: string,
-  model: string = 'gpt-3.5-turbo'
+  model?: string,
+  pageId?: string,
+  sessionId?: string
 ): Promise<string> {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/chat`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({
-        message,
-        context,
-        model
-      } as ChatRequest),
-    });
+    const { ok, data } = await postJson('chat', {
+      message,
+      context,
+      page_id: pageId,
+      session_id: sessionId,
+      model
+    } as ChatRequest) as { ok: boolean; data: ChatResponse };
 
-    const data: ChatResponse = await response.json();
-
-    if (!response.ok || data.error) {
+    const error = data.error || data.detail?.error;
+    if (!ok || error) {
       throw new APIError(
-        data.error?.code || 'CHAT_ERROR',
-        data.error?.message || 'Failed to get response'
+        error?.code || 'CHAT_ERROR',
+        error?.message || 'Failed to get response'
       );
     }
 
@@ -104,28 +217,87 @@ export async function sendChatMessage(
   }
 }
 
+const chatSessions = new Map<string, Promise<string | null>>();
+
 /**
- * Request a summary of the provided text.
+ * Chat session for a page, created once per URL with the page's context (or
+ * its ingested page id) so later turns send only the session id and the new
+ * message. Resolves to null when the session could not be created; the next
+ * call then tries again.
  */
-export async function summarizeText(
-  text: string,
-  model: string = 'gpt-3.5-turbo'
-): Promise<string> {
-  try {
-    const response = await fetch(`${API_BASE_URL}/api/summarize`, {
+function resolveChatSession(source: SessionSource): Promise<string | null> {
+  let session = chatSessions.get(source.url);
+  if (!session) {
+    session = fetch(`${API_BASE_URL}/api/sessions`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({
-        message: text,
-        model
-      } as ChatRequest),
-    });
+      body: JSON.stringify({ context: source.context, page_id: source.pageId }),
+    })
+      .then(response => (response.ok ? response.json() : null))
+      .then((data: SessionResponse | null) => data?.data?.session_id ?? null)
+      .then((sessionId: string | null) => {
+        if (!sessionId) chatSessions.delete(source.url);
+        return sessionId;
+      })
+      .catch(() => {
+        chatSessions.delete(source.url);
+        return null;
+      });
+    chatSessions.set(source.url, session);
+  }
+  return session;
+}
+
+/**
+ * Send a chat message within the page's session, creating the session on
+ * the first message. With onToken the reply is streamed to it as it is
+ * generated. A session the backend has expired is replaced once. Resolves
+ * to null when no session is available, so the caller can send the full
+ * context with sendChatMessage or streamChatMessage instead.
+ */
+export async function sendSessionMessage(
+  message: string,
+  source: SessionSource,
+  turnContext?: string,
+  model?: string,
+  onToken?: TokenHandler,
+  retryExpired: boolean = true
+): Promise<string | null> {
+  const session = resolveChatSession(source);
+  const sessionId = await session;
+  if (!sessionId) return null;
+  try {
+    if (onToken) {
+      return (await streamChatMessage(message, onToken, turnContext, model, undefined, sessionId)).message;
+    }
+    return await sendChatMessage(message, turnContext, model, undefined, sessionId);
+  } catch (error) {
+    if (!retryExpired || !(error instanceof APIError) || error.code !== 'SESSION_NOT_FOUND') {
+      throw error;
+    }
+    if (chatSessions.get(source.url) === session) chatSessions.delete(source.url);
+    return sendSessionMessage(message, source, turnContext, model, onToken, false);
+  }
+}
 
-    const data: ChatResponse = await response.json();
+/**
+ * Request a summary of the provided text.
+ */
+export async function summarizeText(
+  text: string,
+  model?: string,
+  pageId?: string
+): Promise<string> {
+  try {
+    const { ok, data } = await postJson('summarize', {
+      message: pageId ? '' : text,
+      page_id: pageId,
+      model
+    } as ChatRequest) as { ok: boolean; data: ChatResponse };
 
-    if (!response.ok || data.error) {
+    if (!ok || data.error) {
       throw new APIError(
         data.error?.code || 'SUMMARY_ERROR',
         data.error?.message || 'Failed to generate summary'
@@ -150,23 +322,17 @@ export async function summarizeText(
  */
 export async function analyzeDetails(
   text: string,
-  model: string = 'gpt-3.5-turbo'
+  model?: string,
+  pageId?: string
 ): Promise<string> {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/details`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({
-        message: text,
-        model
-      } as ChatRequest),
-    });
+    const { ok, data } = await postJson('details', {
+      message: pageId ? '' : text,
+      page_id: pageId,
+      model
+    } as ChatRequest) as { ok: boolean; data: ChatResponse };
 
-    const data: ChatResponse = await response.json();
-
-    if (!response.ok || data.error) {
+    if (!ok || data.error) {
       throw new APIError(
         data.error?.code || 'DETAILS_ERROR',
         data.error?.message || 'Failed to generate detailed analysis'
@@ -186,6 +352,226 @@ export async function analyzeDetails(
   }
 }
 
+/**
+ * Read a completion stream from the backend, as events on the WebSocket
+ * channel or as a Server-Sent Events response. Calls onToken for every delta
+ * and resolves with the full text once the final `done` frame (carrying
+ * usage) arrives.
+ */
+async function streamCompletion(
+  op: Operation,
+  body: ChatRequest,
+  onToken: TokenHandler,
+  fallbackCode: string
+): Promise<StreamResult> {
+  let text = '';
+
+  // Handles one event; returns the result on `done`
+  const handleEvent = (event: string, payload: any): StreamResult | undefined => {
+    if (event === 'token') {
+      text += payload.delta;
+      onToken(payload.delta, text);
+    } else if (event === 'error') {
+      throw new APIError(
+        payload.error?.code || fallbackCode,
+        payload.error?.message || 'Stream interrupted'
+      );
+    } else if (event === 'done') {
+      return { message: text, model: payload.model, type: payload.type, usage: payload.usage };
+    }
+    return undefined;
+  };
+
+  try {
+    const streamed: { result?: StreamResult } = {};
+    const channelResult = await viaChannel(op, { ...body, stream: true }, {
+      onEvent: (event, payload) => {
+        streamed.result = handleEvent(event, payload) ?? streamed.result;
+      },
+    });
+    if (channelResult) {
+      if (!channelResult.ok) {
+        const error = channelResult.data?.detail?.error || channelResult.data?.error;
+        throw new APIError(error?.code || fallbackCode, error?.message || 'Failed to get response');
+      }
+      if (streamed.result) return streamed.result;
+      throw new APIError('STREAM_INCOMPLETE', 'Response ended unexpectedly');
+    }
+    // The channel dropped, possibly part-way: REST streams the reply again from the start
+    text = '';
+
+    const response = await fetch(`${API_BASE_URL}/api/${op}`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Accept': 'text/event-stream',
+      },
+      body: JSON.stringify({ ...body, stream: true }),
+    });
+
+    // Errors raised before the stream opens come back as regular JSON
+    if (!response.ok || !response.body) {
+      const errorData = await response.json().catch(() => ({}));
+      const error = errorData.detail?.error || errorData.error;
+      throw new APIError(
+        error?.code || fallbackCode,
+        error?.message || 'Failed to get response'
+      );
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // Frames are separated by a blank line
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary !== -1) {
+        const frame = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
+
+        let event = 'message';
+        let data = '';
+        for (const line of frame.split('\n')) {
+          if (line.startsWith('event:')) {
+            event = line.slice(6).trim();
+          } else if (line.startsWith('data:')) {
+            data += line.slice(5).trim();
+          }
+        }
+        if (!data) continue; // comment or keep-alive frame
+
+        const result = handleEvent(event, JSON.parse(data));
+        if (result) return result;
+      }
+    }
+
+    throw new APIError('STREAM_INCOMPLETE', 'Response ended unexpectedly');
+  } catch (error) {
+    if (error instanceof APIError) {
+      throw error;
+    }
+    if (error instanceof StreamAborted) {
+      throw new APIError(error.code, error.message);
+    }
+    throw new APIError('NETWORK_ERROR', 'Failed to connect to server');
+  }
+}
+
+/**
+ * Send a chat message and receive the reply token by token.
+ */
+export async function streamChatMessage(
+  message: string,
+  onToken: TokenHandler,
+  context?: string,
+  model?: string,
+  pageId?: string,
+  sessionId?: string
+): Promise<StreamResult> {
+  return streamCompletion(
+    'chat',
+    { message, context, page_id: pageId, session_id: sessionId, model },
+    onToken,
+    'CHAT_ERROR'
+  );
+}
+
+/**
+ * Request a summary and receive it token by token.
+ */
+export async function streamSummary(
+  text: string,
+  onToken: TokenHandler,
+  model?: string,
+  pageId?: string
+): Promise<StreamResult> {
+  return streamCompletion(
+    'summarize',
+    { message: pageId ? '' : text, page_id: pageId, model },
+    onToken,
+    'SUMMARY_ERROR'
+  );
+}
+
+/**
+ * Request a detailed analysis and receive it token by token.
+ */
+export async function streamDetails(
+  text: string,
+  onToken: TokenHandler,
+  model?: string,
+  pageId?: string
+): Promise<StreamResult> {
+  return streamCompletion(
+    'details',
+    { message: pageId ? '' : text, page_id: pageId, model },
+    onToken,
+    'DETAILS_ERROR'
+  );
+}
+
+interface AudioHints {
+  formats: string[];
+  network?: string;
+}
+
+let playableFormats: string[] | undefined;
+
+/**
+ * Codecs this browser plays and how fast its connection is right now, so the
+ * backend can send Opus, or a lower bitrate on a slow or data-saving connection.
+ */
+function audioHints(): AudioHints {
+  playableFormats ??= document.createElement('audio').canPlayType('audio/ogg; codecs=opus')
+    ? ['opus', 'mp3']
+    : ['mp3'];
+  // Network Information API; not available in Safari or Firefox
+  const connection = (navigator as Navigator & {
+    connection?: { saveData?: boolean; effectiveType?: string };
+  }).connection;
+  return {
+    formats: playableFormats,
+    network: connection?.saveData ? 'save-data' : connection?.effectiveType,
+  };
+}
+
+/**
+ * Request audio over the WebSocket channel. Resolves with the audio, or with
+ * the stable URL of audio the backend had cached when preferUrl is set (the
+ * rest of the body is then cancelled); null means use REST instead.
+ */
+async function listenViaChannel(body: object, preferUrl: boolean): Promise<Blob | string | null> {
+  const chunks: Uint8Array[] = [];
+  let url: string | undefined;
+  let contentType = 'audio/mpeg';
+
+  const result = await viaChannel('listen', body, {
+    onStart: (_status, headers) => {
+      contentType = headers['content-type'] || contentType;
+      const audioId = headers['x-audio-id'];
+      if (preferUrl && audioId && headers['x-audio-cache'] === 'HIT') {
+        url = `${API_BASE_URL}/api/listen/audio/${audioId}`;
+        return false;
+      }
+    },
+    onChunk: (chunk) => {
+      chunks.push(chunk);
+    },
+  });
+  if (!result) return null;
+  if (!result.ok) {
+    const error = result.data?.detail?.error || result.data?.error;
+    throw new APIError(error?.code || 'AUDIO_ERROR', error?.message || 'Failed to generate audio');
+  }
+  return url ?? new Blob(chunks as BlobPart[], { type: contentType });
+}
+
 /**
  * Generate audio from text using text-to-speech.
  */
@@ -195,16 +581,21 @@ export async function generateAudio(
   modelId: string = 'eleven_multilingual_v2'
 ): Promise<Blob> {
   try {
+    const body = {
+      message: text,
+      voice_id: voiceId,
+      model_id: modelId,
+      ...audioHints(),
+    };
+    const audio = await listenViaChannel(body, false);
+    if (audio instanceof Blob) return audio;
+
     const response = await fetch(`${API_BASE_URL}/api/listen`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({
-        message: text,
-        voice_id: voiceId,
-        model_id: modelId
-      }),
+      body: JSON.stringify(body),
     });
 
     if (!response.ok) {
@@ -225,6 +616,86 @@ export async function generateAudio(
   }
 }
 
+/**
+ * Generate audio and return a URL the audio player can load.
+ * Audio the backend has already cached is played from its stable URL, so the
+ * browser can seek with range requests and reuse its HTTP cache; freshly
+ * generated audio is returned as an object URL.
+ */
+export async function generateAudioUrl(
+  text: string,
+  voiceId: string = 'JBFqnCBsd6RMkjVDRZzb',
+  modelId: string = 'eleven_multilingual_v2',
+  pageId?: string
+): Promise<string> {
+  try {
+    const body = {
+      message: pageId ? '' : text,
+      page_id: pageId,
+      voice_id: voiceId,
+      model_id: modelId,
+      ...audioHints(),
+    };
+    const audio = await listenViaChannel(body, true);
+    if (typeof audio === 'string') return audio;
+    if (audio) return URL.createObjectURL(audio);
+
+    const response = await fetch(`${API_BASE_URL}/api/listen`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify(body),
+    });
+
+    if (!response.ok) {
+      const errorData = await response.json().catch(() => ({}));
+      throw new APIError(
+        errorData.error?.code || 'AUDIO_ERROR',
+        errorData.error?.message || 'Failed to generate audio'
+      );
+    }
+
+    const audioId = response.headers.get('X-Audio-Id');
+    if (audioId && response.headers.get('X-Audio-Cache') === 'HIT') {
+      response.body?.cancel();
+      return `${API_BASE_URL}/api/listen/audio/${audioId}`;
+    }
+
+    const audioBlob = await response.blob();
+    return URL.createObjectURL(audioBlob);
+  } catch (error) {
+    if (error instanceof APIError) {
+      throw error;
+    }
+    throw new APIError('NETWORK_ERROR', 'Failed to connect to audio service');
+  }
+}
+
+/**
+ * Ask the backend to generate the page's summary, and with audio set its
+ * audio, in the background, so a later Summarize or Listen click is answered
+ * from its cache. Best effort: the backend skips prefetches over its budgets
+ * or while busy, and failures are only logged.
+ */
+export async function prefetchPage(
+  text: string,
+  pageId?: string,
+  audio: boolean = true
+): Promise<void> {
+  try {
+    const { data } = await postJson('prefetch', {
+      message: pageId ? '' : text,
+      page_id: pageId,
+      audio,
+      ...(audio ? audioHints() : {}),
+    });
+    console.log(`Page prefetch: ${data?.data?.status ?? data?.error?.code ?? 'failed'}`);
+  } catch (error) {
+    console.warn('Page prefetch failed:', error);
+  }
+}
+
 /**
  * Generic feature handler for future AI features.
  * This can be extended for different feature types.
@@ -236,11 +707,11 @@ export async function handleFeature(
 ): Promise<string> {
   switch (feature.toLowerCase()) {
     case 'summarize':
-      return summarizeText(content, options?.model);
+      return summarizeText(content, options?.model, options?.pageId);
     
     case 'details':
       // Provide detailed analysis of the content
-      return analyzeDetails(content, options?.model);
+      return analyzeDetails(content, options?.model, options?.pageId);
     
     case 'listen':
       // Generate audio and return a placeholder message
@@ -0,0 +1,235 @@
+/**
+ * Persistent WebSocket channel to the backend.
+ * Carries chat, summarize, details and listen requests over one connection,
+ * tagged with request ids so several can be in flight at once (the frame
+ * format is described in backend/channel.py). Each request skips the CORS
+ * preflight and connection setup a cross-origin fetch pays. When the channel
+ * cannot be used, requests fail with ChannelUnavailable and the caller falls
+ * back to the REST endpoints.
+ */
+
+export type Operation = 'chat' | 'summarize' | 'details' | 'listen' | 'prefetch';
+
+export interface ChannelResponse {
+  status: number;
+  headers: Record<string, string>;
+  // JSON body of a plain response; null after a stream of events or audio
+  body: any;
+}
+
+export interface RequestHandlers {
+  onEvent?: (event: string, data: any) => void;
+  // Called before an audio body; returning false cancels the body
+  onStart?: (status: number, headers: Record<string, string>) => boolean | void;
+  onChunk?: (chunk: Uint8Array) => void;
+}
+
+// The channel is down, or went down before the response arrived; use REST instead
+export class ChannelUnavailable extends Error {
+  constructor(message: string) {
+    super(message);
+    this.name = 'ChannelUnavailable';
+  }
+}
+
+// The server ended a stream part-way
+export class StreamAborted extends Error {
+  public code: string;
+
+  constructor(code: string, message: string) {
+    super(message);
+    this.code = code;
+    this.name = 'StreamAborted';
+  }
+}
+
+interface Pending {
+  handlers: RequestHandlers;
+  resolve: (response: ChannelResponse) => void;
+  reject: (error: Error) => void;
+  status: number;
+  headers: Record<string, string>;
+}
+
+const CONNECT_TIMEOUT_MS = 3000;
+// The backend closes connections it has heard nothing on for 75s
+const PING_INTERVAL_MS = 25000;
+const PONG_TIMEOUT_MS = 10000;
+// After a failed connection attempt, REST is used for this long, doubling up to the maximum
+const RETRY_DELAY_MS = 15000;
+const MAX_RETRY_DELAY_MS = 5 * 60 * 1000;
+
+export class WidgetChannel {
+  private url: string;
+  private socket: WebSocket | null = null;
+  private connecting: Promise<WebSocket> | null = null;
+  private pending = new Map<string, Pending>();
+  private nextId = 1;
+  private retryDelay = RETRY_DELAY_MS;
+  private unavailableUntil = 0;
+  private pingTimer: ReturnType<typeof setInterval> | undefined;
+  private pongTimer: ReturnType<typeof setTimeout> | undefined;
+
+  constructor(baseUrl: string) {
+    this.url = `${baseUrl.replace(/^http/, 'ws').replace(/\/$/, '')}/ws`;
+  }
+
+  /**
+   * Send one request and resolve with its response. Error statuses resolve
+   * like success does, as they would from fetch; a dropped connection
+   * rejects with ChannelUnavailable.
+   */
+  async request(
+    op: Operation,
+    body: object,
+    handlers: RequestHandlers = {},
+    signal?: AbortSignal
+  ): Promise<ChannelResponse> {
+    const socket = await this.connect();
+    if (socket.readyState !== WebSocket.OPEN) {
+      throw new ChannelUnavailable('WebSocket closed');
+    }
+    const id = String(this.nextId++);
+    return new Promise<ChannelResponse>((resolve, reject) => {
+      this.pending.set(id, { handlers, resolve, reject, status: 0, headers: {} });
+      socket.send(JSON.stringify({ type: 'request', id, op, body }));
+      signal?.addEventListener('abort', () => {
+        if (this.pending.has(id)) {
+          this.cancel(id);
+          this.settle(id, undefined, new DOMException('Request aborted', 'AbortError'));
+        }
+      });
+    });
+  }
+
+  private connect(): Promise<WebSocket> {
+    if (this.socket?.readyState === WebSocket.OPEN) {
+      return Promise.resolve(this.socket);
+    }
+    if (Date.now() < this.unavailableUntil) {
+      return Promise.reject(new ChannelUnavailable('WebSocket channel unavailable'));
+    }
+    if (!this.connecting) {
+      this.connecting = new Promise<WebSocket>((resolve, reject) => {
+        const socket = new WebSocket(this.url);
+        socket.binaryType = 'arraybuffer';
+        const timeout = setTimeout(() => socket.close(), CONNECT_TIMEOUT_MS);
+
+        socket.onopen = () => {
+          clearTimeout(timeout);
+          this.socket = socket;
+          this.retryDelay = RETRY_DELAY_MS;
+          this.pingTimer = setInterval(() => this.ping(), PING_INTERVAL_MS);
+          resolve(socket);
+        };
+        socket.onmessage = (message) => this.receive(message.data);
+        socket.onclose = () => {
+          clearTimeout(timeout);
+          if (this.socket !== socket) {
+            // Never opened: proxies and networks that block WebSockets get REST for a while
+            this.unavailableUntil = Date.now() + this.retryDelay;
+            this.retryDelay = Math.min(this.retryDelay * 2, MAX_RETRY_DELAY_MS);
+            reject(new ChannelUnavailable('WebSocket connection failed'));
+            return;
+          }
+          this.closed();
+        };
+      }).finally(() => {
+        this.connecting = null;
+      });
+    }
+    return this.connecting;
+  }
+
+  private closed(): void {
+    clearInterval(this.pingTimer);
+    clearTimeout(this.pongTimer);
+    this.socket = null;
+    for (const id of [...this.pending.keys()]) {
+      this.settle(id, undefined, new ChannelUnavailable('WebSocket closed'));
+    }
+  }
+
+  private ping(): void {
+    this.socket?.send(JSON.stringify({ type: 'ping', t: Date.now() }));
+    // Any frame proves the connection alive; a silent one (a dead mobile link) is dropped
+    clearTimeout(this.pongTimer);
+    this.pongTimer = setTimeout(() => this.socket?.close(), PONG_TIMEOUT_MS);
+  }
+
+  private cancel(id: string): void {
+    this.socket?.send(JSON.stringify({ type: 'cancel', id }));
+  }
+
+  private settle(id: string, response?: ChannelResponse, error?: Error): void {
+    const request = this.pending.get(id);
+    if (!request) return;
+    this.pending.delete(id);
+    if (error) {
+      request.reject(error);
+    } else {
+      request.resolve(response!);
+    }
+  }
+
+  private receive(data: string | ArrayBuffer): void {
+    clearTimeout(this.pongTimer);
+    if (typeof data !== 'string') {
+      this.receiveChunk(new Uint8Array(data));
+      return;
+    }
+
+    const frame = JSON.parse(data);
+    const request = this.pending.get(frame.id);
+    if (!request) return; // pong, or a late frame of a cancelled request
+
+    try {
+      switch (frame.type) {
+        case 'response':
+          this.settle(frame.id, { status: frame.status, headers: frame.headers, body: frame.body });
+          break;
+        case 'event':
+          request.handlers.onEvent?.(frame.event, frame.data);
+          break;
+        case 'start':
+          request.status = frame.status;
+          request.headers = frame.headers;
+          if (request.handlers.onStart?.(frame.status, frame.headers) === false) {
+            this.cancel(frame.id);
+            this.settle(frame.id, { status: frame.status, headers: frame.headers, body: null });
+          }
+          break;
+        case 'end':
+          this.settle(frame.id, { status: request.status || 200, headers: request.headers, body: null });
+          break;
+        case 'abort':
+          this.settle(frame.id, undefined, new StreamAborted(frame.error?.code, frame.error?.message));
+          break;
+        case 'cancelled':
+          this.settle(frame.id, undefined, new DOMException('Request cancelled', 'AbortError'));
+          break;
+      }
+    } catch (error) {
+      // A handler gave up on the request, e.g. on an error event
+      this.cancel(frame.id);
+      this.settle(frame.id, undefined, error as Error);
+    }
+  }
+
+  private receiveChunk(bytes: Uint8Array): void {
+    const idLength = bytes[0];
+    const id = new TextDecoder().decode(bytes.subarray(1, 1 + idLength));
+    const chunk = bytes.subarray(1 + idLength);
+    const request = this.pending.get(id);
+    if (!request) return;
+    try {
+      request.handlers.onChunk?.(chunk);
+    } catch (error) {
+      this.cancel(id);
+      this.settle(id, undefined, error as Error);
+      return;
+    }
+    // Returns send credit, so the server keeps streaming
+    this.socket?.send(JSON.stringify({ type: 'ack', id, bytes: chunk.byteLength }));
+  }
+}
@@ -2,6 +2,8 @@
  * Utilities for extracting context from the current webpage.
  */
 
+import { resolvePageId } from '../services/api';
+
 interface PageContext {
   url: string;
   title: string;
@@ -21,9 +23,11 @@ function getMetaDescription(): string {
 
 /**
  * Extract main text content from the page.
- * Limits to reasonable length to avoid token limits.
+ * Line breaks between blocks are kept so the backend can recognise headings
+ * and navigation when it trims the content to its token budget; the length
+ * cap here only bounds the request size.
  */
-function getMainContent(maxLength: number = 2000): string {
+function getMainContent(maxLength: number = 16000): string {
   // Try to find main content areas
   const contentSelectors = [
     'main',
@@ -41,8 +45,13 @@ function getMainContent(maxLength: number = 2000): string {
   for (const selector of contentSelectors) {
     const element = document.querySelector(selector);
     if (element) {
-      // Get text content, remove extra whitespace
-      content = element.textContent?.trim().replace(/\s+/g, ' ') || '';
+      // Get rendered text, collapsing whitespace within lines
+      const text = (element as HTMLElement).innerText ?? element.textContent ?? '';
+      content = text
+        .split('\n')
+        .map(line => line.replace(/\s+/g, ' ').trim())
+        .filter(line => line.length > 0)
+        .join('\n');
       if (content.length > 100) { // Found substantial content
         break;
       }
@@ -79,8 +88,9 @@ export function extractPageContext(): PageContext {
 
 /**
  * Format context for sending to the API.
+ * Pass includeContent = false when the backend already has the page text.
  */
-export function formatContextForAPI(context: PageContext): string {
+export function formatContextForAPI(context: PageContext, includeContent: boolean = true): string {
   let formatted = `Page: ${context.title}\nURL: ${context.url}`;
   
   if (context.description) {
@@ -89,8 +99,8 @@ export function formatContextForAPI(context: PageContext): string {
   
   if (context.selectedText) {
     formatted += `\n\nSelected text: "${context.selectedText}"`;
-  } else if (context.mainContent) {
-    formatted += `\n\nPage content preview: ${context.mainContent.substring(0, 1000)}...`;
+  } else if (includeContent && context.mainContent) {
+    formatted += `\n\nPage content:\n${context.mainContent}`;
   }
   
   return formatted;
@@ -109,4 +119,16 @@ export function getContentForSummarization(): string {
   
   // Otherwise, use the main content
   return context.mainContent || `${context.title}\n${context.description}`;
-}
\ No newline at end of file
+}
+
+/**
+ * Page id to send instead of the page text for summarize, details and listen.
+ * Undefined when the user has selected text (which must be sent as is) or
+ * the page has not been ingested by the backend.
+ */
+export async function getPageIdForSummarization(): Promise<string | undefined> {
+  if (getSelectedText().length > 50) {
+    return undefined;
+  }
+  return (await resolvePageId(window.location.href)) ?? undefined;
+}